@@ -0,0 +1,81 @@
+"""
+Benchmark: per-record writes vs. the bulk ingest API.
+
+Loads N synthetic cases (patient record + lab results each) into a scratch
+database, first with one `store_*_in_db` call per record, then with
+`store_patients_bulk` / `store_lab_results_bulk`, and reports rows/sec.
+
+    python benchmarks/patient_db_bulk.py --cases 100000 --batch-size 1000
+"""
+import argparse
+import importlib.util
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
+
+def iter_cases(n):
+    for i in range(n):
+        yield {
+            "patient_id": f"BULK-{i}",
+            "description": f"Synthetic case {i}: 54-year-old with chest pain and dyspnea",
+            "metadata": {"medical_task": "Diagnosis", "body_system": "Cardiovascular", "i": i},
+        }
+
+
+def iter_labs(n):
+    for i in range(n):
+        yield f"BULK-{i}", "Troponin I: 0.8 ng/mL [HIGH]; WBC: 9.1 x10^9/L"
+
+
+def load_per_record(n):
+    for case in iter_cases(n):
+        patient_db_tool.store_patient_data_in_db(case["patient_id"], case["description"], case["metadata"])
+    for patient_id, labs in iter_labs(n):
+        patient_db_tool.store_patient_lab_results_in_db(patient_id, labs)
+
+
+def load_bulk(n, batch_size):
+    patient_db_tool.store_patients_bulk(iter_cases(n), batch_size=batch_size)
+    patient_db_tool.store_lab_results_bulk(iter_labs(n), batch_size=batch_size)
+
+
+def timed(db_path, load, *args):
+    patient_db_tool.configure(db_path)
+    patient_db_tool.migrate_database()
+    start = time.perf_counter()
+    load(*args)
+    elapsed = time.perf_counter() - start
+    patient_db_tool.close_connections()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = 2 * args.cases  # one patient_data and one patient_lab_results row per case
+    with tempfile.TemporaryDirectory() as tmp:
+        per_record = timed(os.path.join(tmp, "per-record.sqlite"), load_per_record, args.cases)
+        bulk = timed(os.path.join(tmp, "bulk.sqlite"), load_bulk, args.cases, args.batch_size)
+
+    print(f"{'mode':>10}  {'seconds':>8}  {'rows/s':>10}")
+    print(f"{'per-record':>10}  {per_record:>8.2f}  {rows / per_record:>10.0f}")
+    print(f"{'bulk':>10}  {bulk:>8.2f}  {rows / bulk:>10.0f}")
+    print(f"speedup: {per_record / bulk:.1f}x ({args.cases} cases, batch size {args.batch_size})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark: patient file payload codecs.
+
+Stores copies of a demo imaging set (a PNG chest X-ray, a CT slice as .npy,
+a DICOM CT slice and an uncompressed NIfTI MRI volume) under each codec
+policy, then reports database size, write time and read throughput for
+whole-payload reads (`get_patient_file_by_id`) and streamed reads
+(`iter_patient_file_chunks`).
+
+The images are synthetic phantoms with acquisition-like noise, generated
+with the standard library only.
+
+    python benchmarks/patient_db_compression.py --patients 20
+"""
+import argparse
+import importlib.util
+import math
+import os
+import pathlib
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
+compression = patient_db_tool.compression
+
+
+def phantom(width, height, depth=1, seed=0, noise=12.0):
+    """int16 body/lung phantom (HU-like values) with Gaussian noise, slice-major."""
+    rng = random.Random(seed)
+    pixels = array("h")
+    for z in range(depth):
+        shrink = 1 - 0.3 * abs(z - depth / 2) / max(depth, 1)
+        for y in range(height):
+            for x in range(width):
+                u, v = (x - width / 2) / (width * 0.45 * shrink), (y - height / 2) / (height * 0.35 * shrink)
+                value = -1000
+                if u * u + v * v < 1:
+                    value = 40
+                    for cx in (-0.45, 0.45):
+                        if ((u - cx) / 0.35) ** 2 + (v / 0.7) ** 2 < 1:
+                            value = -850
+                    if math.hypot(u, v + 0.1) < 0.12:
+                        value = 900
+                pixels.append(max(-1024, min(3071, int(value + rng.gauss(0, noise)))))
+    if sys.byteorder != "little":
+        pixels.byteswap()
+    return pixels.tobytes()
+
+
+def png_gray8(width, height, seed=0):
+    """8-bit grayscale PNG with two brighter "lung" bands over noise."""
+    rng = random.Random(seed)
+    rows = b"".join(
+        b"\x00" + bytes(60 + rng.randrange(60) + (80 if 100 < x < 200 or 300 < x < 400 else 0) for x in range(width))
+        for _ in range(height)
+    )
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(rows, 9)) + chunk(b"IEND", b"")
+
+
+def npy_int16(pixels, shape):
+    header = f"{{'descr': '<i2', 'fortran_order': False, 'shape': {shape}, }}"
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode() + pixels
+
+
+def nifti1_int16(pixels, dims):
+    header = bytearray(348)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, len(dims), *dims, *([1] * (7 - len(dims))))
+    struct.pack_into("<hh", header, 70, 4, 16)  # datatype INT16, bitpix
+    struct.pack_into("<8f", header, 76, 1, 1.0, 1.0, 2.5, 1, 1, 1, 1)
+    struct.pack_into("<f", header, 108, 352.0)  # vox_offset
+    header[344:348] = b"n+1\x00"
+    return bytes(header) + b"\x00" * 4 + pixels
+
+
+def dicom_ct(pixels, rows, cols):
+    """Minimal explicit-VR little-endian DICOM file around 16-bit pixel data."""
+
+    def element(group, elem, vr, value):
+        if vr in (b"OB", b"OW", b"UN"):
+            return struct.pack("<HH", group, elem) + vr + b"\x00\x00" + struct.pack("<I", len(value)) + value
+        return struct.pack("<HH", group, elem) + vr + struct.pack("<H", len(value)) + value
+
+    meta = element(0x0002, 0x0010, b"UI", b"1.2.840.10008.1.2.1\x00")
+    body = (
+        element(0x0008, 0x0060, b"CS", b"CT")
+        + element(0x0028, 0x0010, b"US", struct.pack("<H", rows))
+        + element(0x0028, 0x0011, b"US", struct.pack("<H", cols))
+        + element(0x0028, 0x0100, b"US", struct.pack("<H", 16))
+        + element(0x7FE0, 0x0010, b"OW", pixels)
+    )
+    return b"\x00" * 128 + b"DICM" + element(0x0002, 0x0000, b"UL", struct.pack("<I", len(meta))) + meta + body
+
+
+def demo_files():
+    ct = phantom(512, 512, seed=1)
+    return [
+        ("chest_xray", png_gray8(512, 512, seed=2), "chest_xray_pa.png", "image/png"),
+        ("ct_slice", npy_int16(ct, (512, 512)), "ct_chest_slice.npy", "application/x-npy"),
+        ("ct_dicom", dicom_ct(phantom(512, 512, seed=3), 512, 512), "ct_chest.dcm", "application/dicom"),
+        ("mri_volume", nifti1_int16(phantom(128, 128, 48, seed=4), (128, 128, 48)), "mri_brain_t1.nii", None),
+    ]
+
+
+def run_policy(name, policy, files, patients, tmp):
+    db_path = os.path.join(tmp, f"{name}.sqlite")
+    patient_db_tool.configure(db_path, codec_policy=policy)
+    start = time.perf_counter()
+    file_ids = patient_db_tool.store_files_bulk(
+        {"patient_id": f"DEMO-{p:03d}", "type": kind, "data": data, "filename": filename, "mime_type": mime}
+        for p in range(patients)
+        for kind, data, filename, mime in files
+    )
+    write_s = time.perf_counter() - start
+    conn = patient_db_tool.connection.connection()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    codecs = dict(conn.execute("SELECT type, codec FROM patient_files WHERE patient_id = 'DEMO-000'").fetchall())
+    raw_bytes = sum(len(f[1]) for f in files) * patients
+
+    start = time.perf_counter()
+    for file_id in file_ids:
+        patient_db_tool.get_patient_file_by_id(file_id)
+    read_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for file_id in file_ids:
+        for _ in patient_db_tool.iter_patient_file_chunks(file_id):
+            pass
+    stream_s = time.perf_counter() - start
+    size = os.path.getsize(db_path)
+    patient_db_tool.close_connections()
+    return codecs, raw_bytes, size, write_s, read_s, stream_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20, help="Copies of the demo set to store")
+    args = parser.parse_args()
+
+    files = demo_files()
+    print("Demo set: " + ", ".join(f"{filename} {len(data) / 1e6:.2f} MB" for _, data, filename, _ in files))
+    policies = [(codec, compression.CodecPolicy.fixed(codec)) for codec in compression.CODECS
+                if codec != compression.ZSTD or compression.zstandard is not None]
+    policies.append(("auto", compression.CodecPolicy()))
+
+    mb = 1e6
+    print(f"{'policy':<9}  {'DB MB':>7}  {'ratio':>5}  {'write MB/s':>10}  {'read MB/s':>9}  {'stream MB/s':>11}  codecs")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, policy in policies:
+            codecs, raw_bytes, size, write_s, read_s, stream_s = run_policy(name, policy, files, args.patients, tmp)
+            print(
+                f"{name:<9}  {size / mb:>7.1f}  {raw_bytes / size:>5.2f}  {raw_bytes / mb / write_s:>10.0f}"
+                f"  {raw_bytes / mb / read_s:>9.0f}  {raw_bytes / mb / stream_s:>11.0f}"
+                f"  {', '.join(f'{k}={v}' for k, v in sorted(codecs.items()))}"
+            )
+
+
+if __name__ == "__main__":
+    main()
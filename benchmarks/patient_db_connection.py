@@ -0,0 +1,131 @@
+"""
+Benchmark: per-call connections vs. the pooled WAL connection manager.
+
+Runs a mixed read/write workload (reads of patient records, lab result writes)
+against a scratch database, first with the legacy open/close-per-operation
+pattern and default rollback journal, then through patient_db_tool.
+
+    python benchmarks/patient_db_connection.py --ops 5000 --threads 1 4
+"""
+import argparse
+import importlib.util
+import os
+import pathlib
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
+N_PATIENTS = 1000
+WRITE_RATIO = 0.2
+
+
+class LegacyStore:
+    """The pre-pooling access pattern: one connection per call, rollback journal."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get_patient_data_from_db(self, patient_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT description, metadata FROM patient_data WHERE patient_id = ?", (patient_id,))
+        row = cursor.fetchone()
+        cursor.execute("SELECT lab_results_string FROM patient_lab_results WHERE patient_id = ?", (patient_id,))
+        cursor.fetchone()
+        conn.close()
+        return row
+
+    def store_patient_lab_results_in_db(self, patient_id, lab_results_string):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+        cursor.execute(
+            "INSERT OR REPLACE INTO patient_lab_results (patient_id, lab_results_string) VALUES (?, ?)",
+            (patient_id, lab_results_string),
+        )
+        conn.commit()
+        conn.close()
+
+
+def seed(db_path):
+    patient_db_tool.configure(db_path)
+    for i in range(N_PATIENTS):
+        patient_db_tool.store_patient_data_in_db(f"BENCH-{i}", f"Synthetic case {i}", {"i": i})
+    patient_db_tool.close_connections()
+
+
+def run_workload(store, ops, threads):
+    per_thread = ops // threads
+    errors = []
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        try:
+            for _ in range(per_thread):
+                pid = f"BENCH-{rng.randrange(N_PATIENTS)}"
+                if rng.random() < WRITE_RATIO:
+                    store.store_patient_lab_results_in_db(pid, "WBC: 12.1 x10^9/L [HIGH]")
+                else:
+                    store.get_patient_data_from_db(pid)
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'threads':>7}  {'legacy ops/s':>13}  {'pooled ops/s':>13}  {'speedup':>7}")
+        for threads in args.threads:
+            legacy_path = os.path.join(tmp, f"legacy-{threads}", "patient_db.sqlite")
+            pooled_path = os.path.join(tmp, f"pooled-{threads}", "patient_db.sqlite")
+            seed(legacy_path)
+            # seed() leaves a WAL database behind; the legacy baseline runs on
+            # the default rollback journal
+            conn = sqlite3.connect(legacy_path)
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.close()
+            seed(pooled_path)
+
+            legacy_rate, legacy_errors = run_workload(LegacyStore(legacy_path), args.ops, threads)
+            patient_db_tool.configure(pooled_path)
+            pooled_rate, pooled_errors = run_workload(patient_db_tool, args.ops, threads)
+            patient_db_tool.close_connections()
+
+            print(f"{threads:>7}  {legacy_rate:>13.0f}  {pooled_rate:>13.0f}  {pooled_rate / legacy_rate:>6.1f}x")
+            for label, errors in (("legacy", legacy_errors), ("pooled", pooled_errors)):
+                if errors:
+                    print(f"         {label}: {len(errors)} thread(s) failed, first error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: full-text patient search latency.
+
+Bulk-loads N synthetic vignettes into a scratch database, then times
+`search_patients` for a set of clinical queries and reports median and
+95th percentile latency.
+
+    python benchmarks/patient_db_search.py --cases 100000 --repeat 50
+"""
+import argparse
+import importlib.util
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
+SYMPTOMS = [
+    "chest pain", "dyspnea", "fever", "headache", "neck stiffness", "abdominal pain", "jaundice",
+    "syncope", "palpitations", "hemoptysis", "weight loss", "night sweats", "rash", "arthralgia",
+    "confusion", "polyuria", "edema", "cough", "diarrhea", "vomiting",
+]
+FINDINGS = [
+    "elevated troponin", "ST elevation", "low hemoglobin", "raised D-dimer", "leukocytosis",
+    "hyponatremia", "elevated lipase", "positive blood cultures", "bilateral infiltrates",
+    "papilledema", "splenomegaly", "hypotension", "tachycardia", "crackles at both bases",
+]
+BODY_SYSTEMS = ["Cardiovascular", "Respiratory", "Nervous", "Digestive", "Endocrine", "Skeletal", "Urinary"]
+TASKS = ["Diagnosis", "Treatment", "Basic Science"]
+
+QUERIES = ["chest pain troponin", "fever neck stiffness", "cardiovascular diagnosis", "hemoptysis weight loss", "lipase"]
+
+
+def iter_cases(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        age = rng.randint(18, 90)
+        sex = rng.choice(["man", "woman"])
+        symptoms = ", ".join(rng.sample(SYMPTOMS, 3))
+        findings = " and ".join(rng.sample(FINDINGS, 2))
+        yield {
+            "patient_id": f"SEARCH-{i}",
+            "description": (
+                f"A {age}-year-old {sex} presents with {symptoms} for {rng.randint(1, 14)} days. "
+                f"Examination and workup show {findings}. Which of the following is the most likely diagnosis?"
+            ),
+            "metadata": {"body_system": rng.choice(BODY_SYSTEMS), "medical_task": rng.choice(TASKS)},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        patient_db_tool.configure(os.path.join(tmp, "search.sqlite"))
+        start = time.perf_counter()
+        patient_db_tool.store_patients_bulk(iter_cases(args.cases), batch_size=5000)
+        print(f"Loaded and indexed {args.cases} cases in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<26}  {'matches':>7}  {'p50 ms':>7}  {'p95 ms':>7}")
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                results = patient_db_tool.search_patients(query, limit=args.limit)
+                timings.append((time.perf_counter() - t0) * 1000)
+            matches = patient_db_tool.connection.connection().execute(
+                "SELECT COUNT(*) FROM patient_search WHERE patient_search MATCH ?",
+                (patient_db_tool.search.to_fts_query(query),),
+            ).fetchone()[0]
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f"{query:<26}  {matches:>7}  {statistics.median(timings):>7.2f}  {p95:>7.2f}")
+        patient_db_tool.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: write throughput of worker processes against 1 vs. N shards.
+
+Starts P processes that each write lab results for their own patients
+through a ShardedPatientStore, all starting at the same moment, and reports
+commits/sec for every shard count. With one shard every commit queues on
+the same SQLite write lock; with more, writers for different patients
+commit in parallel (given a core per process).
+
+    python benchmarks/patient_db_sharding.py --processes 4 --shards 1 2 4 --writes 2000
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+
+
+def load_patient_db_tool():
+    if "patient_db_tool" in sys.modules:
+        return sys.modules["patient_db_tool"]
+    spec = importlib.util.spec_from_file_location(
+        "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["patient_db_tool"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def writer(directory, worker, writes, start_at):
+    store = load_patient_db_tool().open_sharded_store(directory, derivatives="off")
+    store.get_patient_data_from_db("warm-up")
+    while time.time() < start_at:
+        time.sleep(0.001)
+    start = time.perf_counter()
+    for i in range(writes):
+        store.store_patient_lab_results_in_db(f"SHARD-{worker}-{i}", "Troponin I: 0.8 ng/mL [HIGH]")
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed
+
+
+def run(directory, shards, processes, writes):
+    store = load_patient_db_tool().open_sharded_store(directory, shards=shards)
+    store.migrate_database()
+    store.close()
+    start_at = time.time() + 2  # every process connected before the clock starts
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        elapsed = pool.starmap(writer, [(directory, w, writes, start_at) for w in range(processes)])
+    return processes * writes / max(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--writes", type=int, default=2000, help="Writes per process")
+    args = parser.parse_args()
+
+    print(f"{args.processes} writer process(es), {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>6}  {'commits/s':>10}  {'speedup':>7}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for shards in args.shards:
+            rate = run(os.path.join(tmp, f"shards-{shards}"), shards, args.processes, args.writes)
+            baseline = baseline or rate
+            print(f"{shards:>6}  {rate:>10.0f}  {rate / baseline:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Patient database microbenchmark suite.
+
+Generates synthetic patient databases at 1k/10k/100k/1M patients (with
+lab results and a mix of imaging payloads modelled on
+`scripts/populate_medical_images.py`), then measures latency percentiles
+and throughput of the public `patient_db_tool` functions under
+single-thread, multi-thread and multi-process load, and writes the results
+as JSON. `compare` checks a result file against a baseline and exits
+non-zero on regressions, so database changes can be gated on them.
+
+    python -m benchmarks.patient_db_suite run --scales 1k 10k --out results.json
+    python -m benchmarks.patient_db_suite compare baseline.json results.json --threshold 0.15
+
+Modules: `datasets` (generation, cached on disk), `workloads` (one
+operation per public function), `runner` (load modes), `results`
+(percentiles, JSON, regression checks).
+"""
+import importlib.util
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+
+
+def load_patient_db_tool():
+    """Loads medagent/patient_db_tool standalone, as the scripts do (no ADK import chain)."""
+    if "patient_db_tool" in sys.modules:
+        return sys.modules["patient_db_tool"]
+    pkg_path = ROOT / "medagent" / "patient_db_tool"
+    spec = importlib.util.spec_from_file_location(
+        "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["patient_db_tool"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,101 @@
+"""
+Command line for the patient database benchmark suite.
+
+    python -m benchmarks.patient_db_suite run --scales 1k 10k --workers 2 4 --out results.json
+    python -m benchmarks.patient_db_suite run --scales 100k --operations search_patients get_patient_data_from_db
+    python -m benchmarks.patient_db_suite compare baseline.json results.json --threshold 0.15
+
+`compare` exits with status 1 when any result regressed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from .datasets import DEFAULT_FILE_RATIO, DEFAULT_MAX_FILES, dataset_files, ensure_dataset, parse_scale
+from .results import METRICS, compare, format_table, load_results, write_results
+from .runner import MODES, run_scale
+from .workloads import MAINTENANCE, READ, WRITE, select_operations
+
+
+def cmd_run(args):
+    operations = select_operations(args.operations, args.groups)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="medagent-bench-") as work_dir:
+        for scale in args.scales:
+            patients = parse_scale(scale)
+            files = dataset_files(patients, args.file_ratio, args.max_files)
+            print(f"Dataset {scale}: {patients} patients, {files} files (cached in {args.data_dir})")
+            manifest = ensure_dataset(args.data_dir, patients, files, seed=args.seed)
+            results += run_scale(
+                scale,
+                manifest,
+                operations,
+                args.modes,
+                args.workers,
+                os.path.join(work_dir, scale),
+                seed=args.seed,
+                duration=args.duration,
+                max_ops=args.max_ops,
+            )
+    write_results(args.out, results, {k: v for k, v in vars(args).items() if k != "func"})
+    print()
+    print(format_table(results))
+    print(f"\nWrote {len(results)} result(s) to {args.out}")
+
+
+def cmd_compare(args):
+    regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold, args.metrics)
+    for r in regressions:
+        print(
+            f"REGRESSION {r['scale']} {r['operation']} {r['mode']} x{r['workers']} {r['metric']}:"
+            f" {r['baseline']:.3f} -> {r['current']:.3f} ({r['change']:+.0%})"
+        )
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.patient_db_suite",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the suite and write a JSON result file")
+    run.add_argument("--scales", nargs="+", default=["1k", "10k"], help="1k, 10k, 100k, 1m or a patient count")
+    run.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    run.add_argument("--workers", nargs="+", type=int, default=[4], help="Thread/process counts for the scaling curve")
+    run.add_argument("--operations", nargs="+", help="Only these operations (default: all)")
+    run.add_argument("--groups", nargs="+", choices=(READ, WRITE, MAINTENANCE), help="Only these operation groups")
+    run.add_argument("--duration", type=float, default=1.0, help="Seconds per operation, mode and worker count")
+    run.add_argument("--max-ops", type=int, default=10_000, help="Calls per worker at most")
+    run.add_argument("--file-ratio", type=float, default=DEFAULT_FILE_RATIO, help="Imaging files per patient")
+    run.add_argument("--max-files", type=int, default=DEFAULT_MAX_FILES, help="Imaging files per dataset at most")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "medagent-bench-data"),
+        help="Where generated datasets are cached",
+    )
+    run.add_argument("--out", default="patient_db_bench.json", help="Result file")
+    run.set_defaults(func=cmd_run)
+
+    comp = sub.add_parser("compare", help="Check results against a baseline; exit 1 on regressions")
+    comp.add_argument("baseline")
+    comp.add_argument("current")
+    comp.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown, as a fraction")
+    comp.add_argument("--metrics", nargs="+", choices=METRICS, default=["p50", "throughput"])
+    comp.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Synthetic benchmark datasets.
+
+A dataset of N patients has, for every patient, a vignette-style
+description with indexed metadata and a lab results string (so one lab
+version and parsed observations); a fraction of them also get imaging
+files. File payloads follow the mix `scripts/populate_medical_images.py`
+creates - a 512x512 chest X-ray PNG, 256x256 CT and MRI slice PNGs -
+plus short clinical notes and the occasional uncompressed NIfTI volume of
+a few MB. Each kind is drawn from a few pre-rendered variants and made
+unique per file (a PNG text chunk, the NIfTI description field), so the
+content-addressed blob store does not collapse them.
+
+Datasets are generated once per (patients, files, seed) and cached in the
+data directory: generating 1M patients takes minutes, copying the cached
+file does not.
+"""
+import json
+import os
+import random
+import struct
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Tuple
+
+from . import load_patient_db_tool
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Imaging files per patient, and a cap so 1M patients do not mean 100+ GB of payloads
+DEFAULT_FILE_RATIO = 0.05
+DEFAULT_MAX_FILES = 5_000
+
+SYMPTOMS = [
+    "chest pain", "dyspnea", "fever", "headache", "neck stiffness", "abdominal pain", "jaundice",
+    "syncope", "palpitations", "hemoptysis", "weight loss", "night sweats", "rash", "arthralgia",
+    "confusion", "polyuria", "edema", "cough", "diarrhea", "vomiting",
+]
+FINDINGS = [
+    "elevated troponin", "ST elevation", "low hemoglobin", "raised D-dimer", "leukocytosis",
+    "hyponatremia", "elevated lipase", "positive blood cultures", "bilateral infiltrates",
+    "papilledema", "splenomegaly", "hypotension", "tachycardia", "crackles at both bases",
+]
+BODY_SYSTEMS = ["Cardiovascular", "Respiratory", "Nervous", "Digestive", "Endocrine", "Skeletal", "Urinary"]
+TASKS = ["Diagnosis", "Treatment", "Basic Science"]
+QUESTION_TYPES = ["Multiple Choice", "Open Ended"]
+# (analyte, unit, normal range, abnormal range)
+ANALYTES = [
+    ("Troponin I", "ng/mL", (0.0, 0.04), (0.1, 5.0)),
+    ("WBC", "x10^9/L", (4.0, 11.0), (12.0, 30.0)),
+    ("Hemoglobin", "g/dL", (12.0, 17.0), (6.0, 10.0)),
+    ("Sodium", "mmol/L", (135.0, 145.0), (118.0, 130.0)),
+    ("Creatinine", "mg/dL", (0.6, 1.2), (1.5, 6.0)),
+    ("Lipase", "U/L", (10.0, 60.0), (200.0, 2000.0)),
+]
+
+# kind -> (file type, filename, MIME type, weight)
+FILE_KINDS = {
+    "chest_xray": ("chest_xray", "chest_xray_pa.png", "image/png", 0.25),
+    "ct_slice": ("CT", "ct_chest_slice.png", "image/png", 0.30),
+    "mri_slice": ("MRI", "mri_brain_slice.png", "image/png", 0.20),
+    "note": ("note", "clinical_note.txt", "text/plain", 0.20),
+    "volume": ("MRI", "mri_brain_t1.nii", None, 0.05),
+}
+_VARIANTS = 4
+
+
+def parse_scale(text: str) -> int:
+    """"10k" / "1m" / "2500" -> number of patients."""
+    return SCALES.get(text.lower()) or int(text)
+
+
+def patient_id(i: int) -> str:
+    return f"BENCH-{i:07d}"
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _png(rows: List[bytes], width: int) -> bytes:
+    ihdr = struct.pack(">IIBBBBB", width, len(rows), 8, 0, 0, 0, 0)
+    raw = b"".join(b"\x00" + row for row in rows)
+    return b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", ihdr) + _chunk(b"IDAT", zlib.compress(raw, 6)) + _chunk(b"IEND", b"")
+
+
+def _brighter(amount: int) -> bytes:
+    return bytes(min(v + amount, 255) for v in range(256))
+
+
+def chest_xray(rng: random.Random, size: int = 512) -> bytes:
+    """Noise with two brighter lung fields, as in create_sample_images."""
+    lungs = _brighter(50)
+    rows = []
+    for y in range(size):
+        row = bytearray(rng.randbytes(size))
+        if 150 <= y < 400:
+            row[100:200] = row[100:200].translate(lungs)
+            row[300:400] = row[300:400].translate(lungs)
+        rows.append(bytes(row))
+    return _png(rows, size)
+
+
+def ct_slice(rng: random.Random, size: int = 256) -> bytes:
+    lesion = _brighter(80)
+    rows = []
+    for y in range(size):
+        row = bytearray(rng.randbytes(size))
+        if 80 <= y < 180:
+            row[80:180] = row[80:180].translate(lesion)
+        rows.append(bytes(row))
+    return _png(rows, size)
+
+
+def mri_slice(rng: random.Random, size: int = 256) -> bytes:
+    """Mid-grey noise with a brighter disc ("brain")."""
+    base = bytes(50 + v * 150 // 256 for v in range(256))
+    brain = bytes(min(50 + v * 150 // 256 + 50, 255) for v in range(256))
+    rows = []
+    for y in range(size):
+        row = bytearray(rng.randbytes(size).translate(base))
+        half = int(max(0, 80 ** 2 - (y - size // 2) ** 2) ** 0.5)
+        if half:
+            lo, hi = size // 2 - half, size // 2 + half
+            row[lo:hi] = row[lo:hi].translate(brain)
+        rows.append(bytes(row))
+    return _png(rows, size)
+
+
+def nifti_volume(rng: random.Random, dims: Tuple[int, int, int] = (128, 128, 64)) -> bytes:
+    """Uncompressed int16 NIfTI-1 volume (noise)."""
+    header = bytearray(348)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, 3, *dims, 1, 1, 1, 1)
+    struct.pack_into("<hh", header, 70, 4, 16)  # INT16
+    struct.pack_into("<8f", header, 76, 1, 1.0, 1.0, 2.5, 1, 1, 1, 1)
+    struct.pack_into("<f", header, 108, 352.0)
+    header[123] = 2  # mm
+    header[344:348] = b"n+1\x00"
+    return bytes(header) + bytes(4) + rng.randbytes(2 * dims[0] * dims[1] * dims[2])
+
+
+def clinical_note(rng: random.Random) -> bytes:
+    lines = [
+        f"Presented with {', '.join(rng.sample(SYMPTOMS, 3))}. Workup showed {' and '.join(rng.sample(FINDINGS, 2))}."
+        for _ in range(rng.randint(10, 60))
+    ]
+    return "\n".join(lines).encode()
+
+
+class PayloadFactory:
+    """Unique payloads of every kind in FILE_KINDS, drawn from a few pre-rendered variants."""
+
+    def __init__(self, seed: int = 0):
+        rng = random.Random(seed)
+        self._variants = {
+            "chest_xray": [chest_xray(rng) for _ in range(_VARIANTS)],
+            "ct_slice": [ct_slice(rng) for _ in range(_VARIANTS)],
+            "mri_slice": [mri_slice(rng) for _ in range(_VARIANTS)],
+            "volume": [nifti_volume(rng) for _ in range(2)],
+        }
+        self._kinds = list(FILE_KINDS)
+        self._weights = [FILE_KINDS[k][3] for k in self._kinds]
+
+    def choose_kind(self, rng: random.Random) -> str:
+        return rng.choices(self._kinds, self._weights)[0]
+
+    def make(self, kind: str, rng: random.Random, tag: str) -> bytes:
+        if kind == "note":
+            return clinical_note(rng)
+        base = rng.choice(self._variants[kind])
+        if kind == "volume":  # descrip (80 bytes at offset 148)
+            return base[:148] + tag.encode()[:80].ljust(80, b"\x00") + base[228:]
+        # A tEXt chunk right after IHDR (8 + 25 bytes)
+        return base[:33] + _chunk(b"tEXt", b"Comment\x00" + tag.encode()) + base[33:]
+
+    def file_record(self, rng: random.Random, patient: str, tag: str) -> Dict[str, Any]:
+        kind = self.choose_kind(rng)
+        file_type, filename, mime_type, _ = FILE_KINDS[kind]
+        return {
+            "patient_id": patient,
+            "type": file_type,
+            "data": self.make(kind, rng, tag),
+            "filename": filename,
+            "mime_type": mime_type,
+        }
+
+
+def lab_results_string(rng: random.Random) -> str:
+    entries = []
+    for name, unit, normal, abnormal in rng.sample(ANALYTES, rng.randint(2, 4)):
+        if rng.random() < 0.3:
+            flag = "HIGH" if abnormal[0] > normal[1] else "LOW"
+            entries.append(f"{name}: {rng.uniform(*abnormal):.2f} {unit} [{flag}]")
+        else:
+            entries.append(f"{name}: {rng.uniform(*normal):.2f} {unit}")
+    return "; ".join(entries)
+
+
+def iter_patients(n: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {
+            "patient_id": patient_id(i),
+            "description": (
+                f"A {rng.randint(18, 90)}-year-old {rng.choice(['man', 'woman'])} presents with"
+                f" {', '.join(rng.sample(SYMPTOMS, 3))} for {rng.randint(1, 14)} days."
+                f" Workup shows {' and '.join(rng.sample(FINDINGS, 2))}."
+            ),
+            "metadata": {
+                "body_system": rng.choice(BODY_SYSTEMS),
+                "medical_task": rng.choice(TASKS),
+                "question_type": rng.choice(QUESTION_TYPES),
+            },
+        }
+
+
+def iter_labs(n: int, seed: int = 0) -> Iterator[Tuple[str, str]]:
+    rng = random.Random(seed + 1)
+    for i in range(n):
+        yield patient_id(i), lab_results_string(rng)
+
+
+def iter_files(n_patients: int, n_files: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed + 2)
+    factory = PayloadFactory(seed)
+    for i in range(n_files):
+        yield factory.file_record(rng, patient_id(rng.randrange(n_patients)), f"bench-file-{i}")
+
+
+def dataset_files(patients: int, file_ratio: float = DEFAULT_FILE_RATIO, max_files: int = DEFAULT_MAX_FILES) -> int:
+    return min(int(patients * file_ratio), max_files)
+
+
+def ensure_dataset(
+    data_dir: str,
+    patients: int,
+    files: int,
+    seed: int = 0,
+    batch_size: int = 5_000,
+) -> Dict[str, Any]:
+    """The manifest of a cached dataset, generating it first if needed.
+
+    The manifest (`<name>.json` next to `<name>.sqlite`) has `path`,
+    `patients`, `files`, a sample of file ids and the patients that own
+    them, and how long generation took.
+    """
+    name = f"patients-{patients}-files-{files}-seed-{seed}"
+    path = os.path.join(data_dir, f"{name}.sqlite")
+    manifest_path = os.path.join(data_dir, f"{name}.json")
+    if os.path.exists(manifest_path) and os.path.exists(path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    os.makedirs(data_dir, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = load_patient_db_tool()
+    db.configure(path, derivatives="off")
+    start = time.perf_counter()
+    try:
+        db.migrate_database()
+        db.store_patients_bulk(iter_patients(patients, seed), batch_size=batch_size)
+        db.store_lab_results_bulk(iter_labs(patients, seed), batch_size=batch_size)
+        db.store_files_bulk(iter_files(patients, files, seed), batch_size=50)
+        conn = db.connection.connection()
+        conn.execute("ANALYZE")
+        sample = conn.execute(
+            "SELECT file_id, patient_id FROM patient_files ORDER BY file_id LIMIT 1000"
+        ).fetchall()
+    finally:
+        db.close_connections()
+    manifest = {
+        "path": path,
+        "patients": patients,
+        "files": files,
+        "seed": seed,
+        "file_ids": [row[0] for row in sample],
+        "file_patients": sorted({row[1] for row in sample}),
+        "bytes": os.path.getsize(path),
+        "generate_seconds": time.perf_counter() - start,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return manifest
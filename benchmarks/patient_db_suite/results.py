@@ -0,0 +1,143 @@
+"""
+Benchmark results: latency percentiles, the JSON result file, and regression checks.
+
+A result file is
+
+    {"meta": {...environment and arguments...},
+     "results": [{"scale", "patients", "operation", "group", "mode", "workers",
+                  "ops", "errors", "seconds", "throughput",
+                  "latency_ms": {"mean", "p50", "p90", "p95", "p99", "max"}}, ...]}
+
+with one result per (scale, operation, mode, workers). `compare` matches
+results of two files on that key.
+"""
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from . import ROOT
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Latency metrics regress when they grow, throughput when it shrinks
+METRICS = ("p50", "p90", "p95", "p99", "throughput")
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, Optional[float]]:
+    """Mean, nearest-rank percentiles and max of latencies in seconds, in milliseconds."""
+    if not samples:
+        return {"mean": None, **{f"p{p}": None for p in PERCENTILES}, "max": None}
+    ordered = sorted(samples)
+    summary = {"mean": sum(ordered) / len(ordered) * 1000}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] * 1000
+    summary["max"] = ordered[-1] * 1000
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10, check=True
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip()
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(path: str, results: List[Dict[str, Any]], args: Dict[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"meta": {**environment(), "args": args}, "results": results}, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _key(result: Dict[str, Any]) -> Tuple[str, str, str, int]:
+    return result["scale"], result["operation"], result["mode"], result["workers"]
+
+
+def _value(result: Dict[str, Any], metric: str) -> Optional[float]:
+    return result["throughput"] if metric == "throughput" else result["latency_ms"].get(metric)
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.10,
+    metrics: Iterable[str] = ("p50", "throughput"),
+) -> List[Dict[str, Any]]:
+    """Regressions of `current` against `baseline`: metrics worse by more than `threshold` (a fraction).
+
+    Each regression names the result (scale, operation, mode, workers),
+    the metric, both values and the relative change. Results present in
+    only one file are skipped.
+    """
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metric(s): {', '.join(sorted(unknown))}")
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = base.get(_key(result))
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = _value(before, metric), _value(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric == "throughput" else change
+            if worse > threshold:
+                scale, operation, mode, workers = _key(result)
+                regressions.append({
+                    "scale": scale,
+                    "operation": operation,
+                    "mode": mode,
+                    "workers": workers,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": change,
+                })
+    return regressions
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    """A fixed-width summary: one line per result."""
+    lines = [
+        f"{'scale':>6}  {'operation':<32} {'mode':<9} {'workers':>7}  {'ops/s':>10}  "
+        f"{'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'errors':>6}"
+    ]
+
+    def ms(value: Optional[float]) -> str:
+        return f"{value:>8.3f}" if value is not None else f"{'-':>8}"
+
+    for r in results:
+        latency = r["latency_ms"]
+        lines.append(
+            f"{r['scale']:>6}  {r['operation']:<32} {r['mode']:<9} {r['workers']:>7}  {r['throughput']:>10.1f}  "
+            f"{ms(latency['p50'])}  {ms(latency['p95'])}  {ms(latency['p99'])}  {r['errors']:>6}"
+        )
+    return "\n".join(lines)
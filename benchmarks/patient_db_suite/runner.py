@@ -0,0 +1,215 @@
+"""
+Runs benchmark operations under load.
+
+- "single": one thread issuing calls back to back.
+- "threads": N threads in this process, sharing the connection manager
+  (one pooled connection per thread).
+- "processes": N spawned processes, each with its own manager, like
+  several `adk web` workers on one database file.
+
+Every worker prepares its arguments untimed, times each call with
+`perf_counter`, and runs for `duration` seconds or `max_ops` calls,
+whichever comes first. All workers of a run start together (a barrier for
+threads, a shared start time for processes) after opening their
+connections; throughput is successful calls over the wall time from the
+common start to the last worker finishing.
+"""
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import load_patient_db_tool
+from .results import latency_summary
+from .workloads import (
+    MAINTENANCE,
+    OPERATIONS_BY_NAME,
+    Operation,
+    WorkloadContext,
+    close_sharded_stores,
+    prepare_sharded_copy,
+)
+
+MODES = ("single", "threads", "processes")
+
+# Processes need a moment to import and connect before the common start
+_PROCESS_START_DELAY = 2.0
+
+# (latencies in seconds, errors, first error, start, end)
+WorkerResult = Tuple[List[float], int, Optional[str], float, float]
+
+
+def _loop(op: Operation, ctx: WorkloadContext, duration: float, max_ops: int) -> WorkerResult:
+    samples: List[float] = []
+    errors, first_error = 0, None
+    started = time.time()
+    deadline = time.perf_counter() + duration
+    while len(samples) + errors < max_ops and time.perf_counter() < deadline:
+        arg = op.prepare(ctx)
+        start = time.perf_counter()
+        try:
+            op.call(ctx, arg)
+        except Exception as e:
+            errors += 1
+            first_error = first_error or f"{type(e).__name__}: {e}"
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples, errors, first_error, started, time.time()
+
+
+def _process_worker(
+    db_path: str,
+    manifest: Dict[str, Any],
+    op_name: str,
+    worker: int,
+    seed: int,
+    duration: float,
+    max_ops: int,
+    start_at: float,
+    scratch_dir: str,
+) -> WorkerResult:
+    db = load_patient_db_tool()
+    db.configure(db_path, derivatives="off")
+    ctx = WorkloadContext(manifest, worker, seed, scratch_dir)
+    db.connection.connection()
+    while time.time() < start_at:
+        time.sleep(0.001)
+    try:
+        return _loop(OPERATIONS_BY_NAME[op_name], ctx, duration, max_ops)
+    finally:
+        close_sharded_stores()
+        db.shutdown_writer()
+        db.close_connections()
+
+
+def _run_threads(
+    op: Operation, manifest: Dict[str, Any], workers: int, seed: int, duration: float, max_ops: int, scratch_dir: str
+) -> List[WorkerResult]:
+    barrier = threading.Barrier(workers)
+    results: List[Optional[WorkerResult]] = [None] * workers
+
+    def worker(index: int) -> None:
+        ctx = WorkloadContext(manifest, index, seed, scratch_dir)
+        ctx.db.connection.connection()
+        barrier.wait()
+        results[index] = _loop(op, ctx, duration, max_ops)
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f"bench-{i}") for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _run_processes(
+    op: Operation,
+    db_path: str,
+    manifest: Dict[str, Any],
+    workers: int,
+    seed: int,
+    duration: float,
+    max_ops: int,
+    scratch_dir: str,
+) -> List[WorkerResult]:
+    start_at = time.time() + _PROCESS_START_DELAY
+    args = [(db_path, manifest, op.name, w, seed, duration, max_ops, start_at, scratch_dir) for w in range(workers)]
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        return pool.starmap(_process_worker, args)
+
+
+def run_operation(
+    op: Operation,
+    db_path: str,
+    manifest: Dict[str, Any],
+    mode: str,
+    workers: int = 1,
+    seed: int = 0,
+    duration: float = 1.0,
+    max_ops: int = 10_000,
+    scratch_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Runs one operation in one load mode against `db_path`; returns its result (without scale)."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}, not {mode!r}")
+    scratch_dir = scratch_dir or os.path.dirname(db_path)
+    if op.group == MAINTENANCE:
+        mode, workers, max_ops = "single", 1, 1
+    if mode == "single":
+        workers = 1
+    if mode == "processes":
+        worker_results = _run_processes(op, db_path, manifest, workers, seed, duration, max_ops, scratch_dir)
+    else:
+        worker_results = _run_threads(op, manifest, workers, seed, duration, max_ops, scratch_dir)
+
+    samples = [s for result in worker_results for s in result[0]]
+    errors = sum(result[1] for result in worker_results)
+    first_error = next((result[2] for result in worker_results if result[2]), None)
+    seconds = max(result[4] for result in worker_results) - min(result[3] for result in worker_results)
+    result = {
+        "operation": op.name,
+        "group": op.group,
+        "mode": mode,
+        "workers": workers,
+        "ops": len(samples),
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": len(samples) / seconds if seconds > 0 else 0.0,
+        "latency_ms": latency_summary(samples),
+    }
+    if first_error:
+        result["first_error"] = first_error
+    return result
+
+
+def prepare_working_copy(manifest: Dict[str, Any], work_dir: str) -> str:
+    """Copies a cached dataset into `work_dir` so the run's writes never touch the cache."""
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, os.path.basename(manifest["path"]))
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(manifest["path"], path)
+    return path
+
+
+def run_scale(
+    scale: str,
+    manifest: Dict[str, Any],
+    operations: List[Operation],
+    modes: List[str],
+    workers: List[int],
+    work_dir: str,
+    seed: int = 0,
+    duration: float = 1.0,
+    max_ops: int = 10_000,
+    progress=print,
+) -> List[Dict[str, Any]]:
+    """Every operation in every mode (and worker count) against a fresh copy of one dataset."""
+    db = load_patient_db_tool()
+    db_path = prepare_working_copy(manifest, work_dir)
+    db.configure(db_path, derivatives="off")
+    results = []
+    try:
+        if any(op.sharded for op in operations):
+            prepare_sharded_copy(db_path, work_dir)
+        for op in operations:
+            runs = [("single", 1)] if op.group == MAINTENANCE else [
+                (mode, 1 if mode == "single" else n) for mode in modes for n in ([1] if mode == "single" else workers)
+            ]
+            for mode, n in runs:
+                result = run_operation(op, db_path, manifest, mode, n, seed, duration, max_ops, work_dir)
+                result = {"scale": scale, "patients": manifest["patients"], **result}
+                results.append(result)
+                if progress:
+                    progress(
+                        f"{scale:>6} {op.name:<32} {mode:<9} x{n:<3} {result['throughput']:>10.1f} ops/s"
+                        f"  p50 {result['latency_ms']['p50'] or 0:.3f} ms"
+                    )
+    finally:
+        close_sharded_stores()
+        db.shutdown_writer()
+        db.close_connections()
+    return results
@@ -0,0 +1,307 @@
+"""
+One benchmark operation per public `patient_db_tool` function.
+
+Each operation has a `prepare` step (not timed) that picks its arguments -
+a random dataset patient, a stored file id, a fresh patient id for writes -
+and a `call` that is timed. Writes only ever create new `BW-` patients or
+append to existing ones, so reads keep seeing the generated dataset.
+Maintenance operations (backup, index rebuild, blob GC, reshard) run once
+per scale rather than under load.
+
+`ShardedPatientStore.*` operations run against a sharded copy of the
+dataset (`SHARDS` shards under the work directory), made untimed by the
+runner before the first of them.
+"""
+import io
+import itertools
+import os
+import random
+import shutil
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from . import load_patient_db_tool
+from .datasets import BODY_SYSTEMS, FINDINGS, SYMPTOMS, TASKS, ct_slice, lab_results_string, patient_id
+
+READ = "read"
+WRITE = "write"
+MAINTENANCE = "maintenance"
+
+# Shard count and directory (under the work directory) of the sharded copy
+SHARDS = 4
+SHARD_DIR = "shards"
+
+# One open store per shard directory and process, shared by its worker threads
+_sharded_stores: Dict[str, Any] = {}
+_sharded_lock = threading.Lock()
+
+
+class WorkloadContext:
+    """Per-worker state: an RNG, the dataset's ids and a source of new patient ids."""
+
+    def __init__(self, manifest: Dict[str, Any], worker: int, seed: int = 0, scratch_dir: Optional[str] = None):
+        self.db = load_patient_db_tool()
+        self.rng = random.Random(seed * 1000 + worker)
+        self.patients = manifest["patients"]
+        self.file_ids: List[int] = manifest["file_ids"]
+        self.file_patients: List[str] = manifest["file_patients"]
+        self.scratch_dir = scratch_dir
+        self.tag = f"{os.getpid()}-{worker}"
+        self._ids = itertools.count()
+        self.image = ct_slice(random.Random(seed), size=128)
+
+    def patient(self) -> str:
+        return patient_id(self.rng.randrange(self.patients))
+
+    def patient_with_files(self) -> str:
+        return self.rng.choice(self.file_patients) if self.file_patients else self.patient()
+
+    def file_id(self) -> int:
+        return self.rng.choice(self.file_ids) if self.file_ids else 1
+
+    def new_patient(self) -> str:
+        return f"BW-{self.tag}-{next(self._ids)}"
+
+    def search_query(self) -> str:
+        return self.rng.choice(SYMPTOMS + FINDINGS)
+
+    def sharded(self):
+        """The sharded copy of the dataset (see `prepare_sharded_copy`)."""
+        directory = os.path.join(self.scratch_dir, SHARD_DIR)
+        with _sharded_lock:
+            if directory not in _sharded_stores:
+                _sharded_stores[directory] = self.db.open_sharded_store(directory, derivatives="off")
+            return _sharded_stores[directory]
+
+    def image_path(self) -> str:
+        """The benchmark image as a file on disk (written once per worker)."""
+        path = os.path.join(self.scratch_dir, f"ct-{self.tag}.png")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(self.image)
+        return path
+
+
+def prepare_sharded_copy(db_path: str, work_dir: str, shards: int = SHARDS) -> str:
+    """Reshards the working copy at `db_path` into `work_dir`/SHARD_DIR (replacing an earlier one)."""
+    directory = os.path.join(work_dir, SHARD_DIR)
+    close_sharded_stores()
+    shutil.rmtree(directory, ignore_errors=True)
+    load_patient_db_tool().reshard(db_path, directory, shards)
+    return directory
+
+
+def close_sharded_stores() -> None:
+    with _sharded_lock:
+        stores = list(_sharded_stores.values())
+        _sharded_stores.clear()
+    for store in stores:
+        store.close()
+
+
+@dataclass
+class Operation:
+    name: str
+    group: str
+    call: Callable[[WorkloadContext, Any], Any]
+    prepare: Callable[[WorkloadContext], Any] = field(default=lambda ctx: None)
+
+    @property
+    def sharded(self) -> bool:
+        return self.name.startswith("ShardedPatientStore.")
+
+
+def _new_file(ctx: WorkloadContext) -> int:
+    return ctx.db.store_patient_file_in_db(ctx.new_patient(), "CT", ctx.image, filename="ct.png")
+
+
+def _patient(ctx: WorkloadContext) -> str:
+    return ctx.patient()
+
+
+def _patient_with_files(ctx: WorkloadContext) -> str:
+    return ctx.patient_with_files()
+
+
+def _file(ctx: WorkloadContext) -> int:
+    return ctx.file_id()
+
+
+def _read_head(ctx: WorkloadContext, file_id: int) -> bytes:
+    with ctx.db.open_patient_file(file_id) as f:
+        return f.read(64 * 1024)
+
+
+def _blob_garbage(ctx: WorkloadContext):
+    """A copy of the dataset with its payloads in a blob store and every other file deleted."""
+    path = os.path.join(ctx.scratch_dir, f"gc-{ctx.tag}.sqlite")
+    blob_dir = os.path.join(ctx.scratch_dir, f"gc-{ctx.tag}-blobs")
+    shutil.rmtree(blob_dir, ignore_errors=True)
+    ctx.db.backup_database(path)
+    manager = ctx.db.ConnectionManager(path, blob_store_dir=blob_dir, derivatives="off")
+    with ctx.db.use_manager(manager):
+        ctx.db.externalize_patient_files()
+        for file_id in ctx.file_ids[::2]:
+            ctx.db.delete_patient_file(file_id)
+    return manager
+
+
+def _collect_blob_garbage(ctx: WorkloadContext, manager) -> int:
+    try:
+        with ctx.db.use_manager(manager):
+            return ctx.db.collect_blob_garbage()
+    finally:
+        manager.close_all()
+
+
+def _reshard_paths(ctx: WorkloadContext):
+    dest = os.path.join(ctx.scratch_dir, f"reshard-{ctx.tag}")
+    shutil.rmtree(dest, ignore_errors=True)
+    return ctx.db.get_db_path(), dest
+
+
+def _first_page(ctx: WorkloadContext, after: str) -> List[Dict[str, Any]]:
+    return list(itertools.islice(ctx.db.iter_patients_with_files(page_size=100, after=after), 100))
+
+
+OPERATIONS: List[Operation] = [
+    # Single-patient reads
+    Operation("get_patient_data_from_db", READ, lambda ctx, p: ctx.db.get_patient_data_from_db(p), _patient),
+    # Dataset patients all exist, so this never creates one; the creating path is benchmarked as a write
+    Operation("get_or_create_patient_data", READ, lambda ctx, p: ctx.db.get_or_create_patient_data(p), _patient),
+    Operation("get_latest_lab", READ, lambda ctx, p: ctx.db.get_latest_lab(p, "WBC"), _patient),
+    Operation("get_lab_history", READ, lambda ctx, p: ctx.db.get_lab_history(p, "WBC"), _patient),
+    Operation("get_abnormal_labs", READ, lambda ctx, p: ctx.db.get_abnormal_labs(p), _patient),
+    Operation("get_lab_results_history", READ, lambda ctx, p: ctx.db.get_lab_results_history(p), _patient),
+    Operation("list_patient_files", READ, lambda ctx, p: ctx.db.list_patient_files(p), _patient_with_files),
+    Operation("get_patient_file_from_db", READ, lambda ctx, p: ctx.db.get_patient_file_from_db(p), _patient_with_files),
+    # Files by id
+    Operation("get_patient_file_by_id", READ, lambda ctx, f: ctx.db.get_patient_file_by_id(f), _file),
+    Operation("get_patient_file_info", READ, lambda ctx, f: ctx.db.get_patient_file_info(f), _file),
+    Operation("open_patient_file", READ, _read_head, _file),
+    Operation("iter_patient_file_chunks", READ, lambda ctx, f: b"".join(ctx.db.iter_patient_file_chunks(f)), _file),
+    Operation("get_file_header", READ, lambda ctx, f: ctx.db.get_file_header(f, generate=False), _file),
+    Operation("get_file_derivative", READ, lambda ctx, f: ctx.db.get_file_derivative(f, generate=False), _file),
+    # Across patients
+    Operation(
+        "get_patients_bulk", READ,
+        lambda ctx, ids: ctx.db.get_patients_bulk(ids),
+        lambda ctx: [ctx.patient() for _ in range(50)],
+    ),
+    Operation("search_patients", READ, lambda ctx, q: ctx.db.search_patients(q), lambda ctx: ctx.search_query()),
+    Operation(
+        "query_patients", READ,
+        lambda ctx, f: ctx.db.query_patients(limit=100, **f),
+        lambda ctx: {"body_system": ctx.rng.choice(BODY_SYSTEMS), "medical_task": ctx.rng.choice(TASKS)},
+    ),
+    Operation(
+        "count_patients", READ,
+        lambda ctx, system: ctx.db.count_patients(body_system=system),
+        lambda ctx: ctx.rng.choice(BODY_SYSTEMS),
+    ),
+    Operation(
+        "query_imaging_files", READ,
+        lambda ctx, p: ctx.db.query_imaging_files(patient_id=p),
+        _patient_with_files,
+    ),
+    Operation("iter_patients_with_files", READ, _first_page, _patient),
+    # Writes
+    Operation(
+        "store_patient_data_in_db", WRITE,
+        lambda ctx, p: ctx.db.store_patient_data_in_db(p, "Synthetic write", {"body_system": "Cardiovascular"}),
+        lambda ctx: ctx.new_patient(),
+    ),
+    Operation(
+        "get_or_create_patient_data:create", WRITE,
+        lambda ctx, p: ctx.db.get_or_create_patient_data(p, "Synthetic write"),
+        lambda ctx: ctx.new_patient(),
+    ),
+    Operation(
+        "store_patient_lab_results_in_db", WRITE,
+        lambda ctx, args: ctx.db.store_patient_lab_results_in_db(*args),
+        lambda ctx: (ctx.patient(), lab_results_string(ctx.rng)),
+    ),
+    Operation(
+        "store_lab_observations", WRITE,
+        lambda ctx, args: ctx.db.store_lab_observations(*args),
+        lambda ctx: (ctx.new_patient(), ctx.db.parse_lab_results_string(lab_results_string(ctx.rng))),
+    ),
+    Operation(
+        "store_patient_file_in_db", WRITE,
+        lambda ctx, p: ctx.db.store_patient_file_in_db(p, "CT", ctx.image, filename="ct.png"),
+        lambda ctx: ctx.new_patient(),
+    ),
+    Operation(
+        "store_patient_file_stream", WRITE,
+        lambda ctx, p: ctx.db.store_patient_file_stream(p, "CT", io.BytesIO(ctx.image), filename="ct.png"),
+        lambda ctx: ctx.new_patient(),
+    ),
+    Operation(
+        "store_patient_file_from_path", WRITE,
+        lambda ctx, args: ctx.db.store_patient_file_from_path(*args, mime_type="image/png"),
+        lambda ctx: (ctx.new_patient(), "CT", ctx.image_path()),
+    ),
+    Operation(
+        "enqueue_patient_file", WRITE,
+        lambda ctx, p: ctx.db.resolve_pending_file(ctx.db.enqueue_patient_file(p, "CT", ctx.image, filename="ct.png")),
+        lambda ctx: ctx.new_patient(),
+    ),
+    Operation("delete_patient_file", WRITE, lambda ctx, f: ctx.db.delete_patient_file(f), _new_file),
+    Operation(
+        "store_patients_bulk", WRITE,
+        lambda ctx, rows: ctx.db.store_patients_bulk(rows),
+        lambda ctx: [(ctx.new_patient(), "Synthetic bulk write", {"body_system": "Respiratory"}) for _ in range(100)],
+    ),
+    Operation(
+        "store_lab_results_bulk", WRITE,
+        lambda ctx, rows: ctx.db.store_lab_results_bulk(rows),
+        lambda ctx: [(ctx.patient(), lab_results_string(ctx.rng)) for _ in range(100)],
+    ),
+    Operation(
+        "store_files_bulk", WRITE,
+        lambda ctx, files: ctx.db.store_files_bulk(files),
+        lambda ctx: [{"patient_id": ctx.new_patient(), "type": "CT", "data": ctx.image} for _ in range(10)],
+    ),
+    # The sharded copy: a routed read, a fan-out read and a routed write
+    Operation(
+        "ShardedPatientStore.get_patient_data_from_db", READ,
+        lambda ctx, p: ctx.sharded().get_patient_data_from_db(p),
+        _patient,
+    ),
+    Operation(
+        "ShardedPatientStore.search_patients", READ,
+        lambda ctx, q: ctx.sharded().search_patients(q),
+        lambda ctx: ctx.search_query(),
+    ),
+    Operation(
+        "ShardedPatientStore.store_patient_lab_results_in_db", WRITE,
+        lambda ctx, args: ctx.sharded().store_patient_lab_results_in_db(*args),
+        lambda ctx: (ctx.patient(), lab_results_string(ctx.rng)),
+    ),
+    # Once per scale
+    Operation(
+        "backup_database", MAINTENANCE,
+        lambda ctx, dest: ctx.db.backup_database(dest),
+        lambda ctx: os.path.join(ctx.scratch_dir, f"backup-{ctx.tag}.sqlite"),
+    ),
+    Operation("rebuild_search_index", MAINTENANCE, lambda ctx, _: ctx.db.rebuild_search_index()),
+    Operation("collect_blob_garbage", MAINTENANCE, _collect_blob_garbage, _blob_garbage),
+    Operation(
+        "reshard", MAINTENANCE,
+        lambda ctx, paths: ctx.db.reshard(*paths, shards=SHARDS),
+        _reshard_paths,
+    ),
+]
+OPERATIONS_BY_NAME = {op.name: op for op in OPERATIONS}
+
+
+def select_operations(names: Optional[List[str]] = None, groups: Optional[List[str]] = None) -> List[Operation]:
+    """Operations by name and/or group (all of them by default), in suite order."""
+    unknown = set(names or ()) - set(OPERATIONS_BY_NAME)
+    if unknown:
+        raise ValueError(f"Unknown operation(s): {', '.join(sorted(unknown))}")
+    return [
+        op for op in OPERATIONS
+        if (not names or op.name in names) and (not groups or op.group in groups)
+    ]
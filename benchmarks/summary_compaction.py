@@ -0,0 +1,166 @@
+"""
+Benchmark: prompt size of get_patient_summary, full vs. token-budgeted.
+
+Replays diagnostic sessions turn by turn - each turn is the session state
+delta written since the previous summary - and renders the summary after
+every turn, once in full and once under each token budget. Reports the
+final and cumulative (summed over turns, i.e. what the root agent's
+prompts carried) estimated tokens, the saving, and render time.
+
+Sessions are JSON lines, {"name": ..., "turns": [{state key: value}, ...]};
+without --sessions, synthetic ones are generated in the shape the agents
+write them (evidence lab dicts, imaging report dumps, the hypothesis
+agent's full DDx text appended every loop) and can be saved with --save.
+
+    python benchmarks/summary_compaction.py --loops 5 10 20 --budgets 500 1000 2000
+    python benchmarks/summary_compaction.py --sessions recorded.jsonl --budgets 1000
+"""
+import argparse
+import importlib
+import json
+import pathlib
+import random
+import statistics
+import sys
+import time
+import types
+
+# medagent/ as a stand-in package, so summary.py and the modules it imports
+# load without the package's ADK imports
+standalone = types.ModuleType("medagent_standalone")
+standalone.__path__ = [str(pathlib.Path(__file__).resolve().parents[1] / "medagent")]
+sys.modules["medagent_standalone"] = standalone
+summary = importlib.import_module("medagent_standalone.summary")
+
+CASES = [
+    ("Chest pain radiating to the left arm, diaphoresis", ["NSTEMI", "Unstable angina", "Pulmonary embolism",
+                                                           "Aortic dissection", "Pericarditis"]),
+    ("Fever, productive cough and pleuritic pain", ["Community-acquired pneumonia", "Pulmonary embolism",
+                                                    "Acute bronchitis", "Lung abscess", "Tuberculosis"]),
+    ("Sudden severe headache and neck stiffness", ["Subarachnoid hemorrhage", "Bacterial meningitis",
+                                                   "Migraine", "Cerebral venous thrombosis"]),
+]
+LABS = {
+    "WBC": (4.5, 11.0, "K/uL"), "HGB": (13.5, 17.5, "g/dL"), "NA": (135, 145, "mmol/L"), "K": (3.5, 5.0, "mmol/L"),
+    "CREATININE": (0.7, 1.3, "mg/dL"), "TROPONIN": (0.0, 0.04, "ng/mL"), "D-DIMER": (0.0, 0.5, "mg/L FEU"),
+    "LACTATE": (0.5, 2.2, "mmol/L"), "CRP": (0.0, 10.0, "mg/L"), "GLUCOSE": (70, 100, "mg/dL"),
+}
+REGIONS = [("XRAY", "Chest"), ("CT", "Chest"), ("CT", "Head"), ("US", "Abdomen"), ("MRI", "Head")]
+
+
+def _lab(rng):
+    test = rng.choice(list(LABS))
+    low, high, unit = LABS[test]
+    flag = rng.choices(["NORMAL", "HIGH", "LOW"], [6, 3, 1])[0]
+    value = {"NORMAL": rng.uniform(low, high), "HIGH": high * rng.uniform(1.1, 3), "LOW": low * rng.uniform(0.5, 0.9)}
+    return {
+        "test": test, "value": round(value[flag], 2), "unit": unit, "flag": flag, "low": low, "high": high,
+        "subject_id": 10000032, "hadm_id": 22595853,
+    }
+
+
+def _imaging(rng, index):
+    modality, region = rng.choice(REGIONS)
+    normal = rng.random() < 0.6
+    return {
+        "id": f"rpt-{index:04d}", "modality": modality, "region": region,
+        "findings": "No acute abnormality identified. Normal study." if normal
+        else "Focal consolidation in the right lower lobe with air bronchograms and a small effusion.",
+        "impression": "Normal." if normal else "Right lower lobe pneumonia with parapneumonic effusion.",
+        "timestamp": f"2026-01-01T{index % 24:02d}:00:00",
+    }
+
+
+def _hypothesis(rng, conditions):
+    ranked = rng.sample(conditions, k=min(4, len(conditions)))
+    return json.dumps([
+        {
+            "Condition": c,
+            "Probability": p,
+            "Reasoning": f"{c} fits the presentation and the results so far; keep on the differential and "
+                         f"correlate with further imaging and serial labs before narrowing.",
+        }
+        for c, p in zip(ranked, ["High", "Med", "Med", "Low"])
+    ])
+
+
+def synthetic_session(rng, loops):
+    complaint, conditions = rng.choice(CASES)
+    turns = [{
+        "patient_age": rng.randint(25, 85), "patient_sex": rng.choice(["Male", "Female"]),
+        "location": "ED", "chief_complaint": complaint,
+        "history_present_illness": f"{complaint}, onset 6 hours ago, progressively worsening.",
+        "vitals": {"hr": rng.randint(70, 130), "bp": f"{rng.randint(85, 150)}/{rng.randint(50, 95)}",
+                   "spo2": rng.randint(88, 99), "temp_c": round(rng.uniform(36.5, 39.5), 1)},
+    }]
+    labs, imaging, ddx = [], [], []
+    previous = None
+    for loop in range(loops):
+        labs = labs + [_lab(rng) for _ in range(rng.randint(2, 4))]
+        turn = {"lab_results": labs, "diagnostic_loop_count": loop + 1}
+        if rng.random() < 0.4:
+            imaging = imaging + [_imaging(rng, loop)]
+            turn["imaging_reports"] = imaging
+        # The hypothesis agent often restates its previous list unchanged
+        hypothesis = previous if previous and rng.random() < 0.4 else _hypothesis(rng, conditions)
+        previous = hypothesis
+        ddx = ddx + [hypothesis]
+        turn["differential_diagnosis"] = ddx
+        turns.append(turn)
+    return {"name": f"synthetic-{loops}-loops", "turns": turns}
+
+
+def replay(session, budgets):
+    """Per budget (None: full): final tokens, summed tokens and mean render ms over the session's turns."""
+    states = {budget: {} for budget in budgets}
+    totals = {budget: {"final": 0, "sum": 0, "ms": []} for budget in budgets}
+    for turn in session["turns"]:
+        for budget in budgets:
+            states[budget].update(turn)
+            start = time.perf_counter()
+            text = summary.render_summary(states[budget], budget)
+            totals[budget]["ms"].append((time.perf_counter() - start) * 1000)
+            tokens = summary.estimate_tokens(text)
+            totals[budget]["final"] = tokens
+            totals[budget]["sum"] += tokens
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", help="JSON lines file of recorded sessions")
+    parser.add_argument(
+        "--loops", type=int, nargs="+", default=[5, 10, 20], help="Diagnostic loops per synthetic session"
+    )
+    parser.add_argument("--budgets", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the synthetic sessions to this JSON lines file")
+    args = parser.parse_args()
+
+    if args.sessions:
+        with open(args.sessions) as f:
+            sessions = [json.loads(line) for line in f if line.strip()]
+    else:
+        rng = random.Random(args.seed)
+        sessions = [synthetic_session(rng, loops) for loops in args.loops]
+        if args.save:
+            with open(args.save, "w") as f:
+                f.writelines(json.dumps(s) + "\n" for s in sessions)
+
+    budgets = [None] + args.budgets
+    print(
+        f"{'session':<24} {'turns':>5}  {'budget':>6}  {'final tok':>9}  {'sum tok':>9}  {'saved':>6}  {'ms/call':>7}"
+    )
+    for session in sessions:
+        totals = replay(session, budgets)
+        full = totals[None]["sum"]
+        for budget in budgets:
+            t = totals[budget]
+            print(
+                f"{session['name']:<24} {len(session['turns']):>5}  {budget or 'full':>6}  {t['final']:>9}"
+                f"  {t['sum']:>9}  {1 - t['sum'] / full:>6.0%}  {statistics.mean(t['ms']):>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
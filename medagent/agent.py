@@ -17,9 +17,15 @@ from .tools import (
     store_patient_data,
     get_patient_summary,
     update_differential_diagnosis,
+    upsert_diagnosis,
+    rerank_differential_diagnosis,
+    get_top_diagnoses,
     finalize_diagnosis,
     increment_diagnostic_loop,
     check_emergency_status,
+    search_patient_cases,
+    get_latest_lab_result,
+    get_abnormal_lab_results,
 )
 
 # Create Root Agent with reasoning model
@@ -33,9 +39,15 @@ root_agent = Agent(
         store_patient_data,
         get_patient_summary,
         update_differential_diagnosis,
+        upsert_diagnosis,
+        rerank_differential_diagnosis,
+        get_top_diagnoses,
         finalize_diagnosis,
         increment_diagnostic_loop,
         check_emergency_status,
+        search_patient_cases,
+        get_latest_lab_result,
+        get_abnormal_lab_results,
         # Sub-agent delegation tools
         AgentTool(agent=triage_agent),
         AgentTool(agent=hypothesis_agent),
@@ -0,0 +1,327 @@
+"""
+Structured differential diagnosis (DDx) store in session state.
+
+Each diagnosis is one entry under its normalised key - case, punctuation,
+spacing and hedges like "suspected" do not create duplicates - holding a
+probability, a rank, and the ids of supporting and refuting evidence (lab
+tests, imaging report ids, ...). Entries are written one state key each,
+so an update touches only the diagnoses it changes; the index of entries
+and the revisions are `session_state` append logs.
+
+A diagnosis the hypothesis agent no longer lists is superseded: it keeps
+its entry and evidence but leaves the ranking, and comes back if a later
+output names it again.
+
+Every change is also recorded as a compact delta (only the fields that
+moved) under the diagnostic iteration it happened in, and the top of the
+ranking is kept as a small table under `ddx_table`, which the judge and
+hypothesis prompts inject instead of the accumulated hypothesis prose.
+
+Pure Python with no ADK imports, so it can be used (and tested) on any
+mapping that behaves like `tool_context.state`.
+"""
+import json
+import re
+from typing import Any, Dict, Iterable, List, MutableMapping, Optional, Sequence
+
+from . import session_state, summary
+
+INDEX_KEY = "ddx:index"
+ENTRY_KEY_PREFIX = "ddx:entry:"
+REVISION_KEY_PREFIX = "ddx:rev:"
+# A plain identifier, so agent instructions can inject it as {ddx_table?}
+TABLE_KEY = "ddx_table"
+
+DEFAULT_TOP_N = 5
+ACTIVE = "active"
+RULED_OUT = "ruled_out"
+# Dropped from the hypothesis agent's latest output
+SUPERSEDED = "superseded"
+STATUSES = (ACTIVE, RULED_OUT, SUPERSEDED)
+
+# The hypothesis agent ranks as High/Med/Low; stored as probabilities
+PROBABILITY_LABELS = {"high": 0.7, "medium": 0.4, "med": 0.4, "moderate": 0.4, "low": 0.1}
+
+_HEDGES = re.compile(r"^(?:suspected|probable|possible|likely|presumed|rule out|r/o)\s+")
+_PROBABILITY_SUFFIX = re.compile(r"\s*[(\[-]\s*(high|medium|med|moderate|low|\d+(?:\.\d+)?\s*%)\s*[)\]]?\s*$", re.I)
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def normalise(name: str) -> str:
+    """The key `name` is stored under: lowercase words, without punctuation or a leading hedge."""
+    key = " ".join(re.sub(r"[^a-z0-9]+", " ", str(name).lower()).split())
+    return _HEDGES.sub("", key)
+
+
+def parse_probability(value: Any) -> Optional[float]:
+    """0.35, "35%", "High"/"Med"/"Low" -> a probability in [0, 1]; None if `value` names none."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        probability = float(value)
+    else:
+        text = str(value).strip().lower()
+        if text in PROBABILITY_LABELS:
+            return PROBABILITY_LABELS[text]
+        try:
+            probability = float(text.rstrip("%").strip()) / (100 if text.endswith("%") else 1)
+        except ValueError:
+            raise ValueError(f"Unrecognised probability {value!r}")
+    if probability > 1:
+        probability /= 100
+    if not 0 <= probability <= 1:
+        raise ValueError(f"Probability must be between 0 and 1 (or a percentage), not {value!r}")
+    return round(probability, 4)
+
+
+def _iteration(state: MutableMapping[str, Any], iteration: Optional[int]) -> int:
+    return state.get("diagnostic_loop_count", 0) if iteration is None else iteration
+
+
+def _record(state: MutableMapping[str, Any], iteration: int, deltas: List[Dict[str, Any]]) -> None:
+    session_state.extend(state, f"{REVISION_KEY_PREFIX}{iteration}", deltas)
+
+
+def get_entry(state: MutableMapping[str, Any], name: str) -> Optional[Dict[str, Any]]:
+    entry = state.get(ENTRY_KEY_PREFIX + normalise(name))
+    return dict(entry) if entry else None
+
+
+def entries(state: MutableMapping[str, Any]) -> List[Dict[str, Any]]:
+    """Every entry, ranked ones first by rank, then ruled-out and superseded ones in the order they were added."""
+    found = [state[ENTRY_KEY_PREFIX + key] for key in session_state.items(state, INDEX_KEY)]
+    return sorted((dict(e) for e in found), key=lambda e: (e["rank"] is None, e["rank"] or 0))
+
+
+def top(state: MutableMapping[str, Any], n: int = DEFAULT_TOP_N) -> List[Dict[str, Any]]:
+    """The `n` highest-ranked active diagnoses."""
+    return [e for e in entries(state) if e["status"] == ACTIVE][:n]
+
+
+def _merge_ids(existing: Sequence[str], new: Iterable[Any]) -> List[str]:
+    merged = list(existing)
+    for item in new:
+        item = str(item).strip()
+        if item and item not in merged:
+            merged.append(item)
+    return merged
+
+
+def upsert(
+    state: MutableMapping[str, Any],
+    name: str,
+    probability: Any = None,
+    supporting: Iterable[Any] = (),
+    refuting: Iterable[Any] = (),
+    status: Optional[str] = None,
+    iteration: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Adds diagnosis `name` or updates its entry; returns the entry.
+
+    Evidence ids are added to what the entry already has. A new diagnosis is
+    ranked last until the next `rerank`; ruling one out or superseding it
+    takes it out of the ranking. Only the fields that changed are recorded as this iteration's
+    revision, and nothing is written when nothing changed.
+    """
+    key = normalise(name)
+    if not key:
+        raise ValueError("Diagnosis name is empty")
+    if status is not None and status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}, not {status!r}")
+    iteration = _iteration(state, iteration)
+    probability = parse_probability(probability)
+
+    old = state.get(ENTRY_KEY_PREFIX + key)
+    delta: Dict[str, Any] = {"key": key}
+    if old is None:
+        entry = {
+            "key": key, "name": str(name).strip(), "probability": None, "rank": None, "status": ACTIVE,
+            "supporting": [], "refuting": [], "updated": iteration,
+        }
+        delta["name"] = entry["name"]
+    else:
+        entry = dict(old)
+
+    if probability is not None and probability != entry["probability"]:
+        entry["probability"] = delta["probability"] = probability
+    for field in ("supporting", "refuting"):
+        merged = _merge_ids(entry[field], supporting if field == "supporting" else refuting)
+        if len(merged) > len(entry[field]):
+            delta[f"+{field}"] = merged[len(entry[field]):]
+            entry[field] = merged
+    if status is not None and status != entry["status"]:
+        entry["status"] = delta["status"] = status
+
+    if len(delta) == 1 and old is not None:
+        return entry
+    if entry["status"] == ACTIVE and entry["rank"] is None:
+        ranked = [e["rank"] for e in entries(state) if e["rank"] is not None and e["key"] != key]
+        entry["rank"] = delta["rank"] = max(ranked, default=0) + 1
+    elif entry["status"] != ACTIVE and entry["rank"] is not None:
+        entry["rank"] = delta["rank"] = None
+    entry["updated"] = iteration
+    state[ENTRY_KEY_PREFIX + key] = entry
+    if old is None:
+        session_state.append(state, INDEX_KEY, key)
+    _record(state, iteration, [delta])
+    if entry["status"] != ACTIVE and old is not None and old["rank"] is not None:
+        rerank(state, iteration=iteration)
+    else:
+        _write_table(state)
+    return entry
+
+
+def rerank(
+    state: MutableMapping[str, Any], order: Optional[Sequence[str]] = None, iteration: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Re-numbers the active diagnoses 1..n and returns them in rank order.
+
+    Diagnoses named in `order` come first, in that order; the rest follow by
+    probability (highest first), keeping their current order on ties.
+    Unknown names in `order` raise ValueError.
+    """
+    iteration = _iteration(state, iteration)
+    active = [e for e in entries(state) if e["status"] == ACTIVE]
+    position = {}
+    for i, name in enumerate(order or ()):
+        key = normalise(name)
+        if not any(e["key"] == key for e in active):
+            raise ValueError(f"No active diagnosis {name!r} to rank")
+        position.setdefault(key, i)
+
+    def sort_key(entry: Dict[str, Any]):
+        probability = entry["probability"] if entry["probability"] is not None else -1.0
+        return (position.get(entry["key"], len(position)), -probability if entry["key"] not in position else 0)
+
+    ranked = sorted(active, key=sort_key)
+    deltas = []
+    for rank, entry in enumerate(ranked, start=1):
+        if entry["rank"] != rank:
+            entry["rank"] = rank
+            entry["updated"] = iteration
+            state[ENTRY_KEY_PREFIX + entry["key"]] = entry
+            deltas.append({"key": entry["key"], "rank": rank})
+    _record(state, iteration, deltas)
+    _write_table(state)
+    return ranked
+
+
+def revisions(state: MutableMapping[str, Any], iteration: int) -> List[Dict[str, Any]]:
+    """The deltas recorded in diagnostic iteration `iteration`, oldest first."""
+    return session_state.items(state, f"{REVISION_KEY_PREFIX}{iteration}")
+
+
+def _ids(ids: Sequence[str], limit: int = 3) -> str:
+    if not ids:
+        return "-"
+    shown = ", ".join(ids[:limit])
+    return shown if len(ids) <= limit else f"{shown} +{len(ids) - limit}"
+
+
+def format_table(ranked: Sequence[Dict[str, Any]]) -> str:
+    """A small markdown table: rank, diagnosis, probability, supporting and refuting evidence ids."""
+    if not ranked:
+        return "No differential diagnosis yet."
+    lines = ["| # | Diagnosis | P | For | Against |", "|---|---|---|---|---|"]
+    for e in ranked:
+        probability = f"{e['probability']:.0%}" if e["probability"] is not None else "?"
+        lines.append(f"| {e['rank']} | {e['name']} | {probability} | {_ids(e['supporting'])} | {_ids(e['refuting'])} |")
+    return "\n".join(lines)
+
+
+def _write_table(state: MutableMapping[str, Any]) -> None:
+    table = format_table(top(state))
+    if state.get(TABLE_KEY) != table:
+        state[TABLE_KEY] = table
+        summary.invalidate(state, TABLE_KEY)
+
+
+def _field(item: Dict[str, Any], *names: str) -> Any:
+    lowered = {str(k).lower(): v for k, v in item.items()}
+    return next((lowered[n] for n in names if lowered.get(n) not in (None, "")), None)
+
+
+def parse_hypotheses(text: str) -> List[Dict[str, Any]]:
+    """
+    Diagnoses named in the hypothesis agent's output, as {"name", "probability"}.
+
+    Reads the JSON list the agent is asked for (also inside a code fence),
+    or else one diagnosis per bullet or numbered line, with an optional
+    trailing "(High)", "- 30%" and the like.
+    """
+    start, end = text.find("["), text.rfind("]")
+    if 0 <= start < end:
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            items = None
+        if isinstance(items, list) and all(isinstance(i, dict) for i in items):
+            parsed = []
+            for item in items:
+                name = _field(item, "condition", "diagnosis", "name")
+                if name:
+                    parsed.append({"name": str(name), "probability": _field(item, "probability", "likelihood")})
+            if parsed:
+                return parsed
+
+    parsed = []
+    lines = [line for line in text.splitlines() if line.strip()]
+    for line in lines:
+        if len(lines) > 1 and not _BULLET.match(line):
+            continue
+        name = _BULLET.sub("", line).split(":")[0].strip(" *")
+        probability = None
+        match = _PROBABILITY_SUFFIX.search(name)
+        if match:
+            probability, name = match.group(1), name[: match.start()].strip(" *")
+        if name:
+            parsed.append({"name": name, "probability": probability})
+    return parsed
+
+
+def record_hypotheses(
+    state: MutableMapping[str, Any], text: str, iteration: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Upserts every diagnosis parsed from `text` and re-ranks by probability; returns the ranked diagnoses.
+
+    Active diagnoses `text` does not name are superseded, and superseded
+    ones it names again are restored; ruled-out ones stay ruled out. Text
+    naming no diagnosis at all changes nothing.
+    """
+    parsed = parse_hypotheses(text)
+    named = set()
+    for item in parsed:
+        try:
+            probability = parse_probability(item["probability"])
+        except ValueError:
+            probability = None
+        old = get_entry(state, item["name"])
+        status = ACTIVE if old and old["status"] == SUPERSEDED else None
+        named.add(upsert(state, item["name"], probability, status=status, iteration=iteration)["key"])
+    if parsed:
+        for entry in entries(state):
+            if entry["status"] == ACTIVE and entry["key"] not in named:
+                upsert(state, entry["name"], status=SUPERSEDED, iteration=iteration)
+    return rerank(state, iteration=iteration)
+
+
+__all__ = [
+    "ACTIVE",
+    "RULED_OUT",
+    "SUPERSEDED",
+    "TABLE_KEY",
+    "entries",
+    "format_table",
+    "get_entry",
+    "normalise",
+    "parse_hypotheses",
+    "parse_probability",
+    "record_hypotheses",
+    "rerank",
+    "revisions",
+    "top",
+    "upsert",
+]
@@ -0,0 +1,135 @@
+"""
+Patient database access layer.
+SQLite-backed storage for patient descriptions, lab results and imaging files.
+
+With sharding configured (`configure(shards=N)` or MEDAGENT_PATIENT_SHARDS)
+the functions below route each call to the patient's shard; see routing.py.
+"""
+from .connection import ConnectionManager, use_manager
+from .schema import SCHEMA_VERSION
+from .compression import CodecPolicy
+from .labs import LabObservation, parse_lab_results_string
+from .records import get_patient_cache_stats
+from .sharding import ShardMap, ShardedPatientStore, open_sharded_store, reshard
+from .derivatives import generate_derivatives, wait_for_derivatives
+from .routing import (
+    configure,
+    get_sharded_store,
+    get_db_path,
+    migrate_database,
+    close_connections,
+    get_patient_data_from_db,
+    get_or_create_patient_data,
+    clear_patient_cache,
+    get_patient_file_from_db,
+    list_patient_files,
+    get_patient_file_by_id,
+    get_patient_file_info,
+    store_patient_data_in_db,
+    store_patient_file_in_db,
+    store_patient_lab_results_in_db,
+    store_lab_observations,
+    get_latest_lab,
+    get_lab_history,
+    get_abnormal_labs,
+    get_lab_results_history,
+    delete_patient_file,
+    externalize_patient_files,
+    collect_blob_garbage,
+    backup_database,
+    search_patients,
+    rebuild_search_index,
+    query_patients,
+    count_patients,
+    query_imaging_files,
+    backfill_imaging_columns,
+    get_patients_bulk,
+    iter_patients_with_files,
+    get_file_derivative,
+    get_file_header,
+    backfill_derivatives,
+    store_patients_bulk,
+    store_files_bulk,
+    store_lab_results_bulk,
+    open_patient_file,
+    iter_patient_file_chunks,
+    store_patient_file_stream,
+    store_patient_file_from_path,
+)
+from .writer import (
+    WriteQueueFull,
+    enqueue_patient_file,
+    resolve_pending_file,
+    pending_file_status,
+    flush_writes,
+    get_writer_stats,
+    shutdown_writer,
+)
+from .streaming import PatientFileReader, PatientFileWriter
+
+__all__ = [
+    "ConnectionManager",
+    "use_manager",
+    "configure",
+    "get_sharded_store",
+    "get_db_path",
+    "migrate_database",
+    "close_connections",
+    "SCHEMA_VERSION",
+    "CodecPolicy",
+    "get_patient_data_from_db",
+    "get_or_create_patient_data",
+    "get_patient_cache_stats",
+    "clear_patient_cache",
+    "get_patient_file_from_db",
+    "list_patient_files",
+    "get_patient_file_by_id",
+    "get_patient_file_info",
+    "store_patient_data_in_db",
+    "store_patient_file_in_db",
+    "store_patient_lab_results_in_db",
+    "store_lab_observations",
+    "get_latest_lab",
+    "get_lab_history",
+    "get_abnormal_labs",
+    "get_lab_results_history",
+    "LabObservation",
+    "parse_lab_results_string",
+    "delete_patient_file",
+    "externalize_patient_files",
+    "collect_blob_garbage",
+    "backup_database",
+    "ShardMap",
+    "ShardedPatientStore",
+    "open_sharded_store",
+    "reshard",
+    "search_patients",
+    "rebuild_search_index",
+    "query_patients",
+    "count_patients",
+    "query_imaging_files",
+    "backfill_imaging_columns",
+    "get_patients_bulk",
+    "iter_patients_with_files",
+    "get_file_derivative",
+    "get_file_header",
+    "generate_derivatives",
+    "backfill_derivatives",
+    "wait_for_derivatives",
+    "store_patients_bulk",
+    "store_files_bulk",
+    "store_lab_results_bulk",
+    "WriteQueueFull",
+    "enqueue_patient_file",
+    "resolve_pending_file",
+    "pending_file_status",
+    "flush_writes",
+    "get_writer_stats",
+    "shutdown_writer",
+    "PatientFileReader",
+    "PatientFileWriter",
+    "open_patient_file",
+    "iter_patient_file_chunks",
+    "store_patient_file_stream",
+    "store_patient_file_from_path",
+]
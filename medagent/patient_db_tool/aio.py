@@ -0,0 +1,144 @@
+"""
+Async facade over patient_db_tool for use from ADK tools.
+
+Every function here has the same name, arguments, return value and errors
+as its synchronous counterpart, but runs on a small dedicated thread pool
+so SQLite I/O (and lock waits up to the busy timeout) never blocks the
+event loop. Each pool thread gets its own pooled connection from the
+ConnectionManager, and calls are routed to the patient's shard when sharding
+is configured (see routing.py).
+
+    from medagent.patient_db_tool import aio as patient_db
+
+    info = await patient_db.get_patient_data_from_db("MM-26")
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from . import routing, writer
+
+# Reads run concurrently under WAL; writers still serialise on SQLite's lock
+MAX_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Pool threads do not survive fork()
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="patient-db")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+async def run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Runs a blocking patient database call on the DB thread pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    # Like asyncio.to_thread: context variables set by the caller stay visible
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stops the DB thread pool; it is recreated on the next call."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _offload(fn: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+get_patient_data_from_db = _offload(routing.get_patient_data_from_db)
+get_or_create_patient_data = _offload(routing.get_or_create_patient_data)
+get_patient_file_from_db = _offload(routing.get_patient_file_from_db)
+list_patient_files = _offload(routing.list_patient_files)
+get_patient_file_by_id = _offload(routing.get_patient_file_by_id)
+get_patient_file_info = _offload(routing.get_patient_file_info)
+store_patient_data_in_db = _offload(routing.store_patient_data_in_db)
+store_patient_file_in_db = _offload(routing.store_patient_file_in_db)
+store_patient_lab_results_in_db = _offload(routing.store_patient_lab_results_in_db)
+store_lab_observations = _offload(routing.store_lab_observations)
+get_latest_lab = _offload(routing.get_latest_lab)
+get_lab_history = _offload(routing.get_lab_history)
+get_abnormal_labs = _offload(routing.get_abnormal_labs)
+get_lab_results_history = _offload(routing.get_lab_results_history)
+delete_patient_file = _offload(routing.delete_patient_file)
+store_patient_file_stream = _offload(routing.store_patient_file_stream)
+store_patient_file_from_path = _offload(routing.store_patient_file_from_path)
+search_patients = _offload(routing.search_patients)
+query_patients = _offload(routing.query_patients)
+count_patients = _offload(routing.count_patients)
+query_imaging_files = _offload(routing.query_imaging_files)
+get_patients_bulk = _offload(routing.get_patients_bulk)
+get_file_derivative = _offload(routing.get_file_derivative)
+get_file_header = _offload(routing.get_file_header)
+store_patients_bulk = _offload(routing.store_patients_bulk)
+store_files_bulk = _offload(routing.store_files_bulk)
+store_lab_results_bulk = _offload(routing.store_lab_results_bulk)
+# Only blocks while the write-behind queue is full
+enqueue_patient_file = _offload(writer.enqueue_patient_file)
+pending_file_status = _offload(writer.pending_file_status)
+
+
+async def resolve_pending_file(pending_id: str, timeout: Optional[float] = None) -> int:
+    """As `writer.resolve_pending_file`, awaiting the write's future instead of holding a pool thread."""
+    future = writer.get_writer().future(pending_id)
+    if future is None:
+        raise KeyError(f"Unknown pending file id {pending_id!r}")
+    try:
+        # shield: a timeout must not cancel the queued write itself
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Patient file write {pending_id} is still queued after {timeout}s") from None
+
+__all__ = [
+    "run",
+    "shutdown",
+    "get_patient_data_from_db",
+    "get_or_create_patient_data",
+    "get_patient_file_from_db",
+    "list_patient_files",
+    "get_patient_file_by_id",
+    "get_patient_file_info",
+    "store_patient_data_in_db",
+    "store_patient_file_in_db",
+    "store_patient_lab_results_in_db",
+    "store_lab_observations",
+    "get_latest_lab",
+    "get_lab_history",
+    "get_abnormal_labs",
+    "get_lab_results_history",
+    "delete_patient_file",
+    "store_patient_file_stream",
+    "store_patient_file_from_path",
+    "search_patients",
+    "query_patients",
+    "count_patients",
+    "query_imaging_files",
+    "get_patients_bulk",
+    "get_file_derivative",
+    "get_file_header",
+    "store_patients_bulk",
+    "store_files_bulk",
+    "store_lab_results_bulk",
+    "enqueue_patient_file",
+    "resolve_pending_file",
+    "pending_file_status",
+]
@@ -0,0 +1,141 @@
+"""
+Online backup of the patient database.
+
+Copies a live database with SQLite's backup API, `pages` pages per step
+with a pause between steps, so writers on the source (WAL mode) keep
+committing while the copy runs. The copy is taken under one read
+transaction on the source: it is a consistent snapshot of the moment the
+backup started, and writes made meanwhile never force the backup to
+restart from page one.
+
+The copy is written next to `dest` and renamed into place when complete,
+so `dest` is never a torn file. With `snapshot=True` it is turned into a
+self-contained read-only file (rollback journal, no `-wal`) for
+`configure(path, read_only=True)`, e.g. for evaluation runs that must not
+contend with the serving database.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .blobstore import BlobStore
+from .connection import get_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKUP_PAGES = 1024
+DEFAULT_BACKUP_SLEEP = 0.005
+
+# (pages copied, total pages)
+ProgressCallback = Callable[[int, int], None]
+
+
+def _link_blobs(conn: sqlite3.Connection, source_root: str, dest_root: str) -> int:
+    """Hard-links (or copies) every blob `conn` references from one store root into another."""
+    source, dest = BlobStore(source_root), BlobStore(dest_root)
+    linked = 0
+    for (sha256,) in conn.execute("SELECT sha256 FROM blob_refs"):
+        target = dest.path(sha256)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source.path(sha256), target)
+        except OSError:  # other filesystem, or links unsupported
+            shutil.copy2(source.path(sha256), target)
+        linked += 1
+    return linked
+
+
+def backup_database(
+    dest: str,
+    pages: int = DEFAULT_BACKUP_PAGES,
+    sleep: float = DEFAULT_BACKUP_SLEEP,
+    snapshot: bool = False,
+    blob_store_dir: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """Copies the configured database to `dest` while it stays in use; returns copy statistics.
+
+    `pages` pages are copied per step and the source is left alone for
+    `sleep` seconds between steps. With `snapshot`, `dest` becomes a
+    read-only, single-file snapshot. With the external blob store enabled,
+    `blob_store_dir` gives the copy its own store: the blobs it references
+    are hard-linked (copied across filesystems) there, so garbage
+    collection on the source cannot remove them.
+    """
+    manager = get_manager()
+    dest = os.path.abspath(dest)
+    if dest == os.path.abspath(manager.db_path):
+        raise ValueError("Backup destination is the database itself")
+    if blob_store_dir and manager.blob_store is None:
+        raise ValueError("blob_store_dir given, but the source has no external blob store")
+    directory = os.path.dirname(dest)
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{dest}.partial"
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(partial + suffix):
+            os.remove(partial + suffix)
+
+    # Not a pooled connection: the read transaction below must not be joined
+    # by (or end with) the caller's own work on this thread
+    source = sqlite3.connect(manager.db_path, timeout=manager.busy_timeout_ms / 1000, isolation_level=None)
+    target = sqlite3.connect(partial, isolation_level=None)
+    steps = 0
+    start = time.perf_counter()
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # starts the read snapshot
+
+        def on_step(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            if progress is not None:
+                progress(total - remaining, total)
+            if remaining and sleep:
+                time.sleep(sleep)
+
+        source.backup(target, pages=pages, progress=on_step)
+        total_pages = target.execute("PRAGMA page_count").fetchone()[0]
+        if blob_store_dir:
+            linked = _link_blobs(source, manager.blob_store.root, blob_store_dir)
+        source.execute("COMMIT")
+
+        if snapshot:
+            target.execute("PRAGMA journal_mode = DELETE")
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"Snapshot failed its integrity check: {check}")
+    except BaseException:
+        target.close()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(dest + suffix):
+            os.remove(dest + suffix)  # left by an earlier backup opened in WAL mode
+    os.replace(partial, dest)
+    if snapshot:
+        os.chmod(dest, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    stats = {
+        "path": dest,
+        "pages": total_pages,
+        "bytes": os.path.getsize(dest),
+        "steps": steps,
+        "seconds": time.perf_counter() - start,
+        "snapshot": snapshot,
+    }
+    if blob_store_dir:
+        stats["blobs_linked"] = linked
+    logger.info(f"Backed up patient DB to {dest}: {total_pages} pages in {steps} step(s), {stats['seconds']:.2f}s")
+    return stats
@@ -0,0 +1,100 @@
+"""
+Multi-patient reads for the patient database.
+
+Fetches many patients with a handful of set-based queries instead of one or
+more queries per patient. Full walks use keyset pagination over
+`patient_id`: every page is read from its own short snapshot, so a long
+export neither blocks WAL checkpoints nor sees a page half-written, and
+rows committed meanwhile simply show up (or not) on later pages.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .connection import get_manager, read_transaction
+from .queries import LIST_FILES_IN_RANGE, LIST_FILES_IN_RANGE_BY_TYPE, SELECT_PATIENTS_PAGE
+from .records import _to_record
+
+DEFAULT_PAGE_SIZE = 500
+# Below SQLite's historical 999 host-parameter limit
+_MAX_IN_PARAMS = 500
+
+
+def get_patients_bulk(patient_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Fetches many patient records at once, keyed by patient_id in request order.
+
+    Records have the same shape as `get_patient_data_from_db` (None for an
+    unknown patient) and share its cache: cached patients are not queried,
+    and the rest are loaded with one `IN (...)` query per 500 ids.
+    """
+    ids = list(dict.fromkeys(patient_ids))
+    cache = get_manager().patient_cache
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    misses = []
+    for patient_id in ids:
+        hit, record = cache.get(patient_id)
+        if hit:
+            results[patient_id] = record
+        else:
+            misses.append(patient_id)
+
+    generation = cache.generation()
+    with read_transaction() as conn:
+        for start in range(0, len(misses), _MAX_IN_PARAMS):
+            chunk = misses[start:start + _MAX_IN_PARAMS]
+            for row in conn.execute(
+                "SELECT p.patient_id, p.description, p.metadata, l.lab_results_string"
+                " FROM patient_data p LEFT JOIN patient_lab_results l ON l.patient_id = p.patient_id"
+                f" WHERE p.patient_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ):
+                results[row[0]] = _to_record(row[1], row[2], row[3])
+    for patient_id in misses:
+        cache.put(patient_id, results.setdefault(patient_id, None), generation)
+    return {patient_id: results[patient_id] for patient_id in ids}
+
+
+def iter_patients_with_files(
+    file_type: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yields every patient, ordered by patient_id, with its files listed.
+
+    Each item is a `get_patient_data_from_db` record plus `patient_id` and
+    `files` (as in `list_patient_files`, optionally only `file_type`; no
+    payloads - stream those with `open_patient_file` or
+    `iter_patient_file_chunks`). Pass the last `patient_id` seen as `after`
+    to resume an interrupted walk.
+
+    Costs two queries per `page_size` patients. Bypasses the record cache so
+    a full walk does not evict the hot working set.
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+    last = "" if after is None else after
+    while True:
+        page = _read_page(last, page_size, file_type)
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]["patient_id"]
+
+
+def _read_page(after: str, page_size: int, file_type: Optional[str]) -> List[Dict[str, Any]]:
+    with read_transaction() as conn:
+        patients: Dict[str, Dict[str, Any]] = {}
+        for row in conn.execute(SELECT_PATIENTS_PAGE, (after, page_size)):
+            patients[row[0]] = {"patient_id": row[0], **_to_record(row[1], row[2], row[3]), "files": []}
+        if not patients:
+            return []
+        last = row[0]
+        if file_type is None:
+            cursor = conn.execute(LIST_FILES_IN_RANGE, (after, last))
+        else:
+            cursor = conn.execute(LIST_FILES_IN_RANGE_BY_TYPE, (after, last, file_type))
+        for f in cursor:
+            patient = patients.get(f["patient_id"])
+            if patient is not None:
+                item = dict(f)
+                del item["patient_id"]
+                patient["files"].append(item)
+    return list(patients.values())
@@ -0,0 +1,197 @@
+"""
+Content-addressed on-disk store for patient file payloads.
+
+Payloads are written once under `<root>/<aa>/<bb>/<sha256>` and referenced
+from `patient_files.blob_sha256`; SQLite keeps only the hash, metadata and a
+reference count per blob in `blob_refs`. Identical uploads share one file,
+which is removed when its last reference goes away.
+
+Publishing and removing files always happens inside the database write
+transaction that changes the reference count, so concurrent writers and
+deleters of the same content are serialised by SQLite's write lock.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Staged uploads older than this are treated as abandoned by `collect_garbage`
+STALE_STAGING_SECONDS = 3600
+
+
+@dataclass
+class StagedBlob:
+    """A payload written to the staging area, not yet visible in the store."""
+
+    sha256: str
+    size: int
+    temp_path: str
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._staging = os.path.join(root, ".staging")
+        self._trash = os.path.join(root, ".trash")
+        os.makedirs(self._staging, exist_ok=True)
+        os.makedirs(self._trash, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def open(self, sha256: str) -> BinaryIO:
+        try:
+            return open(self.path(sha256), "rb")
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Blob {sha256} is missing from {self.root}") from e
+
+    def stage(
+        self, source: Union[bytes, bytearray, memoryview, BinaryIO], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> StagedBlob:
+        """Writes a payload (bytes or binary stream) to staging while hashing it."""
+        stager = BlobStager(self)
+        try:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                stager.write(source)
+            else:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    stager.write(chunk)
+        except BaseException:
+            stager.abort()
+            raise
+        return stager.finish()
+
+    def publish(self, staged: StagedBlob) -> None:
+        """Moves a staged payload into place, or drops it if the content is already stored."""
+        target = self.path(staged.sha256)
+        if os.path.exists(target):
+            self.discard(staged)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(staged.temp_path, target)
+
+    def discard(self, staged: StagedBlob) -> None:
+        try:
+            os.unlink(staged.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def trash(self, sha256: str) -> Optional[str]:
+        """Moves a blob aside so the removal can be undone until `empty_trash`."""
+        tomb = os.path.join(self._trash, f"{sha256}.{uuid.uuid4().hex}")
+        try:
+            os.replace(self.path(sha256), tomb)
+        except FileNotFoundError:
+            return None
+        return tomb
+
+    def restore(self, sha256: str, tomb: str) -> None:
+        os.replace(tomb, self.path(sha256))
+
+    def empty_trash(self, tomb: str) -> None:
+        try:
+            os.unlink(tomb)
+        except FileNotFoundError:
+            pass
+
+    def iter_digests(self) -> Iterator[str]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if len(name) == 64:
+                    yield name
+
+
+class BlobStager:
+    """Incrementally writes and hashes one payload into a store's staging area."""
+
+    def __init__(self, store: BlobStore):
+        self._digest = hashlib.sha256()
+        self.size = 0
+        fd, self._temp_path = tempfile.mkstemp(dir=store._staging)
+        self._out = os.fdopen(fd, "wb")
+
+    def write(self, data) -> None:
+        self._digest.update(data)
+        self._out.write(data)
+        self.size += len(memoryview(data).cast("B"))
+
+    def finish(self) -> StagedBlob:
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._out.close()
+        return StagedBlob(self._digest.hexdigest(), self.size, self._temp_path)
+
+    def abort(self) -> None:
+        self._out.close()
+        try:
+            os.unlink(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def add_blob_ref(conn: sqlite3.Connection, store: BlobStore, staged: StagedBlob) -> None:
+    """Counts a new reference to a staged payload and publishes it. Call inside a write transaction."""
+    conn.execute(
+        "INSERT INTO blob_refs (sha256, size, refcount) VALUES (?, ?, 1)"
+        " ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+        (staged.sha256, staged.size),
+    )
+    store.publish(staged)
+
+
+def release_blob_ref(conn: sqlite3.Connection, store: BlobStore, sha256: str) -> Optional[str]:
+    """
+    Drops one reference to a blob. Call inside a write transaction.
+
+    When the last reference goes, the file is moved to the trash and the
+    tombstone path is returned: pass it to `store.empty_trash` after COMMIT,
+    or to `store.restore` on rollback.
+    """
+    conn.execute("UPDATE blob_refs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,))
+    row = conn.execute("SELECT refcount FROM blob_refs WHERE sha256 = ?", (sha256,)).fetchone()
+    if row is None or row[0] > 0:
+        return None
+    conn.execute("DELETE FROM blob_refs WHERE sha256 = ?", (sha256,))
+    return store.trash(sha256)
+
+
+def collect_garbage(conn: sqlite3.Connection, store: BlobStore) -> int:
+    """
+    Removes blobs with no row in `blob_refs` (left behind by a crash between
+    publishing and commit) and abandoned staging files. Call inside a write
+    transaction. Returns the number of files removed.
+    """
+    removed = 0
+    for sha256 in list(store.iter_digests()):
+        if conn.execute("SELECT 1 FROM blob_refs WHERE sha256 = ?", (sha256,)).fetchone() is None:
+            tomb = store.trash(sha256)
+            if tomb:
+                store.empty_trash(tomb)
+                removed += 1
+
+    cutoff = time.time() - STALE_STAGING_SECONDS
+    for directory in (store._staging, store._trash):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+    if removed:
+        logger.info(f"Removed {removed} unreferenced blob file(s) from {store.root}")
+    return removed
@@ -0,0 +1,167 @@
+"""
+Bulk ingest for the patient database.
+
+Loads many rows with `executemany` inside one write transaction per batch,
+instead of a transaction (and fsync) per record. Inputs may be any iterable,
+including generators, and are consumed one batch at a time.
+
+Batches are committed independently: if a record in a later batch fails,
+earlier batches stay committed and the failing batch is rolled back.
+"""
+import itertools
+import json
+import sqlite3
+from typing import Any, Iterable, Iterator, List, Mapping, Sequence, Tuple, Union
+
+from .blobstore import add_blob_ref
+from .compression import encode
+from .connection import get_manager, transaction
+from .derivatives import schedule_derivatives
+from .imaging import imaging_columns
+from .labs import append_string_observations
+from .queries import APPEND_LAB_RESULTS, SELECT_LAB_RESULTS, UPSERT_PATIENT
+from .records import _ensure_bytes, _invalidate_patients, _utc_timestamp
+from .studies import set_imaging_columns
+
+DEFAULT_BATCH_SIZE = 1000
+# Payloads of a whole batch are held in memory at once
+DEFAULT_FILE_BATCH_SIZE = 100
+
+PatientRecord = Union[Mapping[str, Any], Sequence[Any]]
+
+
+def _batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _fields(record: PatientRecord, names: Tuple[str, ...], required: int) -> tuple:
+    """Mapping or positional record -> tuple of `names` (missing optional fields are None)."""
+    if isinstance(record, Mapping):
+        missing = [n for n in names[:required] if n not in record]
+        if missing:
+            raise KeyError(f"Record is missing {', '.join(missing)}")
+        return tuple(record.get(n) for n in names)
+    values = tuple(record)
+    if not required <= len(values) <= len(names):
+        raise ValueError(f"Expected {required} to {len(names)} fields ({', '.join(names)}), got {len(values)}")
+    return values + (None,) * (len(names) - len(values))
+
+
+def _ensure_patients(conn: sqlite3.Connection, patient_ids: Iterable[str]) -> None:
+    conn.executemany(
+        "INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)",
+        [(pid,) for pid in dict.fromkeys(patient_ids)],
+    )
+
+
+def store_patients_bulk(records: Iterable[PatientRecord], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Stores or replaces many patients; returns the number of records written.
+
+    Each record is a mapping with `patient_id`, `description` and optional
+    `metadata` (a dict, stored as JSON), or a `(patient_id, description[,
+    metadata])` tuple. Same semantics as `store_patient_data_in_db`.
+    """
+    written = 0
+    for batch in _batches(records, batch_size):
+        rows = []
+        for record in batch:
+            patient_id, description, metadata = _fields(record, ("patient_id", "description", "metadata"), 2)
+            rows.append((patient_id, description, json.dumps(metadata) if metadata else None))
+        with transaction() as conn:
+            conn.executemany(UPSERT_PATIENT, rows)
+        _invalidate_patients(*(row[0] for row in rows))
+        written += len(rows)
+    return written
+
+
+def store_lab_results_bulk(records: Iterable[PatientRecord], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Stores a new lab results version for each record; returns the number of versions stored.
+
+    Each record is a mapping with `patient_id` and `lab_results_string`, or a
+    `(patient_id, lab_results_string)` tuple. Unknown patients get a
+    placeholder `patient_data` row, as in `store_patient_lab_results_in_db`.
+    A record that repeats the patient's latest string (or is None for a
+    patient without lab results) is not a new version and is skipped, so
+    re-running an import adds nothing.
+    """
+    written = 0
+    for batch in _batches(records, batch_size):
+        rows = [_fields(record, ("patient_id", "lab_results_string"), 2) for record in batch]
+        with transaction() as conn:
+            _ensure_patients(conn, (row[0] for row in rows))
+            observed_at = _utc_timestamp()
+            for patient_id, lab_results_string in rows:
+                latest = conn.execute(SELECT_LAB_RESULTS, (patient_id,)).fetchone()
+                if (latest[0] if latest else None) == lab_results_string:
+                    continue
+                conn.execute(APPEND_LAB_RESULTS, (patient_id, lab_results_string, observed_at))
+                append_string_observations(conn, patient_id, lab_results_string, observed_at)
+                written += 1
+        _invalidate_patients(*(row[0] for row in rows))
+    return written
+
+
+def store_files_bulk(
+    files: Iterable[Mapping[str, Any]], batch_size: int = DEFAULT_FILE_BATCH_SIZE
+) -> List[int]:
+    """Stores many patient files; returns their `file_id`s in input order.
+
+    Each file is a mapping with `patient_id`, `type` and `data` (bytes or
+    base64, as in `store_patient_file_in_db`) and optional `filename`,
+    `mime_type` and `created_at`. Payloads are compressed per the codec
+    policy before each batch's transaction. With the external blob store
+    enabled, they are also staged beforehand and deduplicated.
+    """
+    manager = get_manager()
+    store = manager.blob_store
+    file_ids: List[int] = []
+    for batch in _batches(files, batch_size):
+        rows, headers = [], []
+        for f in batch:
+            patient_id, file_type, data, filename, mime_type, created_at = _fields(
+                f, ("patient_id", "type", "data", "filename", "mime_type", "created_at"), 3
+            )
+            raw = _ensure_bytes(data)
+            codec, stored = encode(manager.codec_policy, raw, mime_type, filename)
+            headers.append(imaging_columns(raw, mime_type, filename))
+            rows.append([
+                patient_id, file_type, stored, codec, len(raw), filename, mime_type, created_at or _utc_timestamp()
+            ])
+
+        staged = []
+        try:
+            if store is not None:
+                for row in rows:
+                    staged.append(store.stage(row[2]))
+                    row[2] = staged[-1].sha256
+                column = "blob_sha256"
+            else:
+                column = "data"
+            with transaction() as conn:
+                _ensure_patients(conn, (row[0] for row in rows))
+                # Without AUTOINCREMENT, new rowids are max(file_id) + 1 in
+                # insertion order, and the write lock keeps other writers out
+                first_id = conn.execute("SELECT COALESCE(MAX(file_id), 0) + 1 FROM patient_files").fetchone()[0]
+                conn.executemany(
+                    f"INSERT INTO patient_files (patient_id, type, {column}, codec, raw_size, filename, mime_type, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                for blob in staged:
+                    add_blob_ref(conn, store, blob)
+                set_imaging_columns(conn, zip(range(first_id, first_id + len(rows)), headers))
+        finally:
+            for blob in staged:
+                store.discard(blob)  # no-op once published
+        _invalidate_patients(*(row[0] for row in rows))
+        batch_ids = range(first_id, first_id + len(rows))
+        schedule_derivatives((file_id, row[6], row[5]) for file_id, row in zip(batch_ids, rows))
+        file_ids.extend(batch_ids)
+    return file_ids
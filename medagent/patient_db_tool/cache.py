@@ -0,0 +1,93 @@
+"""
+In-process read-through cache of patient records.
+
+Holds the result of `get_patient_data_from_db` (including "not found") per
+patient_id, bounded by size (least recently used entries go first) and age.
+Writes made through patient_db_tool invalidate the affected patients; the
+TTL bounds staleness from writes by other processes.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL_SECONDS = 60.0
+
+_MISSING = object()
+
+
+class PatientRecordCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and hit/miss counters.
+
+    Values are deep-copied on the way in and out, so callers may mutate
+    what they get back. `maxsize=0` disables caching (every lookup misses).
+
+    Reads that race with a write use `generation()`: take it before querying
+    the database and pass it to `put()`, which drops the value if any
+    invalidation happened in between.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Returns `(hit, value)`; `value` is None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, copy.deepcopy(entry[1])
+            if entry is not _MISSING:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if self.maxsize <= 0 or (generation is not None and generation != self._generation):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        self.invalidate_many(keys)
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,64 @@
+"""
+Cohort selection by case metadata.
+
+`body_system`, `medical_task` and `question_type` are generated columns on
+`patient_data` (json_extract over `metadata`, see schema migration 8) with
+indexes, so filtering on them never decodes the JSON of every row.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from .connection import connection
+
+METADATA_COLUMNS = ("body_system", "medical_task", "question_type")
+
+
+def build_patient_query(filters: Dict[str, Any], limit: Optional[int] = None) -> Tuple[str, list]:
+    """Filters -> (SQL, parameters) for `query_patients`."""
+    unknown = sorted(set(filters) - set(METADATA_COLUMNS))
+    if unknown:
+        raise ValueError(f"Cannot filter on {', '.join(unknown)}; indexed fields are {', '.join(METADATA_COLUMNS)}")
+
+    clauses, params = [], []
+    for column in METADATA_COLUMNS:
+        if column not in filters:
+            continue
+        value = filters[column]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        elif value is None:
+            clauses.append(f"{column} IS NULL")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+
+    sql = f"SELECT patient_id, {', '.join(METADATA_COLUMNS)} FROM patient_data"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY patient_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def query_patients(limit: Optional[int] = None, **filters: Any) -> List[Dict[str, Any]]:
+    """Selects patients by indexed metadata fields, ordered by patient_id.
+
+    Each filter is a value (equality), a list of values (any of them) or
+    None (field missing), e.g.
+    `query_patients(body_system="Cardiovascular", medical_task="Diagnosis")`.
+    Returns `patient_id` and the metadata fields for each match.
+    """
+    sql, params = build_patient_query(filters, limit)
+    return [dict(r) for r in connection().execute(sql, params).fetchall()]
+
+
+def count_patients(**filters: Any) -> int:
+    """Number of patients matching `query_patients` filters."""
+    sql, params = build_patient_query(filters)
+    return connection().execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
@@ -0,0 +1,273 @@
+"""
+Per-type compression of patient file payloads.
+
+Payloads are compressed once on write, with the codec a `CodecPolicy` picks
+from the MIME type (falling back to the filename extension), and
+decompressed transparently on read. `patient_files.codec` records how each
+payload is stored; NULL means as is, as for rows written before schema
+migration 9. Raw arrays, DICOM and uncompressed NIfTI typically shrink 2-5x;
+PNG, JPEG and gzipped volumes are compressed already and pass through.
+
+zstd needs the optional `zstandard` package. Without it, policies use
+deflate (zlib) instead, and zstd payloads written elsewhere cannot be read.
+"""
+import io
+import zlib
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+IDENTITY = "identity"
+DEFLATE = "deflate"
+ZSTD = "zstd"
+
+CODECS = (IDENTITY, DEFLATE, ZSTD)
+
+DEFLATE_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Compressed reads pull the stored payload in chunks of this size
+READ_CHUNK_SIZE = 256 * 1024
+
+# Codec used for compressible types: zstd when available
+COMPRESS = ZSTD if zstandard is not None else DEFLATE
+
+DEFAULT_MIME_CODECS: Dict[str, str] = {
+    "application/dicom": COMPRESS,
+    "application/x-npy": COMPRESS,
+    "application/x-nifti": COMPRESS,
+    "application/octet-stream": COMPRESS,
+    "application/json": COMPRESS,
+    "text/plain": COMPRESS,
+    "text/csv": COMPRESS,
+    "image/png": IDENTITY,
+    "image/jpeg": IDENTITY,
+    "image/gif": IDENTITY,
+    "image/webp": IDENTITY,
+    "application/gzip": IDENTITY,
+    "application/zip": IDENTITY,
+    "application/pdf": IDENTITY,
+}
+
+# Used when the MIME type is missing or not listed; the longest match wins
+DEFAULT_EXTENSION_CODECS: Dict[str, str] = {
+    ".dcm": COMPRESS,
+    ".npy": COMPRESS,
+    ".nii": COMPRESS,
+    ".json": COMPRESS,
+    ".txt": COMPRESS,
+    ".csv": COMPRESS,
+    ".png": IDENTITY,
+    ".jpg": IDENTITY,
+    ".jpeg": IDENTITY,
+    ".gz": IDENTITY,
+    ".nii.gz": IDENTITY,
+    ".zip": IDENTITY,
+}
+
+
+def _check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown payload codec {codec!r}; expected one of {', '.join(CODECS)}")
+    if codec == ZSTD and zstandard is None:
+        raise RuntimeError("zstd payload codec requires the 'zstandard' package")
+
+
+@dataclass
+class CodecPolicy:
+    """Chooses the codec for a new payload from its MIME type, filename and size."""
+
+    mime_types: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_MIME_CODECS))
+    extensions: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_EXTENSION_CODECS))
+    default: str = IDENTITY
+    # Below this, headers and per-call overhead outweigh the savings
+    min_size: int = 1024
+
+    @classmethod
+    def fixed(cls, codec: str) -> "CodecPolicy":
+        """A policy that stores every payload with `codec` (IDENTITY disables compression)."""
+        return cls(mime_types={}, extensions={}, default=codec, min_size=0)
+
+    def codec_for(self, mime_type: Optional[str], filename: Optional[str], size: Optional[int] = None) -> str:
+        if size is not None and size < self.min_size:
+            return IDENTITY
+        codec = self.mime_types.get((mime_type or "").split(";")[0].strip().lower())
+        if codec is None and filename:
+            name = filename.lower()
+            matches = [ext for ext in self.extensions if name.endswith(ext)]
+            if matches:
+                codec = self.extensions[max(matches, key=len)]
+        codec = codec or self.default
+        # Policies may name zstd; fall back rather than fail the write
+        if codec == ZSTD and zstandard is None:
+            codec = DEFLATE
+        _check_codec(codec)
+        return codec
+
+
+def codec_policy_from_env(value: Optional[str]) -> CodecPolicy:
+    """MEDAGENT_FILE_COMPRESSION -> policy: "auto" (default, per type) or a codec for every payload."""
+    if not value or value == "auto":
+        return CodecPolicy()
+    if value == "off":
+        value = IDENTITY
+    _check_codec(value)
+    return CodecPolicy.fixed(value)
+
+
+class _IdentityCompressor:
+    def compress(self, data) -> bytes:
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(codec: str):
+    """Incremental compressor with `compress(chunk)` / `flush()`, as zlib.compressobj."""
+    _check_codec(codec)
+    if codec == DEFLATE:
+        return zlib.compressobj(DEFLATE_LEVEL)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return _IdentityCompressor()
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    _check_codec(codec)
+    if codec == DEFLATE:
+        return zlib.compress(data, DEFLATE_LEVEL)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def decompress(codec: Optional[str], data: bytes) -> bytes:
+    codec = codec or IDENTITY
+    _check_codec(codec)
+    if codec == DEFLATE:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        # Streamed payloads have no content size in the frame header
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def encode(policy: CodecPolicy, data: bytes, mime_type: Optional[str], filename: Optional[str]) -> Tuple[str, bytes]:
+    """Compresses a whole payload per `policy`; keeps it as is if that does not make it smaller."""
+    codec = policy.codec_for(mime_type, filename, len(data))
+    if codec == IDENTITY:
+        return IDENTITY, data
+    stored = compress(codec, data)
+    if len(stored) >= len(data):
+        return IDENTITY, data
+    return codec, stored
+
+
+class _InflateReader(io.RawIOBase):
+    """Readable stream of the inflated contents of a deflate (zlib) stream; reads fill the buffer unless at EOF."""
+
+    def __init__(self, raw: BinaryIO):
+        super().__init__()
+        self._raw = raw
+        self._inflater = zlib.decompressobj()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        filled = 0
+        while filled < len(buffer):
+            data = self._inflater.unconsumed_tail
+            if not data:
+                if self._inflater.eof:
+                    break
+                data = self._raw.read(READ_CHUNK_SIZE)
+                if not data:
+                    raise EOFError("Compressed payload is truncated")
+            out = self._inflater.decompress(data, len(buffer) - filled)
+            buffer[filled: filled + len(out)] = out
+            filled += len(out)
+        return filled
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Seekable reader over the decompressed contents of a stored payload.
+
+    Forward seeks decompress and discard; backward seeks restart from the
+    beginning of the payload, so random access is O(offset). `size` (the
+    uncompressed length) is needed for SEEK_END. Closing closes `raw`.
+    """
+
+    def __init__(self, codec: str, raw: BinaryIO, size: Optional[int] = None):
+        super().__init__()
+        _check_codec(codec)
+        self.codec = codec
+        self.size = size
+        self._raw = raw
+        self._start = raw.tell()
+        self._pos = 0
+        self._stream = self._open()
+
+    def _open(self):
+        if self.codec == DEFLATE:
+            return _InflateReader(self._raw)
+        return zstandard.ZstdDecompressor().stream_reader(self._raw, read_size=READ_CHUNK_SIZE, closefd=False)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        # Decoders return what one compressed chunk inflates to; fill the
+        # buffer, since image readers take a short read for a truncated file
+        filled = 0
+        while filled < len(buffer):
+            data = self._stream.read(len(buffer) - filled)
+            if not data:
+                break
+            buffer[filled: filled + len(data)] = data
+            filled += len(data)
+        self._pos += filled
+        return filled
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                raise io.UnsupportedOperation("Uncompressed size unknown; cannot seek from the end")
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        if offset < self._pos:
+            self._raw.seek(self._start)
+            self._stream = self._open()
+            self._pos = 0
+        while self._pos < offset:
+            if not self.read(min(offset - self._pos, READ_CHUNK_SIZE)):
+                break
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+def open_decompressed(codec: Optional[str], raw: BinaryIO, size: Optional[int] = None) -> BinaryIO:
+    """Wraps a stored payload stream so reads return the original bytes."""
+    codec = codec or IDENTITY
+    if codec == IDENTITY:
+        return raw
+    return DecompressingReader(codec, raw, size)
@@ -0,0 +1,310 @@
+"""
+Process-wide SQLite connection management for the patient database.
+
+Connections are opened once per thread and reused for every call, configured
+for concurrent access (WAL journal, relaxed fsync, larger page cache, memory
+mapped reads) and with a busy timeout so writers queue instead of failing.
+"""
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .blobstore import BlobStore
+from .cache import DEFAULT_MAXSIZE, DEFAULT_TTL_SECONDS, PatientRecordCache
+from .compression import CodecPolicy, codec_policy_from_env
+from .schema import migrate
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get("MEDAGENT_PATIENT_DB", "data/patient_db.sqlite")
+
+# Directory of the content-addressed payload store; unset keeps payloads inline
+BLOB_STORE_DIR = os.environ.get("MEDAGENT_BLOB_STORE") or None
+
+# "auto" picks a payload codec per MIME type (see compression.py); a codec
+# name ("identity", "deflate", "zstd") applies to every new file payload
+FILE_COMPRESSION = os.environ.get("MEDAGENT_FILE_COMPRESSION", "auto")
+
+# Thumbnails/previews/headers for new imaging files (see derivatives.py):
+# "background" (one worker thread), "sync" (before the write returns) or "off"
+FILE_DERIVATIVES = os.environ.get("MEDAGENT_FILE_DERIVATIVES", "background")
+DERIVATIVE_MODES = ("background", "sync", "off")
+
+# Patient record cache bounds (0 disables the cache)
+PATIENT_CACHE_SIZE = int(os.environ.get("MEDAGENT_PATIENT_CACHE_SIZE", DEFAULT_MAXSIZE))
+PATIENT_CACHE_TTL_SECONDS = DEFAULT_TTL_SECONDS
+
+# How long a connection waits on a locked database before raising
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every new connection. WAL lets readers proceed while a writer
+# holds the lock; synchronous=NORMAL is durable across application crashes in
+# WAL mode and only risks the last commits on power loss.
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # KiB (negative = size, not pages) -> ~16 MB per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class ConnectionManager:
+    """
+    Hands out one SQLite connection per thread for a single database file.
+
+    Connections are created lazily, configured once and kept open until
+    `close_all()` is called. A forked child never reuses the parent's
+    connections. `initializer` (e.g. schema migration) runs once, on the
+    first connection the manager opens. With `blob_store_dir`, new file
+    payloads go to a content-addressed store instead of inline BLOBs.
+    Patient records read through the manager are cached in `patient_cache`.
+    New payloads are compressed as `codec_policy` decides, and derivatives
+    of new imaging files are generated as `derivatives` says. A `read_only`
+    manager opens the file with `mode=ro` (any write raises
+    sqlite3.OperationalError) and never runs `initializer`, e.g. for a
+    snapshot made by `backup_database`.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+        initializer: Optional[Callable[[sqlite3.Connection], Any]] = None,
+        blob_store_dir: Optional[str] = None,
+        cache_size: int = PATIENT_CACHE_SIZE,
+        cache_ttl: float = PATIENT_CACHE_TTL_SECONDS,
+        codec_policy: Optional[CodecPolicy] = None,
+        derivatives: str = FILE_DERIVATIVES,
+        read_only: bool = False,
+    ):
+        if derivatives not in DERIVATIVE_MODES:
+            raise ValueError(f"derivatives must be one of {', '.join(DERIVATIVE_MODES)}, not {derivatives!r}")
+        self.db_path = db_path
+        self.derivatives = derivatives
+        self.blob_store = BlobStore(blob_store_dir) if blob_store_dir else None
+        self.codec_policy = codec_policy or codec_policy_from_env(FILE_COMPRESSION)
+        self.patient_cache = PatientRecordCache(cache_size, cache_ttl)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.initializer = initializer
+        self.read_only = read_only
+        self._initialized = initializer is None or read_only
+        self._init_lock = threading.Lock()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._pid = os.getpid()
+        # Connections inherited across fork(): referenced but never touched,
+        # closing them in the child could release the parent's file locks.
+        self._inherited: list = []
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # isolation_level=None: statements autocommit unless wrapped in
+        # `transaction()`, which issues explicit BEGIN IMMEDIATE / COMMIT.
+        conn = sqlite3.connect(
+            f"{pathlib.Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro" if self.read_only else self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=self.read_only,
+        )
+        conn.row_factory = sqlite3.Row  # This enables dictionary-like access to rows
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if not self.read_only:  # the journal mode is stored in the file
+            conn.execute("PRAGMA journal_mode = WAL")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _check_fork(self) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._inherited.extend(self._connections.values())
+                    self._connections = {}
+                    self._local = threading.local()
+                    self._pid = os.getpid()
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns the calling thread's connection, opening it on first use."""
+        self._check_fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        conn = self._open()
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    try:
+                        self.initializer(conn)
+                    except BaseException:
+                        conn.close()
+                        raise
+                    self._initialized = True
+        self._local.conn = conn
+        with self._lock:
+            # Drop connections owned by threads that have since exited
+            alive = {t.ident for t in threading.enumerate()}
+            for ident in [i for i in self._connections if i not in alive]:
+                self._connections.pop(ident).close()
+            self._connections[threading.get_ident()] = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs the block in a write transaction on the thread's connection.
+
+        BEGIN IMMEDIATE takes the write lock up front so the busy timeout
+        applies, instead of failing mid-transaction on lock upgrade. Nested
+        use joins the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs the block's reads against one consistent snapshot.
+
+        A deferred BEGIN holds a WAL read mark until the block exits, so keep
+        it short: checkpoints cannot reclaim the WAL past an open reader.
+        Nested use (including inside `transaction()`) joins the outer one.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close_all(self) -> None:
+        """Closes every connection opened by this manager."""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections = {}
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to close patient DB connection: {e}")
+
+
+# Singleton - Lazy Loaded
+_manager: Optional[ConnectionManager] = None
+_manager_lock = threading.Lock()
+
+# Set by `use_manager` (e.g. the sharded store routing a call to one shard)
+_manager_override: ContextVar[Optional[ConnectionManager]] = ContextVar("patient_db_manager", default=None)
+
+
+def get_manager() -> ConnectionManager:
+    global _manager
+    override = _manager_override.get()
+    if override is not None:
+        return override
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager(
+                    DB_PATH, initializer=migrate, blob_store_dir=BLOB_STORE_DIR
+                )
+    return _manager
+
+
+def configure(
+    db_path: Optional[str] = None,
+    auto_migrate: bool = True,
+    blob_store_dir: Optional[str] = None,
+    **kwargs: Any,
+) -> ConnectionManager:
+    """
+    Points the process at a database file, replacing the current manager.
+
+    With `auto_migrate` the schema is brought up to date on first use.
+    `blob_store_dir` enables the external payload store (default: MEDAGENT_BLOB_STORE,
+    not carried over from earlier calls).
+    Keyword arguments are passed to `ConnectionManager` (pragmas, busy_timeout_ms,
+    cache_size, cache_ttl, codec_policy, derivatives, read_only).
+    """
+    global DB_PATH, _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close_all()
+        if db_path is not None:
+            DB_PATH = db_path
+        _manager = ConnectionManager(
+            DB_PATH,
+            initializer=migrate if auto_migrate else None,
+            blob_store_dir=blob_store_dir or BLOB_STORE_DIR,
+            **kwargs,
+        )
+    return _manager
+
+
+@contextmanager
+def use_manager(manager: ConnectionManager) -> Iterator[ConnectionManager]:
+    """
+    Runs the block's patient DB calls against `manager` instead of the configured one.
+
+    The override is a context variable: it covers the calling thread (and
+    tasks or executor calls that copy its context), not other threads.
+    """
+    token = _manager_override.set(manager)
+    try:
+        yield manager
+    finally:
+        _manager_override.reset(token)
+
+
+def get_db_path() -> str:
+    return get_manager().db_path
+
+
+def connection() -> sqlite3.Connection:
+    return get_manager().connection()
+
+
+def transaction():
+    return get_manager().transaction()
+
+
+def read_transaction():
+    return get_manager().read_transaction()
+
+
+def migrate_database() -> int:
+    """Applies pending schema migrations to the configured database; returns the schema version."""
+    return migrate(connection())
+
+
+def close_connections() -> None:
+    if _manager is not None:
+        _manager.close_all()
@@ -0,0 +1,257 @@
+"""
+Precomputed derivatives of imaging files.
+
+For every stored image (PNG, JPEG, DICOM, `.npy`, NIfTI) the header fields
+and two PNG renderings are kept in `patient_file_derivatives`: a thumbnail
+and a larger preview, both windowed to 8 bits (1st-99th percentile) from
+the middle slice. Interactive readers - the viewer, tools that show an
+image to the model - ask for a rendering by size instead of decoding the
+original each time.
+
+Derivatives are generated after the file is committed: on a single
+background worker thread by default, inline with `derivatives="sync"`, or
+not at all with "off" (see `configure`). Header fields need only the
+standard library; renderings need numpy and Pillow (and nibabel/pydicom
+for NIfTI/DICOM). Without them only the header is stored.
+"""
+import contextvars
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .compression import decompress
+from .connection import ConnectionManager, get_manager
+from .imaging import DICOM, JPEG, NIFTI, NPY, PNG, is_imaging_file, read_image_header
+from .queries import SELECT_DERIVATIVE_BY_SIZE, SELECT_FILE_HEADER
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL = "thumbnail"
+PREVIEW = "preview"
+HEADER = "header"
+
+# kind -> bound on the longer side, in pixels
+RENDITIONS = {THUMBNAIL: 128, PREVIEW: 512}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _executor_lock:
+        # A forked child inherits the pool object but not its thread
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="patient-db-derivatives")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _utc_timestamp() -> str:
+    from .records import _utc_timestamp as timestamp
+
+    return timestamp()
+
+
+def _read_payload(manager: ConnectionManager, file_id: int) -> Optional[Tuple[bytes, Optional[str], Optional[str]]]:
+    row = manager.connection().execute(
+        "SELECT data, blob_sha256, codec, filename, mime_type FROM patient_files WHERE file_id = ?", (file_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    data = row["data"]
+    if row["blob_sha256"] is not None:
+        if manager.blob_store is None:
+            raise RuntimeError("Patient file payload is in the external blob store, but no blob store is configured")
+        with manager.blob_store.open(row["blob_sha256"]) as f:
+            data = f.read()
+    if data is None:
+        return None
+    return decompress(row["codec"], data), row["filename"], row["mime_type"]
+
+
+def _load_slice(data: bytes, fmt: Optional[str]):
+    """Payload -> 2D numpy array of the middle slice, or None if it cannot be decoded here."""
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        return None
+
+    if fmt in (PNG, JPEG):
+        with Image.open(io.BytesIO(data)) as img:
+            if img.mode not in ("L", "I", "I;16", "F"):
+                img = img.convert("L")
+            pixels = np.asarray(img)
+    elif fmt == NPY:
+        pixels = np.load(io.BytesIO(data), allow_pickle=False)
+    elif fmt == NIFTI:
+        import gzip
+
+        import nibabel as nib
+        from nibabel.fileholders import FileHolder
+
+        stream = io.BytesIO(data)
+        if data.startswith(b"\x1f\x8b"):
+            stream = io.BytesIO(gzip.decompress(data))
+        holder = FileHolder(fileobj=stream)
+        pixels = np.asanyarray(nib.Nifti1Image.from_file_map({"header": holder, "image": holder}).dataobj)
+    elif fmt == DICOM:
+        import pydicom
+
+        pixels = pydicom.dcmread(io.BytesIO(data)).pixel_array
+    else:
+        return None
+
+    # Same slice the imaging agent analyses by default: middle of axis 2
+    while pixels.ndim > 2:
+        pixels = pixels[:, :, pixels.shape[2] // 2] if pixels.ndim == 3 else pixels[..., 0]
+    return pixels if pixels.ndim == 2 and pixels.size else None
+
+
+def _render(pixels, max_size: int) -> Tuple[bytes, int, int]:
+    """2D array -> (PNG bytes, width, height), windowed to uint8 and bounded to `max_size`."""
+    import numpy as np
+    from PIL import Image
+
+    if pixels.dtype != np.uint8:
+        low, high = np.percentile(pixels, [1, 99])
+        if high <= low:
+            high = low + 1
+        pixels = ((np.clip(pixels, low, high) - low) * (255.0 / (high - low))).astype(np.uint8)
+    img = Image.fromarray(pixels)
+    img.thumbnail((max_size, max_size))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue(), img.width, img.height
+
+
+def generate_derivatives(file_id: int, manager: Optional[ConnectionManager] = None) -> List[str]:
+    """Computes and stores the derivatives of one file now; returns the kinds stored.
+
+    Replaces any earlier derivatives of the file. Returns [] if the file no
+    longer exists.
+    """
+    manager = manager or get_manager()
+    payload = _read_payload(manager, file_id)
+    if payload is None:
+        return []
+    data, filename, mime_type = payload
+
+    header = read_image_header(data, mime_type, filename)
+    created_at = _utc_timestamp()
+    rows = [(file_id, HEADER, None, header.get("width"), header.get("height"), None, None, json.dumps(header), created_at)]
+    try:
+        pixels = _load_slice(data, header["format"])
+    except Exception as e:
+        logger.warning(f"Could not decode patient file {file_id} for previews: {e}")
+        pixels = None
+    if pixels is not None:
+        for kind, max_size in RENDITIONS.items():
+            png, width, height = _render(pixels, max_size)
+            rows.append((file_id, kind, max_size, width, height, "image/png", png, None, created_at))
+
+    with manager.transaction() as conn:
+        # The file may have been deleted while we were decoding it
+        if conn.execute("SELECT 1 FROM patient_files WHERE file_id = ?", (file_id,)).fetchone() is None:
+            return []
+        conn.execute("DELETE FROM patient_file_derivatives WHERE file_id = ?", (file_id,))
+        conn.executemany(
+            "INSERT INTO patient_file_derivatives"
+            " (file_id, kind, max_size, width, height, mime_type, data, metadata, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    return [row[1] for row in rows]
+
+
+def _generate_quietly(file_ids: List[int], manager: ConnectionManager) -> None:
+    for file_id in file_ids:
+        # configure() replaced the manager (and maybe the database) meanwhile
+        if manager is not get_manager():
+            return
+        try:
+            generate_derivatives(file_id, manager)
+        except Exception as e:
+            logger.warning(f"Could not generate derivatives for patient file {file_id}: {e}")
+
+
+def schedule_derivatives(files: Iterable[Tuple[int, Optional[str], Optional[str]]]) -> None:
+    """Queues derivative generation for newly stored `(file_id, mime_type, filename)`s that are images.
+
+    Call after the files are committed. Never raises for a file that
+    cannot be decoded; the failure is logged.
+    """
+    manager = get_manager()
+    if manager.derivatives == "off":
+        return
+    file_ids = [file_id for file_id, mime_type, filename in files if is_imaging_file(mime_type, filename)]
+    if not file_ids:
+        return
+    if manager.derivatives == "sync":
+        _generate_quietly(file_ids, manager)
+    else:
+        # The worker sees the caller's `use_manager` override (a shard), if any
+        _get_executor().submit(contextvars.copy_context().run, _generate_quietly, file_ids, manager)
+
+
+def wait_for_derivatives(timeout: Optional[float] = None) -> None:
+    """Blocks until every derivative queued so far has been generated (the worker runs jobs in order)."""
+    _get_executor().submit(lambda: None).result(timeout)
+
+
+def get_file_derivative(file_id: int, size: int = RENDITIONS[THUMBNAIL], generate: bool = True) -> Optional[Dict[str, Any]]:
+    """A PNG rendering of an imaging file for display, without decoding the original.
+
+    Returns the smallest stored rendering at least `size` pixels on its
+    longer side (else the largest) as a dict with `kind`, `max_size`,
+    `width`, `height`, `mime_type` and `data`, or None. With `generate`,
+    a file that has no derivatives yet (stored before they existed, or
+    still queued) gets them now.
+    """
+    conn = get_manager().connection()
+    row = conn.execute(SELECT_DERIVATIVE_BY_SIZE, (file_id, size, size)).fetchone()
+    if row is None and generate and conn.execute(SELECT_FILE_HEADER, (file_id,)).fetchone() is None:
+        generate_derivatives(file_id)
+        row = conn.execute(SELECT_DERIVATIVE_BY_SIZE, (file_id, size, size)).fetchone()
+    return dict(row) if row else None
+
+
+def get_file_header(file_id: int, generate: bool = True) -> Optional[Dict[str, Any]]:
+    """Header fields of an imaging file (`format`, `width`, `height`, `slices`, `dtype`), or None."""
+    conn = get_manager().connection()
+    row = conn.execute(SELECT_FILE_HEADER, (file_id,)).fetchone()
+    if row is None and generate and generate_derivatives(file_id):
+        row = conn.execute(SELECT_FILE_HEADER, (file_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def backfill_derivatives(batch_size: int = 100) -> int:
+    """Generates derivatives for stored imaging files that have none; returns the number processed."""
+    manager = get_manager()
+    conn = manager.connection()
+    processed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT f.file_id, f.mime_type, f.filename FROM patient_files f"
+            " WHERE f.file_id > ? AND NOT EXISTS"
+            " (SELECT 1 FROM patient_file_derivatives d WHERE d.file_id = f.file_id AND d.kind = 'header')"
+            " ORDER BY f.file_id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return processed
+        for file_id, mime_type, filename in rows:
+            if is_imaging_file(mime_type, filename):
+                try:
+                    generate_derivatives(file_id, manager)
+                except Exception as e:
+                    logger.warning(f"Could not generate derivatives for patient file {file_id}: {e}")
+                processed += 1
+        last_id = rows[-1][0]
@@ -0,0 +1,276 @@
+"""
+Header parsing for stored imaging payloads.
+
+Reads the format, pixel type and dimensions of PNG, JPEG, NumPy `.npy`,
+NIfTI-1/2 (plain or gzipped) and DICOM files from their first bytes,
+without decoding pixel data. Only the standard library is needed, except
+for DICOM headers, which use `pydicom` when it is installed.
+
+Dimensions follow the imaging agent's convention: `width` x `height`
+pixels per slice, `slices` along the third axis (1 for 2D images).
+Spacings are in millimetres along the same axes (`spacing_x` across a
+row, `spacing_y` down a column, `spacing_z` between slices).
+
+`IMAGING_COLUMNS` are the header fields kept on `patient_files` itself
+(schema migration 11), filled in when a file is stored so studies can be
+selected without reading any payload (see `studies.py`).
+"""
+import ast
+import io
+import struct
+import zlib
+from typing import Any, Dict, Optional
+
+PNG = "png"
+JPEG = "jpeg"
+NPY = "npy"
+NIFTI = "nifti"
+DICOM = "dicom"
+
+_MIME_FORMATS = {
+    "image/png": PNG,
+    "image/jpeg": JPEG,
+    "application/x-npy": NPY,
+    "application/x-nifti": NIFTI,
+    "application/dicom": DICOM,
+}
+
+_EXTENSION_FORMATS = {
+    ".png": PNG,
+    ".jpg": JPEG,
+    ".jpeg": JPEG,
+    ".npy": NPY,
+    ".nii": NIFTI,
+    ".nii.gz": NIFTI,
+    ".dcm": DICOM,
+}
+
+# Enough for any NIfTI header (540 bytes + extension flag) and most DICOM headers
+HEADER_BYTES = 64 * 1024
+
+_NIFTI_DTYPES = {
+    2: "uint8", 4: "int16", 8: "int32", 16: "float32", 64: "float64",
+    256: "int8", 512: "uint16", 768: "uint32", 1024: "int64", 1280: "uint64",
+}
+
+_NPY_KINDS = {"i": "int", "u": "uint", "f": "float", "b": "bool"}
+
+# NIfTI xyzt_units spatial codes -> millimetres per unit
+_NIFTI_UNITS_MM = {0: 1.0, 1: 1000.0, 2: 1.0, 3: 0.001}
+
+# patient_files column -> header field
+IMAGING_COLUMNS = {
+    "modality": "modality",
+    "rows": "height",
+    "cols": "width",
+    "slices": "slices",
+    "dtype": "dtype",
+    "spacing_x": "spacing_x",
+    "spacing_y": "spacing_y",
+    "spacing_z": "spacing_z",
+    "study_date": "study_date",
+}
+
+
+def is_imaging_file(mime_type: Optional[str], filename: Optional[str]) -> bool:
+    """Whether a file's MIME type or name marks it as an image this module understands."""
+    return _declared_format(mime_type, filename) is not None
+
+
+def _declared_format(mime_type: Optional[str], filename: Optional[str]) -> Optional[str]:
+    fmt = _MIME_FORMATS.get((mime_type or "").split(";")[0].strip().lower())
+    if fmt is None and filename:
+        name = filename.lower()
+        matches = [ext for ext in _EXTENSION_FORMATS if name.endswith(ext)]
+        if matches:
+            fmt = _EXTENSION_FORMATS[max(matches, key=len)]
+    return fmt
+
+
+def sniff_format(data: bytes, mime_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[str]:
+    """Format from the payload's magic bytes, else from its MIME type or filename."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return PNG
+    if data.startswith(b"\xff\xd8\xff"):
+        return JPEG
+    if data.startswith(b"\x93NUMPY"):
+        return NPY
+    if data[128:132] == b"DICM":
+        return DICOM
+    if data.startswith(b"\x1f\x8b") or _nifti_header(data) is not None:
+        return NIFTI if _declared_format(mime_type, filename) in (None, NIFTI) else None
+    return _declared_format(mime_type, filename)
+
+
+def read_image_header(data: bytes, mime_type: Optional[str] = None, filename: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Header fields of an imaging payload: `format`, `width`, `height`,
+    `slices`, `dtype` (NumPy-style name), `modality` (DICOM only),
+    `spacing_x`/`spacing_y`/`spacing_z` and `study_date` (ISO, DICOM only).
+    Fields that cannot be read are None; a payload in no known format
+    gives `{"format": None}`. The first `HEADER_BYTES` of the payload are
+    enough.
+    """
+    fmt = sniff_format(data, mime_type, filename)
+    parser = _PARSERS.get(fmt)
+    header: Dict[str, Any] = {"format": fmt, "width": None, "height": None, "slices": None, "dtype": None}
+    header.update(dict.fromkeys(("modality", "spacing_x", "spacing_y", "spacing_z", "study_date")))
+    if parser is None:
+        return {"format": None} if fmt is None else header
+    try:
+        header.update(parser(data))
+    except (ValueError, struct.error, SyntaxError, zlib.error):
+        pass
+    return header
+
+
+def imaging_columns(data: bytes, mime_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[tuple]:
+    """Values for `IMAGING_COLUMNS` from a payload's first bytes, or None if it is not an image."""
+    header = read_image_header(data[:HEADER_BYTES], mime_type, filename)
+    if header["format"] is None:
+        return None
+    return tuple(header[field] for field in IMAGING_COLUMNS.values())
+
+
+def _png(data: bytes) -> Dict[str, Any]:
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", data[16:26])
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type, 1)
+    header = {
+        "width": width, "height": height, "slices": 1, "channels": channels,
+        "dtype": "uint16" if bit_depth == 16 else "uint8",
+    }
+    # pHYs precedes the image data; unit 1 is pixels per metre
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        if kind == b"pHYs":
+            per_x, per_y, unit = struct.unpack(">IIB", data[pos + 8:pos + 17])
+            if unit == 1 and per_x and per_y:
+                header.update(spacing_x=1000.0 / per_x, spacing_y=1000.0 / per_y)
+            break
+        if kind in (b"IDAT", b"IEND"):
+            break
+        pos += 12 + length
+    return header
+
+
+def _jpeg(data: bytes) -> Dict[str, Any]:
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG marker")
+        marker = data[pos + 1]
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            precision, height, width, channels = struct.unpack(">BHHB", data[pos + 4:pos + 10])
+            return {
+                "width": width, "height": height, "slices": 1, "channels": channels,
+                "dtype": "uint16" if precision > 8 else "uint8",
+            }
+        pos += 2 + length
+    return {}
+
+
+def _npy(data: bytes) -> Dict[str, Any]:
+    major = data[6]
+    if major == 1:
+        (length,), start = struct.unpack("<H", data[8:10]), 10
+    else:
+        (length,), start = struct.unpack("<I", data[8:12]), 12
+    meta = ast.literal_eval(data[start:start + length].decode("latin1"))
+    shape = tuple(meta["shape"])
+    if meta.get("fortran_order"):
+        raise ValueError("Fortran-ordered arrays are not previewed")
+    descr = meta["descr"]
+    kind = _NPY_KINDS.get(descr[1:2]) if isinstance(descr, str) else None
+    dtype = f"{kind}{int(descr[2:]) * 8}" if kind and kind != "bool" else kind
+    return {
+        "height": shape[0] if len(shape) > 0 else None,
+        "width": shape[1] if len(shape) > 1 else None,
+        "slices": shape[2] if len(shape) > 2 else 1,
+        "dtype": dtype,
+    }
+
+
+def _nifti_header(data: bytes) -> Optional[tuple]:
+    """(header bytes, byte order, version) if `data` starts with a NIfTI header."""
+    for order in "<>":
+        size = struct.unpack(order + "i", data[:4])[0] if len(data) >= 4 else None
+        if size == 348 and data[344:347] in (b"n+1", b"ni1"):
+            return data[:348], order, 1
+        if size == 540 and data[4:7] in (b"n+2", b"ni2"):
+            return data[:540], order, 2
+    return None
+
+
+def _nifti(data: bytes) -> Dict[str, Any]:
+    if data.startswith(b"\x1f\x8b"):
+        data = zlib.decompressobj(wbits=31).decompress(data, 540)
+    parsed = _nifti_header(data)
+    if parsed is None:
+        raise ValueError("Not a NIfTI header")
+    header, order, version = parsed
+    if version == 1:
+        dims = struct.unpack(order + "8h", header[40:56])
+        datatype = struct.unpack(order + "h", header[70:72])[0]
+        pixdim = struct.unpack(order + "8f", header[76:108])
+        units = header[123]
+    else:
+        datatype = struct.unpack(order + "h", header[12:14])[0]
+        dims = struct.unpack(order + "8q", header[16:80])
+        pixdim = struct.unpack(order + "8d", header[104:168])
+        units = struct.unpack(order + "i", header[500:504])[0]
+    ndim = dims[0]
+    scale = _NIFTI_UNITS_MM.get(units & 0x07, 1.0)
+
+    def spacing(axis):
+        return float(pixdim[axis]) * scale if ndim >= axis and pixdim[axis] > 0 else None
+
+    return {
+        "width": dims[1] if ndim >= 1 else None,
+        "height": dims[2] if ndim >= 2 else None,
+        "slices": dims[3] if ndim >= 3 else 1,
+        "dtype": _NIFTI_DTYPES.get(datatype),
+        "spacing_x": spacing(1),
+        "spacing_y": spacing(2),
+        "spacing_z": spacing(3),
+    }
+
+
+def _dicom(data: bytes) -> Dict[str, Any]:
+    try:
+        import pydicom
+    except ImportError:  # optional: format only
+        return {}
+    try:
+        ds = pydicom.dcmread(io.BytesIO(data), stop_before_pixels=True, force=True)
+    except Exception as e:
+        raise ValueError(f"Unreadable DICOM header: {e}") from e
+    bits = ds.get("BitsAllocated")
+    signed = ds.get("PixelRepresentation") == 1
+    # PixelSpacing is (between rows, between columns)
+    pixel_spacing = ds.get("PixelSpacing") or (None, None)
+    slice_spacing = ds.get("SpacingBetweenSlices") or ds.get("SliceThickness")
+    study_date = str(ds.get("StudyDate") or "")
+    return {
+        "width": ds.get("Columns"),
+        "height": ds.get("Rows"),
+        "slices": int(ds.get("NumberOfFrames") or 1),
+        "dtype": f"{'int' if signed else 'uint'}{bits}" if bits else None,
+        "modality": str(ds.get("Modality") or "").upper() or None,
+        "spacing_x": _float(pixel_spacing[1]),
+        "spacing_y": _float(pixel_spacing[0]),
+        "spacing_z": _float(slice_spacing),
+        "study_date": f"{study_date[:4]}-{study_date[4:6]}-{study_date[6:8]}" if len(study_date) >= 8 else None,
+    }
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+_PARSERS = {PNG: _png, JPEG: _jpeg, NPY: _npy, NIFTI: _nifti, DICOM: _dicom}
@@ -0,0 +1,223 @@
+"""
+Structured lab observations.
+
+Turns free-text lab result strings and simulator `LabResult` objects into one
+row per analyte in `lab_observations` (value, unit, reference range, flag,
+time), so lookups like "latest troponin" or "all abnormal labs" are indexed
+queries rather than string matching.
+
+Recognised string formats, one result per line, `;` or `,`-separated:
+
+    TROPONIN: 0.8 ng/mL [HIGH]                      (LabResult.__str__)
+    TROPONIN: 0.8 ng/mL (Range 0.0-0.04) → HIGH     (evidence agent)
+    Troponin I 0.8 ng/mL (ref 0-0.04) H
+    Blood culture: negative
+"""
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Mapping, Optional, Tuple, Union
+
+# Where an observation came from: parsed from `patient_lab_results`, or stored structured
+SOURCE_STRING = "string"
+SOURCE_STRUCTURED = "structured"
+
+_FLAGS = {
+    "H": "HIGH", "HIGH": "HIGH",
+    "L": "LOW", "LOW": "LOW",
+    "HH": "CRITICAL", "LL": "CRITICAL", "CRIT": "CRITICAL", "CRITICAL": "CRITICAL", "PANIC": "CRITICAL",
+    "N": "NORMAL", "NORMAL": "NORMAL",
+    "A": "ABNORMAL", "ABN": "ABNORMAL", "ABNORMAL": "ABNORMAL",
+}
+
+_NUMBER = r"-?\d+(?:\.\d+)?"
+_SPLIT = re.compile(r"\s*(?:[;\n]|,\s*(?=[A-Za-z]))\s*")
+_LABELLED = re.compile(r"^(?P<analyte>[A-Za-z][^:=]*?)\s*[:=]\s*(?P<rest>.*)$")
+_BARE = re.compile(rf"^(?P<analyte>[A-Za-z].*?)\s+(?P<rest>[<>]?=?\s*{_NUMBER}(?:\s.*)?)$")
+_VALUE = re.compile(rf"^(?P<cmp>[<>]=?)?\s*(?P<num>{_NUMBER})(?![\d.])\s*(?P<tail>.*)$")
+_RANGE = re.compile(
+    rf"\(\s*(?:(?:ref(?:erence)?|normal)(?:\s+range)?|range)?[:\s]*(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})\s*\)",
+    re.IGNORECASE,
+)
+_FLAG = re.compile(
+    r"\[\s*(?P<bracket>[A-Za-z]+)\s*\]"
+    r"|(?:→|->)\s*(?P<arrow>[A-Za-z]+)"
+    r"|\(\s*(?P<paren>HH|LL|H|L|N|A|HIGH|LOW|CRIT|CRITICAL|NORMAL|ABNORMAL)\s*\)"
+    r"|(?:^|\s)(?P<bare>HH|LL|H|L)\s*$",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class LabObservation:
+    analyte: str
+    value: Optional[float] = None
+    unit: Optional[str] = None
+    ref_low: Optional[float] = None
+    ref_high: Optional[float] = None
+    flag: Optional[str] = None
+    observed_at: Optional[str] = None
+    # Raw value when it is not a plain number ("negative", "<0.01")
+    value_text: Optional[str] = None
+
+
+def normalize_analyte(name: str) -> str:
+    return " ".join(name.split()).upper()
+
+
+def _normalize_flag(flag: Optional[str]) -> Optional[str]:
+    if not flag:
+        return None
+    flag = flag.strip().upper()
+    return _FLAGS.get(flag, flag)
+
+
+def _derive_flag(obs: LabObservation) -> Optional[str]:
+    if obs.value is None or obs.ref_low is None or obs.ref_high is None:
+        return None
+    if obs.value < obs.ref_low:
+        return "LOW"
+    if obs.value > obs.ref_high:
+        return "HIGH"
+    return "NORMAL"
+
+
+def _parse_range(text: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    match = re.fullmatch(rf"\s*({_NUMBER})\s*(?:-|–|to)\s*({_NUMBER})\s*", text or "")
+    if not match:
+        return None, None
+    return float(match.group(1)), float(match.group(2))
+
+
+def _parse_entry(entry: str) -> Optional[LabObservation]:
+    match = _LABELLED.match(entry) or _BARE.match(entry)
+    if not match:
+        return None
+    obs = LabObservation(analyte=normalize_analyte(match.group("analyte")))
+    rest = match.group("rest").strip()
+
+    value = _VALUE.match(rest)
+    if value is None:
+        if not rest:
+            return None
+        obs.value_text = rest
+        return obs
+    obs.value = float(value.group("num"))
+    if value.group("cmp"):
+        obs.value_text = f"{value.group('cmp')}{value.group('num')}"
+    tail = value.group("tail")
+
+    ref = _RANGE.search(tail)
+    if ref:
+        obs.ref_low, obs.ref_high = float(ref.group("low")), float(ref.group("high"))
+        tail = tail[: ref.start()] + " " + tail[ref.end():]
+    flag = _FLAG.search(tail)
+    if flag:
+        obs.flag = _normalize_flag(next(g for g in flag.groups() if g))
+        tail = tail[: flag.start()] + " " + tail[flag.end():]
+    unit = " ".join(tail.split()).strip(",")
+    obs.unit = unit if unit and unit.upper() != "N/A" else None
+    obs.flag = obs.flag or _derive_flag(obs)
+    return obs
+
+
+def parse_lab_results_string(text: Optional[str]) -> List[LabObservation]:
+    """Parses a free-text lab results string; entries that are not recognised are skipped."""
+    if not text:
+        return []
+    observations = []
+    for entry in _SPLIT.split(text.strip()):
+        obs = _parse_entry(entry.strip())
+        if obs is not None:
+            observations.append(obs)
+    return observations
+
+
+def lab_observation_from_result(result: Any) -> LabObservation:
+    """
+    Converts a simulator `LabResult` (or an evidence agent result dict with
+    `test`/`value`/`unit`/`low`/`high`/`flag`) into a LabObservation.
+    """
+    if isinstance(result, Mapping):
+        name = result.get("analyte") or result.get("test") or result.get("test_name")
+        low, high = result.get("ref_low", result.get("low")), result.get("ref_high", result.get("high"))
+        value, unit, flag = result.get("value"), result.get("unit"), result.get("flag")
+        timestamp = result.get("observed_at") or result.get("timestamp")
+    else:
+        name, value, unit, flag = result.test_name, result.value, result.unit, result.flag
+        low, high = _parse_range(result.reference_range)
+        timestamp = getattr(result, "timestamp", None)
+    obs = LabObservation(
+        analyte=normalize_analyte(str(name)),
+        value=float(value) if value is not None else None,
+        unit=unit if unit and unit != "N/A" else None,
+        ref_low=float(low) if low is not None else None,
+        ref_high=float(high) if high is not None else None,
+        flag=_normalize_flag(flag),
+        observed_at=timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp,
+    )
+    obs.flag = obs.flag or _derive_flag(obs)
+    return obs
+
+
+def to_lab_observations(items: Iterable[Union[LabObservation, str, Any]]) -> List[LabObservation]:
+    """Normalises a mix of LabObservations, lab strings, LabResult objects and result dicts."""
+    observations: List[LabObservation] = []
+    for item in items:
+        if isinstance(item, LabObservation):
+            observations.append(item)
+        elif isinstance(item, str):
+            observations.extend(parse_lab_results_string(item))
+        else:
+            observations.append(lab_observation_from_result(item))
+    return observations
+
+
+def insert_lab_observations(
+    conn: sqlite3.Connection,
+    patient_id: str,
+    observations: Iterable[LabObservation],
+    source: str,
+    observed_at: Optional[str] = None,
+) -> int:
+    """Inserts observations for one patient; `observed_at` fills in missing times. Returns the row count."""
+    rows = [
+        (
+            patient_id, obs.analyte, obs.value, obs.value_text, obs.unit, obs.ref_low, obs.ref_high,
+            obs.flag, obs.observed_at or observed_at, source,
+        )
+        for obs in observations
+    ]
+    conn.executemany(
+        "INSERT INTO lab_observations (patient_id, analyte, value, value_text, unit, ref_low, ref_high,"
+        " flag, observed_at, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def append_string_observations(
+    conn: sqlite3.Connection, patient_id: str, lab_results_string: Optional[str], observed_at: Optional[str]
+) -> int:
+    """
+    Appends the observations parsed from a new version of a patient's lab results string.
+
+    Observations derived from earlier versions are kept as history. An
+    observation identical to the latest one of its analyte derived from a
+    string (same value, unit, range and flag, and same time if it names
+    one) is a restated result rather than a new one and is skipped, so
+    resubmitting an unchanged string adds nothing. Returns the row count.
+    """
+    fresh = []
+    for obs in parse_lab_results_string(lab_results_string):
+        latest = conn.execute(
+            "SELECT value, value_text, unit, ref_low, ref_high, flag, observed_at FROM lab_observations"
+            " WHERE patient_id = ? AND analyte = ? AND source = ? ORDER BY observed_at DESC, obs_id DESC LIMIT 1",
+            (patient_id, obs.analyte, SOURCE_STRING),
+        ).fetchone()
+        if latest is not None and tuple(latest[:6]) == (
+            obs.value, obs.value_text, obs.unit, obs.ref_low, obs.ref_high, obs.flag
+        ) and obs.observed_at in (None, latest[6]):
+            continue
+        fresh.append(obs)
+    return insert_lab_observations(conn, patient_id, fresh, SOURCE_STRING, observed_at)
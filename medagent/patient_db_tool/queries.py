@@ -0,0 +1,162 @@
+"""
+SQL for the patient database hot paths.
+
+Every statement that runs on a per-request path is registered in HOT_QUERIES
+with representative parameters, so tests can check its query plan with
+EXPLAIN QUERY PLAN and catch full-table scans before they reach production.
+"""
+
+SELECT_PATIENT = "SELECT description, metadata FROM patient_data WHERE patient_id = ?"
+
+# INSERT OR REPLACE would delete the old row without firing the FTS delete
+# trigger (and give the patient a new id); update in place instead
+UPSERT_PATIENT = (
+    "INSERT INTO patient_data (patient_id, description, metadata) VALUES (?, ?, ?)"
+    " ON CONFLICT(patient_id) DO UPDATE SET description = excluded.description, metadata = excluded.metadata"
+)
+
+SELECT_LAB_RESULTS = "SELECT lab_results_string FROM patient_lab_results WHERE patient_id = ?"
+
+# Next version = the patient's highest + 1 (one seek on the primary key); run
+# under the write lock so versions are gap-free and increasing. The
+# lab_result_versions_latest trigger updates patient_lab_results.
+APPEND_LAB_RESULTS = (
+    "INSERT INTO lab_result_versions (patient_id, version, lab_results_string, submitted_at)"
+    " SELECT ?1, COALESCE(MAX(version), 0) + 1, ?2, ?3 FROM lab_result_versions WHERE patient_id = ?1"
+)
+
+SELECT_LAB_RESULT_VERSIONS = (
+    "SELECT version, lab_results_string, submitted_at FROM lab_result_versions"
+    " WHERE patient_id = ? ORDER BY version"
+)
+
+# `data` is NULL for payloads in the external blob store; `blob_sha256` names them.
+# Either holds the payload as encoded by `codec` (see compression.py)
+SELECT_FILES = (
+    "SELECT file_id, type, data, blob_sha256, codec, filename, mime_type, created_at FROM patient_files"
+    " WHERE patient_id = ? ORDER BY file_id"
+)
+
+SELECT_FILES_BY_TYPE = (
+    "SELECT file_id, type, data, blob_sha256, codec, filename, mime_type, created_at FROM patient_files"
+    " WHERE patient_id = ? AND type = ? ORDER BY file_id"
+)
+
+# length() of a BLOB is read from the record header; the payload is never loaded.
+# Externally stored payloads take their size from blob_refs. Compressed
+# payloads report their uncompressed size (raw_size).
+LIST_FILES = (
+    "SELECT f.file_id, f.type, f.filename, f.mime_type, f.created_at,"
+    " COALESCE(f.raw_size, length(f.data), b.size) AS size"
+    " FROM patient_files f LEFT JOIN blob_refs b ON b.sha256 = f.blob_sha256"
+    " WHERE f.patient_id = ? ORDER BY f.file_id"
+)
+
+LIST_FILES_BY_TYPE = (
+    "SELECT f.file_id, f.type, f.filename, f.mime_type, f.created_at,"
+    " COALESCE(f.raw_size, length(f.data), b.size) AS size"
+    " FROM patient_files f LEFT JOIN blob_refs b ON b.sha256 = f.blob_sha256"
+    " WHERE f.patient_id = ? AND f.type = ? ORDER BY f.file_id"
+)
+
+SELECT_FILE_BY_ID = (
+    "SELECT file_id, patient_id, type, data, blob_sha256, codec, filename, mime_type, created_at"
+    " FROM patient_files WHERE file_id = ?"
+)
+
+SELECT_FILE_INFO_BY_ID = (
+    "SELECT f.file_id, f.patient_id, f.type, f.filename, f.mime_type, f.created_at,"
+    " COALESCE(f.raw_size, length(f.data), b.size) AS size"
+    " FROM patient_files f LEFT JOIN blob_refs b ON b.sha256 = f.blob_sha256"
+    " WHERE f.file_id = ?"
+)
+
+SELECT_FILE_BLOB_REF = "SELECT blob_sha256 FROM patient_files WHERE file_id = ?"
+
+SELECT_FILE_STORAGE = "SELECT blob_sha256, codec, raw_size FROM patient_files WHERE file_id = ?"
+
+_LAB_COLUMNS = "analyte, value, value_text, unit, ref_low, ref_high, flag, observed_at"
+
+# NULL observed_at (backfilled from old strings) sorts last in DESC order
+SELECT_LATEST_LAB = (
+    f"SELECT {_LAB_COLUMNS} FROM lab_observations WHERE patient_id = ? AND analyte = ?"
+    " ORDER BY observed_at DESC, obs_id DESC LIMIT 1"
+)
+
+SELECT_LAB_HISTORY = (
+    f"SELECT {_LAB_COLUMNS} FROM lab_observations WHERE patient_id = ? AND analyte = ?"
+    " ORDER BY observed_at, obs_id"
+)
+
+# The flag predicate must match idx_lab_observations_abnormal's WHERE clause
+SELECT_ABNORMAL_LABS = (
+    f"SELECT {_LAB_COLUMNS} FROM lab_observations"
+    " WHERE patient_id = ? AND flag IS NOT NULL AND flag <> 'NORMAL'"
+    " ORDER BY observed_at DESC, obs_id DESC"
+)
+
+# FTS5 applies ORDER BY rank (bm25) and LIMIT inside the virtual table
+SEARCH_PATIENTS = (
+    "SELECT p.patient_id, s.rank AS score,"
+    " snippet(patient_search, -1, '[', ']', '…', 16) AS snippet"
+    " FROM patient_search s JOIN patient_data p ON p.id = s.rowid"
+    " WHERE patient_search MATCH ? ORDER BY s.rank LIMIT ?"
+)
+
+# Smallest rendering at least `size` pixels on its longer side, else the largest
+SELECT_DERIVATIVE_BY_SIZE = (
+    "SELECT kind, max_size, width, height, mime_type, data FROM patient_file_derivatives"
+    " WHERE file_id = ? AND data IS NOT NULL"
+    " ORDER BY max_size < ?, CASE WHEN max_size >= ? THEN max_size ELSE -max_size END LIMIT 1"
+)
+
+SELECT_FILE_HEADER = "SELECT metadata FROM patient_file_derivatives WHERE file_id = ? AND kind = 'header'"
+
+# Keyset pagination: each page starts after the last patient_id of the
+# previous one, so a page costs the same at any depth (unlike OFFSET)
+SELECT_PATIENTS_PAGE = (
+    "SELECT p.patient_id, p.description, p.metadata, l.lab_results_string"
+    " FROM patient_data p LEFT JOIN patient_lab_results l ON l.patient_id = p.patient_id"
+    " WHERE p.patient_id > ? ORDER BY p.patient_id LIMIT ?"
+)
+
+# Files of every patient in (after, last] - one range scan of the
+# (patient_id, type) index per page instead of one query per patient
+LIST_FILES_IN_RANGE = (
+    "SELECT f.patient_id, f.file_id, f.type, f.filename, f.mime_type, f.created_at,"
+    " COALESCE(f.raw_size, length(f.data), b.size) AS size"
+    " FROM patient_files f LEFT JOIN blob_refs b ON b.sha256 = f.blob_sha256"
+    " WHERE f.patient_id > ? AND f.patient_id <= ? ORDER BY f.patient_id, f.file_id"
+)
+
+LIST_FILES_IN_RANGE_BY_TYPE = (
+    "SELECT f.patient_id, f.file_id, f.type, f.filename, f.mime_type, f.created_at,"
+    " COALESCE(f.raw_size, length(f.data), b.size) AS size"
+    " FROM patient_files f LEFT JOIN blob_refs b ON b.sha256 = f.blob_sha256"
+    " WHERE f.patient_id > ? AND f.patient_id <= ? AND f.type = ? ORDER BY f.patient_id, f.file_id"
+)
+
+# name -> (sql, example parameters)
+HOT_QUERIES = {
+    "patient": (SELECT_PATIENT, ("P-1",)),
+    "lab_results": (SELECT_LAB_RESULTS, ("P-1",)),
+    "append_lab_results": (APPEND_LAB_RESULTS, ("P-1", "WBC: 9", "2024-01-01T00:00:00")),
+    "lab_result_versions": (SELECT_LAB_RESULT_VERSIONS, ("P-1",)),
+    "files": (SELECT_FILES, ("P-1",)),
+    "files_by_type": (SELECT_FILES_BY_TYPE, ("P-1", "CT")),
+    "list_files": (LIST_FILES, ("P-1",)),
+    "list_files_by_type": (LIST_FILES_BY_TYPE, ("P-1", "CT")),
+    "file_by_id": (SELECT_FILE_BY_ID, (1,)),
+    "file_info_by_id": (SELECT_FILE_INFO_BY_ID, (1,)),
+    "file_blob_ref": (SELECT_FILE_BLOB_REF, (1,)),
+    "file_storage": (SELECT_FILE_STORAGE, (1,)),
+    "latest_lab": (SELECT_LATEST_LAB, ("P-1", "TROPONIN")),
+    "lab_history": (SELECT_LAB_HISTORY, ("P-1", "TROPONIN")),
+    "abnormal_labs": (SELECT_ABNORMAL_LABS, ("P-1",)),
+    "search_patients": (SEARCH_PATIENTS, ('"chest" "pain"', 10)),
+    "derivative_by_size": (SELECT_DERIVATIVE_BY_SIZE, (1, 128, 128)),
+    "file_header": (SELECT_FILE_HEADER, (1,)),
+    "patients_page": (SELECT_PATIENTS_PAGE, ("P-1", 500)),
+    "files_in_range": (LIST_FILES_IN_RANGE, ("P-1", "P-5")),
+    "files_in_range_by_type": (LIST_FILES_IN_RANGE_BY_TYPE, ("P-1", "P-5", "CT")),
+}
@@ -0,0 +1,389 @@
+import sqlite3
+import json
+import base64
+import datetime
+from typing import Optional, Dict, Iterable, List, Any, Tuple, Union
+
+from .blobstore import BlobStore, add_blob_ref, collect_garbage, release_blob_ref
+from .compression import decompress, encode
+from .connection import connection, get_manager, transaction
+from .derivatives import schedule_derivatives
+from .imaging import imaging_columns
+from .studies import set_imaging_columns
+from .labs import SOURCE_STRUCTURED, append_string_observations, insert_lab_observations, normalize_analyte, to_lab_observations
+from .queries import (
+    APPEND_LAB_RESULTS,
+    LIST_FILES,
+    LIST_FILES_BY_TYPE,
+    SELECT_FILE_BLOB_REF,
+    SELECT_FILE_BY_ID,
+    SELECT_FILE_INFO_BY_ID,
+    SELECT_FILES,
+    SELECT_FILES_BY_TYPE,
+    SELECT_ABNORMAL_LABS,
+    SELECT_LAB_HISTORY,
+    SELECT_LAB_RESULTS,
+    SELECT_LAB_RESULT_VERSIONS,
+    SELECT_LATEST_LAB,
+    SELECT_PATIENT,
+    UPSERT_PATIENT,
+)
+
+def _utc_timestamp() -> str:
+    """Current UTC time as a naive ISO string (the format `created_at` has always used)."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None).isoformat()
+
+def _require_blob_store() -> BlobStore:
+    store = get_manager().blob_store
+    if store is None:
+        raise RuntimeError(
+            "Patient file payload is in the external blob store, but no blob store is configured "
+            "(set MEDAGENT_BLOB_STORE or configure(blob_store_dir=...))"
+        )
+    return store
+
+def _with_payload(row: sqlite3.Row) -> Dict[str, Any]:
+    """Row -> dict, reading `data` from the blob store for externally stored payloads
+    and decompressing it."""
+    item = dict(row)
+    sha256 = item.pop("blob_sha256")
+    codec = item.pop("codec")
+    if sha256 is not None:
+        with _require_blob_store().open(sha256) as f:
+            item["data"] = f.read()
+    if codec is not None and item["data"] is not None:
+        item["data"] = decompress(codec, item["data"])
+    return item
+
+def _to_record(description: Optional[str], metadata: Optional[str], lab_results_string: Optional[str]) -> Dict[str, Any]:
+    """Stored columns -> the record shape returned by `get_patient_data_from_db`."""
+    return {
+        'description': description,
+        'metadata': json.loads(metadata) if metadata else metadata,
+        'lab_results_string': lab_results_string,
+    }
+
+def _fetch_patient(conn: sqlite3.Connection, patient_id: str) -> Optional[Dict[str, Any]]:
+    cursor = conn.cursor()
+
+    cursor.execute(SELECT_PATIENT, (patient_id,))
+    patient_data = cursor.fetchone()
+
+    cursor.execute(SELECT_LAB_RESULTS, (patient_id,))
+    lab_results = cursor.fetchone()
+
+    if patient_data:
+        lab_results_string = lab_results['lab_results_string'] if lab_results else None
+        return _to_record(patient_data['description'], patient_data['metadata'], lab_results_string)
+    return None
+
+def _invalidate_patients(*patient_ids: str) -> None:
+    get_manager().patient_cache.invalidate_many(patient_ids)
+
+def get_patient_data_from_db(patient_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieves patient data and lab results from the database (cached per patient_id)."""
+    cache = get_manager().patient_cache
+    hit, result = cache.get(patient_id)
+    if hit:
+        return result
+    generation = cache.generation()
+    result = _fetch_patient(connection(), patient_id)
+    cache.put(patient_id, result, generation)
+    return result
+
+def get_or_create_patient_data(
+    patient_id: str, description: Optional[str] = None, metadata: Optional[Dict] = None
+) -> Tuple[Dict[str, Any], bool]:
+    """Fetches a patient, first creating the record if it does not exist.
+
+    Returns `(record, created)`. `description` and `metadata` are only used
+    for a newly created record; an existing one is returned unchanged.
+    """
+    cache = get_manager().patient_cache
+    hit, result = cache.get(patient_id)
+    if hit and result is not None:
+        return result, False
+
+    metadata_json = json.dumps(metadata) if metadata else None
+    generation = cache.generation()
+    with transaction() as conn:
+        created = conn.execute(
+            "INSERT OR IGNORE INTO patient_data (patient_id, description, metadata) VALUES (?, ?, ?)",
+            (patient_id, description, metadata_json),
+        ).rowcount == 1
+        result = _fetch_patient(conn, patient_id)
+    if created:
+        # Drops any cached "not found"; the next read repopulates
+        _invalidate_patients(patient_id)
+    else:
+        cache.put(patient_id, result, generation)
+    return result, created
+
+def get_patient_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and occupancy of the patient record cache."""
+    return get_manager().patient_cache.stats()
+
+def clear_patient_cache() -> None:
+    """Drops every cached patient record (e.g. after writing to the database directly)."""
+    get_manager().patient_cache.clear()
+
+def get_patient_file_from_db(patient_id: str, file_type: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Retrieves file data from the database.
+
+    Supports optional filtering and can return file data as raw bytes or base64-encoded strings.
+
+    Args:
+        patient_id: ID of the patient.
+        file_type: Optional file type to filter by.
+        return_base64: If True, return file data as base64-encoded strings.
+        mime_type: Optional MIME type to filter by.
+        filename_contains: Optional substring that must appear in filename.
+        max_results: Optional limit on number of returned rows.
+    """
+    cursor = connection().cursor()
+
+    if file_type:
+        cursor.execute(SELECT_FILES_BY_TYPE, (patient_id, file_type))
+    else:
+        cursor.execute(SELECT_FILES, (patient_id,))
+    files = cursor.fetchall()
+
+    if not files:
+        return None
+
+    return [_with_payload(f) for f in files]
+
+def list_patient_files(patient_id: str, file_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Lists a patient's files without loading their payloads.
+
+    Each entry has `file_id`, `type`, `filename`, `mime_type`, `created_at` and
+    `size` (bytes, computed by SQLite). Use `get_patient_file_by_id` to fetch
+    the data of a specific file.
+    """
+    cursor = connection().cursor()
+    if file_type:
+        cursor.execute(LIST_FILES_BY_TYPE, (patient_id, file_type))
+    else:
+        cursor.execute(LIST_FILES, (patient_id,))
+    return [dict(f) for f in cursor.fetchall()]
+
+def get_patient_file_by_id(file_id: int) -> Optional[Dict[str, Any]]:
+    """Retrieves a single file, including its `data` payload, by `file_id`."""
+    row = connection().execute(SELECT_FILE_BY_ID, (file_id,)).fetchone()
+    return _with_payload(row) if row else None
+
+def get_patient_file_info(file_id: int) -> Optional[Dict[str, Any]]:
+    """Retrieves a single file's metadata (as in `list_patient_files`) without its payload."""
+    row = connection().execute(SELECT_FILE_INFO_BY_ID, (file_id,)).fetchone()
+    return dict(row) if row else None
+
+def store_patient_data_in_db(patient_id: str, description: str, metadata: Optional[Dict] = None) -> None:
+    """Stores or updates patient data in the database."""
+    metadata_json = json.dumps(metadata) if metadata else None
+    with transaction() as conn:
+        conn.execute(
+            UPSERT_PATIENT,
+            (patient_id, description, metadata_json)
+        )
+    _invalidate_patients(patient_id)
+
+def store_patient_lab_results_in_db(patient_id: str, lab_results_string: str) -> None:
+    """Stores a new version of the patient's lab results.
+
+    Earlier versions are kept (see `get_lab_results_history`); reads of the
+    patient return the latest. The string is also parsed into
+    `lab_observations`, appended to those derived from earlier versions
+    (results restated unchanged are not repeated).
+    """
+    submitted_at = _utc_timestamp()
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+        conn.execute(APPEND_LAB_RESULTS, (patient_id, lab_results_string, submitted_at))
+        append_string_observations(conn, patient_id, lab_results_string, submitted_at)
+    _invalidate_patients(patient_id)
+
+def store_lab_observations(patient_id: str, observations: Iterable[Any]) -> int:
+    """Appends structured lab observations for a patient; returns the number stored.
+
+    Accepts `LabObservation`s, simulator `LabResult` objects, evidence agent
+    result dicts and lab result strings. Observations without a time are
+    stamped with the current UTC time.
+    """
+    parsed = to_lab_observations(observations)
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+        stored = insert_lab_observations(conn, patient_id, parsed, SOURCE_STRUCTURED, _utc_timestamp())
+    _invalidate_patients(patient_id)
+    return stored
+
+def get_latest_lab(patient_id: str, analyte: str) -> Optional[Dict[str, Any]]:
+    """Most recent observation of one analyte (e.g. "troponin"), or None."""
+    row = connection().execute(SELECT_LATEST_LAB, (patient_id, normalize_analyte(analyte))).fetchone()
+    return dict(row) if row else None
+
+def get_lab_history(patient_id: str, analyte: str) -> List[Dict[str, Any]]:
+    """All observations of one analyte, oldest first."""
+    cursor = connection().execute(SELECT_LAB_HISTORY, (patient_id, normalize_analyte(analyte)))
+    return [dict(r) for r in cursor.fetchall()]
+
+def get_abnormal_labs(patient_id: str) -> List[Dict[str, Any]]:
+    """Observations flagged anything other than NORMAL, newest first."""
+    return [dict(r) for r in connection().execute(SELECT_ABNORMAL_LABS, (patient_id,)).fetchall()]
+
+def get_lab_results_history(patient_id: str) -> List[Dict[str, Any]]:
+    """Every lab results string stored for a patient as `version`, `lab_results_string`, `submitted_at`, oldest first.
+
+    `submitted_at` is None for the version that predates the history (schema migration 12).
+    """
+    return [dict(r) for r in connection().execute(SELECT_LAB_RESULT_VERSIONS, (patient_id,)).fetchall()]
+
+def _ensure_bytes(data: Union[bytes, bytearray, memoryview, str]) -> bytes:
+    """Convert various data types to raw bytes suitable for BLOB storage.
+
+    Accepts bytes, bytearray, memoryview or base64-encoded strings (including data URIs).
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, str):
+        if data.startswith("data:") and "," in data:
+            data = data.split(",", 1)[1]
+        try:
+            return base64.b64decode(data)
+        except Exception as e:
+            raise ValueError("String file_data must be base64-encoded") from e
+    raise TypeError("Unsupported file_data type for BLOB storage")
+
+
+def store_patient_file_in_db(
+    patient_id: str,
+    file_type: str,
+    file_data: Union[bytes, str, bytearray, memoryview],
+    filename: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    created_at: Optional[str] = None,
+) -> int:
+    """Stores a patient file in the database as a BLOB and returns its `file_id`.
+
+    `file_data` may be raw bytes or a base64-encoded string (optionally a data URI).
+    The data is converted to bytes, compressed if the configured codec policy
+    says so for its `mime_type`/`filename`, and stored using `sqlite3.Binary`
+    to ensure proper BLOB behavior. Reads return the original bytes. Image
+    header fields (modality, dimensions, spacing, ...) are stored alongside.
+
+    Optional metadata `filename`, `mime_type`, and `created_at` can be provided.
+    If `created_at` is not provided, the current UTC ISO timestamp will be used.
+    """
+    raw_bytes = _ensure_bytes(file_data)
+
+    if created_at is None:
+        created_at = _utc_timestamp()
+
+    manager = get_manager()
+    codec, stored = encode(manager.codec_policy, raw_bytes, mime_type, filename)
+    header = imaging_columns(raw_bytes, mime_type, filename)
+    store = manager.blob_store
+    staged = store.stage(stored) if store is not None else None
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            # Check if patient_id exists in patient_data, if not, create a placeholder
+            cursor.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+
+            if staged is None:
+                cursor.execute(
+                    "INSERT INTO patient_files (patient_id, type, data, codec, raw_size, filename, mime_type, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (patient_id, file_type, sqlite3.Binary(stored), codec, len(raw_bytes), filename, mime_type, created_at),
+                )
+            else:
+                cursor.execute(
+                    "INSERT INTO patient_files (patient_id, type, blob_sha256, codec, raw_size, filename, mime_type, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (patient_id, file_type, staged.sha256, codec, len(raw_bytes), filename, mime_type, created_at),
+                )
+                add_blob_ref(conn, store, staged)
+            set_imaging_columns(conn, [(cursor.lastrowid, header)])
+    finally:
+        if staged is not None:
+            store.discard(staged)  # no-op once published
+    _invalidate_patients(patient_id)
+    schedule_derivatives([(cursor.lastrowid, mime_type, filename)])
+    return cursor.lastrowid
+
+
+def delete_patient_file(file_id: int) -> bool:
+    """Deletes a stored file; returns False if it did not exist.
+
+    Externally stored payloads are reference counted and removed from disk
+    when the last file referencing them is deleted.
+    """
+    store = get_manager().blob_store
+    tomb = None
+    try:
+        with transaction() as conn:
+            row = conn.execute(SELECT_FILE_BLOB_REF, (file_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM patient_files WHERE file_id = ?", (file_id,))
+            conn.execute("DELETE FROM patient_file_derivatives WHERE file_id = ?", (file_id,))
+            if row["blob_sha256"] is not None:
+                tomb = release_blob_ref(conn, store or _require_blob_store(), row["blob_sha256"])
+    except BaseException:
+        if tomb is not None:
+            store.restore(row["blob_sha256"], tomb)
+        raise
+    if tomb is not None:
+        store.empty_trash(tomb)
+    return True
+
+
+def externalize_patient_files(batch_size: int = 50) -> int:
+    """Moves inline BLOB payloads into the configured blob store; returns the number moved.
+
+    Each file is copied to the store chunk by chunk and then switched over in
+    its own short write transaction, so the tool can run next to live
+    traffic. Run VACUUM afterwards to give the freed pages back to the disk.
+    """
+    store = _require_blob_store()
+    conn = connection()
+    moved = 0
+    last_id = 0
+    while True:
+        ids = [
+            r[0]
+            for r in conn.execute(
+                "SELECT file_id FROM patient_files WHERE file_id > ? AND data IS NOT NULL"
+                " ORDER BY file_id LIMIT ?",
+                (last_id, batch_size),
+            )
+        ]
+        if not ids:
+            return moved
+        for file_id in ids:
+            if hasattr(conn, "blobopen"):
+                with conn.blobopen("patient_files", "data", file_id, readonly=True) as blob:
+                    staged = store.stage(blob)
+            else:
+                data = conn.execute("SELECT data FROM patient_files WHERE file_id = ?", (file_id,)).fetchone()[0]
+                staged = store.stage(data)
+            try:
+                with transaction() as tx:
+                    cursor = tx.execute(
+                        "UPDATE patient_files SET data = NULL, blob_sha256 = ?"
+                        " WHERE file_id = ? AND data IS NOT NULL",
+                        (staged.sha256, file_id),
+                    )
+                    if cursor.rowcount:
+                        add_blob_ref(tx, store, staged)
+                        moved += 1
+            finally:
+                store.discard(staged)
+        last_id = ids[-1]
+
+
+def collect_blob_garbage() -> int:
+    """Removes blob store files no patient file references; returns the number removed."""
+    with transaction() as conn:
+        return collect_garbage(conn, _require_blob_store())
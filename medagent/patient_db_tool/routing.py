@@ -0,0 +1,159 @@
+"""
+Process-wide sharding: the package API routed to a sharded store.
+
+With a shard count configured (`configure(shards=N)`, or the
+MEDAGENT_PATIENT_SHARDS environment variable), the database path names a
+shard directory (see sharding.py) and the functions patient_db_tool and
+its aio facade export run against it: per-patient calls on the patient's
+shard, per-file calls on the shard the file id points into, and calls
+that span patients on every shard, merged. Without one, they run against
+the single database file as before.
+
+    configure("data/shards", shards=8)
+    store_patient_lab_results_in_db("MM-26", labs)  # on MM-26's shard
+
+Code running under `use_manager` (a shard, a backup snapshot, a queued
+write) always gets that manager's database, never the routed store.
+"""
+import functools
+import os
+import threading
+from typing import Any, Callable, Optional, Union
+
+from . import batch, bulk, cohorts, connection, derivatives, records, search, streaming, studies
+from .backup import backup_database as _backup_database
+from .connection import ConnectionManager
+from .sharding import ShardedPatientStore, open_sharded_store
+
+# Shards for the process-wide store; unset or 0 keeps one database file
+PATIENT_SHARDS = int(os.environ.get("MEDAGENT_PATIENT_SHARDS") or 0)
+
+_store: Optional[ShardedPatientStore] = None
+# Whether _store reflects the configuration (env default until `configure`)
+_store_resolved = False
+_store_lock = threading.Lock()
+
+
+def get_sharded_store() -> Optional[ShardedPatientStore]:
+    """The process-wide sharded store, or None when the database is a single file."""
+    global _store, _store_resolved
+    if not _store_resolved:
+        with _store_lock:
+            if not _store_resolved:
+                if PATIENT_SHARDS:
+                    _store = open_sharded_store(
+                        connection.DB_PATH, PATIENT_SHARDS, blob_store_dir=connection.BLOB_STORE_DIR
+                    )
+                _store_resolved = True
+    return _store
+
+
+def _active_store() -> Optional[ShardedPatientStore]:
+    # An explicit use_manager() wins over the configured store
+    if connection._manager_override.get() is not None:
+        return None
+    return get_sharded_store()
+
+
+def configure(
+    db_path: Optional[str] = None,
+    auto_migrate: bool = True,
+    blob_store_dir: Optional[str] = None,
+    shards: Optional[int] = None,
+    **kwargs: Any,
+) -> Union[ConnectionManager, ShardedPatientStore]:
+    """
+    Points the process at a database file, or with `shards` at a shard directory.
+
+    `shards` defaults to MEDAGENT_PATIENT_SHARDS; 0 means a single file.
+    A shard count must match an existing directory's (see `reshard`). The
+    other arguments are as for `connection.configure`, applied to every
+    shard. Returns the new ConnectionManager, or the ShardedPatientStore.
+    """
+    global _store, _store_resolved
+    if shards is None:
+        shards = PATIENT_SHARDS
+    with _store_lock:
+        old, _store = _store, None
+        if old is not None:
+            old.close()
+        manager = connection.configure(db_path, auto_migrate, blob_store_dir, **kwargs)
+        if shards:
+            _store = open_sharded_store(
+                manager.db_path, shards, auto_migrate=auto_migrate,
+                blob_store_dir=blob_store_dir or connection.BLOB_STORE_DIR, **kwargs,
+            )
+        _store_resolved = True
+    return _store or manager
+
+
+def _routed(fn: Callable[..., Any], on_store: Optional[Callable[..., Any]] = None) -> Callable[..., Any]:
+    """`fn`, or with sharding configured the store's method of the same name (or `on_store(store, ...)`)."""
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        store = _active_store()
+        if store is None:
+            return fn(*args, **kwargs)
+        if on_store is not None:
+            return on_store(store, *args, **kwargs)
+        return getattr(store, fn.__name__)(*args, **kwargs)
+
+    return wrapper
+
+
+def _no_sharded_backup(store: ShardedPatientStore, *args: Any, **kwargs: Any) -> Any:
+    raise ValueError(
+        f"{store.shard_map.directory} is a shard directory; copy it with reshard() while it is not written to"
+    )
+
+
+def close_connections() -> None:
+    with _store_lock:
+        store = _store
+    if store is not None:
+        store.close()
+    connection.close_connections()
+
+
+get_db_path = _routed(connection.get_db_path, lambda store: store.shard_map.directory)
+# Every shard is migrated to the same version
+migrate_database = _routed(connection.migrate_database, lambda store: min(store.migrate_database()))
+backup_database = _routed(_backup_database, _no_sharded_backup)
+
+get_patient_data_from_db = _routed(records.get_patient_data_from_db)
+get_or_create_patient_data = _routed(records.get_or_create_patient_data)
+clear_patient_cache = _routed(records.clear_patient_cache)
+get_patient_file_from_db = _routed(records.get_patient_file_from_db)
+list_patient_files = _routed(records.list_patient_files)
+get_patient_file_by_id = _routed(records.get_patient_file_by_id)
+get_patient_file_info = _routed(records.get_patient_file_info)
+store_patient_data_in_db = _routed(records.store_patient_data_in_db)
+store_patient_file_in_db = _routed(records.store_patient_file_in_db)
+store_patient_lab_results_in_db = _routed(records.store_patient_lab_results_in_db)
+store_lab_observations = _routed(records.store_lab_observations)
+get_latest_lab = _routed(records.get_latest_lab)
+get_lab_history = _routed(records.get_lab_history)
+get_abnormal_labs = _routed(records.get_abnormal_labs)
+get_lab_results_history = _routed(records.get_lab_results_history)
+delete_patient_file = _routed(records.delete_patient_file)
+externalize_patient_files = _routed(records.externalize_patient_files)
+collect_blob_garbage = _routed(records.collect_blob_garbage)
+search_patients = _routed(search.search_patients)
+rebuild_search_index = _routed(search.rebuild_search_index)
+query_patients = _routed(cohorts.query_patients)
+count_patients = _routed(cohorts.count_patients)
+query_imaging_files = _routed(studies.query_imaging_files)
+backfill_imaging_columns = _routed(studies.backfill_imaging_columns)
+get_patients_bulk = _routed(batch.get_patients_bulk)
+iter_patients_with_files = _routed(batch.iter_patients_with_files)
+get_file_derivative = _routed(derivatives.get_file_derivative)
+get_file_header = _routed(derivatives.get_file_header)
+backfill_derivatives = _routed(derivatives.backfill_derivatives)
+store_patients_bulk = _routed(bulk.store_patients_bulk)
+store_files_bulk = _routed(bulk.store_files_bulk)
+store_lab_results_bulk = _routed(bulk.store_lab_results_bulk)
+open_patient_file = _routed(streaming.open_patient_file)
+iter_patient_file_chunks = _routed(streaming.iter_patient_file_chunks)
+store_patient_file_stream = _routed(streaming.store_patient_file_stream)
+store_patient_file_from_path = _routed(streaming.store_patient_file_from_path)
@@ -0,0 +1,359 @@
+"""
+Versioned schema migrations for the patient database.
+
+The schema version lives in `PRAGMA user_version`. Each migration step runs
+once, in order, inside a single write transaction, so the read/write paths
+never need to inspect or alter the schema themselves.
+"""
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+from .labs import SOURCE_STRING, insert_lab_observations, parse_lab_results_string
+
+logger = logging.getLogger(__name__)
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS patient_data (
+            patient_id TEXT PRIMARY KEY,
+            description TEXT,
+            metadata TEXT
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS patient_files (
+            patient_id TEXT,
+            type TEXT,
+            data BLOB,
+            filename TEXT,
+            mime_type TEXT,
+            created_at TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS patient_lab_results (
+            patient_id TEXT,
+            lab_results_string TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+
+
+def _add_file_metadata_columns(conn: sqlite3.Connection) -> None:
+    # Databases created by scripts/evaluation_setup.py predate these columns
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(patient_files)")}
+    for column in ("filename", "mime_type", "created_at"):
+        if column not in cols:
+            conn.execute(f"ALTER TABLE patient_files ADD COLUMN {column} TEXT")
+
+
+def _create_lookup_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_patient_files_patient_type ON patient_files (patient_id, type)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_patient_lab_results_patient ON patient_lab_results (patient_id)"
+    )
+
+
+def _add_file_ids(conn: sqlite3.Connection) -> None:
+    # rowids of a table without INTEGER PRIMARY KEY may change on VACUUM;
+    # rebuild so existing rows keep their current rowid as a stable file_id
+    conn.execute("""
+        CREATE TABLE patient_files_new (
+            file_id INTEGER PRIMARY KEY,
+            patient_id TEXT,
+            type TEXT,
+            data BLOB,
+            filename TEXT,
+            mime_type TEXT,
+            created_at TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO patient_files_new (file_id, patient_id, type, data, filename, mime_type, created_at)
+        SELECT rowid, patient_id, type, data, filename, mime_type, created_at FROM patient_files
+    """)
+    conn.execute("DROP TABLE patient_files")
+    conn.execute("ALTER TABLE patient_files_new RENAME TO patient_files")
+    conn.execute(
+        "CREATE INDEX idx_patient_files_patient_type ON patient_files (patient_id, type)"
+    )
+
+
+def _add_blob_refs(conn: sqlite3.Connection) -> None:
+    # Payloads may live in the external blob store (see blobstore.py), in
+    # which case `data` is NULL and `blob_sha256` names the content
+    conn.execute("ALTER TABLE patient_files ADD COLUMN blob_sha256 TEXT")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blob_refs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL
+        )
+    """)
+
+
+def _add_lab_observations(conn: sqlite3.Connection) -> None:
+    # Without a key, INSERT OR REPLACE appended a row per write; keep the
+    # latest string per patient and make patient_id the primary key
+    conn.execute("""
+        CREATE TABLE patient_lab_results_new (
+            patient_id TEXT PRIMARY KEY,
+            lab_results_string TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO patient_lab_results_new (patient_id, lab_results_string)
+        SELECT patient_id, lab_results_string FROM patient_lab_results
+        WHERE rowid IN (
+            SELECT MAX(rowid) FROM patient_lab_results WHERE patient_id IS NOT NULL GROUP BY patient_id
+        )
+    """)
+    conn.execute("DROP TABLE patient_lab_results")  # also drops idx_patient_lab_results_patient
+    conn.execute("ALTER TABLE patient_lab_results_new RENAME TO patient_lab_results")
+
+    conn.execute("""
+        CREATE TABLE lab_observations (
+            obs_id INTEGER PRIMARY KEY,
+            patient_id TEXT NOT NULL,
+            analyte TEXT NOT NULL,
+            value REAL,
+            value_text TEXT,
+            unit TEXT,
+            ref_low REAL,
+            ref_high REAL,
+            flag TEXT,
+            observed_at TEXT,
+            source TEXT NOT NULL,
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX idx_lab_observations_patient_analyte ON lab_observations (patient_id, analyte, observed_at)"
+    )
+    # Partial index: only flagged results, the ones "abnormal labs" asks for
+    conn.execute(
+        "CREATE INDEX idx_lab_observations_abnormal ON lab_observations (patient_id, observed_at)"
+        " WHERE flag IS NOT NULL AND flag <> 'NORMAL'"
+    )
+
+    # Backfill from existing strings; their original time is unknown
+    for patient_id, text in conn.execute("SELECT patient_id, lab_results_string FROM patient_lab_results").fetchall():
+        insert_lab_observations(conn, patient_id, parse_lab_results_string(text), SOURCE_STRING)
+
+
+def _add_patient_search(conn: sqlite3.Connection) -> None:
+    # FTS5 rows are keyed by rowid, and the implicit rowid of a table with a
+    # TEXT primary key may change on VACUUM: rebuild with an explicit id
+    conn.execute("""
+        CREATE TABLE patient_data_new (
+            id INTEGER PRIMARY KEY,
+            patient_id TEXT NOT NULL UNIQUE,
+            description TEXT,
+            metadata TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT INTO patient_data_new (id, patient_id, description, metadata)
+        SELECT rowid, patient_id, description, metadata FROM patient_data WHERE patient_id IS NOT NULL
+    """)
+    conn.execute("DROP TABLE patient_data")
+    conn.execute("ALTER TABLE patient_data_new RENAME TO patient_data")
+
+    # Indexed metadata fields; malformed legacy JSON indexes as NULL instead
+    # of failing the write
+    fields = ("body_system", "medical_task", "question_type")
+
+    def field_exprs(row: str, alias: bool = False) -> str:
+        return ", ".join(
+            f"CASE WHEN json_valid({row}.metadata) THEN json_extract({row}.metadata, '$.{f}') END"
+            + (f" AS {f}" if alias else "")
+            for f in fields
+        )
+
+    columns = ", ".join(("description",) + fields)
+    conn.execute(
+        f"CREATE VIEW patient_search_content AS SELECT id, description, {field_exprs('patient_data', alias=True)} "
+        f"FROM patient_data"
+    )
+    # External content: the index stores no second copy of the vignettes
+    conn.execute(
+        f"CREATE VIRTUAL TABLE patient_search USING fts5({columns}, content='patient_search_content',"
+        f" content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')"
+    )
+    insert = f"INSERT INTO patient_search (rowid, {columns}) VALUES (new.id, new.description, {field_exprs('new')});"
+    delete = (
+        f"INSERT INTO patient_search (patient_search, rowid, {columns})"
+        f" VALUES ('delete', old.id, old.description, {field_exprs('old')});"
+    )
+    conn.execute(f"CREATE TRIGGER patient_data_search_ai AFTER INSERT ON patient_data BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER patient_data_search_ad AFTER DELETE ON patient_data BEGIN {delete} END")
+    conn.execute(
+        f"CREATE TRIGGER patient_data_search_au AFTER UPDATE OF description, metadata ON patient_data"
+        f" BEGIN {delete} {insert} END"
+    )
+    conn.execute("INSERT INTO patient_search (patient_search) VALUES ('rebuild')")
+
+
+def _add_metadata_columns(conn: sqlite3.Connection) -> None:
+    # Computed from the JSON on read (VIRTUAL, so existing rows need no
+    # rewrite) and materialised only in the indexes
+    for field in ("body_system", "medical_task", "question_type"):
+        conn.execute(
+            f"ALTER TABLE patient_data ADD COLUMN {field} TEXT GENERATED ALWAYS AS"
+            f" (CASE WHEN json_valid(metadata) THEN json_extract(metadata, '$.{field}') END) VIRTUAL"
+        )
+    conn.execute("CREATE INDEX idx_patient_data_body_system ON patient_data (body_system, medical_task)")
+    conn.execute("CREATE INDEX idx_patient_data_medical_task ON patient_data (medical_task, question_type)")
+    conn.execute("CREATE INDEX idx_patient_data_question_type ON patient_data (question_type)")
+
+
+def _add_payload_codecs(conn: sqlite3.Connection) -> None:
+    # Existing payloads stay as they are (codec NULL = stored uncompressed);
+    # raw_size is the decompressed length, NULL where it equals the stored one
+    conn.execute("ALTER TABLE patient_files ADD COLUMN codec TEXT")
+    conn.execute("ALTER TABLE patient_files ADD COLUMN raw_size INTEGER")
+
+
+def _add_file_derivatives(conn: sqlite3.Connection) -> None:
+    # Small renderings and header fields computed once per imaging file, so
+    # interactive readers never decode the original (see derivatives.py)
+    conn.execute("""
+        CREATE TABLE patient_file_derivatives (
+            file_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            max_size INTEGER,
+            width INTEGER,
+            height INTEGER,
+            mime_type TEXT,
+            data BLOB,
+            metadata TEXT,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (file_id, kind),
+            FOREIGN KEY (file_id) REFERENCES patient_files(file_id)
+        )
+    """)
+
+
+def _add_imaging_columns(conn: sqlite3.Connection) -> None:
+    # Header fields parsed once at ingest (imaging.IMAGING_COLUMNS), NULL for
+    # non-image files and for files stored before this migration until
+    # backfilled (studies.backfill_imaging_columns)
+    for column, sql_type in (
+        ("modality", "TEXT"),
+        ("rows", "INTEGER"),
+        ("cols", "INTEGER"),
+        ("slices", "INTEGER"),
+        ("dtype", "TEXT"),
+        ("spacing_x", "REAL"),
+        ("spacing_y", "REAL"),
+        ("spacing_z", "REAL"),
+        ("study_date", "TEXT"),
+    ):
+        conn.execute(f"ALTER TABLE patient_files ADD COLUMN {column} {sql_type}")
+    conn.execute("CREATE INDEX idx_patient_files_patient_modality ON patient_files (patient_id, modality, study_date)")
+    conn.execute("CREATE INDEX idx_patient_files_modality ON patient_files (modality, study_date)")
+
+
+def _add_lab_result_history(conn: sqlite3.Connection) -> None:
+    # Every lab submission is a new (patient_id, version) row; the trigger
+    # keeps patient_lab_results as the latest version per patient, so reads
+    # stay one primary-key lookup however long the history grows
+    conn.execute("""
+        CREATE TABLE lab_result_versions (
+            patient_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            lab_results_string TEXT,
+            submitted_at TEXT,
+            PRIMARY KEY (patient_id, version),
+            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
+        )
+    """)
+    conn.execute("ALTER TABLE patient_lab_results ADD COLUMN version INTEGER")
+    conn.execute("ALTER TABLE patient_lab_results ADD COLUMN updated_at TEXT")
+    # The current strings become version 1; when they were written is unknown
+    conn.execute("""
+        INSERT INTO lab_result_versions (patient_id, version, lab_results_string, submitted_at)
+        SELECT patient_id, 1, lab_results_string, NULL FROM patient_lab_results WHERE patient_id IS NOT NULL
+    """)
+    conn.execute("UPDATE patient_lab_results SET version = 1")
+    conn.execute("""
+        CREATE TRIGGER lab_result_versions_latest AFTER INSERT ON lab_result_versions BEGIN
+            INSERT INTO patient_lab_results (patient_id, lab_results_string, version, updated_at)
+            VALUES (new.patient_id, new.lab_results_string, new.version, new.submitted_at)
+            ON CONFLICT(patient_id) DO UPDATE SET
+                lab_results_string = excluded.lab_results_string,
+                version = excluded.version,
+                updated_at = excluded.updated_at
+            WHERE excluded.version > COALESCE(patient_lab_results.version, 0);
+        END
+    """)
+    for event in ("UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER lab_result_versions_no_{event.lower()} BEFORE {event} ON lab_result_versions BEGIN
+                SELECT RAISE(ABORT, 'lab_result_versions is append-only');
+            END
+        """)
+
+
+# (version, description, step) - append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "create base tables", _create_base_tables),
+    (2, "add filename/mime_type/created_at to patient_files", _add_file_metadata_columns),
+    (3, "index patient_files and patient_lab_results by patient", _create_lookup_indexes),
+    (4, "give patient_files a stable file_id primary key", _add_file_ids),
+    (5, "external blob store references", _add_blob_refs),
+    (6, "key lab results by patient; structured lab_observations", _add_lab_observations),
+    (7, "stable patient ids; FTS5 search over descriptions and metadata", _add_patient_search),
+    (8, "indexed generated columns for metadata fields", _add_metadata_columns),
+    (9, "per-file payload codec and uncompressed size", _add_payload_codecs),
+    (10, "thumbnails, previews and header metadata per imaging file", _add_file_derivatives),
+    (11, "indexed imaging header columns on patient_files", _add_imaging_columns),
+    (12, "append-only versioned lab result history", _add_lab_result_history),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Brings the database up to SCHEMA_VERSION and returns the resulting version.
+
+    Safe to call concurrently from several processes: the version is re-read
+    after taking the write lock, so each step is applied exactly once.
+    """
+    current = get_schema_version(conn)
+    if current > SCHEMA_VERSION:
+        logger.warning(
+            f"Patient DB schema version {current} is newer than this code ({SCHEMA_VERSION})"
+        )
+    if current >= SCHEMA_VERSION:
+        return current
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = get_schema_version(conn)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying patient DB migration {version}: {description}")
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            current = version
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.execute("COMMIT")
+    return current
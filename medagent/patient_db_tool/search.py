@@ -0,0 +1,49 @@
+"""
+Full-text search over patient cases.
+
+`patient_search` is an FTS5 index over `patient_data.description` and the
+`body_system`, `medical_task` and `question_type` metadata fields, kept in
+sync by triggers on `patient_data` (see schema migration 7). Results are
+ranked by bm25 with the best-matching fields first.
+"""
+import re
+import sqlite3
+from typing import Any, Dict, List
+
+from .connection import connection, transaction
+from .queries import SEARCH_PATIENTS
+
+DEFAULT_LIMIT = 10
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def to_fts_query(text: str) -> str:
+    """Free text -> FTS5 query matching every word (punctuation is not query syntax)."""
+    return " ".join(f'"{term}"' for term in _TERM.findall(text))
+
+
+def search_patients(query: str, limit: int = DEFAULT_LIMIT, raw: bool = False) -> List[Dict[str, Any]]:
+    """Finds patients whose description or case metadata match `query`, best first.
+
+    Each result has `patient_id`, `score` (bm25; lower is better) and a
+    `snippet` with matched terms in [brackets]. By default every word of
+    `query` must match; pass `raw=True` to use FTS5 query syntax instead
+    (`OR`, `NEAR`, prefix `card*`, column filters like `body_system:cardio*`).
+    """
+    match = query if raw else to_fts_query(query)
+    if not match:
+        return []
+    try:
+        cursor = connection().execute(SEARCH_PATIENTS, (match, limit))
+        return [dict(r) for r in cursor.fetchall()]
+    except sqlite3.OperationalError as e:
+        if raw:
+            raise ValueError(f"Invalid search query {query!r}: {e}") from e
+        raise
+
+
+def rebuild_search_index() -> None:
+    """Rebuilds `patient_search` from `patient_data`, e.g. after rows were changed bypassing the triggers."""
+    with transaction() as conn:
+        conn.execute("INSERT INTO patient_search (patient_search) VALUES ('rebuild')")
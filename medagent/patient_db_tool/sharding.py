@@ -0,0 +1,589 @@
+"""
+Sharded patient store.
+
+Spreads patients over N database files by a stable hash of `patient_id`,
+so writers in different worker processes mostly take different SQLite
+write locks instead of queueing on one. The shard map (`shards.json` in
+the shard directory) fixes the number of shards and their files; every
+process that opens the directory routes a patient to the same file.
+
+    store = open_sharded_store("data/shards", shards=8)
+    store.store_patient_lab_results_in_db("MM-26", labs)
+    store.search_patients("chest pain")  # every shard, merged
+
+Per-patient calls run the ordinary patient_db_tool functions against the
+patient's shard (see `connection.use_manager`). Calls that span patients
+(search, cohort queries, full walks) run on every shard in parallel and
+merge the results. File ids are made unique across shards by putting the
+shard number above bit `FILE_ID_SHARD_SHIFT`; on shard 0 they are the
+plain row ids, so a one-shard store reads like an unsharded database.
+
+The shard count is fixed for a directory: `reshard` copies a database, or
+a shard directory, into a new one with a different count.
+"""
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from . import batch, bulk, cohorts, derivatives, records, search, streaming, studies
+from .blobstore import BlobStore
+from .bulk import PatientRecord, _batches, _fields
+from .connection import ConnectionManager, migrate_database, use_manager
+from .schema import SCHEMA_VERSION, migrate
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAP_FILE = "shards.json"
+# blake2b (8-byte digest) of the UTF-8 patient_id, modulo the shard count.
+# Not Python's hash(): that is salted per process.
+HASH_SCHEME = "blake2b64-mod"
+
+# file_id = shard << FILE_ID_SHARD_SHIFT | row id within the shard's file
+FILE_ID_SHARD_SHIFT = 48
+MAX_SHARDS = 1 << (63 - FILE_ID_SHARD_SHIFT)
+_LOCAL_ID_MASK = (1 << FILE_ID_SHARD_SHIFT) - 1
+
+# Fan-out threads per store (SQLite releases the GIL while it runs a query)
+MAX_FAN_OUT_WORKERS = 8
+
+
+def shard_for(patient_id: str, count: int) -> int:
+    """The shard (0 <= shard < count) that holds `patient_id`."""
+    digest = hashlib.blake2b(patient_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+@dataclass(frozen=True)
+class ShardMap:
+    """The shard files of a shard directory, in shard order (names relative to `directory`)."""
+
+    directory: str
+    files: Tuple[str, ...]
+    scheme: str = HASH_SCHEME
+
+    @property
+    def count(self) -> int:
+        return len(self.files)
+
+    def path(self, shard: int) -> str:
+        return os.path.join(self.directory, self.files[shard])
+
+    def shard_for(self, patient_id: str) -> int:
+        return shard_for(patient_id, self.count)
+
+    @classmethod
+    def create(cls, directory: str, count: int) -> "ShardMap":
+        """A new map of `count` shards (`shard-000.sqlite`, ...) in `directory`; call `save()` to keep it."""
+        if not 1 <= count <= MAX_SHARDS:
+            raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}, not {count}")
+        return cls(directory, tuple(f"shard-{i:03d}.sqlite" for i in range(count)))
+
+    @classmethod
+    def load(cls, directory: str) -> "ShardMap":
+        with open(os.path.join(directory, SHARD_MAP_FILE)) as f:
+            data = json.load(f)
+        if data.get("scheme") != HASH_SCHEME:
+            raise ValueError(f"Unsupported shard hash scheme {data.get('scheme')!r} in {directory}")
+        return cls(directory, tuple(data["files"]), data["scheme"])
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, SHARD_MAP_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"scheme": self.scheme, "count": self.count, "files": list(self.files)}, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+
+def is_shard_directory(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, SHARD_MAP_FILE))
+
+
+def _global_ids(shard: int, result: Any) -> Any:
+    """Row ids -> store-wide file ids in a file id, a file dict, or a list of either."""
+    if not shard or result is None:
+        return result
+    if isinstance(result, int):
+        return shard << FILE_ID_SHARD_SHIFT | result
+    if isinstance(result, dict):
+        if result.get("file_id") is not None:
+            result = {**result, "file_id": shard << FILE_ID_SHARD_SHIFT | result["file_id"]}
+        if "files" in result:
+            result = {**result, "files": _global_ids(shard, result["files"])}
+        return result
+    return [_global_ids(shard, item) for item in result]
+
+
+def _per_patient(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """A store method running `fn(patient_id, ...)` on the patient's shard."""
+
+    @functools.wraps(fn)
+    def method(self: "ShardedPatientStore", patient_id: str, *args: Any, **kwargs: Any) -> Any:
+        shard = self.shard_for(patient_id)
+        return _global_ids(shard, self.on_shard(shard, fn, patient_id, *args, **kwargs))
+
+    return method
+
+
+def _per_file(fn: Callable[..., Any], missing: Any = None) -> Callable[..., Any]:
+    """A store method running `fn(file_id, ...)` on the shard the file id points into."""
+
+    @functools.wraps(fn)
+    def method(self: "ShardedPatientStore", file_id: int, *args: Any, **kwargs: Any) -> Any:
+        shard = file_id >> FILE_ID_SHARD_SHIFT
+        if not 0 <= shard < len(self.managers):
+            return missing
+        return _global_ids(shard, self.on_shard(shard, fn, file_id & _LOCAL_ID_MASK, *args, **kwargs))
+
+    return method
+
+
+class ShardedPatientStore:
+    """
+    The patient_db_tool API over a shard directory.
+
+    Holds one ConnectionManager per shard (keyword arguments are passed to
+    each). With `blob_store_dir`, every shard gets its own external payload
+    store in a subdirectory named after its file: blob reference counts are
+    kept per database, so shards must not share a store.
+    """
+
+    def __init__(
+        self,
+        shard_map: ShardMap,
+        auto_migrate: bool = True,
+        blob_store_dir: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        self.shard_map = shard_map
+        self.blob_store_dir = blob_store_dir
+        self.managers = [
+            ConnectionManager(
+                shard_map.path(shard),
+                initializer=migrate if auto_migrate else None,
+                blob_store_dir=_shard_blob_dir(blob_store_dir, shard_map, shard),
+                **kwargs,
+            )
+            for shard in range(shard_map.count)
+        ]
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._executor_lock = threading.Lock()
+
+    def shard_for(self, patient_id: str) -> int:
+        return self.shard_map.shard_for(patient_id)
+
+    def manager_for(self, patient_id: str) -> ConnectionManager:
+        return self.managers[self.shard_for(patient_id)]
+
+    def on_shard(self, shard: int, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs a patient_db_tool function against one shard."""
+        with use_manager(self.managers[shard]):
+            return fn(*args, **kwargs)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            # Pool threads do not survive fork()
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=min(len(self.managers), MAX_FAN_OUT_WORKERS), thread_name_prefix="patient-db-shard"
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def fan_out(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> List[Any]:
+        """Runs a patient_db_tool function on every shard in parallel; returns the results in shard order."""
+        if len(self.managers) == 1:
+            return [self.on_shard(0, fn, *args, **kwargs)]
+        executor = self._get_executor()
+        futures = [executor.submit(self.on_shard, shard, fn, *args, **kwargs) for shard in range(len(self.managers))]
+        return [future.result() for future in futures]
+
+    def _iterate(self, shard: int, fn: Callable[..., Iterator[Any]], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        # Only each step runs under the shard's manager, never the caller's code between items
+        iterator = self.on_shard(shard, fn, *args, **kwargs)
+        while True:
+            with use_manager(self.managers[shard]):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield _global_ids(shard, item)
+
+    # Per patient
+    get_patient_data_from_db = _per_patient(records.get_patient_data_from_db)
+    get_or_create_patient_data = _per_patient(records.get_or_create_patient_data)
+    store_patient_data_in_db = _per_patient(records.store_patient_data_in_db)
+    store_patient_lab_results_in_db = _per_patient(records.store_patient_lab_results_in_db)
+    store_lab_observations = _per_patient(records.store_lab_observations)
+    get_latest_lab = _per_patient(records.get_latest_lab)
+    get_lab_history = _per_patient(records.get_lab_history)
+    get_abnormal_labs = _per_patient(records.get_abnormal_labs)
+    get_lab_results_history = _per_patient(records.get_lab_results_history)
+    get_patient_file_from_db = _per_patient(records.get_patient_file_from_db)
+    list_patient_files = _per_patient(records.list_patient_files)
+    store_patient_file_in_db = _per_patient(records.store_patient_file_in_db)
+    store_patient_file_stream = _per_patient(streaming.store_patient_file_stream)
+    store_patient_file_from_path = _per_patient(streaming.store_patient_file_from_path)
+
+    # Per file
+    get_patient_file_by_id = _per_file(records.get_patient_file_by_id)
+    get_patient_file_info = _per_file(records.get_patient_file_info)
+    delete_patient_file = _per_file(records.delete_patient_file, missing=False)
+    get_file_derivative = _per_file(derivatives.get_file_derivative)
+    get_file_header = _per_file(derivatives.get_file_header)
+
+    def open_patient_file(self, file_id: int) -> io.BufferedReader:
+        """Opens a stored patient file for streaming reads."""
+        shard = file_id >> FILE_ID_SHARD_SHIFT
+        if not 0 <= shard < len(self.managers):
+            raise FileNotFoundError(f"No patient file {file_id}")
+        return self.on_shard(shard, streaming.open_patient_file, file_id & _LOCAL_ID_MASK)
+
+    def iter_patient_file_chunks(self, file_id: int, chunk_size: int = streaming.DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yields a stored patient file's payload in chunks of at most `chunk_size` bytes."""
+        with self.open_patient_file(file_id) as reader:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    # Bulk: each batch is split by shard, one transaction per shard
+    def store_patients_bulk(
+        self, records: Iterable[PatientRecord], batch_size: int = bulk.DEFAULT_BATCH_SIZE
+    ) -> int:
+        """`store_patients_bulk`, routing each record to its patient's shard."""
+        return self._store_bulk(bulk.store_patients_bulk, records, ("patient_id", "description", "metadata"), batch_size)
+
+    def store_lab_results_bulk(
+        self, records: Iterable[PatientRecord], batch_size: int = bulk.DEFAULT_BATCH_SIZE
+    ) -> int:
+        """`store_lab_results_bulk`, routing each record to its patient's shard."""
+        return self._store_bulk(bulk.store_lab_results_bulk, records, ("patient_id", "lab_results_string"), batch_size)
+
+    def _store_bulk(
+        self, fn: Callable[..., int], records: Iterable[PatientRecord], names: Tuple[str, ...], batch_size: int
+    ) -> int:
+        written = 0
+        for chunk in _batches(records, batch_size):
+            by_shard: Dict[int, List[PatientRecord]] = {}
+            for record in chunk:
+                patient_id = _fields(record, names, 2)[0]
+                by_shard.setdefault(self.shard_for(patient_id), []).append(record)
+            for shard, shard_records in by_shard.items():
+                written += self.on_shard(shard, fn, shard_records, batch_size=len(shard_records))
+        return written
+
+    def store_files_bulk(
+        self, files: Iterable[Mapping[str, Any]], batch_size: int = bulk.DEFAULT_FILE_BATCH_SIZE
+    ) -> List[int]:
+        """`store_files_bulk`, routing each file to its patient's shard; returns file ids in input order."""
+        file_ids: List[int] = []
+        for chunk in _batches(files, batch_size):
+            by_shard: Dict[int, List[Tuple[int, Mapping[str, Any]]]] = {}
+            for index, f in enumerate(chunk):
+                by_shard.setdefault(self.shard_for(f["patient_id"]), []).append((index, f))
+            chunk_ids: List[int] = [0] * len(chunk)
+            for shard, items in by_shard.items():
+                ids = self.on_shard(shard, bulk.store_files_bulk, [f for _, f in items], batch_size=len(items))
+                for (index, _), file_id in zip(items, ids):
+                    chunk_ids[index] = _global_ids(shard, file_id)
+            file_ids.extend(chunk_ids)
+        return file_ids
+
+    # Across patients: every shard, merged
+    def get_patients_bulk(self, patient_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """`get_patients_bulk`: one query batch per shard holding any of the patients, keyed in request order."""
+        ids = list(dict.fromkeys(patient_ids))
+        by_shard: Dict[int, List[str]] = {}
+        for patient_id in ids:
+            by_shard.setdefault(self.shard_for(patient_id), []).append(patient_id)
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        for shard, shard_ids in by_shard.items():
+            results.update(self.on_shard(shard, batch.get_patients_bulk, shard_ids))
+        return {patient_id: results[patient_id] for patient_id in ids}
+
+    def search_patients(self, query: str, limit: int = search.DEFAULT_LIMIT, raw: bool = False) -> List[Dict[str, Any]]:
+        """`search_patients` over every shard: the best `limit` matches by bm25.
+
+        Each shard scores against its own index statistics; with patients
+        spread by hash these are close enough to rank across shards.
+        """
+        hits = itertools.chain.from_iterable(self.fan_out(search.search_patients, query, limit, raw))
+        return heapq.nsmallest(limit, hits, key=lambda hit: hit["score"])
+
+    def query_patients(self, limit: Optional[int] = None, **filters: Any) -> List[Dict[str, Any]]:
+        """`query_patients` over every shard, merged in patient_id order."""
+        merged = heapq.merge(*self.fan_out(cohorts.query_patients, limit, **filters), key=lambda r: r["patient_id"])
+        return list(itertools.islice(merged, limit))
+
+    def count_patients(self, **filters: Any) -> int:
+        return sum(self.fan_out(cohorts.count_patients, **filters))
+
+    def query_imaging_files(self, limit: Optional[int] = None, **filters: Any) -> List[Dict[str, Any]]:
+        """`query_imaging_files` over every shard, in the same order (a patient's files all live on one shard)."""
+        results = self.fan_out(studies.query_imaging_files, limit, **filters)
+        merged = heapq.merge(
+            *(_global_ids(shard, files) for shard, files in enumerate(results)), key=lambda f: f["patient_id"]
+        )
+        return list(itertools.islice(merged, limit))
+
+    def iter_patients_with_files(
+        self,
+        file_type: Optional[str] = None,
+        page_size: int = batch.DEFAULT_PAGE_SIZE,
+        after: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """`iter_patients_with_files` over every shard, merged in patient_id order (resumable with `after`)."""
+        walks = [
+            self._iterate(shard, batch.iter_patients_with_files, file_type, page_size, after)
+            for shard in range(len(self.managers))
+        ]
+        return heapq.merge(*walks, key=lambda patient: patient["patient_id"])
+
+    # Maintenance, per shard
+    def migrate_database(self) -> List[int]:
+        """Applies pending schema migrations to every shard; returns their schema versions."""
+        return self.fan_out(migrate_database)
+
+    def rebuild_search_index(self) -> None:
+        self.fan_out(search.rebuild_search_index)
+
+    def collect_blob_garbage(self) -> int:
+        return sum(self.fan_out(records.collect_blob_garbage))
+
+    def externalize_patient_files(self, batch_size: int = 50) -> int:
+        return sum(self.fan_out(records.externalize_patient_files, batch_size))
+
+    def backfill_imaging_columns(self, batch_size: int = 100) -> int:
+        return sum(self.fan_out(studies.backfill_imaging_columns, batch_size))
+
+    def backfill_derivatives(self, batch_size: int = 100) -> int:
+        return sum(self.fan_out(derivatives.backfill_derivatives, batch_size))
+
+    def clear_patient_cache(self) -> None:
+        self.fan_out(records.clear_patient_cache)
+
+    def close(self) -> None:
+        """Closes every shard's connections and the fan-out threads."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=True)
+        for manager in self.managers:
+            manager.close_all()
+
+
+def _shard_blob_dir(blob_store_dir: Optional[str], shard_map: ShardMap, shard: int) -> Optional[str]:
+    if not blob_store_dir:
+        return None
+    return os.path.join(blob_store_dir, os.path.splitext(shard_map.files[shard])[0])
+
+
+def open_sharded_store(directory: str, shards: Optional[int] = None, **kwargs: Any) -> ShardedPatientStore:
+    """Opens the shard directory `directory`, creating it with `shards` shards if it has no shard map.
+
+    `shards` must match an existing map; use `reshard` to change the count.
+    Keyword arguments are passed to `ShardedPatientStore`.
+    """
+    if is_shard_directory(directory):
+        shard_map = ShardMap.load(directory)
+        if shards is not None and shards != shard_map.count:
+            raise ValueError(
+                f"{directory} has {shard_map.count} shard(s), not {shards}; use reshard to change the count"
+            )
+    else:
+        shard_map = ShardMap.create(directory, shards or 1)
+        shard_map.save()
+    return ShardedPatientStore(shard_map, **kwargs)
+
+
+def _columns(conn: sqlite3.Connection, table: str, exclude: Tuple[str, ...] = ()) -> List[str]:
+    """Stored (non-generated) columns of `table` other than `exclude`."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] not in exclude]
+
+
+def _copy_rows(
+    source: sqlite3.Connection, dest: sqlite3.Connection, table: str, columns: List[str], where: str, params: list
+) -> int:
+    names = ", ".join(columns)
+    rows = source.execute(f"SELECT {names} FROM {table} WHERE {where}", params).fetchall()
+    dest.executemany(f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))})", rows)
+    return len(rows)
+
+
+def _source_files(source: str, blob_store_dir: Optional[str]) -> List[Tuple[str, Optional[str], int]]:
+    """`(database path, blob store dir, shard)` for a database file or every shard of a shard directory."""
+    if not is_shard_directory(source):
+        return [(source, blob_store_dir, 0)]
+    shard_map = ShardMap.load(source)
+    return [
+        (shard_map.path(shard), _shard_blob_dir(blob_store_dir, shard_map, shard), shard)
+        for shard in range(shard_map.count)
+    ]
+
+
+def reshard(
+    source: str,
+    dest: str,
+    shards: int,
+    blob_store_dir: Optional[str] = None,
+    dest_blob_store_dir: Optional[str] = None,
+    batch_size: int = 500,
+) -> Dict[str, Any]:
+    """Copies a patient database, or a shard directory, into a new shard directory of `shards` shards.
+
+    `dest` must not be a shard directory yet. Every patient moves with its
+    lab versions and observations, files, derivatives and search entries;
+    payloads keep their stored encoding. Files get new ids: the returned
+    statistics include `file_ids`, mapping each old id to its new one.
+    Externally stored payloads (from `blob_store_dir`, laid out as
+    `ShardedPatientStore` does for a shard directory) are hard-linked, or
+    copied across filesystems, into the destination's per-shard stores
+    under `dest_blob_store_dir`.
+
+    The source must not be written to meanwhile: each source file is read
+    in one snapshot, but writes made after it was read are not copied.
+    Open the result with `open_sharded_store(dest)`.
+    """
+    if is_shard_directory(dest):
+        raise ValueError(f"{dest} is already a shard directory")
+    sources = _source_files(source, blob_store_dir)
+    for path, _, _ in sources:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No patient database at {path}")
+
+    shard_map = ShardMap.create(dest, shards)
+    store = ShardedPatientStore(shard_map, blob_store_dir=dest_blob_store_dir, derivatives="off")
+    stats: Dict[str, Any] = {"path": dest, "shards": shards, "patients": 0, "files": 0, "blobs": 0, "file_ids": {}}
+    start = time.perf_counter()
+    try:
+        store.migrate_database()
+        for path, source_blob_dir, source_shard in sources:
+            conn = sqlite3.connect(path, isolation_level=None)
+            try:
+                conn.execute("BEGIN")  # one snapshot of the whole file
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version != SCHEMA_VERSION:
+                    raise ValueError(f"{path} is at schema version {version}, not {SCHEMA_VERSION}; migrate it first")
+                _copy_database(conn, store, source_blob_dir, source_shard, batch_size, stats)
+            finally:
+                conn.close()
+    except BaseException:
+        store.close()
+        raise
+    store.close()
+    shard_map.save()  # last: an interrupted reshard leaves no usable shard directory behind
+    stats["seconds"] = time.perf_counter() - start
+    logger.info(
+        f"Resharded {source} into {shards} shard(s) at {dest}: {stats['patients']} patients,"
+        f" {stats['files']} files in {stats['seconds']:.2f}s"
+    )
+    return stats
+
+
+def _copy_database(
+    source: sqlite3.Connection,
+    store: ShardedPatientStore,
+    blob_store_dir: Optional[str],
+    source_shard: int,
+    batch_size: int,
+    stats: Dict[str, Any],
+) -> None:
+    patient_columns = _columns(source, "patient_data", exclude=("id",))
+    version_columns = _columns(source, "lab_result_versions")
+    observation_columns = _columns(source, "lab_observations", exclude=("obs_id",))
+    file_columns = _columns(source, "patient_files", exclude=("file_id",))
+    derivative_columns = _columns(source, "patient_file_derivatives", exclude=("file_id",))
+    source_blobs = BlobStore(blob_store_dir) if blob_store_dir else None
+
+    last = ""
+    while True:
+        patient_ids = [
+            row[0]
+            for row in source.execute(
+                "SELECT patient_id FROM patient_data WHERE patient_id > ? ORDER BY patient_id LIMIT ?",
+                (last, batch_size),
+            )
+        ]
+        if not patient_ids:
+            return
+        last = patient_ids[-1]
+        by_shard: Dict[int, List[str]] = {}
+        for patient_id in patient_ids:
+            by_shard.setdefault(store.shard_for(patient_id), []).append(patient_id)
+
+        for shard, ids in by_shard.items():
+            where = f"patient_id IN ({', '.join('?' * len(ids))})"
+            manager = store.managers[shard]
+            with manager.transaction() as dest:
+                stats["patients"] += _copy_rows(source, dest, "patient_data", patient_columns, where, ids)
+                # In version order: the trigger keeps patient_lab_results at the latest
+                _copy_rows(source, dest, "lab_result_versions", version_columns, f"{where} ORDER BY version", ids)
+                _copy_rows(source, dest, "lab_observations", observation_columns, f"{where} ORDER BY obs_id", ids)
+                file_ids = [row[0] for row in source.execute(f"SELECT file_id FROM patient_files WHERE {where}", ids)]
+                for file_id in file_ids:
+                    new_id = _copy_file(
+                        source, dest, manager.blob_store, source_blobs, file_id, file_columns, derivative_columns, stats
+                    )
+                    old_global = source_shard << FILE_ID_SHARD_SHIFT | file_id
+                    stats["file_ids"][old_global] = shard << FILE_ID_SHARD_SHIFT | new_id
+
+
+def _copy_file(
+    source: sqlite3.Connection,
+    dest: sqlite3.Connection,
+    dest_blobs: Optional[BlobStore],
+    source_blobs: Optional[BlobStore],
+    file_id: int,
+    file_columns: List[str],
+    derivative_columns: List[str],
+    stats: Dict[str, Any],
+) -> int:
+    """Copies one file row, its blob reference and derivatives; returns the new row id."""
+    names = ", ".join(file_columns)
+    row = source.execute(f"SELECT {names} FROM patient_files WHERE file_id = ?", (file_id,)).fetchone()
+    new_id = dest.execute(
+        f"INSERT INTO patient_files ({names}) VALUES ({', '.join('?' * len(file_columns))})", row
+    ).lastrowid
+    sha256 = row[file_columns.index("blob_sha256")]
+    if sha256 is not None:
+        if source_blobs is None or dest_blobs is None:
+            raise ValueError(f"Patient file {file_id} is in the external blob store: pass both blob store directories")
+        target = dest_blobs.path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(source_blobs.path(sha256), target)
+            except OSError:  # other filesystem, or links unsupported
+                shutil.copy2(source_blobs.path(sha256), target)
+            stats["blobs"] += 1
+        size = source.execute("SELECT size FROM blob_refs WHERE sha256 = ?", (sha256,)).fetchone()[0]
+        dest.execute(
+            "INSERT INTO blob_refs (sha256, size, refcount) VALUES (?, ?, 1)"
+            " ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+            (sha256, size),
+        )
+    derivatives = ", ".join(derivative_columns)
+    dest.executemany(
+        f"INSERT INTO patient_file_derivatives (file_id, {derivatives})"
+        f" VALUES (?, {', '.join('?' * len(derivative_columns))})",
+        [
+            (new_id, *r)
+            for r in source.execute(f"SELECT {derivatives} FROM patient_file_derivatives WHERE file_id = ?", (file_id,))
+        ],
+    )
+    stats["files"] += 1
+    return new_id
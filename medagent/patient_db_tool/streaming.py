@@ -0,0 +1,331 @@
+"""
+Streaming access to patient file payloads.
+
+Built on SQLite incremental BLOB I/O: writes stage the payload on disk, then
+preallocate it with zeroblob() and fill it chunk by chunk in one short
+transaction; reads pull only the requested byte ranges. Large NIfTI volumes or slides never have to be held in memory whole.
+
+Incremental BLOB I/O needs Python 3.11+ (`Connection.blobopen`); on 3.10 the
+same API falls back to whole-payload reads and writes. When the external blob
+store is enabled, payloads stream to and from its files instead.
+
+Payloads the codec policy compresses (see compression.py) are compressed
+chunk by chunk on write and decompressed on read; the file objects always
+deal in the original bytes.
+"""
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import BinaryIO, Iterator, Optional
+
+from .blobstore import BlobStager, add_blob_ref
+from .compression import IDENTITY, compressor, open_decompressed
+from .connection import get_manager, read_transaction, transaction
+from .derivatives import schedule_derivatives
+from .imaging import HEADER_BYTES, imaging_columns
+from .queries import SELECT_FILE_STORAGE
+from .records import _invalidate_patients, _require_blob_store, _utc_timestamp
+from .studies import set_imaging_columns
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_HAS_BLOBOPEN = hasattr(sqlite3.Connection, "blobopen")
+
+
+class PatientFileReader(io.RawIOBase):
+    """
+    Read-only, seekable raw file object over a stored patient file's payload.
+
+    The storage lookup and the BLOB open run in one short read transaction,
+    and later writes never show through: an inline payload's BLOB handle
+    keeps reading the snapshot it was opened on, and an external payload is
+    an immutable content-addressed file. That open handle pins its WAL read
+    snapshot until the reader is closed, which holds back checkpoints, so
+    close it promptly (use it as a context manager). Don't write to the
+    database from the same thread while an inline payload is open: the
+    connection's stale handle blocks its writes. Seeking within a compressed
+    payload decompresses up to the target (from the start when seeking
+    backwards).
+
+    Reads may return fewer bytes than asked for; `open_patient_file` wraps
+    it in an `io.BufferedReader`, whose reads do not.
+    """
+
+    def __init__(self, file_id: int):
+        super().__init__()
+        self.file_id = file_id
+        with read_transaction() as conn:
+            ref = conn.execute(SELECT_FILE_STORAGE, (file_id,)).fetchone()
+            if ref is None:
+                raise FileNotFoundError(f"No patient file {file_id}")
+            sha256, codec, raw_size = ref
+            if sha256 is not None:
+                blob = _require_blob_store().open(sha256)
+            elif _HAS_BLOBOPEN:
+                try:
+                    blob = conn.blobopen("patient_files", "data", file_id, readonly=True)
+                except sqlite3.OperationalError as e:
+                    raise FileNotFoundError(f"No payload for patient file {file_id}") from e
+            else:
+                row = conn.execute("SELECT data FROM patient_files WHERE file_id = ?", (file_id,)).fetchone()
+                if row is None or row[0] is None:
+                    raise FileNotFoundError(f"No payload for patient file {file_id}")
+                blob = io.BytesIO(row[0])
+        try:
+            self._blob = open_decompressed(codec, blob, raw_size)
+        except BaseException:
+            blob.close()
+            raise
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._blob.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self) -> int:
+        return self._blob.tell()
+
+    def close(self) -> None:
+        # _blob is unset when __init__ raised (e.g. unknown file_id)
+        if not self.closed and hasattr(self, "_blob"):
+            self._blob.close()
+        super().close()
+
+
+class PatientFileWriter(io.RawIOBase):
+    """
+    Write-only file object that streams a new patient file into the database.
+
+    The payload size must be known up front. The row is committed on a clean
+    `close()` once exactly `size` bytes have been written; on error, or if
+    the size does not match, nothing is stored. The row (and `file_id`) only
+    exists after `close()`.
+
+    No database transaction is held while the caller uploads: the payload
+    is streamed (compressed, if the codec policy says so) to a staging file
+    of the external blob store, or else to a temporary file that is copied
+    into a preallocated BLOB in one short transaction on `close()`.
+    """
+
+    def __init__(
+        self,
+        patient_id: str,
+        file_type: str,
+        size: int,
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        created_at: Optional[str] = None,
+    ):
+        super().__init__()
+        if created_at is None:
+            created_at = _utc_timestamp()
+        self.size = size
+        self.written = 0
+        self.file_id: Optional[int] = None
+        self._row = (patient_id, file_type, filename, mime_type, created_at)
+        self._head = bytearray()  # enough of the payload to parse an image header
+        manager = get_manager()
+        self._codec = manager.codec_policy.codec_for(mime_type, filename, size)
+        self._compressor = compressor(self._codec)
+        self._store = manager.blob_store
+        if self._store is not None:
+            self._stager = BlobStager(self._store)
+        else:
+            self._spool = tempfile.TemporaryFile()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        n = len(memoryview(data).cast("B"))
+        if self.written + n > self.size:
+            raise ValueError(f"Write exceeds declared size of {self.size} bytes")
+        if len(self._head) < HEADER_BYTES:
+            self._head += memoryview(data).cast("B")[:HEADER_BYTES - len(self._head)]
+        if self._codec != IDENTITY:
+            data = self._compressor.compress(data)
+        if self._store is not None:
+            self._stager.write(data)
+        else:
+            self._spool.write(data)
+        self.written += n
+        return n
+
+    def _set_imaging_columns(self, conn: sqlite3.Connection, file_id: int) -> None:
+        _, _, filename, mime_type, _ = self._row
+        set_imaging_columns(conn, [(file_id, imaging_columns(bytes(self._head), mime_type, filename))])
+
+    def _finish_external(self, error: Optional[BaseException]) -> None:
+        if error is not None:
+            self._stager.abort()
+            raise error
+        try:
+            self._stager.write(self._compressor.flush())
+        except BaseException:
+            self._stager.abort()
+            raise
+        staged = self._stager.finish()
+        patient_id, file_type, filename, mime_type, created_at = self._row
+        try:
+            with transaction() as conn:
+                conn.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+                cursor = conn.execute(
+                    "INSERT INTO patient_files (patient_id, type, blob_sha256, codec, raw_size, filename, mime_type, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (patient_id, file_type, staged.sha256, self._codec, self.size, filename, mime_type, created_at),
+                )
+                add_blob_ref(conn, self._store, staged)
+                self._set_imaging_columns(conn, cursor.lastrowid)
+            self.file_id = cursor.lastrowid
+        finally:
+            self._store.discard(staged)  # no-op once published
+        _invalidate_patients(patient_id)
+        schedule_derivatives([(self.file_id, mime_type, filename)])
+
+    def _finish_inline(self, error: Optional[BaseException]) -> None:
+        patient_id, file_type, filename, mime_type, created_at = self._row
+        try:
+            if error is not None:
+                raise error
+            self._spool.write(self._compressor.flush())
+            stored_size = self._spool.tell()
+            self._spool.seek(0)
+            with transaction() as conn:
+                conn.execute("INSERT OR IGNORE INTO patient_data (patient_id) VALUES (?)", (patient_id,))
+                cursor = conn.execute(
+                    "INSERT INTO patient_files (patient_id, type, data, codec, raw_size, filename, mime_type, created_at)"
+                    " VALUES (?, ?, zeroblob(?), ?, ?, ?, ?, ?)",
+                    (patient_id, file_type, stored_size, self._codec, self.size, filename, mime_type, created_at),
+                )
+                if _HAS_BLOBOPEN:
+                    with conn.blobopen("patient_files", "data", cursor.lastrowid) as blob:
+                        shutil.copyfileobj(self._spool, blob, DEFAULT_CHUNK_SIZE)
+                else:
+                    conn.execute(
+                        "UPDATE patient_files SET data = ? WHERE file_id = ?", (self._spool.read(), cursor.lastrowid)
+                    )
+                self._set_imaging_columns(conn, cursor.lastrowid)
+            self.file_id = cursor.lastrowid
+        finally:
+            self._spool.close()
+        _invalidate_patients(patient_id)
+        schedule_derivatives([(self.file_id, mime_type, filename)])
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        if self.closed:
+            return
+        if error is None and self.written != self.size:
+            error = ValueError(f"Wrote {self.written} of {self.size} declared bytes")
+        super().close()
+        if self._store is not None:
+            self._finish_external(error)
+        else:
+            self._finish_inline(error)
+
+    def close(self) -> None:
+        self._finish(None)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            try:
+                self._finish(exc)
+            except BaseException:
+                pass
+            return False
+        self._finish(None)
+        return False
+
+
+def open_patient_file(file_id: int) -> io.BufferedReader:
+    """
+    Opens a stored patient file for streaming reads.
+
+    Buffered, so `read(n)` returns `n` bytes unless at the end of the file,
+    as image decoders (pydicom, nibabel) expect.
+    """
+    return io.BufferedReader(PatientFileReader(file_id))
+
+
+def iter_patient_file_chunks(file_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields a stored patient file's payload in chunks of at most `chunk_size` bytes."""
+    with PatientFileReader(file_id) as reader:
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _remaining_size(stream: BinaryIO) -> Optional[int]:
+    try:
+        position = stream.tell()
+        end = stream.seek(0, io.SEEK_END)
+        stream.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def store_patient_file_stream(
+    patient_id: str,
+    file_type: str,
+    stream: BinaryIO,
+    size: Optional[int] = None,
+    filename: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    created_at: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Stores a patient file from a binary stream, chunk by chunk; returns its `file_id`.
+
+    If `size` is not given it is taken from a seekable stream; non-seekable
+    streams are first spooled to a temporary file on disk.
+    """
+    spool = None
+    if size is None:
+        size = _remaining_size(stream)
+    if size is None:
+        spool = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+        shutil.copyfileobj(stream, spool, chunk_size)
+        size = spool.tell()
+        spool.seek(0)
+        stream = spool
+    try:
+        with PatientFileWriter(patient_id, file_type, size, filename, mime_type, created_at) as writer:
+            shutil.copyfileobj(stream, writer, chunk_size)
+        return writer.file_id
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+def store_patient_file_from_path(
+    patient_id: str,
+    file_type: str,
+    path: str,
+    mime_type: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Streams a file from disk into the database; returns its `file_id`."""
+    with open(path, "rb") as f:
+        return store_patient_file_stream(
+            patient_id,
+            file_type,
+            f,
+            size=os.fstat(f.fileno()).st_size,
+            filename=os.path.basename(path),
+            mime_type=mime_type,
+            chunk_size=chunk_size,
+        )
@@ -0,0 +1,122 @@
+"""
+Imaging study selection by decoded header fields.
+
+`modality`, `rows`, `cols`, `slices`, `dtype`, `spacing_x`/`spacing_y`/
+`spacing_z` and `study_date` are columns on `patient_files` (schema
+migration 11), parsed from each image's header when it is stored, so
+choosing a study never reads pixel data. Files stored before that
+migration get them from `backfill_imaging_columns`.
+"""
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .connection import connection, get_manager, transaction
+from .derivatives import _read_payload
+from .imaging import IMAGING_COLUMNS, imaging_columns, is_imaging_file
+
+# Filterable by value; the ordered ones also by `min_<column>`/`max_<column>`
+EXACT_COLUMNS = ("patient_id", "type", "modality", "dtype")
+RANGE_COLUMNS = ("rows", "cols", "slices", "spacing_x", "spacing_y", "spacing_z", "study_date")
+
+UPDATE_IMAGING_COLUMNS = (
+    f"UPDATE patient_files SET {', '.join(f'{column} = ?' for column in IMAGING_COLUMNS)} WHERE file_id = ?"
+)
+
+
+def set_imaging_columns(conn: sqlite3.Connection, files: Iterable[Tuple[int, Optional[tuple]]]) -> None:
+    """Stores `(file_id, imaging.imaging_columns(...))` pairs; call in the transaction that inserts the files."""
+    rows = [(*values, file_id) for file_id, values in files if values is not None]
+    if rows:
+        conn.executemany(UPDATE_IMAGING_COLUMNS, rows)
+
+
+def build_imaging_query(filters: Dict[str, Any], limit: Optional[int] = None) -> Tuple[str, list]:
+    """Filters -> (SQL, parameters) for `query_imaging_files`."""
+    clauses, params = ["f.rows IS NOT NULL"], []  # decoded images only
+    for name, value in filters.items():
+        bound, _, column = name.partition("_") if name.startswith(("min_", "max_")) else ("", "", name)
+        if bound:
+            if column not in RANGE_COLUMNS:
+                raise ValueError(f"Cannot bound {column}; ordered fields are {', '.join(RANGE_COLUMNS)}")
+            clauses.append(f"f.{column} {'>=' if bound == 'min' else '<='} ?")
+            params.append(value)
+            continue
+        if column not in EXACT_COLUMNS + RANGE_COLUMNS:
+            raise ValueError(
+                f"Cannot filter on {column}; fields are {', '.join(EXACT_COLUMNS + RANGE_COLUMNS)}"
+                " (ordered ones also as min_<field>/max_<field>)"
+            )
+        if column == "modality" and value is not None:
+            value = [v.upper() for v in value] if isinstance(value, (list, tuple, set, frozenset)) else value.upper()
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"f.{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        elif value is None:
+            clauses.append(f"f.{column} IS NULL")
+        else:
+            clauses.append(f"f.{column} = ?")
+            params.append(value)
+
+    sql = (
+        "SELECT f.file_id, f.patient_id, f.type, f.filename, f.mime_type, f.created_at, "
+        + ", ".join(f"f.{column}" for column in IMAGING_COLUMNS)
+        + " FROM patient_files f WHERE " + " AND ".join(clauses)
+        # Newest study first within each patient; undated ones last
+        + " ORDER BY f.patient_id, f.study_date DESC, f.file_id"
+    )
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def query_imaging_files(limit: Optional[int] = None, **filters: Any) -> List[Dict[str, Any]]:
+    """Selects stored images by their header fields, without reading any payload.
+
+    Each filter is a value (equality), a list of values (any of them) or
+    None (field missing) for `patient_id`, `type`, `modality`, `dtype` and
+    the ordered fields `rows`, `cols`, `slices`, `spacing_x`, `spacing_y`,
+    `spacing_z` (mm) and `study_date` (YYYY-MM-DD); the ordered fields
+    also take inclusive bounds as `min_<field>`/`max_<field>`, e.g.
+    `query_imaging_files(patient_id="P-1", modality="CT", min_slices=20, max_spacing_z=2.5)`.
+
+    Returns file info and the header fields per match, ordered by patient
+    and then newest study first. Modality is read from DICOM headers only.
+    """
+    sql, params = build_imaging_query(filters, limit)
+    return [dict(r) for r in connection().execute(sql, params).fetchall()]
+
+
+def backfill_imaging_columns(batch_size: int = 100) -> int:
+    """Parses and stores the header fields of images stored without them; returns the number updated.
+
+    Reads each candidate's payload, so this is a maintenance step (see
+    `manage_patient_db.py imaging-columns`), not something to run per request.
+    """
+    manager = get_manager()
+    conn = manager.connection()
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT file_id, mime_type, filename FROM patient_files"
+            " WHERE file_id > ? AND rows IS NULL ORDER BY file_id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return updated
+        parsed = []
+        for file_id, mime_type, filename in rows:
+            # Files with neither a MIME type nor a name may still be images
+            if is_imaging_file(mime_type, filename) or (mime_type is None and filename is None):
+                payload = _read_payload(manager, file_id)
+                if payload is not None:
+                    parsed.append((file_id, imaging_columns(payload[0], mime_type, filename)))
+        with transaction() as tx:
+            set_imaging_columns(tx, parsed)
+        updated += sum(values is not None for _, values in parsed)
+        last_id = rows[-1][0]
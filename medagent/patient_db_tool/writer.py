@@ -0,0 +1,356 @@
+"""
+Write-behind queue for patient files.
+
+`enqueue_patient_file` hands a file to a single background writer thread
+and returns a pending id at once, so a caller on the conversational path
+does not wait for SQLite (or the blob store) to take a large upload. The
+writer group-commits: it takes whatever is queued, up to `batch_size`
+files, waiting at most `max_delay` seconds for more after the first, and
+stores them with `store_files_bulk` in one transaction.
+
+The queue is bounded by file count and by payload bytes; `enqueue` blocks
+(up to its timeout) while it is full. Files accepted by the queue are
+written before `shutdown_writer` returns, which runs at interpreter exit;
+a process that is killed loses what was still queued. A batch that fails
+is retried file by file, so one bad payload only fails its own write.
+
+    pending_id = enqueue_patient_file("MM-26", "CT", data, filename="ct.dcm")
+    file_id = resolve_pending_file(pending_id, timeout=30)
+"""
+import atexit
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from .bulk import store_files_bulk
+from .connection import ConnectionManager, get_manager, use_manager
+from .records import _ensure_bytes, _utc_timestamp
+from .routing import _active_store
+from .sharding import _global_ids
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = 256
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_DELAY = 0.02
+
+# Completed writes remembered for `resolve_pending_file` / `pending_file_status`
+_RECENT_RESULTS = 4096
+# Latency samples kept for the percentiles in `stats()`
+_LATENCY_SAMPLES = 1024
+
+
+def _route(patient_id: str) -> Tuple[ConnectionManager, int]:
+    """The manager (and shard) a write for `patient_id` goes to."""
+    store = _active_store()
+    if store is None:
+        return get_manager(), 0
+    shard = store.shard_for(patient_id)
+    return store.managers[shard], shard
+
+
+class WriteQueueFull(Exception):
+    """The write-behind queue stayed full for the whole enqueue timeout."""
+
+
+class _PendingWrite:
+    __slots__ = ("pending_id", "record", "size", "manager", "shard", "enqueued_at", "future")
+
+    def __init__(self, pending_id: str, record: Dict[str, Any], size: int, manager: ConnectionManager, shard: int):
+        self.pending_id = pending_id
+        self.record = record
+        self.size = size
+        self.manager = manager
+        self.shard = shard  # of the sharded store, which file ids are made store-wide for
+        self.enqueued_at = time.perf_counter()
+        self.future: Future = Future()
+
+
+def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "p50": ordered[len(ordered) // 2] * 1000,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+class WriteBehindQueue:
+    """Bounded queue of patient file writes drained by one group-committing thread."""
+
+    def __init__(
+        self,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._queue: Deque[_PendingWrite] = deque()
+        self._queued_bytes = 0
+        self._in_flight = 0
+        self._closed = False
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._recent: "OrderedDict[str, Future]" = OrderedDict()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._commit_times: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._counts = {"enqueued": 0, "written": 0, "failed": 0, "batches": 0, "max_depth": 0}
+        self._thread = threading.Thread(target=self._run, name="patient-db-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, record: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        """Queues one file (a `store_files_bulk` mapping); returns its pending id.
+
+        The payload is converted to bytes here, so conversion errors are
+        raised to the caller. Raises WriteQueueFull if there is no room
+        within `timeout` seconds (None waits indefinitely).
+        """
+        record = dict(record)
+        record["data"] = _ensure_bytes(record["data"])
+        # The upload time, not the time the writer gets to it
+        record.setdefault("created_at", _utc_timestamp())
+        size = len(record["data"])
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # A single file larger than max_bytes still goes in once the queue is empty
+            while not self._closed and self._queue and (
+                len(self._queue) >= self.max_items or self._queued_bytes + size > self.max_bytes
+            ):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise WriteQueueFull(f"{len(self._queue)} file(s), {self._queued_bytes} bytes queued")
+                self._cond.wait(remaining)
+            if self._closed:
+                raise RuntimeError("The patient file writer has been shut down")
+            # Random ids: unique across restarts and processes sharing a database
+            item = _PendingWrite(f"pending-{uuid.uuid4().hex}", record, size, *_route(record["patient_id"]))
+            self._queue.append(item)
+            self._queued_bytes += size
+            self._pending[item.pending_id] = item
+            self._counts["enqueued"] += 1
+            self._counts["max_depth"] = max(self._counts["max_depth"], len(self._queue))
+            self._cond.notify_all()
+        return item.pending_id
+
+    def future(self, pending_id: str) -> Optional[Future]:
+        """The future of a pending or recently completed write (resolves to its file_id), or None."""
+        with self._cond:
+            item = self._pending.get(pending_id)
+            return item.future if item is not None else self._recent.get(pending_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything queued so far is committed (or failed); False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Stops accepting writes and returns once the queued ones are written; False on timeout."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "depth": len(self._queue),
+                "queued_bytes": self._queued_bytes,
+                "in_flight": self._in_flight,
+                **self._counts,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                # enqueue -> commit, and the commit of each batch, in milliseconds
+                "latency_ms": _percentiles(self._latencies),
+                "commit_ms": _percentiles(self._commit_times),
+            }
+
+    def _take_batch(self) -> List[_PendingWrite]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            # Group commit: give writers arriving right behind the first a moment to join
+            deadline = time.monotonic() + self.max_delay
+            while not self._closed and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._queued_bytes -= sum(item.size for item in batch)
+            self._in_flight = len(batch)
+            self._cond.notify_all()  # room for blocked enqueuers
+            return batch
+
+    def _write(self, batch: List[_PendingWrite]) -> None:
+        # Each write goes to the database its caller was using when it was
+        # queued (a use_manager() override, its patient's shard, or the
+        # manager configure() set then); consecutive writes to the same one
+        # are committed together
+        for manager, group in itertools.groupby(batch, key=lambda item: item.manager):
+            with use_manager(manager):
+                self._write_group(list(group))
+
+    def _write_group(self, batch: List[_PendingWrite]) -> None:
+        start = time.perf_counter()
+        try:
+            file_ids = store_files_bulk([item.record for item in batch], batch_size=len(batch))
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            logger.warning(f"Group commit of {len(batch)} patient files failed, retrying one by one: {e}")
+            for item in batch:
+                self._write_group([item])
+            return
+        done = time.perf_counter()
+        with self._cond:
+            self._commit_times.append(done - start)
+            self._counts["batches"] += 1
+            self._latencies.extend(done - item.enqueued_at for item in batch)
+        for item, file_id in zip(batch, file_ids):
+            item.future.set_result(_global_ids(item.shard, file_id))
+
+    def _finish(self, batch: List[_PendingWrite]) -> None:
+        with self._cond:
+            for item in batch:
+                if item.future.exception() is None:
+                    self._counts["written"] += 1
+                else:
+                    self._counts["failed"] += 1
+                    logger.error(f"Patient file write {item.pending_id} failed: {item.future.exception()}")
+                item.record = None  # drop the payload
+                del self._pending[item.pending_id]
+                self._recent[item.pending_id] = item.future
+            while len(self._recent) > _RECENT_RESULTS:
+                self._recent.popitem(last=False)
+            self._in_flight = 0
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return  # closed and drained
+            try:
+                self._write(batch)
+            except BaseException as e:  # never leave a caller waiting forever
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            finally:
+                self._finish(batch)
+
+
+_writer: Optional[WriteBehindQueue] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteBehindQueue:
+    """The process-wide write-behind queue, started on first use."""
+    global _writer, _writer_pid
+    with _writer_lock:
+        # A forked child inherits the queue object but not its thread
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = WriteBehindQueue()
+            _writer_pid = os.getpid()
+        return _writer
+
+
+def enqueue_patient_file(
+    patient_id: str,
+    file_type: str,
+    file_data: Union[bytes, str, bytearray, memoryview],
+    filename: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    created_at: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """Queues a patient file for writing (same arguments as `store_patient_file_in_db`); returns a pending id.
+
+    The file is not visible to readers until it is committed; use
+    `resolve_pending_file` to wait for its `file_id`.
+    """
+    return get_writer().enqueue(
+        {
+            "patient_id": patient_id,
+            "type": file_type,
+            "data": file_data,
+            "filename": filename,
+            "mime_type": mime_type,
+            "created_at": created_at,
+        },
+        timeout=timeout,
+    )
+
+
+def resolve_pending_file(pending_id: str, timeout: Optional[float] = None) -> int:
+    """Waits for a queued write and returns its `file_id`.
+
+    Raises the write's error if it failed, KeyError for an unknown (or
+    long forgotten) pending id, and TimeoutError if it is still queued
+    after `timeout` seconds.
+    """
+    future = get_writer().future(pending_id)
+    if future is None:
+        raise KeyError(f"Unknown pending file id {pending_id!r}")
+    return future.result(timeout)
+
+
+def pending_file_status(pending_id: str) -> Optional[Dict[str, Any]]:
+    """`{"state": "queued" | "written" | "failed", "file_id", "error"}` for a pending id, or None if unknown."""
+    future = get_writer().future(pending_id)
+    if future is None:
+        return None
+    if not future.done():
+        return {"state": "queued", "file_id": None, "error": None}
+    error = future.exception()
+    if error is not None:
+        return {"state": "failed", "file_id": None, "error": str(error)}
+    return {"state": "written", "file_id": future.result(), "error": None}
+
+
+def flush_writes(timeout: Optional[float] = None) -> bool:
+    """Blocks until every queued write is committed; False if `timeout` expired first."""
+    return get_writer().flush(timeout)
+
+
+def get_writer_stats() -> Dict[str, Any]:
+    """Queue depth, write counts and enqueue-to-commit / commit latency percentiles (ms)."""
+    return get_writer().stats()
+
+
+def shutdown_writer(timeout: Optional[float] = None) -> bool:
+    """Writes everything still queued and stops the writer thread; False on timeout.
+
+    Runs automatically at interpreter exit. A later enqueue starts a new writer.
+    """
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+        if writer is None or _writer_pid != os.getpid():
+            return True
+    return writer.close(timeout)
+
+
+atexit.register(shutdown_writer)
@@ -0,0 +1,133 @@
+"""
+Append-optimised session state: append-only logs, bounded ring buffers and counters.
+
+ADK records every `state[key] = value` in the event's state delta with the
+whole value, so the usual `results = state.get(key, []); results.append(x);
+state[key] = results` re-serialises the entire list on every call, and two
+tool calls running in parallel can each append to the same old list and
+lose one of the items.
+
+Here every appended item gets a state key of its own, `<key>#<index>`,
+next to a length counter `<key>#len`: an append writes exactly two small
+keys whatever the length of the log. Indexes are claimed under a lock, so
+concurrent appends never overwrite each other. The suffixes keep the
+key's scope prefix (`temp:`, `user:`, `app:`) intact.
+
+Pure Python with no ADK imports; works on `tool_context.state` or any
+mapping that behaves like it.
+"""
+import threading
+from typing import Any, Iterable, List, MutableMapping
+
+SEPARATOR = "#"
+LENGTH_SUFFIX = "#len"
+
+# One lock for every state object: claims are a dict lookup and a store
+_lock = threading.Lock()
+
+
+def _item_key(key: str, index: int) -> str:
+    return f"{key}{SEPARATOR}{index}"
+
+
+def _length(state: MutableMapping[str, Any], key: str) -> int:
+    n = state.get(key + LENGTH_SUFFIX, 0)
+    # Parallel tool calls merge their deltas in any order, so the stored
+    # length may trail items that were written; count those too
+    while _item_key(key, n) in state:
+        n += 1
+    return n
+
+
+def append(state: MutableMapping[str, Any], key: str, value: Any) -> int:
+    """Appends `value` to the log at `key`; returns its index."""
+    with _lock:
+        index = _length(state, key)
+        state[_item_key(key, index)] = value
+        state[key + LENGTH_SUFFIX] = index + 1
+    return index
+
+
+def extend(state: MutableMapping[str, Any], key: str, values: Iterable[Any]) -> int:
+    """Appends every value to the log at `key`; returns the new length."""
+    values = list(values)
+    with _lock:
+        index = _length(state, key)
+        for offset, value in enumerate(values):
+            state[_item_key(key, index + offset)] = value
+        if values:
+            state[key + LENGTH_SUFFIX] = index + len(values)
+    return index + len(values)
+
+
+def length(state: MutableMapping[str, Any], key: str) -> int:
+    legacy = state.get(key)
+    return (len(legacy) if isinstance(legacy, list) else 0) + _length(state, key)
+
+
+def items(state: MutableMapping[str, Any], key: str) -> List[Any]:
+    """
+    Everything appended to the log at `key`, oldest first.
+
+    A plain list stored at `key` itself (by code that predates these
+    helpers) is read as the start of the log.
+    """
+    legacy = state.get(key)
+    head = list(legacy) if isinstance(legacy, list) else []
+    return head + [state[_item_key(key, i)] for i in range(_length(state, key))]
+
+
+def last(state: MutableMapping[str, Any], key: str, default: Any = None) -> Any:
+    n = _length(state, key)
+    if n:
+        return state[_item_key(key, n - 1)]
+    legacy = state.get(key)
+    return legacy[-1] if isinstance(legacy, list) and legacy else default
+
+
+def ring_append(state: MutableMapping[str, Any], key: str, value: Any, capacity: int) -> int:
+    """
+    Appends `value` to the ring buffer at `key`, overwriting the oldest of its `capacity` slots once full.
+
+    Returns the item's sequence number (how many items were appended before it).
+    """
+    if capacity < 1:
+        raise ValueError(f"capacity must be at least 1, not {capacity}")
+    with _lock:
+        seq = max(state.get(key + LENGTH_SUFFIX, 0), _ring_next(state, key, capacity))
+        state[_item_key(key, seq % capacity)] = {"seq": seq, "value": value}
+        state[key + LENGTH_SUFFIX] = seq + 1
+    return seq
+
+
+def _ring_slots(state: MutableMapping[str, Any], key: str, capacity: int) -> List[dict]:
+    return [slot for slot in (state.get(_item_key(key, i)) for i in range(capacity)) if slot]
+
+
+def _ring_next(state: MutableMapping[str, Any], key: str, capacity: int) -> int:
+    return max((slot["seq"] + 1 for slot in _ring_slots(state, key, capacity)), default=0)
+
+
+def ring_items(state: MutableMapping[str, Any], key: str, capacity: int) -> List[Any]:
+    """The (at most `capacity`) newest items of the ring buffer at `key`, oldest first."""
+    return [slot["value"] for slot in sorted(_ring_slots(state, key, capacity), key=lambda slot: slot["seq"])]
+
+
+def incr(state: MutableMapping[str, Any], key: str, amount: int = 1) -> int:
+    """Adds `amount` to the counter at `key` (0 when unset); returns the new value."""
+    with _lock:
+        value = state.get(key, 0) + amount
+        state[key] = value
+    return value
+
+
+__all__ = [
+    "append",
+    "extend",
+    "incr",
+    "items",
+    "last",
+    "length",
+    "ring_append",
+    "ring_items",
+]
@@ -7,11 +7,12 @@ from google.adk import Agent
 from . import prompt
 from . import tools
 from ...config import settings
+from ...tools import get_abnormal_lab_results, get_latest_lab_result
 
 evidence_agent = Agent(
     model=settings.MODEL_FAST,
     name="evidence_agent",
     description="Orders and interprets laboratory tests. Validates lab requests and returns results with clinical flags.",
     instruction=prompt.EVIDENCE_INSTRUCTION,
-    tools=[tools.tool_order_labs]
+    tools=[tools.tool_order_labs, get_latest_lab_result, get_abnormal_lab_results]
 )
@@ -4,6 +4,7 @@ Evidence Agent Tools - Lab ordering and simulation
 from google.adk.tools.tool_context import ToolContext
 from google.adk.plugins.save_files_as_artifacts_plugin import SaveFilesAsArtifactsPlugin
 import pandas as pd
+from ... import session_state
 from ...utils import extract_data 
 
 mimic = extract_data.mimic
@@ -97,9 +98,7 @@ def tool_order_labs(
         "hadm_id": row["hadm_id"],
     }
     if tool_context:
-        results = tool_context.state.get("temp:lab_results", [])
-        results.append(pulled)
-        tool_context.state["temp:lab_results"] = results
+        session_state.append(tool_context.state, "temp:lab_results", pulled)
 
     return (
         f"{test_key}: {pulled['value']} {pulled['unit']} "
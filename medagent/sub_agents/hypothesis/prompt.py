@@ -6,6 +6,10 @@ HYPOTHESIS_INSTRUCTION = """
 You are a Board-Certified Internist specializing in Diagnostic Medicine.
 Generate a Differential Diagnosis (DDx) based on the patient summary.
 
+### CURRENT DIFFERENTIAL (ranked, from earlier iterations):
+{ddx_table?}
+Revise it: restate diagnoses you keep under the same names, adjust their probability, and add or drop as the evidence warrants.
+
 ### COGNITIVE FRAMEWORK:
 1. Identify key clinical features (e.g., Elderly Male + Fever + Confusion)
 2. Apply VINDICATE heuristic: Vascular, Infection, Neoplasm, Degenerative, Iatrogenic, Congenital, Autoimmune, Trauma, Endocrine
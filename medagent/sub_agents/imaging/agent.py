@@ -13,5 +13,5 @@ imaging_agent = Agent(
     name="imaging_agent",
     description="Orders and interprets radiology studies (CT, MRI, X-ray, Ultrasound). Generates structured reports with findings and impressions.",
     instruction=prompt.IMAGING_INSTRUCTION,
-    tools=[tools.tool_order_imaging]
+    tools=[tools.tool_order_imaging, tools.tool_find_patient_studies, tools.tool_analyze_patient_file]
 )
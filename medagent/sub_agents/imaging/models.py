@@ -3,6 +3,8 @@ from typing import List, Optional, Literal, Dict
 from datetime import datetime
 import uuid
 
+from ...summary import LEVELS, CompactionLevel, compact_lines, dedupe, estimate_tokens, fit_to_budget
+
 # --- Value Objects ---
 
 class Vitals(BaseModel):
@@ -76,11 +78,25 @@ class PatientCase(BaseModel):
         entry = f"[{datetime.now().isoformat()}] {agent.upper()}: {action}"
         self.action_log.append(entry)
 
-    def clinical_summary(self) -> str:
-        """Generates a dense text summary for LLM context injection."""
-        labs = "\n".join([str(l) for l in self.lab_results]) or "None"
-        imgs = "\n".join([f"{i.modality} {i.region}: {i.impression}" for i in self.imaging_reports]) or "None"
-        
+    def clinical_summary(self, token_budget: Optional[int] = None) -> str:
+        """
+        Generates a dense text summary for LLM context injection.
+        With `token_budget`, older normal labs and imaging collapse into one-liners
+        (newest and abnormal stay verbatim) until it fits, repeated DDx entries are
+        listed once, and the summary ends with its estimated token count.
+        """
+        if token_budget is None:
+            return self._render_summary(LEVELS[0], unique_ddx=False)
+        text, _ = fit_to_budget(self._render_summary, token_budget)
+        return f"{text}(~{estimate_tokens(text)} tokens, budget {token_budget})\n"
+
+    def _render_summary(self, level: CompactionLevel, unique_ddx: bool = True) -> str:
+        labs = "\n".join(compact_lines(self.lab_results, level, verbatim=str, brief=str)) or "None"
+        imgs = "\n".join(
+            compact_lines(self.imaging_reports, level, verbatim=_imaging_line, brief=_imaging_line)
+        ) or "None"
+        ddx = dedupe(self.differential_diagnosis) if unique_ddx else self.differential_diagnosis
+
         return (
             f"--- PATIENT SUMMARY ---\n"
             f"ID: {self.case_id}\n"
@@ -92,5 +108,9 @@ class PatientCase(BaseModel):
             f"LABS:\n{labs}\n"
             f"IMAGING:\n{imgs}\n"
             f"--- CURRENT THINKING ---\n"
-            f"DIFFERENTIAL: {self.differential_diagnosis}\n"
+            f"DIFFERENTIAL: {ddx}\n"
         )
+
+
+def _imaging_line(report: ImagingReport) -> str:
+    return f"{report.modality} {report.region}: {report.impression}"
@@ -5,15 +5,21 @@ Imaging Agent Tools - Radiology ordering and simulation
 from google.adk.tools.tool_context import ToolContext
 
 
+import asyncio
+import gzip
 import random
 import numpy as np
 import pydicom
 import nibabel as nib
+from nibabel.fileholders import FileHolder
 from skimage import filters, feature
 from skimage.transform import resize
 
 from .models import LabResult, ImagingReport
 from .mock_data import LAB_REFERENCE_RANGES, DISEASE_PROFILES
+from ... import ddx, session_state
+from ...patient_db_tool import aio as patient_db
+from ...patient_db_tool import open_patient_file
 
 
 # =========================
@@ -138,7 +144,15 @@ class ImageFeatureExtractor:
     Computes technical image metrics only.
     """
 
-    def load_image(self, path):
+    def load_image(self, path, fmt=None):
+        """
+        Loads an image from a path, or from a binary file object (e.g. a
+        patient_db_tool stream) whose format is given by `fmt`, a filename or
+        extension such as ".nii.gz".
+        """
+        if hasattr(path, "read"):
+            return self._load_stream(path, str(fmt or "").lower())
+
         path = str(path).lower()
 
         if path.endswith(".dcm"):
@@ -154,6 +168,25 @@ class ImageFeatureExtractor:
 
         raise ValueError("Unsupported file format.")
 
+    def _load_stream(self, stream, fmt):
+        # Decoders read straight from the stream; the encoded file is never
+        # buffered in memory as a whole
+        if fmt.endswith(".dcm") or fmt == "application/dicom":
+            ds = pydicom.dcmread(stream)
+            return ds.pixel_array.astype(np.float32)
+
+        if fmt.endswith(".nii") or fmt.endswith(".nii.gz"):
+            if fmt.endswith(".gz"):
+                stream = gzip.GzipFile(fileobj=stream)
+            holder = FileHolder(fileobj=stream)
+            img = nib.Nifti1Image.from_file_map({"header": holder, "image": holder})
+            return img.get_fdata().astype(np.float32)
+
+        if fmt.endswith(".npy"):
+            return np.load(stream).astype(np.float32)
+
+        raise ValueError("Unsupported file format.")
+
     def extract_slice(self, img, slice_index=None):
         if img.ndim == 2:
             return img
@@ -199,11 +232,11 @@ class ImageFeatureExtractor:
         median = filters.median(slice_img)
         return float(np.mean(np.abs(slice_img - median)))
 
-    def analyze(self, path, slice_index=None, operations=None, bins=64):
+    def analyze(self, path, slice_index=None, operations=None, bins=64, fmt=None):
         if operations is None:
             operations = ["histogram", "edges", "contrast", "symmetry", "noise"]
 
-        img = self.load_image(path)
+        img = self.load_image(path, fmt)
         slice_img = self.extract_slice(img, slice_index)
 
         results = {}
@@ -231,6 +264,9 @@ class ImageFeatureExtractor:
 # SINGLETONS
 # =========================
 
+# Analyses carry whole histograms; session state keeps only the newest ones
+IMAGE_ANALYSES_KEPT = 16
+
 lab_sim = LabSimulator()
 img_sim = ImagingSimulator()
 img_feat_extractor = ImageFeatureExtractor()
@@ -285,14 +321,14 @@ def tool_order_imaging(modality: str, region: str, clinical_context: str = "", t
         differential = tool_context.state.get('temp:differential_diagnosis', [])
         if differential:
             clinical_context = str(differential[-1]) if isinstance(differential, list) else str(differential)
+        else:
+            clinical_context = " ".join(entry["name"] for entry in ddx.top(tool_context.state, 3))
     
     report = img_sim.order_scan(modality, region, clinical_context)
     
     # Store result in state if tool_context available
     if tool_context:
-        imaging_reports = tool_context.state.get('temp:imaging_reports', [])
-        imaging_reports.append(report.model_dump())
-        tool_context.state['temp:imaging_reports'] = imaging_reports
+        session_state.append(tool_context.state, 'temp:imaging_reports', report.model_dump())
     
     return f"REPORT ID: {report.id}\nFINDINGS: {report.findings}\nIMPRESSION: {report.impression}"
 
@@ -312,8 +348,79 @@ def tool_analyze_image(path: str, slice_index: int = None, operations=None, bins
     results = img_feat_extractor.analyze(path, slice_index, operations, bins)
     
     if tool_context:
-        image_analyses = tool_context.state.get('temp:image_analyses', [])
-        image_analyses.append({'path': path, 'results': results})
-        tool_context.state['temp:image_analyses'] = image_analyses
+        session_state.ring_append(
+            tool_context.state, 'temp:image_analyses', {'path': path, 'results': results}, IMAGE_ANALYSES_KEPT
+        )
     
     return results
+
+
+def _analyze_stored_file(file_id: int, fmt: str, slice_index: int = None, operations=None, bins: int = 64):
+    with open_patient_file(file_id) as stream:
+        return img_feat_extractor.analyze(stream, slice_index, operations, bins, fmt=fmt)
+
+
+async def tool_analyze_patient_file(file_id: int, slice_index: int = None, operations=None, bins: int = 64, tool_context: ToolContext = None):
+    """
+    [TOOL] Analyzes a medical image stored in the patient database.
+
+    Args:
+        file_id: ID of the stored file (as listed by access_patient_database).
+        slice_index: Specific slice index for 3D images.
+        operations: List of analysis operations to perform.
+        bins: Number of bins for histogram analysis.
+        tool_context: ADK tool context for accessing session state.
+    Returns:
+        Dictionary of extracted image features.
+    """
+    meta = await patient_db.get_patient_file_info(file_id)
+    if meta is None:
+        return {"error": f"No patient file with id {file_id}"}
+
+    # Decoding and feature extraction are CPU-bound: keep them off the event
+    # loop and off the database pool (the reader opens its own connection)
+    results = await asyncio.to_thread(
+        _analyze_stored_file, file_id, meta["filename"] or meta["mime_type"], slice_index, operations, bins
+    )
+
+    if tool_context:
+        session_state.ring_append(
+            tool_context.state, 'temp:image_analyses', {'file_id': file_id, 'results': results}, IMAGE_ANALYSES_KEPT
+        )
+
+    return results
+
+
+async def tool_find_patient_studies(
+    patient_id: str,
+    modality: str = None,
+    min_slices: int = None,
+    max_slice_spacing_mm: float = None,
+    tool_context: ToolContext = None,
+):
+    """
+    [TOOL] Lists a patient's stored images by header fields, without loading pixel data.
+
+    Args:
+        patient_id: The ID of the patient (e.g., "MM-26").
+        modality: DICOM modality code (CT, MR, CR, DX, US); only DICOM files carry one.
+        min_slices: Only volumes with at least this many slices.
+        max_slice_spacing_mm: Only studies with slices at most this far apart (mm).
+        tool_context: ADK tool context for accessing session state.
+    Returns:
+        Stored images, newest study first, with file_id (for tool_analyze_patient_file),
+        modality, rows x cols x slices, dtype, voxel spacing in mm and study date.
+    """
+    filters = {"patient_id": patient_id}
+    if modality:
+        filters["modality"] = modality
+    if min_slices is not None:
+        filters["min_slices"] = min_slices
+    if max_slice_spacing_mm is not None:
+        filters["max_spacing_z"] = max_slice_spacing_mm
+    studies = await patient_db.query_imaging_files(**filters)
+
+    if tool_context:
+        tool_context.state[f"temp:imaging_studies_{patient_id}"] = [s["file_id"] for s in studies]
+
+    return studies
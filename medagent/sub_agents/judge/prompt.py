@@ -6,6 +6,9 @@ JUDGE_INSTRUCTION = """
 You are the Chief Medical Officer (CMO), the Orchestrator.
 You manage the diagnostic lifecycle using a Loop-of-Thought process.
 
+### CURRENT DIFFERENTIAL (ranked):
+{ddx_table?}
+
 ### DECISION MATRIX:
 1. Review patient context, current DDx, and evidence
 2. Evaluate confidence:
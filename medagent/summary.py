@@ -0,0 +1,418 @@
+"""
+Incrementally rendered clinical case summary for `get_patient_summary`.
+
+The summary is a fixed sequence of sections, each rendered from a few
+session state keys. Every section is cached next to the revision of its
+keys - a per-section counter that writers bump with `invalidate` (the
+`medagent.ddx` store does) - and the values it was rendered from, and is
+re-rendered only when the counter moved or a key was re-assigned (checked
+by identity and length, never by walking the values). The assembled text
+is cached too, under a version counter that moves whenever the text does;
+a call that finds nothing changed returns the cached text unchanged.
+
+The cache and the counters live under `temp:` keys, so they stay out of
+the persisted state deltas and start over with every invocation.
+
+The differential is the ranked table kept by `medagent.ddx` (`ddx_table`),
+or, for sessions without one, the raw `differential_diagnosis` list.
+
+With a token budget, the list sections (labs, imaging, differential) are
+compacted until the summary fits: the newest and abnormal entries stay
+verbatim, older ones collapse into one-liners and finally into a count,
+and repeated differential entries are kept once. Budgeted summaries are
+cached separately per budget and end with their estimated token count.
+
+Pure Python with no ADK imports, so it can be used (and tested) on any
+mapping that behaves like `tool_context.state`.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Sequence, Tuple
+
+from . import session_state
+
+logger = logging.getLogger(__name__)
+
+# Session state keys of the cache: one per section, plus the assembled text
+# and its version. Budgeted summaries use "temp:summary@<budget>:" instead.
+CACHE_PREFIX = "temp:summary:"
+SECTION_KEY = "section:"
+TEXT_KEY = "text"
+VERSION_KEY = "version"
+# Per-section revision counters bumped by `invalidate`, shared by every budget
+REVISION_PREFIX = "temp:summary:rev:"
+
+HEADER = "=== CLINICAL CASE SUMMARY ==="
+
+# Rough size of a token in English clinical text; good to within ~20% for
+# Gemini and similar tokenizers, which is all a budget needs
+CHARS_PER_TOKEN = 4
+
+# Budget for get_patient_summary when the caller gives none; unset or 0 means no budget
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("MEDAGENT_SUMMARY_TOKEN_BUDGET") or 0) or None
+
+ABNORMAL_FLAGS = frozenset({"HIGH", "LOW", "CRITICAL", "ABNORMAL"})
+_ABNORMAL_TEXT = re.compile(r"\b(HIGH|LOW|CRITICAL|ABNORMAL)\b")
+_NORMAL_IMPRESSION = re.compile(r"^\s*(normal|no acute)", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class CompactionLevel:
+    """How hard list sections are compacted; level 0 keeps everything verbatim."""
+
+    recent: Optional[int]  # newest entries kept verbatim (None: all)
+    width: int  # one-liner length for the older entries
+    abnormal_verbatim: bool  # abnormal entries kept verbatim rather than as one-liners
+    keep_older: bool  # older normal entries as one-liners, or only counted
+
+
+LEVELS: Tuple[CompactionLevel, ...] = (
+    CompactionLevel(None, 0, True, True),
+    CompactionLevel(5, 120, True, True),
+    CompactionLevel(2, 80, True, True),
+    CompactionLevel(1, 60, False, True),
+    CompactionLevel(1, 60, False, False),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _item(value: Any) -> str:
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {v}" for k, v in value.items() if v not in (None, ""))
+    return str(value)
+
+
+def one_line(text: str, width: int) -> str:
+    """`text` on a single line of at most `width` characters."""
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[: width - 1].rstrip() + "…"
+
+
+def is_abnormal(value: Any) -> bool:
+    """Flagged labs (HIGH, LOW, CRITICAL, ABNORMAL) and imaging whose impression is not normal."""
+    if isinstance(value, dict):
+        flag, impression = value.get("flag") or value.get("LABEL"), value.get("impression")
+    else:
+        flag, impression = getattr(value, "flag", None), getattr(value, "impression", None)
+    if flag is not None:
+        return str(flag).upper() in ABNORMAL_FLAGS
+    if impression:
+        return not _NORMAL_IMPRESSION.match(str(impression))
+    return bool(_ABNORMAL_TEXT.search(str(value)))
+
+
+def _imaging_line(value: Any) -> str:
+    if isinstance(value, dict) and value.get("impression"):
+        return " ".join(str(value[k]) for k in ("modality", "region") if value.get(k)) + f": {value['impression']}"
+    return _item(value)
+
+
+def ddx_key(text: Any) -> str:
+    """Differential entries that differ only in case, punctuation or spacing share a key."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+
+def dedupe(values: Iterable[Any], key: Callable[[Any], str] = ddx_key) -> List[Any]:
+    """`values` without repeats, each kept at its latest position."""
+    latest: Dict[str, int] = {}
+    values = list(values)
+    for i, value in enumerate(values):
+        latest[key(value)] = i
+    return [values[i] for i in sorted(latest.values())]
+
+
+def compact_lines(
+    values: Sequence[Any],
+    level: CompactionLevel,
+    verbatim: Callable[[Any], str] = _item,
+    brief: Callable[[Any], str] = _item,
+) -> List[str]:
+    """
+    `values` (oldest first) as lines compacted to `level`.
+
+    The newest `level.recent` entries are always verbatim; abnormal ones are
+    verbatim or one-liners, depending on the level; the remaining older
+    entries become one-liners, or a single "N older entries omitted" line.
+    """
+    cut = 0 if level.recent is None else max(0, len(values) - level.recent)
+    lines, omitted = [], 0
+    for i, value in enumerate(values):
+        if i >= cut or (level.abnormal_verbatim and is_abnormal(value)):
+            lines.append(verbatim(value))
+        elif level.keep_older or is_abnormal(value):
+            lines.append(one_line(brief(value), level.width))
+        else:
+            omitted += 1
+    if omitted:
+        lines.insert(0, f"({omitted} older {'entry' if omitted == 1 else 'entries'} omitted)")
+    return lines
+
+
+def fit_to_budget(render: Callable[[CompactionLevel], str], token_budget: int) -> Tuple[str, int]:
+    """The least compacted `render(level)` within `token_budget`, or the most compacted one; and its level index."""
+    for index, level in enumerate(LEVELS):
+        text = render(level)
+        if estimate_tokens(text) <= token_budget:
+            break
+    return text, index
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    title: str
+    keys: Tuple[str, ...]
+    render: Callable[..., str]
+    # Renders the section's values at a compaction level; None for sections never compacted
+    compact: Optional[Callable[..., str]] = None
+
+
+@dataclass(frozen=True)
+class SummaryRender:
+    """What one `render_summary` call did, as passed to render hooks."""
+
+    version: int
+    rendered: Tuple[str, ...]  # sections re-rendered by this call; empty when the cache was used as is
+    seconds: float
+    chars: int
+    tokens: int
+    token_budget: Optional[int] = None
+    level: int = 0  # compaction level used to fit the budget
+
+    @property
+    def cached(self) -> bool:
+        return not self.rendered
+
+
+def _bullets(values: Any, empty: str, fmt: Callable[[Any], str] = _item) -> str:
+    if not values:
+        return empty
+    if not isinstance(values, (list, tuple)):
+        return fmt(values)
+    return "\n".join(f"- {fmt(v)}" for v in values)
+
+
+def _compact_bullets(empty: str, brief: Callable[[Any], str] = _item, unique: bool = False):
+    def render(level: CompactionLevel, values: Any) -> str:
+        if not values:
+            return empty
+        if not isinstance(values, (list, tuple)):
+            return _item(values)
+        if unique:
+            values = dedupe(values)
+        return "\n".join(f"- {line}" for line in compact_lines(values, level, brief=brief))
+
+    return render
+
+
+_compact_ddx = _compact_bullets("Not yet formulated", unique=True)
+
+
+def _demographics(age: Any, sex: Any, location: Any) -> str:
+    return f"- Age: {age or 'Unknown'}\n- Sex: {sex or 'Unknown'}\n- Location: {location or 'Unknown'}"
+
+
+SECTIONS: List[Section] = [
+    Section("demographics", "DEMOGRAPHICS", ("patient_age", "patient_sex", "location"), _demographics),
+    Section("chief_complaint", "CHIEF COMPLAINT", ("chief_complaint",), lambda v: str(v or "None")),
+    Section(
+        "history", "HISTORY OF PRESENT ILLNESS", ("history_present_illness",), lambda v: str(v or "Not yet documented")
+    ),
+    Section("vitals", "VITALS", ("vitals",), lambda v: _item(v) if v else "Not recorded"),
+    Section(
+        "labs", "LABORATORY RESULTS", ("lab_results",),
+        lambda v: _bullets(v, "None ordered"),
+        _compact_bullets("None ordered"),
+    ),
+    Section(
+        "imaging", "IMAGING STUDIES", ("imaging_reports",),
+        lambda v: _bullets(v, "None ordered"),
+        _compact_bullets("None ordered", brief=_imaging_line),
+    ),
+    Section(
+        "differential", "DIFFERENTIAL DIAGNOSIS", ("differential_diagnosis", "ddx_table"),
+        lambda v, table: table or _bullets(v, "Not yet formulated"),
+        lambda level, v, table: table or _compact_ddx(level, v),
+    ),
+    Section("final", "FINAL DIAGNOSIS", ("final_diagnosis",), lambda v: str(v or "Pending")),
+]
+
+# The section each state key is rendered in
+_SECTION_OF = {key: s.name for s in SECTIONS for key in s.keys}
+
+
+def invalidate(state: MutableMapping[str, Any], *keys: str) -> None:
+    """
+    Marks the sections rendered from `keys` as changed; keys no section reads are ignored.
+
+    Re-assigning a key is noticed without it, as is a list or dict that
+    grew; call it after changing a value in place.
+    """
+    for name in dict.fromkeys(_SECTION_OF[k] for k in keys if k in _SECTION_OF):
+        session_state.incr(state, REVISION_PREFIX + name)
+
+
+_hooks: List[Callable[[SummaryRender], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def add_render_hook(hook: Callable[[SummaryRender], None]) -> None:
+    """Calls `hook(SummaryRender)` after every `render_summary`: render time, output size, re-rendered sections."""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_render_hook(hook: Callable[[SummaryRender], None]) -> None:
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _report(stats: SummaryRender) -> None:
+    logger.debug(
+        f"Summary v{stats.version}: {stats.chars} chars (~{stats.tokens} tokens) in {stats.seconds * 1000:.2f} ms"
+        f" (re-rendered: {', '.join(stats.rendered) or 'none'})"
+    )
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(stats)
+        except Exception:
+            logger.exception("Summary render hook failed")
+
+
+def _size(value: Any) -> Optional[int]:
+    return len(value) if isinstance(value, (list, tuple, dict)) else None
+
+
+def _fresh(entry: Optional[Dict[str, Any]], revision: int, values: Sequence[Any]) -> bool:
+    """Whether the cache `entry` was rendered at `revision` from these same value objects, none of them grown."""
+    return bool(entry) and entry["revision"] == revision and all(
+        new is old and _size(new) == size for new, old, size in zip(values, entry["values"], entry["sizes"])
+    )
+
+
+def _assemble(texts: Dict[str, str], footer: str = "") -> str:
+    text = "\n\n".join([HEADER] + [f"{s.title}:\n{texts[s.name]}" for s in SECTIONS])
+    return f"{text}\n\n{footer}" if footer else text
+
+
+def _prefix(token_budget: Optional[int]) -> str:
+    return CACHE_PREFIX if token_budget is None else f"temp:summary@{token_budget}:"
+
+
+def render_summary(state: MutableMapping[str, Any], token_budget: Optional[int] = None) -> str:
+    """
+    The clinical case summary for the session `state`, re-rendering only the sections whose keys changed.
+
+    With `token_budget`, list sections are compacted until the estimated
+    token count fits (see `LEVELS`), and the summary ends with that count.
+    Changed sections, the new text and a bumped version are written back to
+    `state` under `temp:` keys; when nothing changed, nothing is written.
+    """
+    start = time.perf_counter()
+    prefix = _prefix(token_budget)
+    values = {s.name: [state.get(k) for k in s.keys] for s in SECTIONS}
+    revisions = {s.name: state.get(REVISION_PREFIX + s.name, 0) for s in SECTIONS}
+    fresh = {
+        name: _fresh(state.get(prefix + SECTION_KEY + name), revisions[name], v) for name, v in values.items()
+    }
+    cached: Dict[str, Optional[Dict[str, Any]]] = {s.name: state.get(prefix + SECTION_KEY + s.name) for s in SECTIONS}
+    version = state.get(prefix + VERSION_KEY, 0)
+    text = state.get(prefix + TEXT_KEY)
+
+    if text is not None and all(fresh.values()):
+        level = next((c.get("level", 0) for c in cached.values() if "level" in c), 0)
+        _report(SummaryRender(
+            version, (), time.perf_counter() - start, len(text), estimate_tokens(text), token_budget, level
+        ))
+        return text
+
+    texts: Dict[str, str] = {}
+    rendered: List[str] = []
+
+    def section_text(section: Section, level: Optional[int]) -> str:
+        entry = cached[section.name]
+        if fresh[section.name] and entry.get("level") == level:
+            return entry["text"]
+        if level is None:
+            return section.render(*values[section.name])
+        return section.compact(LEVELS[level], *values[section.name])
+
+    budgeted = token_budget is not None
+    for section in SECTIONS:
+        if not (budgeted and section.compact):
+            texts[section.name] = section_text(section, None)
+
+    level = 0
+    if budgeted:
+        def render_at(compaction: CompactionLevel) -> str:
+            index = LEVELS.index(compaction)
+            for s in SECTIONS:
+                if s.compact:
+                    texts[s.name] = section_text(s, index)
+            return _assemble(texts)
+
+        new_text, level = fit_to_budget(render_at, token_budget)
+        new_text = _assemble(texts, f"(~{estimate_tokens(new_text)} tokens, budget {token_budget})")
+    else:
+        new_text = _assemble(texts)
+
+    for section in SECTIONS:
+        section_level = level if budgeted and section.compact else None
+        entry = cached[section.name]
+        if fresh[section.name] and entry.get("level") == section_level:
+            continue
+        section_values = values[section.name]
+        cache_entry = {
+            "revision": revisions[section.name],
+            "values": section_values,
+            "sizes": [_size(v) for v in section_values],
+            "text": texts[section.name],
+        }
+        if section_level is not None:
+            cache_entry["level"] = section_level
+        state[prefix + SECTION_KEY + section.name] = cache_entry
+        rendered.append(section.name)
+
+    if new_text != text:
+        version += 1
+        state[prefix + VERSION_KEY] = version
+        state[prefix + TEXT_KEY] = new_text
+
+    _report(SummaryRender(
+        version, tuple(rendered), time.perf_counter() - start, len(new_text), estimate_tokens(new_text),
+        token_budget, level,
+    ))
+    return new_text
+
+
+def summary_version(state: MutableMapping[str, Any], token_budget: Optional[int] = None) -> int:
+    """The version of the cached summary (for `token_budget`); 0 before the invocation's first render."""
+    return state.get(_prefix(token_budget) + VERSION_KEY, 0)
+
+
+__all__ = [
+    "DEFAULT_TOKEN_BUDGET",
+    "LEVELS",
+    "SECTIONS",
+    "SummaryRender",
+    "add_render_hook",
+    "compact_lines",
+    "dedupe",
+    "estimate_tokens",
+    "fit_to_budget",
+    "invalidate",
+    "is_abnormal",
+    "remove_render_hook",
+    "render_summary",
+    "summary_version",
+]
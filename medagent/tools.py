@@ -11,13 +11,10 @@ from typing import Any, Dict, List, Literal, Optional
 from google.adk.tools import load_artifacts
 from google.adk.tools.tool_context import ToolContext
 
-from medagent.patient_db_tool import (
-    get_patient_data_from_db,
-    get_patient_file_from_db,
-    store_patient_data_in_db,
-    store_patient_file_in_db,
-    store_patient_lab_results_in_db,
-)
+# Async facade: database calls run off the event loop
+from medagent import ddx, session_state
+from medagent.patient_db_tool import aio as patient_db
+from medagent.summary import DEFAULT_TOKEN_BUDGET, invalidate, render_summary
 
 logger = logging.getLogger(__name__)
 
@@ -38,80 +35,112 @@ def store_patient_data(field: str, value: Any, tool_context: ToolContext) -> str
         Confirmation message
     """
     tool_context.state[field] = value
+    invalidate(tool_context.state, field)
     logger.info(f"Stored {field}: {str(value)[:100]}...")
     return f"Successfully stored {field} in patient record"
 
 
-def get_patient_summary(tool_context: ToolContext) -> str:
+def get_patient_summary(tool_context: ToolContext, token_budget: Optional[int] = None) -> str:
     """
     Generate clinical summary from session state.
-    Compiles all patient data stored in the session.
+    Compiles all patient data stored in the session; sections whose data did
+    not change since the last call are reused from the cached summary.
+
+    Args:
+        token_budget: (Optional) Approximate maximum summary length in tokens. Older normal
+            results are shortened to fit; the newest and abnormal ones are kept in full.
+            Defaults to MEDAGENT_SUMMARY_TOKEN_BUDGET (no limit when unset).
 
     Returns:
         Formatted clinical case summary
     """
-    age = tool_context.state.get("patient_age", "Unknown")
-    sex = tool_context.state.get("patient_sex", "Unknown")
-    location = tool_context.state.get("location", "Unknown")
-    complaint = tool_context.state.get("chief_complaint", "None")
-    hpi = tool_context.state.get("history_present_illness", "")
-    vitals = tool_context.state.get("vitals", {})
-    labs = tool_context.state.get("lab_results", [])
-    imaging = tool_context.state.get("imaging_reports", [])
-    ddx = tool_context.state.get("differential_diagnosis", [])
-    final_dx = tool_context.state.get("final_diagnosis", "")
-
-    summary = f"""
-=== CLINICAL CASE SUMMARY ===
+    return render_summary(tool_context.state, token_budget or DEFAULT_TOKEN_BUDGET)
 
-DEMOGRAPHICS:
-- Age: {age}
-- Sex: {sex}
-- Location: {location}
 
-CHIEF COMPLAINT:
-{complaint}
+def update_differential_diagnosis(diagnosis: str, tool_context: ToolContext) -> str:
+    """
+    Add or update differential diagnosis list.
+    Each diagnosis named in the hypothesis agent's output is stored once (repeats
+    update the existing entry) and the list is re-ranked by probability.
 
-HISTORY OF PRESENT ILLNESS:
-{hpi if hpi else "Not yet documented"}
+    Args:
+        diagnosis: New or updated differential diagnosis from hypothesis agent
 
-VITALS:
-{vitals if vitals else "Not recorded"}
+    Returns:
+        The ranked differential diagnosis table
+    """
+    ranked = ddx.record_hypotheses(tool_context.state, diagnosis)
+    if not ranked:
+        return "No diagnoses found in the hypothesis output; differential diagnosis unchanged."
+    logger.info(f"Updated differential diagnosis (total: {len(ranked)})")
+    table = ddx.format_table(ddx.top(tool_context.state))
+    return f"Differential diagnosis updated. Total diagnoses: {len(ranked)}\n{table}"
 
-LABORATORY RESULTS:
-{labs if labs else "None ordered"}
 
-IMAGING STUDIES:
-{imaging if imaging else "None ordered"}
+def upsert_diagnosis(
+    diagnosis: str,
+    tool_context: ToolContext,
+    probability: Optional[float] = None,
+    supporting_evidence: Optional[List[str]] = None,
+    refuting_evidence: Optional[List[str]] = None,
+    ruled_out: bool = False,
+) -> str:
+    """
+    Add one diagnosis to the differential or update it.
 
-DIFFERENTIAL DIAGNOSIS:
-{chr(10).join(f"- {d}" for d in ddx) if ddx else "Not yet formulated"}
+    Args:
+        diagnosis: Diagnosis name (e.g., "NSTEMI"); spelling variants map to the same entry.
+        probability: (Optional) Estimated probability, 0-1.
+        supporting_evidence: (Optional) Ids of findings that support it (e.g., lab test names, imaging report ids).
+        refuting_evidence: (Optional) Ids of findings that argue against it.
+        ruled_out: Set to true to take the diagnosis out of the ranking.
 
-FINAL DIAGNOSIS:
-{final_dx if final_dx else "Pending"}
-"""
-    return summary.strip()
+    Returns:
+        The updated entry
+    """
+    try:
+        entry = ddx.upsert(
+            tool_context.state,
+            diagnosis,
+            probability,
+            supporting_evidence or (),
+            refuting_evidence or (),
+            status=ddx.RULED_OUT if ruled_out else None,
+        )
+    except ValueError as e:
+        return f"Error: {e}"
+    rank = f"rank {entry['rank']}" if entry["rank"] else entry["status"].replace("_", " ")
+    return f"{entry['name']}: {rank}\n{ddx.format_table(ddx.top(tool_context.state))}"
 
 
-def update_differential_diagnosis(diagnosis: str, tool_context: ToolContext) -> str:
+def rerank_differential_diagnosis(ranking: List[str], tool_context: ToolContext) -> str:
     """
-    Add or update differential diagnosis list.
+    Re-order the differential diagnosis.
 
     Args:
-        diagnosis: New or updated differential diagnosis from hypothesis agent
+        ranking: Diagnoses in the new order, most likely first; unlisted ones follow by probability.
 
     Returns:
-        Confirmation message
+        The re-ranked differential diagnosis table
     """
-    ddx_list = tool_context.state.get("differential_diagnosis", [])
-    if isinstance(ddx_list, list):
-        ddx_list.append(diagnosis)
-    else:
-        ddx_list = [diagnosis]
-    tool_context.state["differential_diagnosis"] = ddx_list
+    try:
+        ddx.rerank(tool_context.state, ranking)
+    except ValueError as e:
+        return f"Error: {e}"
+    return ddx.format_table(ddx.top(tool_context.state))
+
 
-    logger.info(f"Updated differential diagnosis (total: {len(ddx_list)})")
-    return f"Differential diagnosis updated. Total diagnoses: {len(ddx_list)}"
+def get_top_diagnoses(tool_context: ToolContext, n: int = 5) -> str:
+    """
+    Retrieve the highest-ranked diagnoses of the differential.
+
+    Args:
+        n: Number of diagnoses to return (default 5)
+
+    Returns:
+        Table of rank, diagnosis, probability, supporting and refuting evidence
+    """
+    return ddx.format_table(ddx.top(tool_context.state, n))
 
 
 def finalize_diagnosis(final_diagnosis: str, tool_context: ToolContext) -> str:
@@ -126,6 +155,7 @@ def finalize_diagnosis(final_diagnosis: str, tool_context: ToolContext) -> str:
     """
     tool_context.state["final_diagnosis"] = final_diagnosis
     tool_context.state["case_complete"] = True
+    invalidate(tool_context.state, "final_diagnosis")
     logger.info("Final diagnosis recorded")
     return f"Final diagnosis recorded and case marked complete"
 
@@ -137,9 +167,7 @@ def increment_diagnostic_loop(tool_context: ToolContext) -> str:
     Returns:
         Current iteration number
     """
-    current = tool_context.state.get("diagnostic_loop_count", 0)
-    current += 1
-    tool_context.state["diagnostic_loop_count"] = current
+    current = session_state.incr(tool_context.state, "diagnostic_loop_count")
 
     logger.info(f"Diagnostic loop iteration: {current}")
     return f"Diagnostic loop iteration {current}"
@@ -171,17 +199,16 @@ async def access_patient_database(
         A message indicating the result of the operation, including retrieved data.
     """
 
-    # Ensure patient_id exists as a base entry if we are trying to store
-    if query_type in ["data", "file", "lab_results"] and not get_patient_data_from_db(
-        patient_id
-    ):
-        store_patient_data_in_db(
+    # Ensure patient_id exists as a base entry, fetching it in the same call
+    patient_info = None
+    if query_type in ["data", "file", "lab_results"]:
+        patient_info, created = await patient_db.get_or_create_patient_data(
             patient_id, f"Placeholder entry for patient {patient_id}", {}
         )
-        logger.info(f"Created placeholder entry for patient {patient_id} in DB.")
+        if created:
+            logger.info(f"Created placeholder entry for patient {patient_id} in DB.")
 
     if query_type == "data":
-        patient_info = get_patient_data_from_db(patient_id)
         if patient_info and patient_info.get("description"):
             response = f"Patient Data for {patient_id}:\nDescription: {patient_info['description']}\nMetadata: {json.dumps(patient_info['metadata'])}"
             if patient_info.get("lab_results_string"):
@@ -197,7 +224,7 @@ async def access_patient_database(
                     payload={"patient_id": patient_id, "data": ""},
                 )
             user_input = tool_confirmation.payload.get("data", "")
-            store_patient_data_in_db(
+            await patient_db.store_patient_data_in_db(
                 patient_id, user_input, {}
             )  # Store with empty metadata for now
             tool_context.state[f"patient_data_{patient_id}"] = {
@@ -207,7 +234,6 @@ async def access_patient_database(
             return f"Patient description for {patient_id} stored: {user_input}"
 
     elif query_type == "lab_results":
-        patient_info = get_patient_data_from_db(patient_id)
         if patient_info and patient_info.get("lab_results_string"):
             response = f"Patient {patient_id} Lab Results: {patient_info['lab_results_string']}"
             tool_context.state[f"patient_lab_results_{patient_id}"] = patient_info[
@@ -223,7 +249,7 @@ async def access_patient_database(
                     payload={"patient_id": patient_id, "lab_results": ""},
                 )
             user_input = tool_confirmation.payload.get("lab_results", "")
-            store_patient_lab_results_in_db(patient_id, user_input)
+            await patient_db.store_patient_lab_results_in_db(patient_id, user_input)
             tool_context.state[f"patient_lab_results_{patient_id}"] = user_input
             return f"Patient {patient_id} lab results stored: {user_input}"
 
@@ -231,10 +257,19 @@ async def access_patient_database(
         if not item_type:
             return "Error: item_type is required for query_type 'file'."
 
-        files = get_patient_file_from_db(patient_id, item_type)
+        files = await patient_db.list_patient_files(patient_id, item_type)
         if files:
             # Return metadata about the file, not the raw blob directly
-            file_info = [{"type": f["type"], "size": len(f["data"])} for f in files]
+            file_info = [
+                {
+                    "file_id": f["file_id"],
+                    "type": f["type"],
+                    "filename": f["filename"],
+                    "mime_type": f["mime_type"],
+                    "size": f["size"],
+                }
+                for f in files
+            ]
             tool_context.state[f"patient_file_{patient_id}_{item_type}"] = file_info
             return f"Found {len(files)} files of type '{item_type}' for patient {patient_id}: {file_info}"
         else:
@@ -262,12 +297,24 @@ async def access_patient_database(
                     if data_bytes is None:
                         return f"Error: No data found in uploaded artifact '{most_recent_file}'."
 
-                    store_patient_file_in_db(patient_id, item_type, data_bytes)
+                    # Written behind by the patient DB writer thread, which
+                    # group-commits it; the upload returns without waiting
+                    pending_id = await patient_db.enqueue_patient_file(
+                        patient_id,
+                        item_type,
+                        data_bytes,
+                        filename=most_recent_file,
+                        mime_type=artifact_content.inline_data.mime_type,
+                    )
                     tool_context.state[f"patient_file_{patient_id}_{item_type}"] = {
+                        "pending_file_id": pending_id,
                         "type": item_type,
                         "size": len(data_bytes),
                     }
-                    return f"'{item_type}' file for patient {patient_id} uploaded and stored. Size: {len(data_bytes)} bytes."
+                    return (
+                        f"'{item_type}' file for patient {patient_id} uploaded and queued for storage"
+                        f" (pending id {pending_id}). Size: {len(data_bytes)} bytes."
+                    )
                 except Exception as e:
                     return f"Error processing uploaded file: {e}"
             else:
@@ -276,6 +323,98 @@ async def access_patient_database(
     return "Invalid query_type specified."
 
 
+async def check_pending_file(pending_id: str, tool_context: ToolContext) -> str:
+    """
+    Checks on an uploaded patient file queued for storage by access_patient_database.
+
+    Register it next to access_patient_database: uploads return a pending
+    id straight away, and this resolves it to the file ID or the write error.
+
+    Args:
+        pending_id: The pending id access_patient_database returned (e.g., "pending-3f2a...").
+
+    Returns:
+        The file's ID once stored, that it is still queued, or why storing it failed
+    """
+    status = await patient_db.pending_file_status(pending_id)
+    if status is None:
+        return f"No pending file {pending_id}; it may have been stored long ago or never queued."
+    if status["state"] == "queued":
+        return f"Pending file {pending_id} is still queued for storage."
+    if status["state"] == "failed":
+        return f"Storing pending file {pending_id} failed: {status['error']}"
+    return f"Pending file {pending_id} is stored with file ID {status['file_id']}."
+
+
+def _format_lab(obs: Dict[str, Any]) -> str:
+    value = obs["value_text"] or (f"{obs['value']:g}" if obs["value"] is not None else "?")
+    text = f"{obs['analyte']}: {value}"
+    if obs["unit"]:
+        text += f" {obs['unit']}"
+    if obs["ref_low"] is not None and obs["ref_high"] is not None:
+        text += f" (ref {obs['ref_low']:g}-{obs['ref_high']:g})"
+    if obs["flag"]:
+        text += f" [{obs['flag']}]"
+    if obs["observed_at"]:
+        text += f" at {obs['observed_at']}"
+    return text
+
+
+async def get_latest_lab_result(
+    patient_id: str, analyte: str, tool_context: ToolContext
+) -> str:
+    """
+    Looks up the most recent stored result of one lab test for a patient.
+
+    Args:
+        patient_id: The ID of the patient (e.g., "MM-26").
+        analyte: Lab test name (e.g., "troponin", "WBC", "D-dimer").
+
+    Returns:
+        The latest result with unit, reference range and flag, or a not-found message
+    """
+    obs = await patient_db.get_latest_lab(patient_id, analyte)
+    if obs is None:
+        return f"No {analyte} results stored for patient {patient_id}."
+    return f"Latest {_format_lab(obs)}"
+
+
+async def get_abnormal_lab_results(patient_id: str, tool_context: ToolContext) -> str:
+    """
+    Lists every stored lab result flagged HIGH, LOW, CRITICAL or ABNORMAL for a patient.
+
+    Args:
+        patient_id: The ID of the patient (e.g., "MM-26").
+
+    Returns:
+        Abnormal results, newest first, or a message that none were found
+    """
+    abnormal = await patient_db.get_abnormal_labs(patient_id)
+    if not abnormal:
+        return f"No abnormal lab results stored for patient {patient_id}."
+    lines = "\n".join(f"- {_format_lab(obs)}" for obs in abnormal)
+    return f"Abnormal lab results for {patient_id} ({len(abnormal)}):\n{lines}"
+
+
+async def search_patient_cases(query: str, tool_context: ToolContext, limit: int = 5) -> str:
+    """
+    Full-text search of stored patient cases by clinical content.
+    Matches case descriptions and metadata (body system, task, question type).
+
+    Args:
+        query: Words that must all appear, e.g. "chest pain troponin" or "cardiovascular diagnosis"
+        limit: Maximum number of cases to return (default 5)
+
+    Returns:
+        Matching patient IDs, best match first, each with a text snippet
+    """
+    results = await patient_db.search_patients(query, limit=limit)
+    if not results:
+        return f"No patient cases match '{query}'."
+    lines = "\n".join(f"- {r['patient_id']}: {r['snippet']}" for r in results)
+    return f"Found {len(results)} case(s) matching '{query}':\n{lines}"
+
+
 def check_emergency_status(triage_output: str, tool_context: ToolContext) -> str:
     """
     Check if triage agent returned emergency abort signal.
@@ -290,6 +429,7 @@ def check_emergency_status(triage_output: str, tool_context: ToolContext) -> str
         emergency_msg = triage_output.split("EMERGENCY_ABORT:")[1].strip()
         tool_context.state["final_diagnosis"] = f"EMERGENCY: {emergency_msg}"
         tool_context.state["is_emergency"] = True
+        invalidate(tool_context.state, "final_diagnosis")
         logger.critical(f"Emergency detected: {emergency_msg}")
         return f"EMERGENCY_DETECTED: {emergency_msg}"
     else:
@@ -304,9 +444,16 @@ __all__ = [
     "store_patient_data",
     "get_patient_summary",
     "update_differential_diagnosis",
+    "upsert_diagnosis",
+    "rerank_differential_diagnosis",
+    "get_top_diagnoses",
     "finalize_diagnosis",
     "increment_diagnostic_loop",
     "check_emergency_status",
     "access_patient_database",
+    "check_pending_file",
+    "get_latest_lab_result",
+    "get_abnormal_lab_results",
+    "search_patient_cases",
     "load_artifacts",  # For file upload capability
 ]
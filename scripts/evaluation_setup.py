@@ -1,8 +1,17 @@
+import importlib.util
+import pathlib
+import sys
 import pandas as pd
-import sqlite3
-import json
 import os
 
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
 # Login using e.g. `huggingface-cli login` to access this dataset
 splits = {'dev': 'MM/dev.jsonl', 'test': 'MM/test.jsonl'}
 dataset_path = "hf://datasets/TsinghuaC3I/MedXpertQA/" + splits["dev"]
@@ -12,71 +21,35 @@ db_path = "data/patient_db.sqlite"
 os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
 def setup_database():
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Create patient_data table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_data (
-            patient_id TEXT PRIMARY KEY,
-            description TEXT,
-            metadata TEXT
-        )
-    """)
-
-    # Create patient_files table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_files (
-            patient_id TEXT,
-            type TEXT,
-            data BLOB,
-            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
-        )
-    """)
-
-    # Create patient_lab_results table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_lab_results (
-            patient_id TEXT,
-            lab_results_string TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patient_data(patient_id)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    # Schema (and upgrades of databases created by older versions of this
+    # script) is owned by patient_db_tool's migrations
+    patient_db_tool.configure(db_path)
+    version = patient_db_tool.migrate_database()
+    patient_db_tool.close_connections()
+    print(f"Schema at version {version}")
+
+def iter_patients(df):
+    for row in df.to_dict(orient="records"):
+        yield {
+            "patient_id": row['id'],
+            "description": row['question'],
+            "metadata": {
+                "medical_task": row.get('medical_task'),
+                "body_system": row.get('body_system'),
+                "question_type": row.get('question_type'),
+                "options": row.get('options'),
+                "label": row.get('label')
+            },
+        }
 
 def populate_database():
     df = pd.read_json(dataset_path, lines=True)
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    for index, row in df.iterrows():
-        patient_id = row['id']
-        description = row['question']
-        
-        metadata = {
-            "medical_task": row.get('medical_task'),
-            "body_system": row.get('body_system'),
-            "question_type": row.get('question_type'),
-            "options": row.get('options'),
-            "label": row.get('label')
-        }
-        metadata_json = json.dumps(metadata)
-
-        # Insert into patient_data
-        cursor.execute(
-            "INSERT OR REPLACE INTO patient_data (patient_id, description, metadata) VALUES (?, ?, ?)",
-            (patient_id, description, metadata_json)
-        )
-
-        # Insert into patient_lab_results (with NULL for lab_results_string)
-        cursor.execute(
-            "INSERT OR REPLACE INTO patient_lab_results (patient_id, lab_results_string) VALUES (?, ?)",
-            (patient_id, None) # None maps to NULL in SQLite
-        )
-    
-    conn.commit()
-    conn.close()
+    patient_db_tool.configure(db_path)
+    try:
+        # Lab results start out empty: a case without a stored version reads as NULL
+        patient_db_tool.store_patients_bulk(iter_patients(df))
+    finally:
+        patient_db_tool.close_connections()
     print(f"Database populated with {len(df)} entries from {dataset_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+"""
+Maintenance commands for the patient database.
+
+    python scripts/manage_patient_db.py migrate [--db PATH]
+    python scripts/manage_patient_db.py status [--db PATH]
+    python scripts/manage_patient_db.py --blob-store DIR externalize
+    python scripts/manage_patient_db.py --blob-store DIR gc
+    python scripts/manage_patient_db.py rebuild-search
+    python scripts/manage_patient_db.py backup backups/patient_db.sqlite [--snapshot]
+    python scripts/manage_patient_db.py derivatives
+    python scripts/manage_patient_db.py imaging-columns
+    python scripts/manage_patient_db.py cohort --body-system Cardiovascular --medical-task Diagnosis
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import pathlib
+import sys
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("ManagePatientDB")
+
+# Import patient_db_tool
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
+patient_db_tool = importlib.util.module_from_spec(spec)
+sys.modules["patient_db_tool"] = patient_db_tool
+spec.loader.exec_module(patient_db_tool)
+
+
+def cmd_migrate(args):
+    version = patient_db_tool.migrate_database()
+    logger.info(f"✅ {patient_db_tool.get_db_path()} is at schema version {version}")
+
+
+def cmd_status(args):
+    conn = patient_db_tool.connection.connection()
+    version = patient_db_tool.schema.get_schema_version(conn)
+    pending = [m for m in patient_db_tool.schema.MIGRATIONS if m[0] > version]
+    logger.info(f"Database: {patient_db_tool.get_db_path()}")
+    logger.info(f"Schema version: {version} (latest {patient_db_tool.SCHEMA_VERSION})")
+    for number, description, _ in pending:
+        logger.info(f"  pending {number}: {description}")
+
+
+def cmd_externalize(args):
+    patient_db_tool.migrate_database()
+    moved = patient_db_tool.externalize_patient_files(batch_size=args.batch_size)
+    logger.info(f"✅ Moved {moved} inline payload(s) to {args.blob_store}")
+    if moved and args.vacuum:
+        logger.info("Running VACUUM to reclaim freed pages...")
+        patient_db_tool.connection.connection().execute("VACUUM")
+
+
+def cmd_gc(args):
+    removed = patient_db_tool.collect_blob_garbage()
+    logger.info(f"✅ Removed {removed} unreferenced blob file(s)")
+
+
+def cmd_rebuild_search(args):
+    patient_db_tool.migrate_database()
+    patient_db_tool.rebuild_search_index()
+    logger.info("✅ Rebuilt the patient search index")
+
+
+def cmd_backup(args):
+    logged = [-1]
+
+    def report(copied, total):
+        percent = copied * 100 // total if total else 100
+        if percent // 10 > logged[0]:  # every 10%
+            logged[0] = percent // 10
+            logger.info(f"  {percent}% ({copied}/{total} pages)")
+
+    stats = patient_db_tool.backup_database(
+        args.dest,
+        pages=args.pages,
+        sleep=args.sleep,
+        snapshot=args.snapshot,
+        blob_store_dir=args.snapshot_blobs,
+        progress=report,
+    )
+    kind = "read-only snapshot" if args.snapshot else "backup"
+    logger.info(f"✅ Wrote {kind} {stats['path']} ({stats['bytes'] / 1e6:.1f} MB) in {stats['seconds']:.1f}s")
+
+
+def cmd_reshard(args):
+    source = args.source or patient_db_tool.get_db_path()
+    blob_store = patient_db_tool.connection.get_manager().blob_store
+    stats = patient_db_tool.reshard(
+        source,
+        args.dest,
+        shards=args.shards,
+        blob_store_dir=blob_store.root if blob_store else None,
+        dest_blob_store_dir=args.dest_blob_store,
+    )
+    if args.id_map:
+        with open(args.id_map, "w") as f:
+            json.dump({str(old): new for old, new in stats["file_ids"].items()}, f)
+    logger.info(
+        f"✅ Copied {stats['patients']} patient(s) and {stats['files']} file(s) into"
+        f" {args.shards} shard(s) at {stats['path']} in {stats['seconds']:.1f}s"
+    )
+
+
+def cmd_derivatives(args):
+    patient_db_tool.migrate_database()
+    processed = patient_db_tool.backfill_derivatives(batch_size=args.batch_size)
+    logger.info(f"✅ Generated headers and previews for {processed} imaging file(s)")
+
+
+def cmd_imaging_columns(args):
+    patient_db_tool.migrate_database()
+    updated = patient_db_tool.backfill_imaging_columns(batch_size=args.batch_size)
+    logger.info(f"✅ Stored header columns for {updated} imaging file(s)")
+
+
+def cmd_cohort(args):
+    filters = {
+        field: getattr(args, field)
+        for field in patient_db_tool.cohorts.METADATA_COLUMNS
+        if getattr(args, field) is not None
+    }
+    if args.count:
+        logger.info(f"{patient_db_tool.count_patients(**filters)} patient(s) match {filters}")
+        return
+    for patient in patient_db_tool.query_patients(limit=args.limit, **filters):
+        print(patient["patient_id"])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Patient database maintenance")
+    parser.add_argument("--db", help="Database path (default: MEDAGENT_PATIENT_DB or data/patient_db.sqlite)")
+    parser.add_argument("--blob-store", help="External payload store directory (default: MEDAGENT_BLOB_STORE)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="Apply pending schema migrations").set_defaults(func=cmd_migrate)
+    sub.add_parser("status", help="Show schema version and pending migrations").set_defaults(func=cmd_status)
+
+    externalize = sub.add_parser("externalize", help="Move inline file payloads to the blob store")
+    externalize.add_argument("--batch-size", type=int, default=50)
+    externalize.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    externalize.set_defaults(func=cmd_externalize)
+
+    sub.add_parser("gc", help="Remove blob store files no patient file references").set_defaults(func=cmd_gc)
+    sub.add_parser("rebuild-search", help="Rebuild the full-text patient search index").set_defaults(
+        func=cmd_rebuild_search
+    )
+
+    backup = sub.add_parser("backup", help="Copy the database while it is in use (SQLite online backup)")
+    backup.add_argument("dest", help="Backup file path")
+    backup.add_argument("--pages", type=int, default=1024, help="Pages copied per step")
+    backup.add_argument("--sleep", type=float, default=0.005, help="Seconds to pause between steps")
+    backup.add_argument("--snapshot", action="store_true", help="Make the copy a read-only single-file snapshot")
+    backup.add_argument("--snapshot-blobs", help="Give the copy its own blob store here (hard links)")
+    backup.set_defaults(func=cmd_backup)
+
+    reshard = sub.add_parser("reshard", help="Copy the database (or a shard directory) into N hash-routed shards")
+    reshard.add_argument("dest", help="New shard directory")
+    reshard.add_argument("--shards", type=int, required=True, help="Number of shards")
+    reshard.add_argument("--source", help="Shard directory to reshard (default: the --db database)")
+    reshard.add_argument("--dest-blob-store", help="Blob store directory for the shards (with --blob-store)")
+    reshard.add_argument("--id-map", help="Write a JSON map of old to new file ids here")
+    reshard.set_defaults(func=cmd_reshard)
+
+    derivatives = sub.add_parser("derivatives", help="Generate missing image headers and previews")
+    derivatives.add_argument("--batch-size", type=int, default=100)
+    derivatives.set_defaults(func=cmd_derivatives)
+
+    imaging_columns = sub.add_parser("imaging-columns", help="Parse header columns of images stored without them")
+    imaging_columns.add_argument("--batch-size", type=int, default=100)
+    imaging_columns.set_defaults(func=cmd_imaging_columns)
+
+    cohort = sub.add_parser("cohort", help="List patient ids by indexed metadata fields")
+    cohort.add_argument("--body-system", dest="body_system")
+    cohort.add_argument("--medical-task", dest="medical_task")
+    cohort.add_argument("--question-type", dest="question_type")
+    cohort.add_argument("--limit", type=int)
+    cohort.add_argument("--count", action="store_true", help="Only print the number of matches")
+    cohort.set_defaults(func=cmd_cohort)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Migrations only run when asked for explicitly
+    patient_db_tool.configure(args.db, auto_migrate=False, blob_store_dir=args.blob_store)
+    try:
+        args.func(args)
+    finally:
+        patient_db_tool.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,15 +15,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("PopulateMedicalImages")
 
 # Import patient_db_tool
-mod_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool.py"
-spec = importlib.util.spec_from_file_location("patient_db_tool", str(mod_path))
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
 patient_db_tool = importlib.util.module_from_spec(spec)
 sys.modules["patient_db_tool"] = patient_db_tool
 spec.loader.exec_module(patient_db_tool)
 
-store_patient_file_in_db = patient_db_tool.store_patient_file_in_db
-store_patient_data_in_db = patient_db_tool.store_patient_data_in_db
-get_patient_file_from_db = patient_db_tool.get_patient_file_from_db
+store_patients_bulk = patient_db_tool.store_patients_bulk
+store_files_bulk = patient_db_tool.store_files_bulk
+list_patient_files = patient_db_tool.list_patient_files
 
 
 def download_mimic_cxr_sample():
@@ -125,38 +127,23 @@ def populate_database():
     samples = create_sample_images()
     
     # Store in database
-    for sample in samples:
-        logger.info(f"Storing {sample['type']} for patient {sample['patient_id']}...")
-        
-        # Store patient description
-        store_patient_data_in_db(
-            patient_id=sample['patient_id'],
-            description=sample['description'],
-            metadata=sample['metadata']
-        )
-        
-        # Store image file
-        store_patient_file_in_db(
-            patient_id=sample['patient_id'],
-            file_type=sample['type'],
-            file_data=sample['data'],
-            filename=sample['filename'],
-            mime_type=sample['mime_type']
-        )
+    logger.info(f"Storing {len(samples)} patient(s) and image(s)...")
+    store_patients_bulk(samples)
+    store_files_bulk(samples)
     
     logger.info("✅ Database population complete!")
     
     # Verify
     logger.info("\nVerifying stored data...")
     for sample in samples:
-        files = get_patient_file_from_db(sample['patient_id'], sample['type'])
+        files = list_patient_files(sample['patient_id'], sample['type'])
         if files:
             logger.info(f"  ✓ {sample['patient_id']}: {len(files)} file(s), "
-                       f"size: {len(files[0]['data'])} bytes")
+                       f"size: {files[0]['size']} bytes")
         else:
             logger.warning(f"  ✗ {sample['patient_id']}: No files found")
     
-    logger.info(f"\n📁 Database location: {patient_db_tool.DB_PATH}")
+    logger.info(f"\n📁 Database location: {patient_db_tool.get_db_path()}")
 
 
 if __name__ == "__main__":
@@ -4,8 +4,10 @@ import sys
 import base64
 
 
-mod_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool.py"
-spec = importlib.util.spec_from_file_location("patient_db_tool", str(mod_path))
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
 patient_db_tool = importlib.util.module_from_spec(spec)
 sys.modules["patient_db_tool"] = patient_db_tool
 spec.loader.exec_module(patient_db_tool)
@@ -1,115 +1,157 @@
 """
 View medical images stored in the patient database.
+
+Walks every patient page by page (two queries per page, see
+`iter_patients_with_files`) and streams each file's payload to disk on a
+pool of worker threads, each reading through its own connection. Image
+dimensions come from the header stored at ingest (`get_file_header`), and
+`--previews` exports the stored PNG rendering instead of the original.
+
+    python scripts/view_medical_images.py --output-dir exported --workers 8
+    python scripts/view_medical_images.py --output-dir previews --previews 512
 """
+import argparse
 import importlib.util
+import os
 import pathlib
 import sys
 import logging
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ViewMedicalImages")
 
 # Import patient_db_tool
-mod_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool.py"
-spec = importlib.util.spec_from_file_location("patient_db_tool", str(mod_path))
+pkg_path = pathlib.Path(__file__).resolve().parents[1] / "medagent" / "patient_db_tool"
+spec = importlib.util.spec_from_file_location(
+    "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+)
 patient_db_tool = importlib.util.module_from_spec(spec)
 sys.modules["patient_db_tool"] = patient_db_tool
 spec.loader.exec_module(patient_db_tool)
 
-get_patient_file_from_db = patient_db_tool.get_patient_file_from_db
-get_patient_data_from_db = patient_db_tool.get_patient_data_from_db
+iter_patients_with_files = patient_db_tool.iter_patients_with_files
+iter_patient_file_chunks = patient_db_tool.iter_patient_file_chunks
+get_file_derivative = patient_db_tool.get_file_derivative
+get_file_header = patient_db_tool.get_file_header
+
+EXPORT_CHUNK = 64
+
+
+def export_file(patient_id: str, index: int, file_info: dict, output_dir: str, preview_size: int = 0) -> str:
+    """Streams one stored file (or its PNG preview) to `output_dir`; returns a one-line summary for the log."""
+    filename = os.path.basename(file_info.get("filename") or f"{patient_id}_{index}.png")
+    if preview_size:
+        preview = get_file_derivative(file_info["file_id"], preview_size)
+        if preview is None:
+            return f"    ⚠️ No preview for file {file_info['file_id']}"
+        filename = os.path.splitext(filename)[0] + ".png"
+    output_path = os.path.join(output_dir, f"output_{patient_id}_{filename}")
+    try:
+        with open(output_path, "wb") as f:
+            if preview_size:
+                f.write(preview["data"])
+            else:
+                for chunk in iter_patient_file_chunks(file_info["file_id"]):
+                    f.write(chunk)
+    except FileNotFoundError:
+        # Deleted between listing the page and reading it
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return f"    ⚠️ File {file_info['file_id']} was deleted before export"
+    except Exception as e:
+        return f"    ❌ Failed to save {output_path}: {e}"
+
+    summary = f"    💾 Saved to: {output_path}"
+    # Stored at ingest; files from before derivatives existed have none until backfilled
+    header = get_file_header(file_info["file_id"], generate=False)
+    if header and header.get("format"):
+        dims = f"{header['width']}x{header['height']}"
+        if (header.get("slices") or 1) > 1:
+            dims += f"x{header['slices']}"
+        summary += f" ({header['format'].upper()} {dims} {header['dtype']})"
+    return summary
+
 
-# Import database connection to list all patients
-import sqlite3
+def export_files(batch: list, output_dir: str, preview_size: int = 0) -> list:
+    return [
+        export_file(patient_id, index, file_info, output_dir, preview_size)
+        for patient_id, index, file_info in batch
+    ]
 
-def list_all_patients():
-    """List all patients in the database."""
-    conn = sqlite3.connect(patient_db_tool.DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT patient_id, description FROM patient_data ORDER BY patient_id")
-    patients = cursor.fetchall()
-    conn.close()
-    return patients
 
-def view_patient_images(patient_id: str, save_to_disk: bool = True):
-    """View and optionally save images for a specific patient."""
+def log_patient(patient: dict) -> None:
+    patient_id = patient["patient_id"]
     logger.info(f"\n{'='*60}")
     logger.info(f"Patient ID: {patient_id}")
     logger.info(f"{'='*60}")
-    
-    # Get patient data
-    patient_data = get_patient_data_from_db(patient_id)
-    if patient_data:
-        logger.info(f"Description: {patient_data.get('description', 'N/A')}")
-        if patient_data.get('metadata'):
-            logger.info(f"Metadata: {patient_data['metadata']}")
-    
-    # Get all files for this patient
-    files = get_patient_file_from_db(patient_id)
-    
+    logger.info(f"Description: {patient.get('description') or 'N/A'}")
+    if patient.get("metadata"):
+        logger.info(f"Metadata: {patient['metadata']}")
+
+    files = patient["files"]
     if not files:
         logger.warning(f"  No files found for patient {patient_id}")
         return
-    
+
     logger.info(f"\nFound {len(files)} file(s):")
-    
-    for i, file_data in enumerate(files):
+    for i, file_info in enumerate(files):
         logger.info(f"\n  File #{i+1}:")
-        logger.info(f"    Type: {file_data.get('type', 'N/A')}")
-        logger.info(f"    Filename: {file_data.get('filename', 'N/A')}")
-        logger.info(f"    MIME Type: {file_data.get('mime_type', 'N/A')}")
-        logger.info(f"    Size: {len(file_data['data'])} bytes")
-        logger.info(f"    Created: {file_data.get('created_at', 'N/A')}")
-        
-        if save_to_disk and file_data['data']:
-            # Save to disk
-            filename = file_data.get('filename', f"{patient_id}_{i}.png")
-            output_path = f"output_{patient_id}_{filename}"
-            
-            try:
-                with open(output_path, 'wb') as f:
-                    f.write(file_data['data'])
-                logger.info(f"    💾 Saved to: {output_path}")
-                
-                # Try to display image info
-                try:
-                    img = Image.open(io.BytesIO(file_data['data']))
-                    logger.info(f"    📊 Image: {img.format} {img.size[0]}x{img.size[1]} {img.mode}")
-                except:
-                    pass
-                    
-            except Exception as e:
-                logger.error(f"    ❌ Failed to save: {e}")
+        logger.info(f"    Type: {file_info.get('type') or 'N/A'}")
+        logger.info(f"    Filename: {file_info.get('filename') or 'N/A'}")
+        logger.info(f"    MIME Type: {file_info.get('mime_type') or 'N/A'}")
+        logger.info(f"    Size: {file_info['size']} bytes")
+        logger.info(f"    Created: {file_info.get('created_at') or 'N/A'}")
+
 
 def main():
-    """Main function to view all medical images."""
+    """Main function to view (and export) all medical images."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=".", help="Directory to export files into")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent file writers")
+    parser.add_argument("--type", dest="file_type", help="Only files of this type (e.g. CT)")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--no-save", action="store_true", help="List only, do not export payloads")
+    parser.add_argument("--previews", type=int, default=0, metavar="SIZE",
+                        help="Export the stored PNG preview closest to SIZE pixels instead of the original")
+    args = parser.parse_args()
+
     logger.info("🏥 Medical Image Database Viewer")
     logger.info("="*60)
-    
-    # List all patients
-    patients = list_all_patients()
-    
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    patients = files = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        batch, pending = [], []
+        for patient in iter_patients_with_files(file_type=args.file_type, page_size=args.page_size):
+            patients += 1
+            files += len(patient["files"])
+            log_patient(patient)
+            if not args.no_save:
+                batch.extend((patient["patient_id"], i, f) for i, f in enumerate(patient["files"]))
+            # One task per EXPORT_CHUNK files keeps thread hand-offs off the hot path
+            if len(batch) >= EXPORT_CHUNK:
+                pending.append(pool.submit(export_files, batch, args.output_dir, args.previews))
+                batch = []
+            # Bound the queue (and report progress) every few chunks
+            if len(pending) >= 2 * args.workers:
+                for future in pending:
+                    for line in future.result():
+                        logger.info(line)
+                pending = []
+        if batch:
+            pending.append(pool.submit(export_files, batch, args.output_dir, args.previews))
+        for future in pending:
+            for line in future.result():
+                logger.info(line)
+
     if not patients:
         logger.warning("No patients found in database.")
         return
-    
-    logger.info(f"\nFound {len(patients)} patient(s):\n")
-    for patient_id, description in patients:
-        logger.info(f"  • {patient_id}: {description or 'No description'}")
-    
-    # View each patient's images
-    logger.info("\n" + "="*60)
-    logger.info("Patient Image Details:")
-    logger.info("="*60)
-    
-    for patient_id, _ in patients:
-        view_patient_images(patient_id, save_to_disk=True)
-    
+
     logger.info(f"\n{'='*60}")
-    logger.info("✅ Complete! Check the current directory for exported images.")
+    logger.info(f"✅ Complete! {patients} patient(s), {files} file(s). Exported to: {os.path.abspath(args.output_dir)}")
     logger.info(f"{'='*60}")
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import importlib
+import importlib.util
+import os
+import pathlib
+import sys
+import tempfile
+import types
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+# Keep the import-time default database out of the working tree
+os.environ.setdefault(
+    "MEDAGENT_PATIENT_DB", os.path.join(tempfile.mkdtemp(prefix="medagent-"), "patient_db.sqlite")
+)
+# No background derivative jobs outliving a test's database; tests that
+# exercise them configure derivatives="sync"
+os.environ.setdefault("MEDAGENT_FILE_DERIVATIVES", "off")
+
+
+def load_patient_db_tool():
+    """Loads medagent/patient_db_tool standalone, as the scripts do (no ADK import chain)."""
+    if "patient_db_tool" in sys.modules:
+        return sys.modules["patient_db_tool"]
+    pkg_path = ROOT / "medagent" / "patient_db_tool"
+    spec = importlib.util.spec_from_file_location(
+        "patient_db_tool", str(pkg_path / "__init__.py"), submodule_search_locations=[str(pkg_path)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["patient_db_tool"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_medagent_module(name):
+    """
+    Loads a dependency-free module under medagent/ without the package's ADK imports.
+
+    Modules are loaded into a stand-in package, `medagent_standalone`, over
+    the same directory, so their relative imports of each other resolve.
+    """
+    package = "medagent_standalone"
+    if package not in sys.modules:
+        module = types.ModuleType(package)
+        module.__path__ = [str(ROOT / "medagent")]
+        sys.modules[package] = module
+    return importlib.import_module(f"{package}.{name}")
+
+
+@pytest.fixture
+def patient_db(tmp_path):
+    """A patient_db_tool module pointed at a fresh database file."""
+    db = load_patient_db_tool()
+    db.configure(str(tmp_path / "patient_db.sqlite"))
+    yield db
+    db.close_connections()
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from tests.conftest import load_medagent_module
+
+ddx = load_medagent_module("ddx")
+summary = load_medagent_module("summary")
+
+
+class RecordingState(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delta = {}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.delta[key] = value
+
+
+def _hypotheses(*ranked):
+    return "```json\n" + json.dumps(
+        [{"Condition": c, "Probability": p, "Reasoning": "Long prose " * 20} for c, p in ranked]
+    ) + "\n```"
+
+
+def test_repeated_hypotheses_are_stored_once_and_ranked():
+    state = RecordingState(diagnostic_loop_count=1)
+    ddx.record_hypotheses(state, _hypotheses(("Pulmonary embolism", "Med"), ("NSTEMI", "High")))
+    state["diagnostic_loop_count"] = 2
+    state.delta.clear()
+    ranked = ddx.record_hypotheses(state, _hypotheses(("nstemi", "High"), ("Suspected pulmonary embolism.", "Med")))
+
+    assert [(e["name"], e["rank"], e["probability"]) for e in ranked] == [
+        ("NSTEMI", 1, 0.7), ("Pulmonary embolism", 2, 0.4)
+    ]
+    # Restating the same differential writes nothing
+    assert state.delta == {}
+    assert ddx.revisions(state, 1) == [
+        {"key": "pulmonary embolism", "name": "Pulmonary embolism", "probability": 0.4, "rank": 1},
+        {"key": "nstemi", "name": "NSTEMI", "probability": 0.7, "rank": 2},
+        {"key": "nstemi", "rank": 1},
+        {"key": "pulmonary embolism", "rank": 2},
+    ]
+
+
+def test_diagnoses_dropped_from_the_latest_output_are_superseded():
+    state = RecordingState(diagnostic_loop_count=1)
+    ddx.upsert(state, "Aortic dissection", status=ddx.RULED_OUT)
+    ddx.record_hypotheses(state, _hypotheses(("NSTEMI", "High"), ("Pericarditis", "Low")))
+    state["diagnostic_loop_count"] = 2
+    ranked = ddx.record_hypotheses(state, _hypotheses(("Pulmonary embolism", "Med")))
+
+    assert [(e["name"], e["rank"]) for e in ranked] == [("Pulmonary embolism", 1)]
+    assert ddx.get_entry(state, "NSTEMI")["status"] == ddx.SUPERSEDED
+    assert {"key": "nstemi", "status": ddx.SUPERSEDED, "rank": None} in ddx.revisions(state, 2)
+    assert "NSTEMI" not in state["ddx_table"]
+
+    # Named again, it is restored; a ruled-out diagnosis is not, and unparseable output changes nothing
+    state["diagnostic_loop_count"] = 3
+    ranked = ddx.record_hypotheses(state, _hypotheses(("nstemi", "High"), ("Aortic dissection", "Low")))
+    assert [e["name"] for e in ranked] == ["NSTEMI"]
+    assert ddx.get_entry(state, "Pulmonary embolism")["status"] == ddx.SUPERSEDED
+    assert ddx.get_entry(state, "Aortic dissection")["status"] == ddx.RULED_OUT
+    assert [e["name"] for e in ddx.record_hypotheses(state, "No change.\nSee above.")] == ["NSTEMI"]
+
+
+def test_upsert_records_only_changed_fields_and_evidence():
+    state = RecordingState(diagnostic_loop_count=3)
+    ddx.upsert(state, "NSTEMI", 0.5, supporting=["TROPONIN"])
+    ddx.upsert(state, "Pericarditis", "20%")
+    state.delta.clear()
+
+    entry = ddx.upsert(state, "nstemi", supporting=["TROPONIN", "ECG"], refuting=["rpt-1"], iteration=4)
+
+    assert entry["supporting"] == ["TROPONIN", "ECG"] and entry["refuting"] == ["rpt-1"]
+    assert set(state.delta) == {
+        "ddx:entry:nstemi", "ddx:rev:4#0", "ddx:rev:4#len", "ddx_table", "temp:summary:rev:differential"
+    }
+    assert ddx.revisions(state, 4) == [{"key": "nstemi", "+supporting": ["ECG"], "+refuting": ["rpt-1"]}]
+    assert "| 1 | NSTEMI | 50% | TROPONIN, ECG | rpt-1 |" in state["ddx_table"]
+
+    ddx.upsert(state, "NSTEMI", status=ddx.RULED_OUT)
+    assert [(e["name"], e["rank"]) for e in ddx.top(state)] == [("Pericarditis", 1)]
+    with pytest.raises(ValueError):
+        ddx.upsert(state, "NSTEMI", probability=3.5e3)
+
+
+def test_rerank_puts_named_diagnoses_first():
+    state = RecordingState()
+    for name, p in [("A", 0.2), ("B", 0.6), ("C", 0.4), ("D", None)]:
+        ddx.upsert(state, name, p)
+
+    assert [e["name"] for e in ddx.rerank(state)] == ["B", "C", "A", "D"]
+    assert [e["name"] for e in ddx.rerank(state, ["D", "a"])] == ["D", "A", "B", "C"]
+    assert [e["name"] for e in ddx.top(state, 2)] == ["D", "A"]
+    with pytest.raises(ValueError):
+        ddx.rerank(state, ["Z"])
+
+
+def test_parse_hypotheses_from_bullets():
+    text = "Differential:\n1. Sepsis (High): lactate 4.1\n- Pyelonephritis - 30%\n* **Influenza**"
+    assert ddx.parse_hypotheses(text) == [
+        {"name": "Sepsis", "probability": "High"},
+        {"name": "Pyelonephritis", "probability": "30%"},
+        {"name": "Influenza", "probability": None},
+    ]
+
+
+def test_summary_shows_ranked_table_instead_of_prose():
+    state = RecordingState(differential_diagnosis=["old prose " * 50])
+    ddx.record_hypotheses(state, _hypotheses(("Sepsis", "High")))
+
+    text = summary.render_summary(state)
+    assert "| 1 | Sepsis | 70% | - | - |" in text and "old prose" not in text
+
+    ddx.upsert(state, "Pyelonephritis", 0.9)
+    ddx.rerank(state)
+    assert state["temp:summary:rev:differential"] == 3  # one bump per table written
+    assert "| 1 | Pyelonephritis | 90% | - | - |" in summary.render_summary(state)
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+
+def _populate(patient_db, n=200):
+    patient_db.store_patients_bulk((f"P-{i:03d}", "x" * 2000, {"body_system": "Cardiovascular"}) for i in range(n))
+
+
+def test_backup_is_a_consistent_copy_while_writers_continue(patient_db, tmp_path):
+    _populate(patient_db)
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        while not stop.is_set():
+            patient_db.store_patient_data_in_db(f"W-{len(written)}", "live traffic")
+            written.append(1)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    steps = []
+    try:
+        stats = patient_db.backup_database(
+            str(tmp_path / "backup.sqlite"), pages=4, sleep=0.002, progress=lambda c, t: steps.append((c, t))
+        )
+    finally:
+        stop.set()
+        thread.join()
+
+    assert stats["steps"] > 1 and steps[-1][0] == steps[-1][1] == stats["pages"]
+    assert [b[0] for b in steps] == sorted(b[0] for b in steps)  # never restarted
+    assert written  # writers were not stalled for the whole copy
+    with sqlite3.connect(tmp_path / "backup.sqlite") as copy:
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert copy.execute("SELECT COUNT(*) FROM patient_data WHERE patient_id LIKE 'P-%'").fetchone()[0] == 200
+    assert not os.path.exists(tmp_path / "backup.sqlite.partial")
+
+
+def test_read_only_snapshot(patient_db, tmp_path):
+    _populate(patient_db, 10)
+    live_path = patient_db.get_db_path()
+    snapshot = str(tmp_path / "snapshots" / "eval.sqlite")
+    patient_db.backup_database(snapshot, snapshot=True)
+    patient_db.store_patient_data_in_db("P-new", "after the snapshot")
+
+    assert not os.path.exists(snapshot + "-wal")
+    patient_db.configure(snapshot, read_only=True)
+    try:
+        assert patient_db.count_patients(body_system="Cardiovascular") == 10
+        assert patient_db.get_patient_data_from_db("P-new") is None
+        with pytest.raises(sqlite3.OperationalError):
+            patient_db.store_patient_data_in_db("P-x", "write to snapshot")
+    finally:
+        patient_db.configure(live_path)
+
+
+def test_snapshot_keeps_its_own_blobs(patient_db, tmp_path):
+    patient_db.configure(patient_db.get_db_path(), blob_store_dir=str(tmp_path / "blobs"))
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", b"scan" * 1000, filename="ct.dcm")
+    stats = patient_db.backup_database(
+        str(tmp_path / "snap.sqlite"), snapshot=True, blob_store_dir=str(tmp_path / "snap-blobs")
+    )
+    patient_db.delete_patient_file(file_id)
+    patient_db.collect_blob_garbage()
+
+    assert stats["blobs_linked"] == 1
+    patient_db.configure(str(tmp_path / "snap.sqlite"), read_only=True, blob_store_dir=str(tmp_path / "snap-blobs"))
+    assert patient_db.get_patient_file_by_id(file_id)["data"] == b"scan" * 1000
+
+
+def test_backup_refuses_to_overwrite_its_source(patient_db):
+    with pytest.raises(ValueError):
+        patient_db.backup_database(patient_db.get_db_path())
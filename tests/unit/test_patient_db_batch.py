@@ -0,0 +1,71 @@
+import pytest
+
+
+@pytest.fixture
+def populated(patient_db):
+    patient_db.store_patients_bulk(
+        {"patient_id": f"P-{i:03d}", "description": f"case {i}", "metadata": {"body_system": "Renal"}}
+        for i in range(25)
+    )
+    patient_db.store_lab_results_bulk([("P-001", "WBC: 9"), ("P-007", "Na 140")])
+    patient_db.store_files_bulk(
+        {"patient_id": f"P-{i:03d}", "type": "CT" if j else "MRI", "data": bytes([i]) * (j + 1)}
+        for i in range(0, 25, 3)
+        for j in range(2)
+    )
+    return patient_db
+
+
+def test_get_patients_bulk_matches_single_reads(populated):
+    ids = ["P-007", "missing", "P-001", "P-007"]
+
+    records = populated.get_patients_bulk(ids)
+
+    assert list(records) == ["P-007", "missing", "P-001"]
+    assert records["missing"] is None
+    for pid in ("P-007", "P-001"):
+        assert records[pid] == populated.get_patient_data_from_db(pid)
+    assert records["P-001"]["lab_results_string"] == "WBC: 9"
+
+
+def test_get_patients_bulk_reads_through_the_cache(populated):
+    populated.clear_patient_cache()
+    populated.get_patients_bulk(["P-001", "P-002", "missing"])
+    misses = populated.get_patient_cache_stats()["misses"]
+
+    populated.get_patients_bulk(["P-001", "P-002", "missing"])
+    populated.store_patient_data_in_db("P-002", "updated")
+
+    assert populated.get_patient_cache_stats()["misses"] == misses
+    assert populated.get_patients_bulk(["P-002"])["P-002"]["description"] == "updated"
+
+
+def test_iter_patients_with_files_pages_in_order(populated):
+    patients = list(populated.iter_patients_with_files(page_size=4))
+
+    assert [p["patient_id"] for p in patients] == [f"P-{i:03d}" for i in range(25)]
+    by_id = {p["patient_id"]: p for p in patients}
+    assert [(f["type"], f["size"]) for f in by_id["P-003"]["files"]] == [("MRI", 1), ("CT", 2)]
+    assert by_id["P-004"]["files"] == []
+    assert by_id["P-001"]["metadata"] == {"body_system": "Renal"}
+    assert "data" not in by_id["P-003"]["files"][0]
+
+
+def test_iter_patients_with_files_filters_and_resumes(populated):
+    patients = list(populated.iter_patients_with_files(file_type="CT", page_size=10, after="P-020"))
+
+    assert [p["patient_id"] for p in patients] == ["P-021", "P-022", "P-023", "P-024"]
+    assert [f["type"] for f in patients[0]["files"]] == ["CT"]
+
+
+def test_iter_patients_with_files_sees_writes_between_pages(populated):
+    walk = populated.iter_patients_with_files(page_size=5)
+    first = [next(walk)["patient_id"] for _ in range(5)]
+
+    populated.store_patient_data_in_db("P-000a", "inserted before the cursor")
+    populated.store_patient_data_in_db("P-999", "inserted after the cursor")
+    rest = [p["patient_id"] for p in walk]
+
+    assert first[-1] == "P-004"
+    assert "P-000a" not in first + rest
+    assert rest[-1] == "P-999"
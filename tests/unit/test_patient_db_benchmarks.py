@@ -0,0 +1,84 @@
+import json
+import random
+
+import pytest
+
+from benchmarks.patient_db_suite import datasets, results, runner, workloads
+
+
+def test_latency_summary_uses_nearest_rank():
+    summary = results.latency_summary([i / 1000 for i in range(1, 101)])  # 1..100 ms
+
+    assert (summary["p50"], summary["p99"], summary["max"]) == pytest.approx((50, 99, 100))
+    assert results.latency_summary([])["p50"] is None
+
+
+def _result(operation, p50, throughput):
+    return {
+        "scale": "1k", "operation": operation, "mode": "threads", "workers": 4,
+        "throughput": throughput, "latency_ms": {"p50": p50},
+    }
+
+
+def test_compare_flags_regressions_beyond_the_threshold():
+    baseline = {"results": [_result("search_patients", 1.0, 1000), _result("count_patients", 1.0, 1000)]}
+    current = {"results": [_result("search_patients", 1.05, 700), _result("count_patients", 1.5, 1100)]}
+
+    regressions = results.compare(baseline, current, threshold=0.10)
+    assert {(r["operation"], r["metric"]) for r in regressions} == {
+        ("search_patients", "throughput"),
+        ("count_patients", "p50"),
+    }
+    assert results.compare(baseline, baseline) == []
+
+
+def test_dataset_payloads_are_unique_images(tmp_path):
+    factory = datasets.PayloadFactory(seed=1)
+    rng = random.Random(0)
+    xrays = {factory.make("chest_xray", rng, f"tag-{i}") for i in range(3)}
+    assert len(xrays) == 3 and all(x.startswith(b"\x89PNG") and len(x) > 200_000 for x in xrays)
+
+    manifest = datasets.ensure_dataset(str(tmp_path), patients=50, files=5)
+    assert datasets.ensure_dataset(str(tmp_path), patients=50, files=5) == manifest  # cached
+    assert (manifest["patients"], len(manifest["file_ids"])) == (50, 5)
+
+
+def test_run_scale_writes_results(patient_db, tmp_path):
+    manifest = datasets.ensure_dataset(str(tmp_path / "data"), patients=100, files=3)
+    operations = workloads.select_operations(["get_patient_data_from_db", "store_patient_lab_results_in_db"])
+
+    out = runner.run_scale(
+        "100", manifest, operations, ["single", "threads"], [2], str(tmp_path / "work"),
+        duration=0.05, max_ops=20, progress=None,
+    )
+    results.write_results(str(tmp_path / "r.json"), out, {"scales": ["100"]})
+
+    data = json.loads((tmp_path / "r.json").read_text())
+    assert [(r["operation"], r["mode"], r["workers"]) for r in data["results"]] == [
+        ("get_patient_data_from_db", "single", 1),
+        ("get_patient_data_from_db", "threads", 2),
+        ("store_patient_lab_results_in_db", "single", 1),
+        ("store_patient_lab_results_in_db", "threads", 2),
+    ]
+    assert all(r["ops"] > 0 and r["errors"] == 0 and r["latency_ms"]["p95"] for r in data["results"])
+    assert data["meta"]["sqlite"] and data["meta"]["args"] == {"scales": ["100"]}
+    with pytest.raises(ValueError):
+        workloads.select_operations(["no_such_function"])
+
+
+def test_file_gc_reshard_and_sharded_operations_run(patient_db, tmp_path):
+    manifest = datasets.ensure_dataset(str(tmp_path / "data"), patients=60, files=4)
+    names = [
+        "open_patient_file", "store_patient_file_from_path", "get_or_create_patient_data:create",
+        "ShardedPatientStore.get_patient_data_from_db", "ShardedPatientStore.search_patients",
+        "ShardedPatientStore.store_patient_lab_results_in_db", "collect_blob_garbage", "reshard",
+    ]
+
+    out = runner.run_scale(
+        "60", manifest, workloads.select_operations(names), ["single"], [1], str(tmp_path / "work"),
+        duration=0.05, max_ops=5, progress=None,
+    )
+
+    assert sorted(r["operation"] for r in out) == sorted(names)
+    assert all(r["ops"] > 0 and r["errors"] == 0 for r in out), [r.get("first_error") for r in out]
+    assert workloads.OPERATIONS_BY_NAME["get_or_create_patient_data:create"].group == workloads.WRITE
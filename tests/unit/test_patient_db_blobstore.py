@@ -0,0 +1,69 @@
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture
+def blob_db(patient_db, tmp_path):
+    patient_db.configure(str(tmp_path / "patient_db.sqlite"), blob_store_dir=str(tmp_path / "blobs"))
+    return patient_db
+
+
+def _blob_files(db):
+    store = db.connection.get_manager().blob_store
+    return sorted(store.iter_digests())
+
+
+def test_payloads_are_stored_outside_sqlite(blob_db):
+    file_id = blob_db.store_patient_file_in_db("P-1", "CT", b"ct-bytes", filename="a.dcm")
+
+    row = blob_db.connection.connection().execute(
+        "SELECT data, blob_sha256 FROM patient_files WHERE file_id = ?", (file_id,)
+    ).fetchone()
+    assert row["data"] is None
+    assert _blob_files(blob_db) == [row["blob_sha256"]]
+
+    assert blob_db.get_patient_file_by_id(file_id)["data"] == b"ct-bytes"
+    assert blob_db.get_patient_file_from_db("P-1")[0]["data"] == b"ct-bytes"
+    assert blob_db.list_patient_files("P-1")[0]["size"] == 8
+    with blob_db.open_patient_file(file_id) as f:
+        f.seek(3)
+        assert f.read() == b"bytes"
+
+
+def test_identical_payloads_are_deduplicated_and_refcounted(blob_db):
+    first = blob_db.store_patient_file_in_db("P-1", "CT", b"same")
+    second = blob_db.store_patient_file_stream("P-2", "CT", io.BytesIO(b"same"))
+    assert len(_blob_files(blob_db)) == 1
+
+    assert blob_db.delete_patient_file(first)
+    assert len(_blob_files(blob_db)) == 1
+    assert blob_db.get_patient_file_by_id(second)["data"] == b"same"
+
+    assert blob_db.delete_patient_file(second)
+    assert _blob_files(blob_db) == []
+    assert not blob_db.delete_patient_file(second)
+
+
+def test_externalize_moves_inline_payloads(patient_db, tmp_path):
+    payload = os.urandom(50_000)
+    ids = [patient_db.store_patient_file_in_db("P-1", "MRI", payload) for _ in range(3)]
+    patient_db.configure(str(tmp_path / "patient_db.sqlite"), blob_store_dir=str(tmp_path / "blobs"))
+
+    assert patient_db.externalize_patient_files(batch_size=2) == 3
+    assert patient_db.externalize_patient_files() == 0
+    assert len(_blob_files(patient_db)) == 1
+    refcount = patient_db.connection.connection().execute("SELECT refcount FROM blob_refs").fetchone()[0]
+    assert refcount == 3
+    assert all(patient_db.get_patient_file_by_id(i)["data"] == payload for i in ids)
+
+
+def test_garbage_collection_removes_unreferenced_blobs(blob_db):
+    blob_db.store_patient_file_in_db("P-1", "CT", b"kept")
+    store = blob_db.connection.get_manager().blob_store
+    store.publish(store.stage(b"orphan"))
+    assert len(_blob_files(blob_db)) == 2
+
+    assert blob_db.collect_blob_garbage() == 1
+    assert len(_blob_files(blob_db)) == 1
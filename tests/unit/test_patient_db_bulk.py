@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+
+def test_patients_bulk_consumes_generator_in_batches(patient_db):
+    def cases():
+        for i in range(25):
+            yield {"patient_id": f"P-{i}", "description": f"case {i}", "metadata": {"i": i}}
+
+    assert patient_db.store_patients_bulk(cases(), batch_size=10) == 25
+    assert patient_db.store_patients_bulk([("P-3", "updated")]) == 1
+
+    assert patient_db.get_patient_data_from_db("P-24")["metadata"] == {"i": 24}
+    updated = patient_db.get_patient_data_from_db("P-3")
+    assert updated["description"] == "updated"
+    assert updated["metadata"] is None
+
+
+def test_lab_results_bulk_creates_placeholder_patients(patient_db):
+    written = patient_db.store_lab_results_bulk(
+        [("L-1", "WBC: 12.1 [HIGH]"), {"patient_id": "L-2", "lab_results_string": None}]
+    )
+
+    # None for a patient without lab results is not a new version
+    assert written == 1
+    assert patient_db.get_patient_data_from_db("L-1")["lab_results_string"] == "WBC: 12.1 [HIGH]"
+    assert patient_db.get_patient_data_from_db("L-2") is not None
+    assert patient_db.get_lab_results_history("L-2") == []
+
+
+def test_lab_results_bulk_rerun_adds_no_versions(patient_db):
+    records = [("L-1", "WBC: 12.1 [HIGH]"), ("L-2", None), ("L-1", "WBC: 12.1 [HIGH]")]
+    assert patient_db.store_lab_results_bulk(records) == 1
+    assert patient_db.store_lab_results_bulk(records) == 0
+    assert patient_db.store_lab_results_bulk([("L-1", "WBC: 9")]) == 1
+
+    history = patient_db.get_lab_results_history("L-1")
+    assert [h["lab_results_string"] for h in history] == ["WBC: 12.1 [HIGH]", "WBC: 9"]
+    assert [o["value"] for o in patient_db.get_lab_history("L-1", "WBC")] == [12.1, 9.0]
+
+
+def test_files_bulk_returns_ids_in_input_order(patient_db):
+    patient_db.store_patient_file_in_db("F-0", "CT", b"existing")
+    files = [
+        {"patient_id": f"F-{i % 2}", "type": "MRI", "data": bytes([i]) * (i + 1), "filename": f"{i}.png"}
+        for i in range(7)
+    ]
+
+    file_ids = patient_db.store_files_bulk(files, batch_size=3)
+
+    assert len(file_ids) == 7
+    for i, file_id in enumerate(file_ids):
+        stored = patient_db.get_patient_file_by_id(file_id)
+        assert stored["data"] == files[i]["data"]
+        assert stored["filename"] == f"{i}.png"
+        assert stored["created_at"]
+
+
+def test_files_bulk_deduplicates_in_blob_store(patient_db, tmp_path):
+    patient_db.configure(str(tmp_path / "ext.sqlite"), blob_store_dir=str(tmp_path / "blobs"))
+    file_ids = patient_db.store_files_bulk(
+        {"patient_id": f"B-{i}", "type": "CT", "data": b"same scan"} for i in range(4)
+    )
+
+    assert [patient_db.get_patient_file_by_id(i)["data"] for i in file_ids] == [b"same scan"] * 4
+    refs = patient_db.connection.connection().execute("SELECT refcount FROM blob_refs").fetchall()
+    assert [r[0] for r in refs] == [4]
+
+
+def test_failing_batch_rolls_back_only_itself(patient_db):
+    records = [("OK-1", "first"), ("OK-2", "second"), ("OK-3", "third"), ("BAD", object())]
+
+    with pytest.raises(sqlite3.Error):
+        patient_db.store_patients_bulk(records, batch_size=2)
+
+    assert patient_db.get_patient_data_from_db("OK-2") is not None
+    assert patient_db.get_patient_data_from_db("OK-3") is None
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def cache_db(patient_db, tmp_path):
+    patient_db.configure(str(tmp_path / "cached.sqlite"), cache_size=2, cache_ttl=60)
+    return patient_db
+
+
+def test_repeated_reads_hit_cache(cache_db):
+    cache_db.store_patient_data_in_db("C-1", "case", {"k": 1})
+    first = cache_db.get_patient_data_from_db("C-1")
+    first["metadata"]["k"] = "mutated by caller"
+
+    assert cache_db.get_patient_data_from_db("C-1")["metadata"] == {"k": 1}
+    stats = cache_db.get_patient_cache_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize(
+    "write",
+    [
+        lambda db: db.store_patient_data_in_db("C-1", "new description"),
+        lambda db: db.store_patient_lab_results_in_db("C-1", "Na: 140"),
+        lambda db: db.store_patient_file_in_db("C-1", "CT", b"scan"),
+        lambda db: db.store_patients_bulk([("C-1", "new description")]),
+    ],
+)
+def test_writes_invalidate(cache_db, write):
+    assert cache_db.get_patient_data_from_db("C-1") is None  # cached "not found"
+
+    write(cache_db)
+
+    assert cache_db.get_patient_data_from_db("C-1") is not None
+    assert cache_db.get_patient_cache_stats()["hits"] == 0
+
+
+def test_lru_eviction_and_ttl(patient_db, tmp_path):
+    patient_db.configure(str(tmp_path / "ttl.sqlite"), cache_size=2, cache_ttl=0.05)
+    for pid in ("E-1", "E-2", "E-3"):
+        patient_db.get_patient_data_from_db(pid)
+    assert patient_db.get_patient_cache_stats()["evictions"] == 1
+
+    patient_db.get_patient_data_from_db("E-3")
+    assert patient_db.get_patient_cache_stats()["hits"] == 1
+    time.sleep(0.06)
+    patient_db.get_patient_data_from_db("E-3")
+    assert patient_db.get_patient_cache_stats()["hits"] == 1
+
+
+def test_get_or_create_patient_data(cache_db):
+    record, created = cache_db.get_or_create_patient_data("G-1", "Placeholder entry", {})
+    assert created
+    assert record["description"] == "Placeholder entry"
+    assert record["lab_results_string"] is None
+
+    cache_db.store_patient_lab_results_in_db("G-1", "K: 4.1")
+    record, created = cache_db.get_or_create_patient_data("G-1", "ignored")
+    assert not created
+    assert (record["description"], record["lab_results_string"]) == ("Placeholder entry", "K: 4.1")
+
+    # Served from cache now
+    hits = cache_db.get_patient_cache_stats()["hits"]
+    cache_db.get_or_create_patient_data("G-1")
+    assert cache_db.get_patient_cache_stats()["hits"] == hits + 1
+
+
+def test_stale_read_is_not_cached_over_a_write(cache_db):
+    cache = cache_db.connection.get_manager().patient_cache
+    generation = cache.generation()
+    cache_db.store_patient_data_in_db("R-1", "written concurrently")
+
+    cache.put("R-1", None, generation)  # a read that started before the write
+
+    assert cache_db.get_patient_data_from_db("R-1")["description"] == "written concurrently"
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture
+def cohort_db(patient_db):
+    systems = ["Cardiovascular", "Respiratory", "Nervous", "Digestive", "Endocrine", "Skeletal"]
+    tasks = ["Diagnosis", "Treatment"]
+    patient_db.store_patients_bulk(
+        (f"Q-{i:03d}", f"case {i}", {"body_system": systems[i % 6], "medical_task": tasks[i % 2], "question_type": "Reasoning"})
+        for i in range(120)
+    )
+    patient_db.store_patient_data_in_db("Q-legacy", "no metadata")
+    patient_db.connection.connection().execute("ANALYZE")
+    return patient_db
+
+
+def test_query_patients_filters(cohort_db):
+    cohort = cohort_db.query_patients(body_system="Cardiovascular", medical_task="Diagnosis")
+
+    assert len(cohort) == 20
+    assert all(p["body_system"] == "Cardiovascular" and p["medical_task"] == "Diagnosis" for p in cohort)
+    assert [p["patient_id"] for p in cohort] == sorted(p["patient_id"] for p in cohort)
+    assert cohort_db.count_patients(body_system=["Respiratory", "Nervous"]) == 40
+    assert [p["patient_id"] for p in cohort_db.query_patients(body_system=None)] == ["Q-legacy"]
+    assert len(cohort_db.query_patients(limit=5, question_type="Reasoning")) == 5
+
+
+def test_generated_columns_follow_metadata_updates(cohort_db):
+    cohort_db.store_patient_data_in_db("Q-000", "case 0", {"body_system": "Renal"})
+    assert [p["patient_id"] for p in cohort_db.query_patients(body_system="Renal")] == ["Q-000"]
+
+
+def test_unknown_filter_rejected(cohort_db):
+    with pytest.raises(ValueError):
+        cohort_db.query_patients(label="B")
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"body_system": "Cardiovascular"},
+        {"body_system": "Cardiovascular", "medical_task": "Diagnosis"},
+        {"body_system": ["Respiratory", "Nervous"], "medical_task": "Treatment"},
+        {"question_type": "Reasoning"},
+    ],
+)
+def test_cohort_queries_use_metadata_indexes(cohort_db, filters):
+    sql, params = cohort_db.cohorts.build_patient_query(filters)
+    plan = [r[3] for r in cohort_db.connection.connection().execute("EXPLAIN QUERY PLAN " + sql, params)]
+    assert any("USING INDEX idx_patient_data_" in step for step in plan), plan
@@ -0,0 +1,104 @@
+import io
+import os
+
+import pytest
+
+from tests.conftest import load_patient_db_tool
+
+compression = load_patient_db_tool().compression
+
+CODECS = [compression.DEFLATE] + ([compression.ZSTD] if compression.zstandard is not None else [])
+
+# Smooth 16-bit "image" rows: compresses well, like raw arrays and DICOM pixel data
+ARRAY = b"".join(((i // 7) % 4096).to_bytes(2, "little") for i in range(200_000))
+
+
+def _stored(patient_db, file_id):
+    return patient_db.connection.connection().execute(
+        "SELECT codec, length(data) AS stored, raw_size FROM patient_files WHERE file_id = ?", (file_id,)
+    ).fetchone()
+
+
+@pytest.mark.parametrize(
+    "mime_type, filename, expected",
+    [
+        ("application/dicom", None, compression.COMPRESS),
+        (None, "ct.NPY", compression.COMPRESS),
+        (None, "brain.nii", compression.COMPRESS),
+        (None, "brain.nii.gz", compression.IDENTITY),
+        ("image/png", "scan.npy", compression.IDENTITY),
+        (None, None, compression.IDENTITY),
+    ],
+)
+def test_default_policy_by_type(mime_type, filename, expected):
+    assert compression.CodecPolicy().codec_for(mime_type, filename, 10_000) == expected
+
+
+def test_small_payloads_are_not_compressed():
+    assert compression.CodecPolicy().codec_for("application/dicom", None, 100) == compression.IDENTITY
+
+
+def test_compressed_on_write_and_transparent_on_read(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", ARRAY, filename="ct.dcm", mime_type="application/dicom")
+    png_id = patient_db.store_patient_file_in_db("P-1", "XR", ARRAY, filename="xr.png", mime_type="image/png")
+
+    row = _stored(patient_db, file_id)
+    assert row["codec"] == compression.COMPRESS and row["stored"] * 2 < len(ARRAY)
+    assert _stored(patient_db, png_id)["codec"] == compression.IDENTITY
+    assert patient_db.get_patient_file_by_id(file_id)["data"] == ARRAY
+    assert [f["data"] for f in patient_db.get_patient_file_from_db("P-1")] == [ARRAY, ARRAY]
+    assert [f["size"] for f in patient_db.list_patient_files("P-1")] == [len(ARRAY)] * 2
+
+
+def test_incompressible_payload_is_stored_as_is(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", os.urandom(50_000), mime_type="application/dicom")
+    assert _stored(patient_db, file_id)["codec"] == compression.IDENTITY
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("external", [False, True])
+def test_streaming_roundtrip_and_seek(patient_db, tmp_path, codec, external):
+    patient_db.configure(
+        str(tmp_path / "codec.sqlite"),
+        blob_store_dir=str(tmp_path / "blobs") if external else None,
+        codec_policy=patient_db.CodecPolicy.fixed(codec),
+    )
+    file_id = patient_db.store_patient_file_stream("P-1", "CT", io.BytesIO(ARRAY), chunk_size=4096)
+    [bulk_id] = patient_db.store_files_bulk([{"patient_id": "P-1", "type": "CT", "data": ARRAY}])
+
+    assert _stored(patient_db, file_id)["codec"] == codec
+    assert b"".join(patient_db.iter_patient_file_chunks(file_id, chunk_size=65536)) == ARRAY
+    with patient_db.open_patient_file(bulk_id) as f:
+        f.seek(300_000)
+        assert f.read(10) == ARRAY[300_000:300_010]
+        f.seek(128)
+        assert f.read(4) == ARRAY[128:132]
+        assert f.seek(-4, io.SEEK_END) == len(ARRAY) - 4
+        assert f.read() == ARRAY[-4:]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_reads_are_not_short_across_compressed_chunks(patient_db, tmp_path, codec):
+    # Half random: compresses, but to many READ_CHUNK_SIZE chunks
+    payload = b"".join(os.urandom(1024) + bytes(1024) for _ in range(1536))
+    stored = compression.compress(codec, payload)
+    assert len(stored) > 4 * compression.READ_CHUNK_SIZE
+
+    reader = compression.DecompressingReader(codec, io.BytesIO(stored), len(payload))
+    assert [len(reader.read(1_000_000)) for _ in range(4)] == [1_000_000, 1_000_000, 1_000_000, 145_728]
+
+    patient_db.configure(str(tmp_path / "codec.sqlite"), codec_policy=patient_db.CodecPolicy.fixed(codec))
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", payload, filename="ct.dcm")
+    assert _stored(patient_db, file_id)["codec"] == codec
+    with patient_db.open_patient_file(file_id) as f:
+        assert f.read(1_000_000) == payload[:1_000_000]
+        assert f.read(3_000_000) == payload[1_000_000:]
+
+
+def test_failed_compressed_stream_leaves_no_row(patient_db):
+    patient_db.configure(patient_db.get_db_path(), codec_policy=patient_db.CodecPolicy.fixed(compression.DEFLATE))
+    with pytest.raises(ValueError):
+        with patient_db.PatientFileWriter("P-1", "CT", size=100) as writer:
+            writer.write(b"x" * 10)
+
+    assert patient_db.list_patient_files("P-1") == []
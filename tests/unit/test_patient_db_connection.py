@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+
+def test_connection_is_reused_per_thread(patient_db):
+    manager = patient_db.connection.get_manager()
+    assert manager.connection() is manager.connection()
+
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(manager.connection()))
+    t.start()
+    t.join()
+    assert seen[0] is not manager.connection()
+
+
+def test_connection_pragmas(patient_db):
+    conn = patient_db.connection.connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == patient_db.connection.BUSY_TIMEOUT_MS
+
+
+def test_transaction_rolls_back_on_error(patient_db):
+    with pytest.raises(RuntimeError):
+        with patient_db.connection.transaction() as conn:
+            conn.execute("INSERT INTO patient_data (patient_id) VALUES ('P-1')")
+            raise RuntimeError("boom")
+    assert patient_db.get_patient_data_from_db("P-1") is None
+
+
+def test_roundtrip_across_threads(patient_db):
+    def writer(i):
+        patient_db.store_patient_data_in_db(f"P-{i}", f"case {i}", {"i": i})
+        patient_db.store_patient_lab_results_in_db(f"P-{i}", f"WBC: {i}")
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for i in range(8):
+        record = patient_db.get_patient_data_from_db(f"P-{i}")
+        assert record["description"] == f"case {i}"
+        assert record["metadata"] == {"i": i}
+        assert record["lab_results_string"] == f"WBC: {i}"
+
+
+def test_store_and_read_file(patient_db):
+    patient_db.store_patient_file_in_db("P-1", "CT", b"\x00\x01payload", filename="a.dcm")
+    files = patient_db.get_patient_file_from_db("P-1", "CT")
+    assert len(files) == 1
+    assert files[0]["data"] == b"\x00\x01payload"
+    assert files[0]["filename"] == "a.dcm"
@@ -0,0 +1,114 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+
+from tests.conftest import load_patient_db_tool
+
+imaging = load_patient_db_tool().imaging
+
+
+def _png(width, height, bit_depth=8):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + bytes(width * bit_depth // 8)
+    ihdr = struct.pack(">IIBBBBB", width, height, bit_depth, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b"")
+
+
+def _npy(shape, descr="<i2"):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': {shape}, }}"
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode() + bytes(2 * 4 * 5 * 3)
+
+
+def _nifti(dims, datatype=512):
+    header = bytearray(348)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, len(dims), *dims, *([1] * (7 - len(dims))))
+    struct.pack_into("<h", header, 70, datatype)
+    header[344:348] = b"n+1\x00"
+    return bytes(header) + bytes(4)
+
+
+def _jpeg(width, height):
+    sof = struct.pack(">BHHB", 8, height, width, 1) + b"\x01\x11\x00"
+    app0 = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    return (b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0
+            + b"\xff\xc0" + struct.pack(">H", len(sof) + 2) + sof + b"\xff\xd9")
+
+
+@pytest.mark.parametrize(
+    "data, filename, expected",
+    [
+        (_png(640, 480, 16), None, ("png", 640, 480, 1, "uint16")),
+        (_jpeg(300, 200), None, ("jpeg", 300, 200, 1, "uint8")),
+        (_npy((4, 5, 3)), "ct.npy", ("npy", 5, 4, 3, "int16")),
+        (_nifti((64, 48, 30)), "t1.nii", ("nifti", 64, 48, 30, "uint16")),
+        (gzip.compress(_nifti((64, 48, 30))), "t1.nii.gz", ("nifti", 64, 48, 30, "uint16")),
+    ],
+)
+def test_read_image_header(data, filename, expected):
+    header = imaging.read_image_header(data, filename=filename)
+    assert (header["format"], header["width"], header["height"], header["slices"], header["dtype"]) == expected
+
+
+def test_unknown_payload_has_no_format():
+    assert imaging.read_image_header(b"lab report", "text/plain", "labs.txt") == {"format": None}
+    assert not imaging.is_imaging_file("text/plain", "labs.txt")
+    assert imaging.is_imaging_file(None, "BRAIN.NII.GZ")
+
+
+@pytest.fixture
+def sync_db(patient_db):
+    patient_db.configure(patient_db.get_db_path(), derivatives="sync")
+    return patient_db
+
+
+def test_headers_are_stored_at_ingest(sync_db):
+    file_id = sync_db.store_patient_file_in_db("P-1", "XR", _png(64, 32), mime_type="image/png")
+    [npy_id, txt_id] = sync_db.store_files_bulk([
+        {"patient_id": "P-1", "type": "CT", "data": _npy((4, 5, 3)), "filename": "ct.npy"},
+        {"patient_id": "P-1", "type": "note", "data": b"not an image", "filename": "note.txt"},
+    ])
+
+    assert sync_db.get_file_header(file_id, generate=False)["width"] == 64
+    assert sync_db.get_file_header(npy_id, generate=False)["slices"] == 3
+    assert sync_db.get_file_header(txt_id, generate=False) is None
+
+
+def test_background_worker_and_backfill(patient_db):
+    patient_db.configure(patient_db.get_db_path(), derivatives="background")
+    queued = patient_db.store_patient_file_in_db("P-1", "XR", _png(8, 8), filename="a.png")
+    patient_db.wait_for_derivatives(timeout=10)
+    assert patient_db.get_file_header(queued, generate=False)["format"] == "png"
+
+    patient_db.configure(patient_db.get_db_path(), derivatives="off")
+    later = patient_db.store_patient_file_in_db("P-1", "XR", _png(8, 8), filename="b.png")
+    assert patient_db.get_file_header(later, generate=False) is None
+    assert patient_db.backfill_derivatives() == 1
+    assert patient_db.get_file_header(later, generate=False)["height"] == 8
+
+
+def test_deleting_a_file_drops_its_derivatives(sync_db):
+    file_id = sync_db.store_patient_file_in_db("P-1", "XR", _png(8, 8), filename="a.png")
+    sync_db.delete_patient_file(file_id)
+
+    count = sync_db.connection.connection().execute("SELECT COUNT(*) FROM patient_file_derivatives").fetchone()[0]
+    assert count == 0
+
+
+def test_renditions_are_bounded_pngs(sync_db):
+    pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+    file_id = sync_db.store_patient_file_in_db("P-1", "XR", _png(1000, 600, 16), filename="xr.png")
+
+    thumb = sync_db.get_file_derivative(file_id, 100)
+    preview = sync_db.get_file_derivative(file_id, 400)
+    largest = sync_db.get_file_derivative(file_id, 4000)
+
+    assert (thumb["kind"], thumb["width"], thumb["height"]) == ("thumbnail", 128, 77)
+    assert preview["kind"] == largest["kind"] == "preview"
+    assert preview["data"].startswith(b"\x89PNG") and max(preview["width"], preview["height"]) == 512
@@ -0,0 +1,31 @@
+def test_list_patient_files_returns_metadata_only(patient_db):
+    first = patient_db.store_patient_file_in_db("P-1", "CT", b"a" * 1000, filename="a.dcm", mime_type="application/dicom")
+    second = patient_db.store_patient_file_in_db("P-1", "MRI", b"b" * 10, filename="b.nii")
+
+    listing = patient_db.list_patient_files("P-1")
+    assert [f["file_id"] for f in listing] == [first, second]
+    assert listing[0] == {
+        "file_id": first,
+        "type": "CT",
+        "filename": "a.dcm",
+        "mime_type": "application/dicom",
+        "created_at": listing[0]["created_at"],
+        "size": 1000,
+    }
+    assert [f["type"] for f in patient_db.list_patient_files("P-1", "MRI")] == ["MRI"]
+    assert patient_db.list_patient_files("P-2") == []
+
+
+def test_get_patient_file_by_id(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", b"payload")
+    record = patient_db.get_patient_file_by_id(file_id)
+    assert record["data"] == b"payload"
+    assert record["patient_id"] == "P-1"
+    assert patient_db.get_patient_file_by_id(file_id + 1) is None
+
+
+def test_get_patient_file_info_skips_payload(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", b"payload", filename="a.dcm")
+    info = patient_db.get_patient_file_info(file_id)
+    assert "data" not in info
+    assert (info["patient_id"], info["filename"], info["size"]) == ("P-1", "a.dcm", 7)
@@ -0,0 +1,116 @@
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from tests.conftest import load_patient_db_tool
+
+labs = load_patient_db_tool().labs
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("TROPONIN: 0.8 ng/mL [HIGH]", ("TROPONIN", 0.8, "ng/mL", None, None, "HIGH")),
+        ("TROPONIN: 0.8 ng/mL (Range 0.0-0.04) → HIGH", ("TROPONIN", 0.8, "ng/mL", 0.0, 0.04, "HIGH")),
+        ("Troponin I 0.8 ng/mL (ref 0-0.04) H", ("TROPONIN I", 0.8, "ng/mL", 0.0, 0.04, "HIGH")),
+        ("Hb: 9.8 g/dL (13.5-17.5)", ("HB", 9.8, "g/dL", 13.5, 17.5, "LOW")),
+        ("Na 140 mmol/L", ("NA", 140.0, "mmol/L", None, None, None)),
+    ],
+)
+def test_parse_lab_string_formats(text, expected):
+    [obs] = labs.parse_lab_results_string(text)
+    assert (obs.analyte, obs.value, obs.unit, obs.ref_low, obs.ref_high, obs.flag) == expected
+
+
+def test_parse_multiple_and_non_numeric_entries():
+    observations = labs.parse_lab_results_string("WBC: 12.1 x10^9/L, D-dimer: <0.5 ng/mL; Blood culture: negative\n???")
+
+    assert [o.analyte for o in observations] == ["WBC", "D-DIMER", "BLOOD CULTURE"]
+    assert (observations[1].value, observations[1].value_text) == (0.5, "<0.5")
+    assert (observations[2].value, observations[2].value_text) == (None, "negative")
+
+
+def test_simulator_lab_result_is_converted():
+    result = SimpleNamespace(
+        test_name="TROPONIN", value=0.12, unit="ng/mL", reference_range="0.0-0.04",
+        flag="HIGH", timestamp=datetime(2025, 1, 2, 3, 4, 5),
+    )
+
+    obs = labs.lab_observation_from_result(result)
+
+    assert (obs.ref_low, obs.ref_high, obs.flag) == (0.0, 0.04, "HIGH")
+    assert obs.observed_at == "2025-01-02T03:04:05"
+
+
+def test_latest_and_abnormal_queries(patient_db):
+    patient_db.store_lab_observations("P-1", [
+        {"test": "TROPONIN", "value": 0.01, "unit": "ng/mL", "low": 0, "high": 0.04, "observed_at": "2025-01-01T08:00"},
+        {"test": "TROPONIN", "value": 0.9, "unit": "ng/mL", "low": 0, "high": 0.04, "observed_at": "2025-01-01T14:00"},
+        "K: 4.1 mmol/L (3.5-5.0)",
+    ])
+
+    latest = patient_db.get_latest_lab("P-1", "troponin")
+    assert (latest["value"], latest["flag"]) == (0.9, "HIGH")
+    assert [o["value"] for o in patient_db.get_lab_history("P-1", "Troponin")] == [0.01, 0.9]
+    assert [o["analyte"] for o in patient_db.get_abnormal_labs("P-1")] == ["TROPONIN"]
+    assert patient_db.get_latest_lab("P-1", "lactate") is None
+
+
+def test_lab_string_updates_append_to_observation_history(patient_db):
+    patient_db.store_lab_observations("P-1", ["CRP: 80 mg/L [HIGH]"])
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 15 [H]; Na: 140")
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 8 [N]; Na: 140")
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 8 [N]; Na: 140")
+
+    conn = patient_db.connection.connection()
+    assert conn.execute("SELECT COUNT(*) FROM patient_lab_results WHERE patient_id = 'P-1'").fetchone()[0] == 1
+    # Earlier results are kept; restated ones are not repeated
+    history = patient_db.get_lab_history("P-1", "WBC")
+    assert [(o["value"], o["flag"]) for o in history] == [(15.0, "HIGH"), (8.0, "NORMAL")]
+    assert [o["value"] for o in patient_db.get_lab_history("P-1", "NA")] == [140.0]
+    assert patient_db.get_latest_lab("P-1", "WBC")["value"] == 8.0
+
+
+def test_migration_dedupes_lab_strings_and_backfills(patient_db, tmp_path):
+    path = str(tmp_path / "legacy.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE patient_data (patient_id TEXT PRIMARY KEY, description TEXT, metadata TEXT);
+        CREATE TABLE patient_files (patient_id TEXT, type TEXT, data BLOB);
+        CREATE TABLE patient_lab_results (patient_id TEXT, lab_results_string TEXT);
+        INSERT INTO patient_data VALUES ('Q-1', 'vignette', NULL);
+        INSERT INTO patient_lab_results VALUES ('Q-1', 'WBC: 5');
+        INSERT INTO patient_lab_results VALUES ('Q-1', 'WBC: 19 [HIGH]');
+    """)
+    conn.commit()
+    conn.close()
+    patient_db.configure(path)
+
+    assert patient_db.get_patient_data_from_db("Q-1")["lab_results_string"] == "WBC: 19 [HIGH]"
+    assert [o["value"] for o in patient_db.get_lab_history("Q-1", "WBC")] == [19.0]
+    assert patient_db.get_abnormal_labs("Q-1")[0]["observed_at"] is None
+    assert patient_db.get_lab_results_history("Q-1") == [
+        {"version": 1, "lab_results_string": "WBC: 19 [HIGH]", "submitted_at": None}
+    ]
+
+
+def test_lab_results_are_versioned_and_append_only(patient_db):
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 15 [H]")
+    patient_db.store_lab_results_bulk([("P-1", "WBC: 11"), ("P-2", "Na: 140"), ("P-1", "WBC: 8")])
+    patient_db.store_patient_lab_results_in_db("P-1", None)
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 7")
+
+    history = patient_db.get_lab_results_history("P-1")
+    assert [(h["version"], h["lab_results_string"]) for h in history] == [
+        (1, "WBC: 15 [H]"), (2, "WBC: 11"), (3, "WBC: 8"), (4, None), (5, "WBC: 7")
+    ]
+    assert [h["submitted_at"] for h in history] == sorted(h["submitted_at"] for h in history)
+    assert patient_db.get_patient_data_from_db("P-1")["lab_results_string"] == "WBC: 7"
+    conn = patient_db.connection.connection()
+    assert conn.execute("SELECT version FROM patient_lab_results WHERE patient_id = 'P-1'").fetchone()[0] == 5
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("UPDATE lab_result_versions SET lab_results_string = 'WBC: 1' WHERE patient_id = 'P-1'")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("DELETE FROM lab_result_versions WHERE patient_id = 'P-1'")
@@ -0,0 +1,33 @@
+"""
+Query-plan regression tests: every hot query must be answered from an index.
+"""
+import pytest
+
+from tests.conftest import load_patient_db_tool
+
+HOT_QUERIES = load_patient_db_tool().queries.HOT_QUERIES
+
+
+def _scans(conn, sql, params):
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    # "SCAN t" walks a whole table or index; virtual tables (FTS) report
+    # SCAN even when they use their own index
+    return plan, [d for d in plan if d.startswith("SCAN") and "VIRTUAL TABLE" not in d]
+
+
+@pytest.fixture
+def populated_db(patient_db):
+    for i in range(200):
+        pid = f"P-{i}"
+        patient_db.store_patient_data_in_db(pid, f"case {i}", {"body_system": "Cardiovascular"})
+        patient_db.store_patient_lab_results_in_db(pid, "WBC: 9")
+        patient_db.store_patient_file_in_db(pid, "CT" if i % 2 else "MRI", b"x" * 64)
+    patient_db.connection.connection().execute("ANALYZE")
+    return patient_db
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(populated_db, name):
+    sql, params = HOT_QUERIES[name]
+    plan, scans = _scans(populated_db.connection.connection(), sql, params)
+    assert not scans, f"{name} scans instead of searching an index: {plan}"
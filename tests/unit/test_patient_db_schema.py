@@ -0,0 +1,63 @@
+import sqlite3
+
+
+def _legacy_evaluation_db(path):
+    """The schema scripts/evaluation_setup.py used to create."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE patient_data (patient_id TEXT PRIMARY KEY, description TEXT, metadata TEXT);
+        CREATE TABLE patient_files (patient_id TEXT, type TEXT, data BLOB);
+        CREATE TABLE patient_lab_results (patient_id TEXT, lab_results_string TEXT);
+        INSERT INTO patient_data VALUES ('Q-1', 'vignette', '{"body_system": "Cardiovascular"}');
+        INSERT INTO patient_files VALUES ('Q-1', 'MRI', X'01');
+        INSERT INTO patient_files VALUES ('Q-1', 'CT', X'00ff');
+        DELETE FROM patient_files WHERE type = 'MRI';
+    """)
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_is_at_latest_version(patient_db):
+    assert patient_db.migrate_database() == patient_db.SCHEMA_VERSION
+
+
+def test_legacy_database_is_upgraded(patient_db, tmp_path):
+    path = str(tmp_path / "legacy.sqlite")
+    _legacy_evaluation_db(path)
+    patient_db.configure(path)
+
+    assert patient_db.migrate_database() == patient_db.SCHEMA_VERSION
+    files = patient_db.get_patient_file_from_db("Q-1", "CT")
+    assert files[0]["data"] == b"\x00\xff"
+    assert files[0]["filename"] is None
+    # the legacy rowid is kept as the stable file_id
+    assert files[0]["file_id"] == 2
+
+    patient_db.store_patient_file_in_db("Q-1", "CT", b"new", filename="b.dcm", mime_type="application/dicom")
+    assert [f["filename"] for f in patient_db.get_patient_file_from_db("Q-1", "CT")] == [None, "b.dcm"]
+
+
+def test_migrations_are_not_reapplied(patient_db):
+    conn = patient_db.connection.connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    patient_db.migrate_database()
+    conn.set_trace_callback(None)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_hot_paths_send_no_schema_queries(patient_db):
+    patient_db.store_patient_data_in_db("P-1", "case")
+    conn = patient_db.connection.connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+
+    patient_db.store_patient_file_in_db("P-1", "CT", b"abc")
+    patient_db.get_patient_file_from_db("P-1", "CT")
+    patient_db.store_patient_lab_results_in_db("P-1", "WBC: 9")
+    patient_db.get_patient_data_from_db("P-1")
+
+    conn.set_trace_callback(None)
+    # "-- " statements run inside triggers (FTS5 checks data_version itself)
+    ours = [s for s in statements if not s.startswith("-- ")]
+    assert not [s for s in ours if "PRAGMA" in s or "ALTER" in s or "CREATE" in s]
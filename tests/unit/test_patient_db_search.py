@@ -0,0 +1,54 @@
+import pytest
+
+
+@pytest.fixture
+def cases(patient_db):
+    patient_db.store_patients_bulk([
+        ("C-1", "A 54-year-old man with crushing chest pain radiating to the left arm.",
+         {"body_system": "Cardiovascular", "medical_task": "Diagnosis", "label": "B"}),
+        ("C-2", "A 30-year-old woman with fever, headache and neck stiffness.",
+         {"body_system": "Nervous", "medical_task": "Treatment"}),
+        ("C-3", "Chest pain after a long-haul flight, with tachycardia.",
+         {"body_system": "Respiratory", "medical_task": "Diagnosis"}),
+    ])
+    return patient_db
+
+
+def test_search_ranks_and_snippets(cases):
+    results = cases.search_patients("chest pain")
+
+    assert {r["patient_id"] for r in results} == {"C-1", "C-3"}
+    assert all("[" in r["snippet"] for r in results)
+    assert results == sorted(results, key=lambda r: r["score"])
+
+
+def test_search_matches_metadata_fields_and_stems(cases):
+    assert [r["patient_id"] for r in cases.search_patients("cardiovascular diagnosis")] == ["C-1"]
+    assert [r["patient_id"] for r in cases.search_patients("radiates")] == ["C-1"]
+    # the answer label is not indexed
+    assert cases.search_patients("B") == []
+
+
+def test_index_follows_updates_and_deletes(cases):
+    cases.store_patient_data_in_db("C-2", "Migraine with aura", {"body_system": "Nervous"})
+    assert cases.search_patients("neck stiffness") == []
+    assert [r["patient_id"] for r in cases.search_patients("aura")] == ["C-2"]
+
+    with cases.connection.transaction() as conn:
+        conn.execute("DELETE FROM patient_data WHERE patient_id = 'C-1'")
+    assert [r["patient_id"] for r in cases.search_patients("chest")] == ["C-3"]
+
+
+def test_query_syntax(cases):
+    assert cases.search_patients("D-dimer?") == []  # punctuation is not FTS syntax
+    assert [r["patient_id"] for r in cases.search_patients("body_system:cardio*", raw=True)] == ["C-1"]
+    assert len(cases.search_patients("fever OR tachycardia", raw=True, limit=1)) == 1
+    with pytest.raises(ValueError):
+        cases.search_patients('"unbalanced', raw=True)
+
+
+def test_upsert_keeps_patient_row_id(cases):
+    conn = cases.connection.connection()
+    before = conn.execute("SELECT id FROM patient_data WHERE patient_id = 'C-3'").fetchone()[0]
+    cases.store_patient_data_in_db("C-3", "updated")
+    assert conn.execute("SELECT id FROM patient_data WHERE patient_id = 'C-3'").fetchone()[0] == before
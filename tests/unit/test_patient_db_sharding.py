@@ -0,0 +1,237 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from tests.conftest import load_patient_db_tool
+
+sharding = load_patient_db_tool().sharding
+routing = load_patient_db_tool().routing
+
+
+@pytest.fixture
+def store(patient_db, tmp_path):
+    s = patient_db.open_sharded_store(str(tmp_path / "shards"), shards=4)
+    yield s
+    s.close()
+
+
+def _populate(store, n=40):
+    store.store_patients_bulk(
+        (f"P-{i:03d}", f"case {i} with {'chest pain' if i % 2 else 'headache'}", {"body_system": "Cardiovascular"})
+        for i in range(n)
+    )
+
+
+def test_patients_are_routed_by_a_stable_hash(store, tmp_path):
+    _populate(store)
+    store.store_patient_lab_results_in_db("P-007", "Hb: 9.1 g/dL [LOW]")
+
+    for shard in range(4):
+        with sqlite3.connect(store.shard_map.path(shard)) as conn:
+            ids = [r[0] for r in conn.execute("SELECT patient_id FROM patient_data")]
+        assert ids and all(sharding.shard_for(pid, 4) == shard for pid in ids)
+    assert store.get_patient_data_from_db("P-007")["lab_results_string"] == "Hb: 9.1 g/dL [LOW]"
+
+    reopened = sharding.open_sharded_store(str(tmp_path / "shards"))
+    assert reopened.shard_map == store.shard_map
+    assert reopened.get_patient_data_from_db("P-007") is not None
+    reopened.close()
+    with pytest.raises(ValueError):
+        sharding.open_sharded_store(str(tmp_path / "shards"), shards=2)
+
+
+def test_fan_out_reads_merge_across_shards(store):
+    _populate(store)
+
+    hits = store.search_patients("chest pain", limit=5)
+    assert len(hits) == 5 and [h["score"] for h in hits] == sorted(h["score"] for h in hits)
+    assert {store.shard_for(h["patient_id"]) for h in store.search_patients("chest pain", limit=40)} == {0, 1, 2, 3}
+    assert [p["patient_id"] for p in store.query_patients(limit=3)] == ["P-000", "P-001", "P-002"]
+    assert store.count_patients(body_system="Cardiovascular") == 40
+    walk = [p["patient_id"] for p in store.iter_patients_with_files(page_size=4)]
+    assert walk == [f"P-{i:03d}" for i in range(40)]
+    assert list(store.get_patients_bulk(["P-039", "nobody", "P-001"])) == ["P-039", "nobody", "P-001"]
+
+
+def test_file_ids_are_unique_across_shards(store):
+    patients = ["P-000", "P-001", "P-002", "P-003", "P-004", "P-005"]
+    assert len({store.shard_for(p) for p in patients}) > 1
+    file_ids = store.store_files_bulk([{"patient_id": p, "type": "XR", "data": p.encode()} for p in patients])
+    file_ids.append(store.store_patient_file_in_db("P-005", "CT", b"single"))
+
+    assert len(set(file_ids)) == len(file_ids)
+    assert [store.get_patient_file_by_id(i)["data"] for i in file_ids[:6]] == [p.encode() for p in patients]
+    assert store.list_patient_files("P-005")[-1]["file_id"] == file_ids[-1]
+    assert b"".join(store.iter_patient_file_chunks(file_ids[-1], chunk_size=2)) == b"single"
+    walk = {p["patient_id"]: p["files"] for p in store.iter_patients_with_files()}
+    assert walk["P-003"][0]["file_id"] == file_ids[3]
+    assert store.delete_patient_file(file_ids[0]) and store.get_patient_file_by_id(file_ids[0]) is None
+    assert store.get_patient_file_by_id(99 << sharding.FILE_ID_SHARD_SHIFT | 1) is None
+
+
+def test_configured_shards_route_the_package_api(patient_db, tmp_path):
+    directory = str(tmp_path / "shards")
+    store = patient_db.configure(directory, shards=4)
+    assert patient_db.get_sharded_store() is store and patient_db.get_db_path() == directory
+    assert patient_db.migrate_database() == patient_db.SCHEMA_VERSION
+
+    _populate(patient_db)
+    patient_db.store_patient_lab_results_in_db("P-007", "Hb: 9.1 g/dL [LOW]")
+    file_id = patient_db.resolve_pending_file(patient_db.enqueue_patient_file("P-005", "XR", b"queued"), timeout=10)
+    aio = importlib.import_module("patient_db_tool.aio")
+
+    for shard in range(4):
+        with sqlite3.connect(store.shard_map.path(shard)) as conn:
+            ids = [r[0] for r in conn.execute("SELECT patient_id FROM patient_data")]
+        assert ids and all(sharding.shard_for(pid, 4) == shard for pid in ids)
+    assert file_id >> sharding.FILE_ID_SHARD_SHIFT == store.shard_for("P-005")
+    assert patient_db.get_patient_file_by_id(file_id)["data"] == b"queued"
+    assert asyncio.run(aio.get_latest_lab("P-007", "hb"))["value"] == 9.1
+    assert patient_db.count_patients() == 40 and len(patient_db.search_patients("chest pain", limit=40)) == 20
+    with pytest.raises(ValueError):
+        patient_db.backup_database(str(tmp_path / "backup.sqlite"))
+    aio.shutdown()
+
+    # Back to one file; with MEDAGENT_PATIENT_SHARDS set, configure() shards by default
+    single = patient_db.configure(str(tmp_path / "single.sqlite"), shards=0)
+    assert patient_db.get_sharded_store() is None and patient_db.get_patient_data_from_db("P-007") is None
+    single.close_all()
+    routing.PATIENT_SHARDS = 2
+    try:
+        assert patient_db.configure(str(tmp_path / "other")).shard_map.count == 2
+        with pytest.raises(ValueError):
+            patient_db.configure(directory)  # a 4-shard directory
+    finally:
+        routing.PATIENT_SHARDS = 0
+        patient_db.configure(str(tmp_path / "single.sqlite"))
+
+
+def test_reshard_moves_everything(patient_db, tmp_path):
+    patient_db.store_patients_bulk((f"P-{i}", f"case {i}", {"body_system": "Renal"}) for i in range(30))
+    patient_db.store_patient_lab_results_in_db("P-3", "Creatinine: 1.1 mg/dL")
+    patient_db.store_patient_lab_results_in_db("P-3", "Creatinine: 2.4 mg/dL [HIGH]")
+    file_id = patient_db.store_patient_file_in_db("P-3", "XR", b"x-ray")
+
+    stats = sharding.reshard(patient_db.get_db_path(), str(tmp_path / "three"), shards=3)
+    three = sharding.open_sharded_store(str(tmp_path / "three"))
+    assert (stats["patients"], stats["files"]) == (30, 1)
+    assert [v["lab_results_string"] for v in three.get_lab_results_history("P-3")] == [
+        "Creatinine: 1.1 mg/dL",
+        "Creatinine: 2.4 mg/dL [HIGH]",
+    ]
+    assert three.get_abnormal_labs("P-3")[0]["analyte"] == "CREATININE"
+    assert three.get_patient_file_by_id(stats["file_ids"][file_id])["data"] == b"x-ray"
+    assert three.count_patients(body_system="Renal") == 30 and three.search_patients("case 7")
+    three.close()
+
+    again = sharding.reshard(str(tmp_path / "three"), str(tmp_path / "two"), shards=2)
+    two = sharding.open_sharded_store(str(tmp_path / "two"))
+    assert two.count_patients() == 30
+    assert two.get_patient_file_by_id(again["file_ids"][stats["file_ids"][file_id]])["data"] == b"x-ray"
+    two.close()
+    with pytest.raises(ValueError):
+        sharding.reshard(str(tmp_path / "three"), str(tmp_path / "two"), shards=5)
+
+
+def test_reshard_links_external_blobs(patient_db, tmp_path):
+    patient_db.configure(patient_db.get_db_path(), blob_store_dir=str(tmp_path / "blobs"))
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", b"scan" * 1000)
+
+    stats = sharding.reshard(
+        patient_db.get_db_path(), str(tmp_path / "shards"), shards=2,
+        blob_store_dir=str(tmp_path / "blobs"), dest_blob_store_dir=str(tmp_path / "shard-blobs"),
+    )
+    patient_db.delete_patient_file(file_id)
+    patient_db.collect_blob_garbage()
+
+    store = sharding.open_sharded_store(str(tmp_path / "shards"), blob_store_dir=str(tmp_path / "shard-blobs"))
+    assert stats["blobs"] == 1
+    assert store.get_patient_file_by_id(stats["file_ids"][file_id])["data"] == b"scan" * 1000
+    store.close()
+
+
+def _write_labs(directory, worker, count, start_at):
+    store = load_patient_db_tool().open_sharded_store(directory)
+    store.get_patient_data_from_db("warm-up")  # open every connection before the clock starts
+    while time.time() < start_at:
+        time.sleep(0.001)
+    start = time.perf_counter()
+    for i in range(count):
+        store.store_patient_lab_results_in_db(f"W{worker}-{i}", "WBC: 12.1 x10^9/L [HIGH]")
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed
+
+
+def _throughput(directory, shards, processes, count):
+    setup = sharding.open_sharded_store(directory, shards=shards)
+    setup.migrate_database()
+    setup.close()
+    start_at = time.time() + 2
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        elapsed = pool.starmap(_write_labs, [(directory, w, count, start_at) for w in range(processes)])
+    return processes * count / max(elapsed)
+
+
+def test_concurrent_writer_processes(store, tmp_path):
+    _throughput(os.path.dirname(store.shard_map.path(0)), 4, processes=3, count=50)
+
+    assert store.count_patients() == 150
+    assert store.get_patient_data_from_db("W2-49")["lab_results_string"] == "WBC: 12.1 x10^9/L [HIGH]"
+
+
+def _slow_write(patient_id, hold):
+    # The write lock is held for `hold` seconds, like a long transaction
+    with load_patient_db_tool().connection.transaction():
+        load_patient_db_tool().records.store_patient_data_in_db(patient_id, "held")
+        time.sleep(hold)
+
+
+def _contended_writes(store, writers, count=10, hold=0.02):
+    """Seconds for `writers` threads to each make `count` lock-holding writes, writer w to patients on shard w."""
+    patients = [[p for p in (f"S{w}-{i}" for i in range(1000)) if store.shard_for(p) == w % len(store.managers)][:count]
+                for w in range(writers)]
+
+    def writer(ids):
+        for patient_id in ids:
+            store.on_shard(store.shard_for(patient_id), _slow_write, patient_id, hold)
+
+    threads = [threading.Thread(target=writer, args=(ids,)) for ids in patients]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def test_write_lock_contention_scales_down_with_shards(tmp_path):
+    # Runs on any core count: the writers wait on SQLite's write lock, not the CPU
+    one = sharding.open_sharded_store(str(tmp_path / "one"), shards=1)
+    two = sharding.open_sharded_store(str(tmp_path / "two"), shards=2)
+    try:
+        one.migrate_database()
+        two.migrate_database()
+        serial, parallel = _contended_writes(one, writers=2), _contended_writes(two, writers=2)
+        assert two.count_patients() == one.count_patients() == 20
+    finally:
+        one.close()
+        two.close()
+
+    # One shard serialises both writers' lock holds; two shards overlap them (ideal 2x)
+    assert parallel < 0.75 * serial, (serial, parallel)
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="write scaling needs a core per writer process")
+def test_write_throughput_scales_with_shard_count(tmp_path):
+    one = _throughput(str(tmp_path / "one"), 1, processes=4, count=500)
+    four = _throughput(str(tmp_path / "four"), 4, processes=4, count=500)
+
+    # Ideal is 4x; one shard serialises every commit on a single write lock
+    assert four > 1.5 * one, (one, four)
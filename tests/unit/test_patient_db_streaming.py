@@ -0,0 +1,72 @@
+import io
+import os
+
+import pytest
+
+
+class _NonSeekable(io.RawIOBase):
+    def __init__(self, data):
+        self._inner = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._inner.readinto(b)
+
+
+def test_stream_roundtrip_in_chunks(patient_db):
+    payload = os.urandom(300_000)
+    file_id = patient_db.store_patient_file_stream("P-1", "MRI", io.BytesIO(payload), filename="v.nii", chunk_size=4096)
+
+    chunks = list(patient_db.iter_patient_file_chunks(file_id, chunk_size=65536))
+    assert max(len(c) for c in chunks) == 65536
+    assert b"".join(chunks) == payload
+    assert patient_db.list_patient_files("P-1")[0]["size"] == len(payload)
+
+
+def test_reader_is_seekable(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", bytes(range(256)))
+    with patient_db.open_patient_file(file_id) as f:
+        # Buffered: decoders that take a short read for truncation get whole reads
+        assert isinstance(f, io.BufferedReader)
+        assert f.read(100) == bytes(range(100))
+        f.seek(250)
+        assert f.read() == bytes(range(250, 256))
+        f.seek(-4, io.SEEK_END)
+        assert f.tell() == 252
+
+
+def test_non_seekable_stream_is_spooled(patient_db):
+    payload = os.urandom(10_000)
+    file_id = patient_db.store_patient_file_stream("P-1", "CT", _NonSeekable(payload), chunk_size=1024)
+    assert patient_db.get_patient_file_by_id(file_id)["data"] == payload
+
+
+def test_short_write_is_rolled_back(patient_db):
+    with pytest.raises(ValueError):
+        with patient_db.PatientFileWriter("P-1", "CT", size=10) as w:
+            w.write(b"12345")
+    assert patient_db.list_patient_files("P-1") == []
+
+
+def test_missing_file_raises(patient_db):
+    with pytest.raises(FileNotFoundError):
+        patient_db.open_patient_file(42)
+
+
+def test_open_writer_does_not_block_other_writers(patient_db):
+    with patient_db.PatientFileWriter("P-1", "CT", size=4) as w:
+        w.write(b"ab")
+        # Another write goes through while the upload is still in progress
+        patient_db.store_patient_data_in_db("P-2", "Concurrent write")
+        w.write(b"cd")
+    assert patient_db.get_patient_file_by_id(w.file_id)["data"] == b"abcd"
+
+
+def test_reader_holds_no_transaction(patient_db):
+    file_id = patient_db.store_patient_file_in_db("P-1", "CT", b"payload")
+    conn = patient_db.connection.connection()
+    with patient_db.open_patient_file(file_id) as f:
+        assert not conn.in_transaction
+        assert f.read() == b"payload"
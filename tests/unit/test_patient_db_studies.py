@@ -0,0 +1,125 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+
+def _nifti(dims, pixdim, units=2):
+    header = bytearray(348)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, len(dims), *dims, *([1] * (7 - len(dims))))
+    struct.pack_into("<h", header, 70, 4)
+    struct.pack_into("<8f", header, 76, 1, *pixdim, *([1] * (7 - len(pixdim))))
+    header[123] = units
+    header[344:348] = b"n+1\x00"
+    return bytes(header) + bytes(4)
+
+
+def _png(width, height, pixels_per_metre=None):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    if pixels_per_metre:
+        png += chunk(b"pHYs", struct.pack(">IIB", pixels_per_metre, pixels_per_metre, 1))
+    return png + chunk(b"IDAT", zlib.compress((b"\x00" + bytes(width)) * height)) + chunk(b"IEND", b"")
+
+
+def _dicom(modality, rows, cols, spacing, thickness, study_date):
+    """Minimal explicit-VR little-endian DICOM header (no pixel data)."""
+
+    def element(group, elem, vr, value):
+        if len(value) % 2:
+            value += b" "
+        return struct.pack("<HH", group, elem) + vr + struct.pack("<H", len(value)) + value
+
+    meta = element(0x0002, 0x0010, b"UI", b"1.2.840.10008.1.2.1\x00")
+    body = (
+        element(0x0008, 0x0020, b"DA", study_date.encode())
+        + element(0x0008, 0x0060, b"CS", modality.encode())
+        + element(0x0018, 0x0050, b"DS", thickness.encode())
+        + element(0x0028, 0x0010, b"US", struct.pack("<H", rows))
+        + element(0x0028, 0x0011, b"US", struct.pack("<H", cols))
+        + element(0x0028, 0x0030, b"DS", spacing.encode())
+        + element(0x0028, 0x0100, b"US", struct.pack("<H", 16))
+        + element(0x0028, 0x0103, b"US", struct.pack("<H", 1))
+    )
+    return b"\x00" * 128 + b"DICM" + element(0x0002, 0x0000, b"UL", struct.pack("<I", len(meta))) + meta + body
+
+
+@pytest.fixture
+def study_db(patient_db):
+    patient_db.store_patient_file_in_db("P-1", "MRI", _nifti((128, 128, 48), (0.9, 0.9, 3.0)), filename="t1.nii")
+    patient_db.store_files_bulk([
+        {"patient_id": "P-1", "type": "XR", "data": _png(300, 200, 5000), "filename": "chest.png"},
+        {"patient_id": "P-1", "type": "note", "data": b"discharge letter", "filename": "note.txt"},
+        {"patient_id": "P-2", "type": "MRI", "data": _nifti((64, 64, 12), (0.5, 0.5, 0.005), units=1),
+         "filename": "knee.nii"},
+    ])
+    patient_db.store_patient_file_stream("P-2", "XR", io.BytesIO(_png(40, 30)), filename="hand.png")
+    return patient_db
+
+
+def test_header_columns_stored_at_ingest(study_db):
+    files = {f["filename"]: f for f in study_db.query_imaging_files()}
+
+    assert set(files) == {"t1.nii", "chest.png", "knee.nii", "hand.png"}
+    assert (files["t1.nii"]["cols"], files["t1.nii"]["rows"], files["t1.nii"]["slices"]) == (128, 128, 48)
+    assert files["t1.nii"]["spacing_z"] == pytest.approx(3.0)
+    assert files["knee.nii"]["spacing_z"] == pytest.approx(5.0)  # metres -> mm
+    assert files["chest.png"]["spacing_x"] == pytest.approx(0.2)
+    assert files["hand.png"]["spacing_x"] is None and files["hand.png"]["dtype"] == "uint8"
+
+
+def test_query_imaging_files_filters(study_db):
+    def names(**filters):
+        return [f["filename"] for f in study_db.query_imaging_files(**filters)]
+
+    assert names(patient_id="P-1", min_slices=20) == ["t1.nii"]
+    assert names(type="MRI", max_spacing_z=4) == ["t1.nii"]
+    assert names(slices=1, min_cols=100) == ["chest.png"]
+    assert names(patient_id=["P-2"], dtype="uint8") == ["hand.png"]
+    assert names(limit=1) == ["t1.nii"]
+    with pytest.raises(ValueError):
+        study_db.query_imaging_files(min_dtype="uint8")
+    with pytest.raises(ValueError):
+        study_db.query_imaging_files(body_part="knee")
+
+
+def test_backfill_fills_files_stored_without_columns(study_db):
+    conn = study_db.connection.connection()
+    conn.execute("UPDATE patient_files SET rows = NULL, cols = NULL, slices = NULL")
+    assert study_db.query_imaging_files() == []
+
+    assert study_db.backfill_imaging_columns(batch_size=2) == 4
+    assert len(study_db.query_imaging_files()) == 4
+
+
+def test_dicom_tags(patient_db):
+    pytest.importorskip("pydicom")
+    patient_db.store_patient_file_in_db(
+        "P-1", "CT", _dicom("CT", 512, 400, "0.7\\0.6", "2.5", "20240131"), filename="ct.dcm"
+    )
+    patient_db.store_patient_file_in_db(
+        "P-1", "CT", _dicom("CT", 512, 512, "0.7\\0.7", "5", "20230601"), filename="old.dcm"
+    )
+
+    [latest, older] = patient_db.query_imaging_files(patient_id="P-1", modality="ct")
+    assert (latest["modality"], latest["rows"], latest["cols"], latest["dtype"]) == ("CT", 512, 400, "int16")
+    assert (latest["spacing_x"], latest["spacing_y"], latest["spacing_z"]) == pytest.approx((0.6, 0.7, 2.5))
+    assert (latest["study_date"], older["study_date"]) == ("2024-01-31", "2023-06-01")
+    assert [f["filename"] for f in patient_db.query_imaging_files(min_study_date="2024-01-01")] == ["ct.dcm"]
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"patient_id": "P-1", "modality": "CT"},
+        {"modality": "MR", "min_study_date": "2024-01-01"},
+    ],
+)
+def test_study_queries_use_imaging_indexes(study_db, filters):
+    sql, params = study_db.studies.build_imaging_query(filters)
+    plan = [r[3] for r in study_db.connection.connection().execute("EXPLAIN QUERY PLAN " + sql, params)]
+    assert any("USING INDEX idx_patient_files_" in step and "modality" in step for step in plan), plan
@@ -0,0 +1,116 @@
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from tests.conftest import ROOT, load_patient_db_tool
+
+writer = load_patient_db_tool().writer
+
+
+@pytest.fixture
+def queue(patient_db):
+    q = writer.WriteBehindQueue(batch_size=8, max_delay=0.2)
+    yield q
+    q.close()
+
+
+def test_enqueue_returns_pending_id_then_file_id(patient_db):
+    pending_id = patient_db.enqueue_patient_file("P-1", "CT", b"scan", filename="ct.dcm")
+
+    file_id = patient_db.resolve_pending_file(pending_id, timeout=10)
+    assert patient_db.get_patient_file_by_id(file_id)["data"] == b"scan"
+    assert patient_db.pending_file_status(pending_id) == {"state": "written", "file_id": file_id, "error": None}
+    assert patient_db.pending_file_status("pending-unknown") is None
+    stats = patient_db.get_writer_stats()
+    assert stats["depth"] == 0 and stats["written"] >= 1 and stats["latency_ms"]["max"] is not None
+
+
+def test_pending_ids_are_unique_across_queues(patient_db):
+    first, second = writer.WriteBehindQueue(), writer.WriteBehindQueue()
+    try:
+        ids = {q.enqueue({"patient_id": "P-1", "type": "XR", "data": b"x"}) for q in (first, second)}
+    finally:
+        first.close()
+        second.close()
+    assert len(ids) == 2
+
+
+def test_writes_go_to_the_manager_they_were_queued_under(patient_db, queue, tmp_path):
+    other = patient_db.ConnectionManager(str(tmp_path / "other.sqlite"))
+    try:
+        with patient_db.connection.use_manager(other):
+            patient_db.migrate_database()
+            elsewhere = queue.enqueue({"patient_id": "P-2", "type": "XR", "data": b"other"})
+        here = queue.enqueue({"patient_id": "P-1", "type": "XR", "data": b"here"})
+        assert queue.flush(timeout=10)
+
+        assert queue.future(elsewhere).result() > 0 and queue.future(here).result() > 0
+        assert [f["data"] for f in patient_db.get_patient_file_from_db("P-1")] == [b"here"]
+        assert patient_db.get_patient_file_from_db("P-2") is None
+        with patient_db.connection.use_manager(other):
+            assert [f["data"] for f in patient_db.get_patient_file_from_db("P-2")] == [b"other"]
+    finally:
+        other.close_all()
+
+
+def test_writes_are_group_committed(patient_db, queue):
+    ids = [queue.enqueue({"patient_id": "P-1", "type": "XR", "data": bytes([i])}) for i in range(8)]
+    assert queue.flush(timeout=10)
+
+    assert queue.stats()["batches"] == 1
+    file_ids = [queue.future(i).result() for i in ids]
+    assert [f["data"] for f in patient_db.get_patient_file_from_db("P-1")] == [bytes([i]) for i in range(8)]
+    assert file_ids == sorted(file_ids)
+
+
+def test_failed_write_does_not_fail_its_batch(patient_db, queue):
+    good = queue.enqueue({"patient_id": "P-1", "type": "XR", "data": b"ok"})
+    bad = queue.enqueue({"patient_id": "P-1", "data": b"no type"})
+    queue.flush(timeout=10)
+
+    assert queue.future(good).result() > 0
+    with pytest.raises(KeyError):
+        queue.future(bad).result()
+    assert (queue.stats()["written"], queue.stats()["failed"]) == (1, 1)
+
+
+def test_full_queue_blocks_then_times_out(patient_db):
+    patient_db.migrate_database()
+    q = writer.WriteBehindQueue(max_items=1, max_delay=0)
+    # Hold SQLite's write lock (within the busy timeout) so the writer stalls on its first batch
+    blocker = sqlite3.connect(patient_db.get_db_path(), isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        q.enqueue({"patient_id": "P-1", "type": "XR", "data": b"a"})
+        while q.stats()["in_flight"] == 0:
+            time.sleep(0.001)
+        q.enqueue({"patient_id": "P-1", "type": "XR", "data": b"b"})
+        with pytest.raises(writer.WriteQueueFull):
+            q.enqueue({"patient_id": "P-1", "type": "XR", "data": b"c"}, timeout=0.05)
+        assert q.stats()["depth"] == 1
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert q.close(timeout=10)
+    assert len(patient_db.list_patient_files("P-1")) == 2
+
+
+def test_queued_writes_survive_interpreter_exit(tmp_path):
+    db_path = tmp_path / "exit.sqlite"
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(ROOT)!r})
+        from tests.conftest import load_patient_db_tool
+        db = load_patient_db_tool()
+        db.configure({str(db_path)!r})
+        for i in range(50):
+            db.enqueue_patient_file("P-1", "XR", bytes(1000))
+    """)
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM patient_files").fetchone()[0] == 50
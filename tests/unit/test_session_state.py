@@ -0,0 +1,90 @@
+import json
+import threading
+
+import pytest
+
+from tests.conftest import load_medagent_module
+
+session_state = load_medagent_module("session_state")
+
+
+class RecordingState(dict):
+    """A dict that records each write like an ADK state delta; `take_delta()` returns and resets it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delta = {}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.delta[key] = value
+
+    def take_delta(self):
+        delta, self.delta = self.delta, {}
+        return delta
+
+
+def _lab(i):
+    return {"test": "WBC", "value": 10000 + i, "unit": "K/uL", "flag": "HIGH"}
+
+
+def test_delta_size_is_constant_per_append():
+    state = RecordingState()
+    sizes = []
+    for i in range(500):
+        session_state.append(state, "temp:lab_results", _lab(i))
+        sizes.append(len(json.dumps(state.take_delta())))
+
+    # Only the item's key and the length counter, whose digits grow 1 -> 500
+    assert max(sizes) - min(sizes) <= 4
+    assert session_state.items(state, "temp:lab_results") == [_lab(i) for i in range(500)]
+    assert session_state.length(state, "temp:lab_results") == 500
+    assert session_state.last(state, "temp:lab_results") == _lab(499)
+
+    # The read-modify-write pattern it replaces grows with every append
+    naive, naive_sizes = RecordingState(), []
+    for i in range(500):
+        naive["temp:lab_results"] = naive.get("temp:lab_results", []) + [_lab(i)]
+        naive_sizes.append(len(json.dumps(naive.take_delta())))
+    assert naive_sizes[-1] > 100 * sizes[-1]
+
+
+def test_concurrent_appends_are_not_lost():
+    state = RecordingState()
+
+    def worker(n):
+        for i in range(200):
+            session_state.append(state, "temp:imaging_reports", (n, i))
+            session_state.incr(state, "diagnostic_loop_count")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(session_state.items(state, "temp:imaging_reports")) == [(n, i) for n in range(8) for i in range(200)]
+    assert state["diagnostic_loop_count"] == 1600
+
+
+def test_length_counter_trailing_merged_items_and_legacy_lists():
+    # A parallel tool call's delta merged last can leave the counter behind its items
+    state = {"temp:lab_results": ["legacy"], "temp:lab_results#0": "a", "temp:lab_results#1": "b"}
+    state["temp:lab_results#len"] = 1
+
+    assert session_state.append(state, "temp:lab_results", "c") == 2
+    assert session_state.items(state, "temp:lab_results") == ["legacy", "a", "b", "c"]
+
+
+def test_ring_buffer_keeps_newest_items_in_constant_state():
+    state = RecordingState()
+    sizes = []
+    for i in range(50):
+        session_state.ring_append(state, "temp:image_analyses", {"file_id": i}, capacity=4)
+        sizes.append(len(json.dumps(state.take_delta())))
+
+    assert session_state.ring_items(state, "temp:image_analyses", 4) == [{"file_id": i} for i in range(46, 50)]
+    assert len([k for k in state if k.startswith("temp:image_analyses#")]) == 5  # 4 slots + counter
+    assert max(sizes) - min(sizes) <= 4
+    with pytest.raises(ValueError):
+        session_state.ring_append(state, "temp:image_analyses", {}, capacity=0)
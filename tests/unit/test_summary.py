@@ -0,0 +1,129 @@
+from tests.conftest import load_medagent_module
+
+summary = load_medagent_module("summary")
+
+
+class RecordingState(dict):
+    """A dict that records which keys were written, like an ADK state delta."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delta = {}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.delta[key] = value
+
+
+def _render(state, token_budget=None):
+    calls = []
+    summary.add_render_hook(calls.append)
+    try:
+        text = summary.render_summary(state, token_budget)
+    finally:
+        summary.remove_render_hook(calls.append)
+    return text, calls[0]
+
+
+def test_summary_renders_every_section():
+    state = RecordingState(
+        patient_age=54,
+        chief_complaint="Chest pain",
+        vitals={"hr": 110, "bp": "90/60"},
+        lab_results=[{"test": "TROPONIN", "value": 0.3, "flag": "HIGH"}],
+        differential_diagnosis=["NSTEMI", "PE"],
+    )
+    text, stats = _render(state)
+
+    assert text.startswith("=== CLINICAL CASE SUMMARY ===")
+    assert "- Age: 54" in text and "- Sex: Unknown" in text
+    assert "hr: 110, bp: 90/60" in text
+    assert "- test: TROPONIN, value: 0.3, flag: HIGH" in text
+    assert "DIFFERENTIAL DIAGNOSIS:\n- NSTEMI\n- PE" in text
+    assert "IMAGING STUDIES:\nNone ordered" in text and "FINAL DIAGNOSIS:\nPending" in text
+    assert stats.version == 1 and set(stats.rendered) == {s.name for s in summary.SECTIONS}
+    assert stats.chars == len(text) and stats.seconds >= 0
+
+
+def test_unchanged_state_returns_cached_summary_without_writes():
+    state = RecordingState(chief_complaint="Cough")
+    first, _ = _render(state)
+    state.delta.clear()
+
+    second, stats = _render(state)
+
+    assert second == first
+    assert stats.cached and stats.version == 1
+    assert state.delta == {}
+
+
+def test_only_changed_sections_are_rerendered():
+    state = RecordingState(chief_complaint="Cough", lab_results=["WBC 14 HIGH"])
+    _render(state)
+    state.delta.clear()
+
+    state["differential_diagnosis"] = ["Pneumonia"]
+    text, stats = _render(state)
+
+    assert stats.rendered == ("differential",) and stats.version == 2
+    assert "- Pneumonia" in text and "- WBC 14 HIGH" in text
+    # The cache stays under temp: keys, out of the persisted delta
+    assert set(state.delta) == {
+        "differential_diagnosis", "temp:summary:section:differential", "temp:summary:text", "temp:summary:version"
+    }
+    assert summary.summary_version(state) == 2
+
+
+def test_in_place_changes_need_invalidate():
+    state = RecordingState(vitals={"hr": 110}, lab_results=["WBC 14 HIGH"])
+    _render(state)
+
+    state["lab_results"].append("CRP 80 HIGH")  # a grown list is noticed
+    text, stats = _render(state)
+    assert stats.rendered == ("labs",) and "- CRP 80 HIGH" in text
+
+    state["vitals"]["hr"] = 80  # same object, same size: the cached section stands until invalidated
+    assert "hr: 110" in _render(state)[0]
+    summary.invalidate(state, "vitals", "unrelated")
+    text, stats = _render(state)
+    assert stats.rendered == ("vitals",) and "hr: 80" in text
+
+
+def _session_state(loops):
+    labs = [{"test": "NA", "value": 140, "flag": "NORMAL", "unit": "mmol/L"} for _ in range(loops * 3)]
+    labs[1] = {"test": "TROPONIN", "value": 2.1, "flag": "HIGH", "unit": "ng/mL"}
+    hypothesis = "NSTEMI (High): rising troponin with typical chest pain. " * 5
+    return RecordingState(
+        chief_complaint="Chest pain",
+        lab_results=labs,
+        differential_diagnosis=[hypothesis] * (loops - 1) + [hypothesis.upper(), "Pulmonary embolism"],
+    )
+
+
+def test_token_budget_keeps_newest_and_abnormal_verbatim():
+    state = _session_state(loops=20)
+    full = summary.render_summary(state)
+    text, stats = _render(state, token_budget=300)
+
+    assert stats.tokens <= 300 < summary.estimate_tokens(full) and stats.level > 0
+    assert text.endswith(" tokens, budget 300)")
+    assert "- test: TROPONIN, value: 2.1, flag: HIGH, unit: ng/mL" in text
+    assert text.count("- test: NA, value: 140") == 1  # only the newest normal lab verbatim
+    assert "older entries omitted" in text
+    # Repeated DDx entries (differing only in case) are listed once, at their latest position
+    assert text.count("NSTEMI (HIGH)") == 1 and "NSTEMI (High)" not in text
+    assert text.index("NSTEMI (HIGH)") < text.index("Pulmonary embolism")
+    # Cached per budget, next to the full summary
+    again, stats = _render(state, token_budget=300)
+    assert again == text and stats.cached
+    assert summary.render_summary(state) == full
+
+
+def test_compact_lines_levels():
+    values = ["a normal result"] * 4 + ["K 6.1 [HIGH]", "latest normal result"]
+
+    assert summary.compact_lines(values, summary.LEVELS[0]) == values
+    assert summary.compact_lines(values, summary.LEVELS[-1]) == [
+        "(4 older entries omitted)", "K 6.1 [HIGH]", "latest normal result"
+    ]
+    assert summary.compact_lines(["x" * 200, "y"], summary.LEVELS[3])[0] == "x" * 59 + "…"